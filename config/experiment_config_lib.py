@@ -178,6 +178,26 @@ class ControllerConfig(object):
       raise RuntimeError("No IP address resolved for controller %s!" % self.label)
     return address
 
+  def shift_ports(self, offset):
+    '''
+    Move every TCP port this controller listens on (OpenFlow, additional
+    ports, and the sync port) up by offset, so that several replays can boot
+    copies of this controller concurrently without colliding.
+    '''
+    if offset == 0:
+      return
+    if self.port is not None:
+      self.port += offset
+      self._server_info = (self.address, self.port)
+    self.additional_ports = { name : port + offset
+                              for name, port in self.additional_ports.iteritems() }
+    if self.sync:
+      port_match = re.search(r':(\d+)$', self.sync)
+      if port_match is None:
+        raise ValueError("sync: cannot find port in %s" % self.sync)
+      self.sync = "%s:%d" % (self.sync[:port_match.start()],
+                             int(port_match.group(1)) + offset)
+
   @property
   def cid(self):
     ''' Return this controller's id '''
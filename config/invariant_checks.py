@@ -1,4 +1,4 @@
-from sts.invariant_checker import InvariantChecker
+from sts.invariant_checker import InvariantChecker, IncrementalInvariantChecker
 import sys
 import pox.openflow.libopenflow_01 as of_01
 
@@ -56,6 +56,14 @@ check_for_loops_blackholes = ComposeChecks(InvariantChecker.check_loops,
 check_for_blackholes_or_connectivity =\
   ComposeChecks(InvariantChecker.python_check_blackholes, InvariantChecker.check_connectivity)
 
+# Only recomputes what changed since the previous check, so it is cheap to
+# check these every round (check_interval=1).
+incremental_check_for_loops_blackholes_or_connectivity =\
+  ComposeChecks(
+    ComposeChecks(IncrementalInvariantChecker.check_loops,
+                  IncrementalInvariantChecker.check_blackholes),
+    IncrementalInvariantChecker.check_connectivity)
+
 def check_for_invalid_ports(simulation):
   ''' Check if any of the switches have been asked to forward packets out
   ports that don't exist '''
@@ -136,6 +144,10 @@ name_to_invariant_check = {
   "InvariantChecker.check_persistent_connectivity" : InvariantChecker.check_persistent_connectivity,
   "InvariantChecker.check_blackholes" : InvariantChecker.python_check_blackholes,
   "InvariantChecker.check_correspondence" : InvariantChecker.check_correspondence,
+  "incremental_check_for_loops_blackholes_or_connectivity" : incremental_check_for_loops_blackholes_or_connectivity,
+  "IncrementalInvariantChecker.check_loops" : IncrementalInvariantChecker.check_loops,
+  "IncrementalInvariantChecker.check_blackholes" : IncrementalInvariantChecker.check_blackholes,
+  "IncrementalInvariantChecker.check_connectivity" : IncrementalInvariantChecker.check_connectivity,
 }
 
 # Now make sure that we always check if all controllers are down (should never
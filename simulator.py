@@ -66,6 +66,10 @@ parser.add_argument('-t', '--timestamp-results', dest="timestamp_results",
 parser.add_argument('-p', '--publish', action="store_true", default=False,
                     help='''automatically publish experiment results to git''')
 
+parser.add_argument('-r', '--resume', action="store_true", default=False,
+                    help='''resume an interrupted run from the checkpoint in its '''
+                         '''result directory (only supported by MCSFinder)''')
+
 args = parser.parse_args()
 
 # Allow configs to be specified as paths as well as module names
@@ -91,6 +95,11 @@ else:
   # We default to a Fuzzer
   simulator = Fuzzer(SimulationConfig())
 
+if args.resume:
+  if not hasattr(simulator, "resume"):
+    parser.error("--resume is not supported by %s" % type(simulator).__name__)
+  simulator.resume = True
+
 # Set an interrupt handler
 def handle_int(signal, frame):
   import os
@@ -41,6 +41,9 @@ class EventSchedulerStats(object):
     self.msgrecv2timeouts = Counter()
     # ControlMessageSend packet classes -> timeout counts
     self.msgsend2timeouts = Counter()
+    # Fine grained event classes (see match_class()) -> longest we waited for
+    # a match, in seconds
+    self.class2max_match_latency = {}
     self.replay_start = None
     self.record_start = None
 
@@ -52,8 +55,22 @@ class EventSchedulerStats(object):
     return format_time(time.time() - self.replay_start) + " " + \
            format_time(event.time.as_float() - self.record_start)
 
-  def event_matched(self, event):
+  @staticmethod
+  def match_class(event):
+    ''' Coarse grained event class, refined by packet class for control
+    messages '''
+    if event.__class__.__name__ in ["ControlMessageReceive", "ControlMessageSend"]:
+      return (event.__class__.__name__, event.get_packet().__class__.__name__)
+    return (event.__class__.__name__,)
+
+  def event_matched(self, event, latency_seconds=None):
+    ''' latency_seconds is how long we waited for the event to occur, if we
+    waited at all '''
     msg.replay_event_success(self.time(event) + " Successfully matched event "+str(event))
+    if latency_seconds is not None:
+      match_class = self.match_class(event)
+      self.class2max_match_latency[match_class] = max(
+        latency_seconds, self.class2max_match_latency.get(match_class, 0))
     self.event2matched[event.__class__.__name__] += 1
     if event.__class__.__name__ == "ControlMessageReceive":
       pkt_class = event.get_packet().__class__.__name__
@@ -72,6 +89,11 @@ class EventSchedulerStats(object):
       pkt_class = event.get_packet().__class__.__name__
       self.msgsend2timeouts[pkt_class] += 1
 
+  def max_match_latency(self, event):
+    ''' Return the longest we have waited for an event of event's class to
+    occur, or None if none has been matched yet '''
+    return self.class2max_match_latency.get(self.match_class(event))
+
   def sorted_match_counts(self):
     for e, count in sorted(self.event2matched.items(),
                            key=operator.itemgetter(1)):
@@ -193,6 +215,10 @@ class EventScheduler(EventSchedulerBase):
   '''An EventWatcher schedules events. It controls their admission and
   any post-event delay '''
 
+  # Longest single select() while waiting for a message that wakes us up on
+  # arrival
+  max_select_seconds = 5.0
+
   kwargs = set(['speedup', 'delay_input_events', 'initial_wait',
                 'epsilon_seconds', 'sleep_interval_seconds',
                 'sleep_continuation', 'select_continuation'])
@@ -274,23 +300,59 @@ class EventScheduler(EventSchedulerBase):
 
   def _poll_event(self, event, end_time):
     proceed = False
-    while True:
-      now = time.time()
-      if event.proceed(self.simulation):
-        proceed = True
-        break
-      elif now > end_time:
-        break
-      self.select_continuation(self.sleep_interval_seconds)
+    start = time.time()
+    message_id = self._awaited_message_id(event)
+    if message_id is not None:
+      # The message may be inserted outside of the I/O loop, e.g. when the
+      # select continuation lets dataplane packets through. Wake the I/O loop
+      # up when it is, rather than when the next I/O happens.
+      self.simulation.openflow_buffer.notify_on_arrival(message_id,
+                                                        self._on_arrival)
+    try:
+      while True:
+        now = time.time()
+        if event.proceed(self.simulation):
+          proceed = True
+          break
+        elif now > end_time:
+          break
+        self._select_until(end_time, wakes_on_arrival=message_id is not None)
+    finally:
+      if message_id is not None:
+        self.simulation.openflow_buffer.cancel_arrival_notification(
+            message_id, self._on_arrival)
     if proceed:
       event.timed_out = False
-      self.stats.event_matched(event)
+      self.stats.event_matched(event, latency_seconds=now - start)
       self.update_event_time(event)
     else:
       event.timed_out = True
       self.stats.event_timed_out(event)
     event.replay_time = SyncTime.now()
 
+  def _select_until(self, end_time, wakes_on_arrival=False):
+    ''' Wait for I/O, at most until a little after end_time. If
+    wakes_on_arrival, the message we are waiting for wakes select() up when
+    it arrives (see _on_arrival()), so don't poll in the meantime. '''
+    if wakes_on_arrival:
+      # N.B. still capped, since end_time may be decades away
+      timeout = min(max(end_time - time.time(), 0), self.max_select_seconds)
+    else:
+      timeout = self.sleep_interval_seconds
+    self.select_continuation(timeout)
+
+  @staticmethod
+  def _awaited_message_id(event):
+    ''' The pending message event waits for, if any '''
+    if type(event) == ControlMessageReceive:
+      return event.pending_receive
+    if type(event) == ControlMessageSend:
+      return event.pending_send
+    return None
+
+  def _on_arrival(self, message_id):
+    self.simulation.io_master.wake()
+
   def update_event_time(self, event):
     """ update our bearing on where we currently our in the timeline """
     self.last_real_time = time.time()
@@ -313,3 +375,57 @@ class EventScheduler(EventSchedulerBase):
       raise RuntimeError("Wait time %f is negative for event %s" %
                          (to_wait, str(event)))
     return max(to_wait, 0)
+
+class CausalEventScheduler(EventScheduler):
+  ''' Schedules events by causality alone, rather than by the recorded
+  timeline.
+
+  Inputs are injected as soon as the events before them have matched or timed
+  out, without reproducing the recorded inter-event gaps. Internal events time
+  out after timeout_multiplier times the longest we have so far waited for an
+  event of the same class (see EventSchedulerStats.max_match_latency), but
+  never later than EventScheduler would time them out. Waits wake up on I/O,
+  and never sleep past the deadline. '''
+
+  kwargs = EventScheduler.kwargs | set(['timeout_multiplier', 'min_timeout_seconds'])
+
+  def __init__(self, simulation, timeout_multiplier=3.0, min_timeout_seconds=0.05,
+               **kwargs):
+    super(CausalEventScheduler, self).__init__(simulation, **kwargs)
+    self.timeout_multiplier = timeout_multiplier
+    self.min_timeout_seconds = min_timeout_seconds
+
+  def inject_input(self, event):
+    log.debug("Injecting %r", event)
+    self._poll_event(event, time.time())
+
+  def delay_whitelisted_internal_event(self, event):
+    log.debug("Event whitelisted %s, not delaying" % repr(event).replace("\n", ""))
+    self.stats.event_matched(event)
+    self.update_event_time(event)
+    event.replay_time = SyncTime.now()
+
+  def wait_for_internal(self, event):
+    if event.timeout_disallowed:
+      return super(CausalEventScheduler, self).wait_for_internal(event)
+    timeout_seconds = self.timeout_seconds(event)
+    log.debug("Waiting for %s (maximum wait time: %.0f ms)" %
+              ( repr(event).replace("\n", ""), timeout_seconds * 1000) )
+    self._poll_event(event, time.time() + timeout_seconds)
+
+  def timeout_seconds(self, event):
+    ''' How long to wait for event before timing it out '''
+    # What EventScheduler would wait
+    fallback = self.wait_time(event) + self.epsilon_seconds
+    latency = self.stats.max_match_latency(event)
+    if latency is None:
+      return fallback
+    return min(fallback, max(self.min_timeout_seconds,
+                             latency * self.timeout_multiplier))
+
+  def _select_until(self, end_time, wakes_on_arrival=False):
+    if wakes_on_arrival:
+      return super(CausalEventScheduler, self)._select_until(end_time,
+                                                             wakes_on_arrival)
+    timeout = min(self.sleep_interval_seconds, end_time - time.time())
+    self.select_continuation(max(timeout, 0))
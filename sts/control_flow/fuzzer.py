@@ -150,6 +150,17 @@ class Fuzzer(ControlFlow):
       event.round = self.logical_time
       self._input_logger.log_input_event(event, **kws)
 
+  def _log_input_events(self, events):
+    ''' _log_input_event() each of events, with a single write '''
+    if self._input_logger is not None and events != []:
+      initializing = self._initializing()
+      for event in events:
+        if initializing:
+          # Tell MCSFinder never to prune this event
+          event.prunable = False
+        event.round = self.logical_time
+      self._input_logger.log_input_events(events)
+
   def _load_fuzzer_params(self, fuzzer_params_path):
     if fuzzer_params_path.endswith('.py'):
       fuzzer_params_path = fuzzer_params_path[:-3].replace("/", ".")
@@ -384,29 +395,43 @@ class Fuzzer(ControlFlow):
 
   def check_dataplane(self, pass_through=False):
     ''' Decide whether to delay, drop, or deliver packets '''
+    # Decide for all queued packets first, then log the decisions and carry
+    # them out in bulk
+    permits = []
+    drops = []
+    log_events = []
     def drop(dp_event, log_event=True):
       if log_event:
-        self._log_input_event(DataplaneDrop(dp_event.fingerprint,
-                                            host_id=dp_event.get_host_id(),
-                                          dpid=dp_event.get_switch_id()))
-      self.simulation.patch_panel.drop_dp_event(dp_event)
+        log_events.append(DataplaneDrop(dp_event.fingerprint,
+                                        host_id=dp_event.get_host_id(),
+                                        dpid=dp_event.get_switch_id()))
+      drops.append(dp_event)
     def permit(dp_event):
-      self._log_input_event(DataplanePermit(dp_event.fingerprint))
-      self.simulation.patch_panel.permit_dp_event(dp_event)
+      log_events.append(DataplanePermit(dp_event.fingerprint))
+      permits.append(dp_event)
 
     def in_whitelist(dp_event):
       return (self.never_drop_whitelisted_packets and
               OpenFlowBuffer.in_whitelist(dp_event.fingerprint[0]))
 
-    for dp_event in self.simulation.patch_panel.queued_dataplane_events:
-      if pass_through:
-        permit(dp_event)
-      elif not self.simulation.topology.ok_to_send(dp_event):
-        drop(dp_event, log_event=False)
-      elif (self.random.random() >= self.params.dataplane_drop_rate or in_whitelist(dp_event)):
-        permit(dp_event)
-      else:
-        drop(dp_event)
+    queued_dataplane_events = self.simulation.patch_panel.queued_dataplane_events
+    if pass_through:
+      # Initialization: everything goes through
+      permits = queued_dataplane_events
+      if self._input_logger is not None:
+        log_events = [ DataplanePermit(e.fingerprint) for e in permits ]
+    else:
+      for dp_event in queued_dataplane_events:
+        if not self.simulation.topology.ok_to_send(dp_event):
+          drop(dp_event, log_event=False)
+        elif (self.random.random() >= self.params.dataplane_drop_rate or in_whitelist(dp_event)):
+          permit(dp_event)
+        else:
+          drop(dp_event)
+
+    self._log_input_events(log_events)
+    self.simulation.patch_panel.drop_many(drops)
+    self.simulation.patch_panel.permit_many(permits)
 
     # TODO(cs): temporary hack until we have determinism figured out
     if self.mock_link_discovery and self.random.random() < self.params.link_discovery_rate:
@@ -437,31 +462,32 @@ class Fuzzer(ControlFlow):
 
   def check_pending_messages(self, pass_through=False):
     of_buf = self.simulation.openflow_buffer
-    for (dpid, controller_id) in of_buf.conns_with_pending_receives():
-      for pending_receipt in of_buf.get_pending_receives(dpid, controller_id):
-        if (not pass_through and
-            self.random.random() > self.params.ofp_message_receipt_rate):
-          break
-        message = of_buf.get_message_receipt(pending_receipt)
-        b64_packet = base64_encode(message)
-        self._log_input_event(ControlMessageReceive(pending_receipt.dpid,
-                                                    pending_receipt.controller_id,
-                                                    pending_receipt.fingerprint,
-                                                    b64_packet=b64_packet))
-        of_buf.schedule(pending_receipt)
-
-    for (dpid, controller_id) in of_buf.conns_with_pending_sends():
-      for pending_send in of_buf.get_pending_sends(dpid, controller_id):
-        if (not pass_through and
-            self.random.random() > self.params.ofp_message_send_rate):
-          break
-        message = of_buf.get_message_send(pending_send)
-        b64_packet = base64_encode(message)
-        self._log_input_event(ControlMessageSend(pending_send.dpid,
-                                                 pending_send.controller_id,
-                                                 pending_send.fingerprint,
-                                                 b64_packet=b64_packet))
-        of_buf.schedule(pending_send)
+    # Choose the receives to schedule, log them, and schedule them in bulk.
+    # Then the same for the sends, which may include sends triggered by the
+    # receives.
+    for (conn_ids, get_pending, get_message, rate, event_class) in [
+        (of_buf.conns_with_pending_receives, of_buf.get_pending_receives,
+         of_buf.get_message_receipt, self.params.ofp_message_receipt_rate,
+         ControlMessageReceive),
+        (of_buf.conns_with_pending_sends, of_buf.get_pending_sends,
+         of_buf.get_message_send, self.params.ofp_message_send_rate,
+         ControlMessageSend)]:
+      chosen = []
+      for (dpid, controller_id) in conn_ids():
+        pending_messages = get_pending(dpid, controller_id)
+        if pass_through:
+          chosen.extend(pending_messages)
+          continue
+        for pending_message in pending_messages:
+          if self.random.random() > rate:
+            break
+          chosen.append(pending_message)
+      if self._input_logger is not None:
+        self._log_input_events([
+            event_class(p.dpid, p.controller_id, p.fingerprint,
+                        b64_packet=base64_encode(get_message(p)))
+            for p in chosen ])
+      of_buf.schedule_many(chosen)
 
   def check_pending_commands(self):
     ''' If Fuzzer is configured to delay flow mods, this decides whether
@@ -21,19 +21,22 @@ find the minimal causal sequence (MCS) of a failure.
 '''
 
 from sts.util.console import msg, color, Tee
-from sts.util.convenience import timestamp_string, ExitCode, create_clean_python_dir
+from sts.util.convenience import timestamp_string, ExitCode, create_clean_python_dir, find
 from sts.util.rpc_forker import LocalForker, test_serialize_response
-from sts.util.precompute_cache import PrecomputeCache
+from sts.util.precompute_cache import PrecomputeCache, ReplayOutcomeCache, hash_file
 from sts.replay_event import *
-from sts.event_dag import EventDag, split_list
+from sts.event_dag import EventDag, split_list, expand_atomic_inputs
 import sts.input_traces.log_parser as log_parser
 from sts.input_traces.input_logger import InputLogger
 from sts.control_flow.base import ControlFlow
 from sts.control_flow.replayer import Replayer
 from sts.control_flow.peeker import Peeker
+from sts.control_flow.partitioners import get_partitioner
+from sts.control_flow.snapshot_utils import *
 from config.invariant_checks import name_to_invariant_check
 
 from collections import Counter
+import Queue
 import copy
 import sys
 import time
@@ -42,18 +45,62 @@ import logging
 import json
 import os
 import re
+import hashlib
+import shutil
+import socket
+import tempfile
 
 class MCSFinder(ControlFlow):
+  # In parallel mode, worker slot i shifts its controllers' ports by
+  # i * worker_port_stride.
+  worker_port_stride = 100
+  # Modules that replays import lazily, which the default forker's
+  # pre-forked children import ahead of time
+  preload_modules = ("sts.topology.topology_factory",)
+
   def __init__(self, simulation_cfg, superlog_path_or_dag,
                invariant_check_name="", bug_signature="", transform_dag=None,
                mcs_trace_path=None, extra_log=None, runtime_stats_path=None,
                max_replays_per_subsequence=1,
-               optimized_filtering=False, forker=LocalForker(),
+               optimized_filtering=False, forker=None,
                replay_final_trace=True, strict_assertion_checking=False,
                no_violation_verification_runs=None,
-               **kwargs):
+               max_parallel_replays=1, replay_outcome_cache_path=None,
+               resume=False, partitioner="time", snapshot_replays=False,
+               max_snapshots=8, **kwargs):
     ''' Note that you may pass in any keyword argument for Replayer to
-    MCSFinder, except 'bug_signature' and 'invariant_check_name' '''
+    MCSFinder, except 'bug_signature' and 'invariant_check_name'
+
+    Replays run in children of forker. By default, a LocalForker keeps
+    max_parallel_replays children fork()ed ahead of time, so that replays
+    don't pay for fork()ing and for importing preload_modules.
+
+    If max_parallel_replays > 1, the subsets (and complements) of each delta
+    debugging round are replayed speculatively in up to that many concurrent
+    child processes. The outcome is the same as sequential delta debugging.
+
+    If replay_outcome_cache_path is given, the outcome of every replay is
+    recorded there, and replays of input subsequences whose outcome was
+    recorded by this or any previous run on the same superlog are skipped.
+
+    The progress of the search is checkpointed to the results directory after
+    every replay. If resume is True (simulator.py --resume), the search
+    continues from the checkpoint left behind by an interrupted run.
+
+    partitioner determines how delta debugging splits the inputs into subsets:
+    either a Partitioner or the name of one in
+    sts.control_flow.partitioners.name_to_partitioner, e.g. "switch", or
+    "adaptive" to favour whichever partitioner prunes the most inputs per
+    replay.
+
+    If snapshot_replays is True, each replay snapshots itself (controller and
+    simulator) at the deepest input boundary it shares with the dag under
+    consideration in the current delta debugging round. Later replays that
+    share the snapshot's prefix of events resume from the deepest such
+    snapshot rather than from boot. At most max_snapshots suspended snapshots
+    are kept around. Requires a single POX controller launched with
+    sts.util.socket_mux.pox_monkeypatcher --snapshot_address, and sequential
+    replays. '''
     super(MCSFinder, self).__init__(simulation_cfg)
     # number of subsequences delta debugging has examined so far, for
     # distingushing runtime stats from different intermediate runs.
@@ -73,11 +120,16 @@ class MCSFinder(ControlFlow):
     self.invariant_check_name = invariant_check_name
     self.invariant_check = name_to_invariant_check[invariant_check_name]
 
+    self.superlog_path = None
     if type(superlog_path_or_dag) == str:
       self.superlog_path = superlog_path_or_dag
       # The dag is codefied as a list, where each element has
       # a list of its dependents
-      self.dag = EventDag(log_parser.parse_path(self.superlog_path))
+      skip_classes = ()
+      if self.simulation_cfg.ignore_interposition:
+        skip_classes = all_internal_events
+      self.dag = EventDag(log_parser.parse_path(self.superlog_path,
+                                                skip_classes=skip_classes))
     else:
       self.dag = superlog_path_or_dag
 
@@ -121,9 +173,68 @@ class MCSFinder(ControlFlow):
     self._runtime_stats = RuntimeStats(self.subsequence_id, runtime_stats_path=runtime_stats_path)
     # Whether to try alternate trace splitting techiques besides splitting by time.
     self.optimized_filtering = optimized_filtering
+    self.partitioner = get_partitioner(partitioner)
+    if max_parallel_replays < 1:
+      raise ValueError("max_parallel_replays must be at least 1")
+    self.max_parallel_replays = max_parallel_replays
+    if forker is None:
+      forker = LocalForker(pool_size=max_parallel_replays,
+                           preload_modules=self.preload_modules)
     self.forker = forker
+    # Events replayed so far, which children look up by token. An event's
+    # token is its label, suffixed if a different event object with the same
+    # label was replayed before (e.g. a HostMigration that was rewritten by
+    # EventDag.replace_migration).
+    self._token2event = {}
+    # id(event) -> token
+    self._event2token = {}
+    self.forker.register_task("play_forward", self.play_forward)
     self.replay_final_trace = replay_final_trace
     self.strict_assertion_checking = strict_assertion_checking
+    self.resume = resume
+    self._search_state = MCSSearchState()
+    self._search_state_path = None
+    self._precompute_cache = PrecomputeCache()
+    self._snapshots = None
+    if snapshot_replays:
+      self._check_snapshot_support()
+      self._snapshots = SnapshotTrie(max_snapshots=max_snapshots,
+                                     release=release_replay_snapshot)
+      self._snapshot_dir = tempfile.mkdtemp(prefix="sts_snapshots_")
+      self._snapshot_count = 0
+    # Replays snapshot themselves at the last input boundary they share with
+    # this dag
+    self._snapshot_reference = None
+    self.replay_outcome_cache = None
+    if replay_outcome_cache_path is not None:
+      if self.superlog_path is not None:
+        superlog_hash = hash_file(self.superlog_path)
+      else:
+        superlog_hash = hashlib.sha1(" ".join(e.label for e in self.dag.events)).hexdigest()
+      replay_params = dict(self.kwargs)
+      replay_params.update(invariant_check_name=self.invariant_check_name,
+                           bug_signature=str(self.bug_signature),
+                           simulation_cfg=str(self.simulation_cfg),
+                           transform_dag=type(self.transform_dag).__name__,
+                           max_replays_per_subsequence=self.max_replays_per_subsequence)
+      self.replay_outcome_cache = ReplayOutcomeCache(replay_outcome_cache_path,
+                                                     superlog_hash, **replay_params)
+
+  def _check_snapshot_support(self):
+    if len(self.simulation_cfg.controller_configs) != 1:
+      raise ValueError("Only one controller supported for snapshotting")
+    controller_config = self.simulation_cfg.controller_configs[0]
+    if controller_config.sync is not None:
+      raise ValueError("STSSyncProto currently incompatible with snapshotting")
+    if not getattr(controller_config, "snapshot_address", None):
+      raise ValueError("Controller must be launched with a snapshot_address "
+                       "for snapshot_replays")
+    if not self.simulation_cfg.multiplex_sockets:
+      raise ValueError("snapshot_replays requires multiplex_sockets")
+    if self.max_parallel_replays > 1:
+      raise ValueError("snapshot_replays requires max_parallel_replays=1")
+    if not isinstance(self.forker, LocalForker):
+      raise ValueError("snapshot_replays requires LocalForker")
 
   def log(self, s):
     ''' Output a message to both self._log and self._extra_log '''
@@ -148,9 +259,10 @@ class MCSFinder(ControlFlow):
 
   def init_results(self, results_dir):
     ''' Precondition: results_dir exists, and is clean (preferably
-    initialized by experiments/setup.py).'''
+    initialized by experiments/setup.py), unless self.resume is set.'''
     if self._extra_log is None:
-      self._extra_log = open("%s/mcs_finder.log" % results_dir, "w")
+      self._extra_log = open("%s/mcs_finder.log" % results_dir,
+                             "a" if self.resume else "w")
     if self._runtime_stats.get_runtime_stats_path() is None:
       runtime_stats_path = "%s/runtime_stats.json" % results_dir
       self._runtime_stats.set_runtime_stats_path(runtime_stats_path)
@@ -163,10 +275,71 @@ class MCSFinder(ControlFlow):
                                          self._runtime_stats,
                                          self.simulation_cfg, peeker_exists)
     self.replay_log_tracker = ReplayLogTracker(results_dir)
+    self._search_state_path = os.path.join(results_dir, "mcs_search_state.json")
+    if self.resume:
+      self._load_checkpoint()
+
+  def _checkpoint(self):
+    ''' Write the search state to the results directory '''
+    if self._search_state_path is None:
+      return
+    state = self._search_state
+    state.done_sequences = [ [ e.label for e in sequence ]
+                             for sequence in self._precompute_cache.done_sequences ]
+    state.counters = {
+      "subsequence_id" : self.subsequence_id,
+      "replay_log_count" : self.replay_log_tracker.count,
+      "mcs_log_count" : self.mcs_log_tracker.count,
+      "max_inputs_pruned" : self.mcs_log_tracker.max_inputs_pruned,
+    }
+    state.runtime_stats = self._runtime_stats.__dict__
+    state.dump(self._search_state_path)
+
+  def _load_checkpoint(self):
+    if not os.path.exists(self._search_state_path):
+      raise ValueError("Cannot resume: no search state found at %s" %
+                       self._search_state_path)
+    state = MCSSearchState.load(self._search_state_path)
+    self.log("Resuming MCS search from %s (phase %s)" %
+             (self._search_state_path, state.phase))
+    for labels in state.done_sequences:
+      self._precompute_cache.update(tuple(self.dag.get_events(labels)))
+    self.subsequence_id = state.counters["subsequence_id"]
+    self.replay_log_tracker.count = state.counters["replay_log_count"]
+    self.mcs_log_tracker.count = state.counters["mcs_log_count"]
+    self.mcs_log_tracker.max_inputs_pruned = state.counters["max_inputs_pruned"]
+    # N.B. MCSLogTracker shares our RuntimeStats object, so update it in place
+    self._runtime_stats.__dict__.update(state.runtime_stats)
+    # JSON turned the Counter's integer keys into strings
+    self._runtime_stats.violation_found_in_run = Counter({
+      int(k) : v for k, v in state.runtime_stats["violation_found_in_run"].iteritems()
+    })
+    self._search_state = state
+
+  def _advance_search(self, index, violation):
+    ''' Record that the candidate at index of the current ddmin frame was
+    examined, and checkpoint '''
+    frame = self._search_state.frames[-1]
+    if violation:
+      frame.winner = index
+    else:
+      frame.next_candidate = index + 1
+    self._checkpoint()
 
   # N.B. only called in the parent process.
   def simulate(self, check_reproducibility=True):
-    self._runtime_stats.set_dag_stats(self.dag)
+    try:
+      return self._simulate(check_reproducibility)
+    finally:
+      self.forker.close_pool()
+      if self._snapshots is not None:
+        self._snapshots.clear()
+        shutil.rmtree(self._snapshot_dir, ignore_errors=True)
+
+  def _simulate(self, check_reproducibility):
+    state = self._search_state
+    if state.phase == "reproducibility":
+      self._runtime_stats.set_dag_stats(self.dag)
 
     # apply domain knowledge: treat failure/recovery pairs atomically, and
     # filter event types we don't want to include in the MCS
@@ -176,37 +349,53 @@ class MCSFinder(ControlFlow):
 
     if len(self.dag) == 0:
       raise RuntimeError("No supported input types?")
+    self._checkpoint()
 
-    if check_reproducibility:
-      # First, run through without pruning to verify that the violation exists
-      self._runtime_stats.record_replay_start()
+    if state.phase == "reproducibility":
+      if check_reproducibility:
+        # First, run through without pruning to verify that the violation exists
+        self._runtime_stats.record_replay_start()
 
-      (bug_found, i) = self.replay_max_iterations(self.dag, "reproducibility",
-                                                  ignore_runtime_stats=True)
-      self._runtime_stats.set_initial_verification_runs_needed(i)
-      self._runtime_stats.record_replay_end()
-      if not bug_found:
-        msg.fail("Unable to reproduce correctness violation!")
-        sys.exit(5)
-      self.log("Violation reproduced successfully! Proceeding with pruning")
-
-    self._runtime_stats.record_prune_start()
-
-    # Run optimizations.
-    # TODO(cs): Better than a boolean flag: check if
-    # log(len(self.dag)) > number of input types to try
-    if self.optimized_filtering:
-      self._optimize_event_dag()
-    precompute_cache = PrecomputeCache()
-
-    # Invoke delta debugging
-    (dag, total_inputs_pruned) = self._ddmin(self.dag, 2, precompute_cache=precompute_cache)
-    # Make sure to track the final iteration size
-    self._track_iteration_size(total_inputs_pruned)
-    self.dag = dag
+        (bug_found, i) = self.replay_max_iterations(self.dag, "reproducibility",
+                                                    ignore_runtime_stats=True)
+        self._runtime_stats.set_initial_verification_runs_needed(i)
+        self._runtime_stats.record_replay_end()
+        if not bug_found:
+          msg.fail("Unable to reproduce correctness violation!")
+          sys.exit(5)
+        self.log("Violation reproduced successfully! Proceeding with pruning")
+
+      self._runtime_stats.record_prune_start()
+      state.phase = "optimize"
+      self._checkpoint()
+
+    if state.phase == "optimize":
+      # Run optimizations.
+      # TODO(cs): Better than a boolean flag: check if
+      # log(len(self.dag)) > number of input types to try
+      if self.optimized_filtering:
+        self._optimize_event_dag()
+      state.phase = "prune"
+      state.dag = [ e.label for e in self.dag.input_events ]
+      self._checkpoint()
+    elif state.dag is not None:
+      self.dag = self.dag.input_subset(self.dag.get_events(state.dag))
+
+    if state.phase == "prune":
+      # Invoke delta debugging
+      (dag, total_inputs_pruned) = self._ddmin(self.dag, 2,
+                                               precompute_cache=self._precompute_cache)
+      # Make sure to track the final iteration size
+      self._track_iteration_size(total_inputs_pruned)
+      self.dag = dag
 
-    self._runtime_stats.record_prune_end()
-    self.mcs_log_tracker.dump_runtime_stats()
+      self._runtime_stats.record_prune_end()
+      self.mcs_log_tracker.dump_runtime_stats()
+      state.phase = "final"
+      state.mcs = [ e.label for e in self.dag.input_events ]
+      self._checkpoint()
+    else:
+      self.dag = self.dag.input_subset(self.dag.get_events(state.mcs))
 
     if self.replay_final_trace:
       #  Replaying the final trace achieves two goals:
@@ -240,6 +429,8 @@ class MCSFinder(ControlFlow):
     # since we need to infer which events will time out for events.trace.notimeouts
     if self.mcs_trace_path is not None:
       self.mcs_log_tracker.dump_mcs_trace(self.dag, self)
+    state.phase = "done"
+    self._checkpoint()
     return ExitCode(0)
 
   # N.B. always called by the parent process.
@@ -248,80 +439,246 @@ class MCSFinder(ControlFlow):
     # This is the delta-debugging algorithm from:
     #   http://www.st.cs.uni-saarland.de/papers/tse2002/tse2002.pdf,
     # Section 3.2
-    # TODO(cs): we could do much better if we leverage domain knowledge (e.g.,
-    # start by pruning all LinkFailures, or splitting by nodes rather than
-    # time)
-    if split_ways > len(dag.input_events):
-      self.log("Done")
-      return (dag, total_inputs_pruned)
-
-    local_label = lambda i, inv=False: "%s%d/%d" % ("~" if inv else "", i, split_ways)
-    subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
-    print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
-
-    subsets = split_list(dag.input_events, split_ways)
-    self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s) for i, s in enumerate(subsets)))
-    for i, subset in enumerate(subsets):
-      label = local_label(i)
-      new_dag = dag.input_subset(subset)
-      input_sequence = tuple(new_dag.input_events)
-      self.log("Current subset: %s" % print_subset(label, input_sequence))
-      if precompute_cache.already_done(input_sequence):
-        self.log("Already computed. Skipping")
-        continue
-      precompute_cache.update(input_sequence)
-      if input_sequence == ():
-        self.log("Subset after pruning dependencies was empty. Skipping")
-        continue
+    # Domain knowledge enters through self.partitioner (e.g. splitting by
+    # switch rather than by time).
+    # The algorithm is tail recursive, so we iterate over a single frame
+    # rather than recursing. The frame is part of the checkpointed search
+    # state, which lets a resumed search pick up in the middle of a round.
+    state = self._search_state
+    if state.frames == []:
+      state.frames = [DDMinFrame(dag, split_ways=split_ways,
+                                 label_prefix=label_prefix)]
+      state.total_inputs_pruned = total_inputs_pruned
+    else:
+      state.frames = [ DDMinFrame.from_json(f, self.dag) for f in state.frames ]
+
+    while True:
+      frame = state.frames[-1]
+      (dag, split_ways, label_prefix) = (frame.dag, frame.split_ways, frame.label_prefix)
+      total_inputs_pruned = state.total_inputs_pruned
+      if split_ways > len(dag.input_events):
+        self.log("Done")
+        return (dag, total_inputs_pruned)
+
+      local_label = lambda i, inv=False: "%s%d/%d" % ("~" if inv else "", i, split_ways)
+      subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
+      print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
+
+      subsets = self._partition(frame, dag.input_events, split_ways)
+      if frame.stage is None:
+        self.log("Subsets (by %s):\n" % frame.partitioner +"\n".join(print_subset(local_label(i), s) for i, s in enumerate(subsets)))
+        # N.B. generators, so that views are only computed as they are replayed
+        candidates = ((i, local_label(i), dag.input_subset(subset))
+                      for i, subset in enumerate(subsets)
+                      if i >= frame.next_candidate)
+        winner = self._find_violating_subset(candidates, "subset", precompute_cache,
+                                             subset_label, print_subset,
+                                             total_inputs_pruned, frame)
+        if winner is not None:
+          (i, label, new_dag) = winner
+          self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
+          self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
+                                                           subset_label(label), self)
+
+          self._end_round(frame, len(dag.input_events) - len(new_dag.input_events))
+          state.total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+          state.frames[-1] = DDMinFrame(new_dag, split_ways=2,
+                                        label_prefix=label_prefix + (label, ))
+          self._checkpoint()
+          continue
 
-      self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(new_dag, i, label)
-      if violation:
+        self.log_no_violation("No subsets with violations. Checking complements")
+        frame.stage = "complements"
+        frame.next_candidate = 0
+        self._checkpoint()
+
+      candidates = ((i, local_label(i, True), dag.input_complement(subset))
+                    for i, subset in enumerate(subsets)
+                    if i >= frame.next_candidate)
+      winner = self._find_violating_subset(candidates, "complement", precompute_cache,
+                                           subset_label, print_subset,
+                                           total_inputs_pruned, frame)
+      if winner is not None:
+        (i, label, new_dag) = winner
         self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
         self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
                                                          subset_label(label), self)
+        self._end_round(frame, len(dag.input_events) - len(new_dag.input_events))
+        state.total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+        state.frames[-1] = DDMinFrame(new_dag, split_ways=max(split_ways - 1, 2),
+                                      label_prefix=label_prefix + (label, ))
+        self._checkpoint()
+        continue
 
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        return self._ddmin(new_dag, 2, precompute_cache=precompute_cache,
-                           label_prefix = label_prefix + (label, ),
-                           total_inputs_pruned=total_inputs_pruned)
+      self.log_no_violation("No complements with violations.")
+      self._end_round(frame, 0)
+      if split_ways < len(dag.input_events):
+        self.log("Increasing granularity.")
+        state.frames[-1] = DDMinFrame(dag, split_ways=min(len(dag.input_events), split_ways*2),
+                                      label_prefix=label_prefix)
+        self._checkpoint()
+        continue
+      return (dag, total_inputs_pruned)
+
+  def _partition(self, frame, inputs, split_ways):
+    ''' Split inputs with the partitioner chosen for frame's current round '''
+    if frame.partitioner is None:
+      frame.partitioner = self.partitioner.choose().name
+      frame.round_start_replays = self._runtime_stats.total_replays
+    if self._snapshots is not None:
+      self._snapshot_reference = self._round_dag(frame)
+    return self.partitioner.lookup(frame.partitioner).partition(inputs, split_ways)
 
-    self.log_no_violation("No subsets with violations. Checking complements")
-    for i, subset in enumerate(subsets):
-      label = local_label(i, True)
-      prefix = label_prefix + (label, )
-      new_dag = dag.input_complement(subset)
+  def _round_dag(self, frame):
+    ''' The dag that all of frame's candidates are subsets of '''
+    return frame.dag
+
+  def _end_round(self, frame, inputs_pruned):
+    ''' Tell the partitioner how well frame's round went '''
+    replays = self._runtime_stats.total_replays - frame.round_start_replays
+    self.partitioner.record_outcome(frame.partitioner, inputs_pruned, replays)
+
+  # N.B. always called by the parent process.
+  def _find_violating_subset(self, candidates, kind, precompute_cache,
+                             subset_label, print_subset, total_inputs_pruned,
+                             frame):
+    ''' Given an ordered iterable of (index, label, dag) candidates, return the
+    first candidate that reproduces the violation, or None. '''
+    if frame.winner is not None:
+      # Resumed after the winner's replay, but before we recursed on it.
+      return find(lambda c: c[0] == frame.winner, candidates)
+    if self.max_parallel_replays > 1:
+      return self._parallel_find_violating_subset(candidates, kind, precompute_cache,
+                                                  subset_label, print_subset,
+                                                  total_inputs_pruned)
+    for (i, label, new_dag) in candidates:
       input_sequence = tuple(new_dag.input_events)
-      self.log("Current complement: %s" % print_subset(label, input_sequence))
+      self.log("Current %s: %s" % (kind, print_subset(label, input_sequence)))
       if precompute_cache.already_done(input_sequence):
         self.log("Already computed. Skipping")
+        self._advance_search(i, False)
         continue
       precompute_cache.update(input_sequence)
-
       if input_sequence == ():
-        self.log("Subset %s after pruning dependencies was empty. Skipping", subset_label(label))
+        self.log("Subset %s after pruning dependencies was empty. Skipping" %
+                 subset_label(label))
+        self._advance_search(i, False)
         continue
 
       self._track_iteration_size(total_inputs_pruned)
       violation = self._check_violation(new_dag, i, label)
+      self._advance_search(i, violation)
       if violation:
-        self.log_violation("Subset %s reproduced violation. Subselecting." % subset_label(label))
-        self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag,
-                                                         subset_label(label), self)
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        return self._ddmin(new_dag, max(split_ways - 1, 2),
-                           precompute_cache=precompute_cache,
-                           label_prefix=prefix,
-                           total_inputs_pruned=total_inputs_pruned)
-
-    self.log_no_violation("No complements with violations.")
-    if split_ways < len(dag.input_events):
-      self.log("Increasing granularity.")
-      return self._ddmin(dag, min(len(dag.input_events), split_ways*2),
-                         precompute_cache=precompute_cache,
-                         label_prefix=label_prefix,
-                         total_inputs_pruned=total_inputs_pruned)
-    return (dag, total_inputs_pruned)
+        return (i, label, new_dag)
+    return None
+
+  # N.B. always called by the parent process.
+  def _parallel_find_violating_subset(self, candidates, kind, precompute_cache,
+                                      subset_label, print_subset,
+                                      total_inputs_pruned):
+    ''' Same contract as _find_violating_subset(), but replays up to
+    self.max_parallel_replays candidates at once. Results are consumed in the
+    order that the sequential algorithm would have examined them; replays of
+    candidates after the first violating one are cancelled and ignored. '''
+    candidates = iter(candidates)
+    done_queue = Queue.Queue()
+    # Each worker slot has its own set of controller ports.
+    free_slots = range(self.max_parallel_replays)
+    # SpeculativeReplays, in the order the sequential algorithm examines them
+    window = []
+    exhausted = False
+    try:
+      while True:
+        # Consume finished replays at the head of the window, in order.
+        while window != [] and window[0].finished:
+          speculation = window.pop(0)
+          precompute_cache.update(speculation.input_sequence)
+          self._track_iteration_size(total_inputs_pruned)
+          violation = self._consume_speculative_replay(speculation)
+          self._advance_search(speculation.candidate[0], violation)
+          if violation:
+            return speculation.candidate
+        if exhausted and window == []:
+          return None
+
+        # Speculatively start replays for subsequent candidates.
+        while not exhausted and free_slots != []:
+          try:
+            (i, label, new_dag) = candidates.next()
+          except StopIteration:
+            exhausted = True
+            break
+          input_sequence = tuple(new_dag.input_events)
+          self.log("Current %s: %s" % (kind, print_subset(label, input_sequence)))
+          if (precompute_cache.already_done(input_sequence) or
+              input_sequence in [ s.input_sequence for s in window ]):
+            self.log("Already computed. Skipping")
+            continue
+          if input_sequence == ():
+            precompute_cache.update(input_sequence)
+            self.log("Subset %s after pruning dependencies was empty. Skipping" %
+                     subset_label(label))
+            continue
+          outcome = self._lookup_replay_outcome(new_dag)
+          if outcome is not None:
+            self.log("Outcome of %s already recorded. Skipping replay" % label)
+            speculation = SpeculativeReplay((i, label, new_dag), None)
+            speculation.record_outcome(*outcome)
+          else:
+            speculation = SpeculativeReplay((i, label, new_dag), free_slots.pop(0))
+            self._start_speculative_replay(speculation, done_queue)
+          window.append(speculation)
+
+        if window == [] or window[0].finished:
+          continue
+
+        # Wait for any running replay to return.
+        # N.B. Queue.get() without a timeout can't be interrupted by signals.
+        try:
+          handle = done_queue.get(timeout=0.5)
+        except Queue.Empty:
+          continue
+        speculation = find(lambda s: s.handle is handle, window)
+        speculation.record_iteration(handle.wait())
+        if (not speculation.bug_found and
+            speculation.iterations < self.max_replays_per_subsequence):
+          self._start_speculative_replay(speculation, done_queue)
+        else:
+          speculation.finished = True
+          free_slots.append(speculation.slot)
+          (bug_found, _, timed_out_internal) = speculation.results[-1]
+          self._record_replay_outcome(speculation.candidate[2], bug_found,
+                                      speculation.iterations - 1,
+                                      timed_out_internal)
+    finally:
+      for speculation in window:
+        if speculation.handle is not None:
+          speculation.handle.cancel()
+
+  def _start_speculative_replay(self, speculation, done_queue):
+    (i, label, new_dag) = speculation.candidate
+    if speculation.iterations == 0 and self.transform_dag:
+      log.info("Transforming dag")
+      speculation.replay_dag = self.transform_dag(new_dag)
+    speculation.handle = self._fork_replay(speculation.replay_dag, label,
+                              port_offset=speculation.slot * self.worker_port_stride,
+                              done_queue=done_queue)
+
+  def _consume_speculative_replay(self, speculation):
+    ''' Apply the side effects a sequential replay of this candidate would
+    have had, and return whether it reproduced the violation. '''
+    i = speculation.candidate[0]
+    for _ in range(speculation.replays):
+      self._runtime_stats.record_replay_stats(len(speculation.replay_dag.input_events))
+    for (_, client_runtime_stats, timed_out_internal) in speculation.results:
+      self._merge_replay_result(speculation.replay_dag, client_runtime_stats,
+                                timed_out_internal)
+    if speculation.bug_found:
+      self.log_violation("Violation! Considering %d'th" % i)
+      self._runtime_stats.record_violation_found(speculation.iterations - 1)
+      return True
+    self.log_no_violation("No violation in %d'th..." % i)
+    return False
 
   # N.B. always called by the parent process.
   def _track_iteration_size(self, total_inputs_pruned):
@@ -348,6 +705,14 @@ class MCSFinder(ControlFlow):
 
     Returns a tuple (bug found, 0-indexed iteration at which bug was found)
     '''
+    outcome = self._lookup_replay_outcome(new_dag)
+    if outcome is not None:
+      (bug_found, i, timed_out_internal) = outcome
+      self.log("Outcome of %s already recorded. Skipping replay" % label)
+      new_dag.set_events_as_timed_out(timed_out_internal)
+      return (bug_found, i)
+
+    input_dag = new_dag
     if self.transform_dag:
       log.info("Transforming dag")
       new_dag = self.transform_dag(new_dag)
@@ -358,67 +723,234 @@ class MCSFinder(ControlFlow):
                               ignore_runtime_stats=ignore_runtime_stats)
       if bug_found:
         break
+    self._record_replay_outcome(input_dag, bug_found, i,
+                                [ e.label for e in new_dag.events if e.timed_out ])
     return (bug_found, i)
 
+  def _lookup_replay_outcome(self, new_dag):
+    ''' Return (bug found, iteration, timed out internal event labels) if the
+    outcome of replaying new_dag's inputs was previously recorded, else None '''
+    if self.replay_outcome_cache is None:
+      return None
+    outcome = self.replay_outcome_cache.lookup([ e.label for e in new_dag.input_events ])
+    if outcome is None:
+      return None
+    self._runtime_stats.record_replay_outcome_cache_hit()
+    (bug_found, i, timed_out_internal) = outcome
+    # Internal events inferred by transform_dag are not part of new_dag
+    labels = set(e.label for e in new_dag.events)
+    return (bug_found, i, [ l for l in timed_out_internal if l in labels ])
+
+  def _record_replay_outcome(self, new_dag, bug_found, i, timed_out_internal):
+    if self.replay_outcome_cache is not None:
+      self.replay_outcome_cache.record([ e.label for e in new_dag.input_events ],
+                                       bug_found, i, timed_out_internal)
+
   def replay(self, new_dag, label, ignore_runtime_stats=False):
-    # Run the simulation forward
     self._runtime_stats.record_replay_stats(len(new_dag.input_events))
+    (violation_found, client_runtime_stats,
+                 timed_out_internal) = self._fork_replay(new_dag, label)
+    self._merge_replay_result(new_dag, client_runtime_stats, timed_out_internal,
+                              ignore_runtime_stats=ignore_runtime_stats)
+    return violation_found
 
-    # N.B. this function is run as a child process.
-    def play_forward(results_dir, subsequence_id):
-      # TODO(cs): need to serialize the parameters to Replayer rather than
-      # wrapping them in a closure... otherwise, can't use RemoteForker
-      # TODO(aw): MCSFinder needs to configure Simulation to always let DataplaneEvents pass through
-      create_clean_python_dir(results_dir)
+  def _merge_replay_result(self, new_dag, client_runtime_stats, timed_out_internal,
+                           ignore_runtime_stats=False):
+    new_dag.set_events_as_timed_out(timed_out_internal)
 
-      # Copy stdout and stderr to a file "replay.out"
-      tee = Tee(open(os.path.join(results_dir, "replay.out"), "w"))
-      tee.tee_stdout()
-      tee.tee_stderr()
+    if not ignore_runtime_stats:
+      self._runtime_stats.merge_client_dict(client_runtime_stats)
 
-      # Set up replayer.
-      input_logger = InputLogger()
-      replayer = Replayer(self.simulation_cfg, new_dag,
-                          input_logger=input_logger,
-                          bug_signature=self.bug_signature,
-                          invariant_check_name=self.invariant_check_name,
-                          **self.kwargs)
-      replayer.init_results(results_dir)
-      self._runtime_stats = RuntimeStats(subsequence_id)
-      simulation = None
-      try:
-        simulation = replayer.simulate()
-        self._track_new_internal_events(simulation, replayer)
-      except SystemExit:
-        # One of the invariant checks bailed early. Oddly, this is not an
-        # error for us, it just means that there were no violations...
-        # [this logic is arguably broken]
-        # Return no violations, and let Forker handle system exit for us.
-        simulation.violation_found = False
-      finally:
-        input_logger.close(replayer, self.simulation_cfg, skip_mcs_cfg=True)
-        if simulation is not None:
-          simulation.clean_up()
-        tee.close()
-      if self.strict_assertion_checking:
-        test_serialize_response(violations, self._runtime_stats.client_dict())
-      timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
-      return (simulation.violation_found, self._runtime_stats.client_dict(), timed_out_internal)
-
-    # TODO(cs): once play_forward() is no longer a closure, register it only once
-    self.forker.register_task("play_forward", play_forward)
+  def _fork_replay(self, new_dag, label, port_offset=0, done_queue=None):
+    ''' Replay new_dag in a child process. If done_queue is None, block until
+    the child returns and return its result. Otherwise, return a ForkedTask
+    handle that will be put onto done_queue when the child returns. '''
+    # N.B. callers record the replay in the runtime stats once its result is
+    # used, so cancelled speculative replays aren't counted.
     results_dir = self.replay_log_tracker.get_replay_logger_dir(label)
     self.subsequence_id += 1
-    (violation_found, client_runtime_stats,
-                 timed_out_internal) = self.forker.fork("play_forward",
-                                                        results_dir,
-                                                        self.subsequence_id)
-    new_dag.set_events_as_timed_out(timed_out_internal)
+    if self._snapshots is not None:
+      return self._snapshot_replay(new_dag, results_dir)
+    args = (results_dir, self.subsequence_id, port_offset) + self._replay_args(new_dag)
+    if done_queue is None:
+      return self.forker.fork("play_forward", *args)
+    return self.forker.fork_async("play_forward", args, done_queue=done_queue)
 
-    if not ignore_runtime_stats:
-      self._runtime_stats.merge_client_dict(client_runtime_stats)
+  # N.B. always called by the parent process.
+  def _replay_args(self, new_dag):
+    ''' Return the arguments to play_forward() that describe new_dag '''
+    return (self._event_tokens(new_dag),
+            [ e.label for e in new_dag.events if e.timed_out ])
 
-    return violation_found
+  # N.B. always called by the parent process.
+  def _event_tokens(self, new_dag):
+    ''' Return the tokens by which children look up new_dag's events '''
+    # Children look up the events by token, since they may have been fork()ed
+    # before new_dag existed. Pre-forked children don't know about events added
+    # since they were forked (e.g. by the peeker, or by rewriting migrations),
+    # so discard them.
+    tokens = []
+    new_events = False
+    for e in new_dag.events:
+      token = self._event2token.get(id(e))
+      if token is None:
+        token = e.label
+        suffix = 0
+        while token in self._token2event:
+          suffix += 1
+          token = "%s#%d" % (e.label, suffix)
+        # N.B. holding on to e keeps its id() from being reused
+        self._token2event[token] = e
+        self._event2token[id(e)] = token
+        new_events = True
+      tokens.append(token)
+    if new_events:
+      self.forker.close_pool()
+    return tokens
+
+  # N.B. always called within a child process.
+  def play_forward(self, results_dir, subsequence_id, port_offset, tokens,
+                   timed_out_labels, snapshot_index=None, snapshot_path=None):
+    ''' Replay the events with the given tokens (see _event_tokens()). Return
+    whether the violation was found, the runtime stats, and the labels of the
+    events that timed out '''
+    new_dag = EventDag([ self._token2event[token] for token in tokens ])
+    new_dag.set_events_as_timed_out(timed_out_labels)
+    # TODO(aw): MCSFinder needs to configure Simulation to always let DataplaneEvents pass through
+    create_clean_python_dir(results_dir)
+    # Concurrent replays each need their own controller ports.
+    for controller_config in self.simulation_cfg.controller_configs:
+      controller_config.shift_ports(port_offset)
+
+    # Copy stdout and stderr to a file "replay.out"
+    tee = Tee(open(os.path.join(results_dir, "replay.out"), "w"))
+    tee.tee_stdout()
+    tee.tee_stderr()
+
+    # Set up replayer.
+    input_logger = InputLogger()
+    replayer = Replayer(self.simulation_cfg, new_dag,
+                        input_logger=input_logger,
+                        bug_signature=self.bug_signature,
+                        invariant_check_name=self.invariant_check_name,
+                        **self.kwargs)
+    replayer.init_results(results_dir)
+    self._runtime_stats = RuntimeStats(subsequence_id)
+    snapshot = None
+    if snapshot_index is not None:
+      snapshot = self._replay_snapshot(replayer, snapshot_index, snapshot_path,
+                                       input_logger, tee)
+    simulation = None
+    try:
+      simulation = replayer.simulate()
+      self._track_new_internal_events(simulation, replayer)
+    except SystemExit:
+      # One of the invariant checks bailed early. Oddly, this is not an
+      # error for us, it just means that there were no violations...
+      # [this logic is arguably broken]
+      # Return no violations, and let Forker handle system exit for us.
+      simulation.violation_found = False
+    finally:
+      input_logger.close(replayer, self.simulation_cfg, skip_mcs_cfg=True)
+      if simulation is not None:
+        simulation.clean_up()
+      tee.close()
+    if self.strict_assertion_checking:
+      test_serialize_response(simulation.violation_found, self._runtime_stats.client_dict())
+    if snapshot is not None and snapshot.resumed:
+      # We are a snapshot of an earlier replay, resumed with other events
+      timed_out_internal = [ e.label for e in replayer.dag.events if e.timed_out ]
+      snapshot.reply((simulation.violation_found, self._runtime_stats.client_dict(),
+                      timed_out_internal))
+    timed_out_internal = [ e.label for e in new_dag.events if e.timed_out ]
+    return (simulation.violation_found, self._runtime_stats.client_dict(), timed_out_internal)
+
+  # N.B. always called by the parent process.
+  def _snapshot_replay(self, new_dag, results_dir):
+    ''' Replay new_dag, resuming from the snapshot with the longest prefix of
+    new_dag's events if there is one, and taking a new snapshot along the
+    way '''
+    # Snapshots are keyed by tokens rather than labels, so that a snapshot
+    # isn't resumed for a prefix whose migrations have since been rewritten.
+    (tokens, timed_out_labels) = self._replay_args(new_dag)
+    (resume_index, snapshot_path) = self._snapshots.pop_longest_prefix(tokens)
+    snapshot_index = self._snapshot_index(new_dag, resume_index)
+    new_snapshot_path = None
+    if snapshot_index is not None:
+      self._snapshot_count += 1
+      new_snapshot_path = os.path.join(self._snapshot_dir,
+                                       "%d.sock" % self._snapshot_count)
+
+    result = None
+    if snapshot_path is not None:
+      self.log("Resuming replay from snapshot at event %d of %d" %
+               (resume_index, len(tokens)))
+      request = { "command" : "resume", "events" : [ e.to_json() for e in new_dag.events ],
+                  "results_dir" : results_dir, "subsequence_id" : self.subsequence_id,
+                  "snapshot_index" : snapshot_index,
+                  "snapshot_path" : new_snapshot_path }
+      try:
+        result = tuple(request_replay_snapshot(snapshot_path, request))
+        self._runtime_stats.record_snapshot_resume(
+          len([ e for e in new_dag.events[:resume_index] if isinstance(e, InputEvent) ]))
+      except (socket.error, ValueError) as e:
+        log.warn("Could not resume snapshot %s: %s. Replaying from the start" %
+                 (snapshot_path, e))
+        if snapshot_index is not None:
+          # The failed snapshot may have got as far as taking its own snapshot
+          self._snapshot_count += 1
+          new_snapshot_path = os.path.join(self._snapshot_dir,
+                                           "%d.sock" % self._snapshot_count)
+    if result is None:
+      result = self.forker.fork("play_forward", results_dir, self.subsequence_id,
+                                0, tokens, timed_out_labels, snapshot_index,
+                                new_snapshot_path)
+    if new_snapshot_path is not None and os.path.exists(new_snapshot_path):
+      self._snapshots.insert(tokens[:snapshot_index], new_snapshot_path)
+    return result
+
+  def _snapshot_index(self, new_dag, resume_index):
+    ''' Return the index of the input event in new_dag at which its replay
+    should snapshot itself, or None. That is the last input boundary that
+    new_dag shares with the dag of the current round, since later candidates
+    of the round tend to share it too. Failing that, resume_index, so that
+    the snapshot being resumed is replaced. '''
+    index = resume_index
+    reference = self._snapshot_reference
+    if reference is not None:
+      for i in xrange(1, min(len(new_dag.events), len(reference.events))):
+        if new_dag.events[i-1] is not reference.events[i-1]:
+          break
+        if isinstance(new_dag.events[i], InputEvent) and i > index:
+          index = i
+    if index == 0:
+      return None
+    return index
+
+  # N.B. always called within a child process.
+  def _replay_snapshot(self, replayer, snapshot_index, snapshot_path, input_logger, tee):
+    ''' Have replayer snapshot itself at the input with index snapshot_index,
+    and set up the resumed copies of the replay to log to their own results
+    directory '''
+    trace_offset = [0]
+    def prepare_fork():
+      input_logger.output.flush()
+      trace_offset[0] = input_logger.output.tell()
+
+    def resume(request):
+      results_dir = str(request["results_dir"])
+      trace_path = input_logger.output_path
+      create_clean_python_dir(results_dir)
+      tee.target = open(os.path.join(results_dir, "replay.out"), "w")
+      replayer.init_results(results_dir)
+      # Start the events.trace with the events logged before the snapshot
+      with open(trace_path) as trace:
+        input_logger.output.write(trace.read(trace_offset[0]))
+      self._runtime_stats = RuntimeStats(request["subsequence_id"])
+
+    # N.B. our parent is the MCSFinder process
+    return ReplaySnapshot(replayer, snapshot_index, snapshot_path, os.getppid(),
+                          prepare_fork=prepare_fork, resume=resume)
 
   def _optimize_event_dag(self):
     ''' Employs domain knowledge of event classes to reduce the size of event
@@ -479,6 +1011,11 @@ class EfficientMCSFinder(MCSFinder):
      http://www.st.cs.uni-saarland.de/publications/files/zeller-esec-1999.pdf
   Section 4
   '''
+  def _round_dag(self, frame):
+    if len(frame.carryover) == 0:
+      return frame.dag
+    return frame.dag.insert_atomic_inputs(frame.carryover)
+
   # N.B. always called within a child process.
   def _ddmin(self, dag, carryover_inputs, precompute_cache=None,
              recursion_level=0, label_prefix=(), total_inputs_pruned=0):
@@ -488,64 +1025,248 @@ class EfficientMCSFinder(MCSFinder):
     if type(carryover_inputs) == int:
       carryover_inputs = []
 
-    local_label = lambda i: "%s/%d" % ("l" if i == 0 else "r", recursion_level)
-    subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
-    print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
+    # The recursion is unrolled onto an explicit stack of frames, which is
+    # checkpointed along with the rest of the search state. A frame in stage
+    # None is testing its two halves; "left" and "right" are waiting on the
+    # recursive calls made after interference.
+    state = self._search_state
+    if state.frames == []:
+      state.frames = [DDMinFrame(dag, carryover=carryover_inputs,
+                                 recursion_level=recursion_level,
+                                 label_prefix=label_prefix)]
+      state.total_inputs_pruned = total_inputs_pruned
+    else:
+      state.frames = [ DDMinFrame.from_json(f, self.dag, atomic=True)
+                       for f in state.frames ]
+
+    # The result of the most recently returned frame
+    result = None
+    while True:
+      frame = state.frames[-1]
+      (dag, carryover_inputs, recursion_level, label_prefix) = \
+        (frame.dag, frame.carryover, frame.recursion_level, frame.label_prefix)
+      if len(dag.atomic_input_events) > 1:
+        (left, right) = self._partition(frame, dag.atomic_input_events, 2)
+
+      if result is not None:
+        if frame.stage == "left":
+          frame.left_result = result
+          frame.stage = "right"
+          result = None
+          self.log("Recursing on right half")
+          left_dag = dag.atomic_input_subset(left)
+          state.frames.append(DDMinFrame(dag.atomic_input_subset(right),
+                                carryover=left_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
+                                recursion_level=recursion_level+1,
+                                label_prefix=label_prefix + ("ir/%d" % recursion_level,)))
+          self._checkpoint()
+        else:
+          result = frame.left_result.insert_atomic_inputs(result.atomic_input_events)
+          state.frames.pop()
+          if state.frames == []:
+            return (result, state.total_inputs_pruned)
+        continue
 
-    # Base case. Note that atomic_inputs are grouped-together failure/recovery
-    # pairs, or normal inputs otherwise.
-    if len(dag.atomic_input_events) == 1:
-      self.log("Base case %s" % str(dag.input_events))
-      return (dag, total_inputs_pruned)
+      local_label = lambda i: "%s/%d" % ("l" if i == 0 else "r", recursion_level)
+      subset_label = lambda label: ".".join(map(str, label_prefix + ( label, )))
+      print_subset = lambda label, s: subset_label(label) + ": "+" ".join(map(lambda e: e.label, s))
+
+      # Base case. Note that atomic_inputs are grouped-together failure/recovery
+      # pairs, or normal inputs otherwise.
+      if len(dag.atomic_input_events) == 1:
+        self.log("Base case %s" % str(dag.input_events))
+        result = dag
+        state.frames.pop()
+        if state.frames == []:
+          return (result, state.total_inputs_pruned)
+        continue
 
-    (left, right) = split_list(dag.atomic_input_events, 2)
-    self.log("Subsets:\n"+"\n".join(print_subset(local_label(i), s)
-                                    for i, s in enumerate([left,right])))
-    # This is: [dag.input_subset(left), dag.input_subset(right)]
-    left_right_dag = []
-
-    for i, subsequence in enumerate([left, right]):
-      label = local_label(i)
-      prefix = label_prefix + (label, )
-      new_dag = dag.atomic_input_subset(subsequence)
-      self.log("Current subset: %s" % print_subset(label,
-                                                   new_dag.atomic_input_events))
-      left_right_dag.append(new_dag)
-      # We test on subsequence U carryover_inputs
-      test_dag = new_dag.insert_atomic_inputs(carryover_inputs)
-      self._track_iteration_size(total_inputs_pruned)
-      violation = self._check_violation(test_dag, i, label)
-      if violation:
-        self.log("Violation found in %dth half. Recursing" % i)
-        total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
-        self.mcs_log_tracker.maybe_dump_intermediate_mcs(total_inputs_pruned, new_dag, "", self)
-        return self._ddmin(new_dag, carryover_inputs,
-                           recursion_level=recursion_level+1,
-                           label_prefix=prefix,
-                           total_inputs_pruned=total_inputs_pruned)
-
-    self.log("Interference")
-    (left_dag, right_dag) = left_right_dag
-    self.log("Recursing on left half")
-    prefix = label_prefix + ("il/%d" % recursion_level,)
-    (left_result,
-     total_inputs_pruned) = self._ddmin(left_dag,
-                                        right_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
-                                        recursion_level=recursion_level+1,
-                                        label_prefix=prefix,
-                                        total_inputs_pruned=total_inputs_pruned)
-    self.log("Recursing on right half")
-    prefix = label_prefix + ("ir/%d" % recursion_level,)
-    (right_result,
-     total_inputs_pruned) = self._ddmin(right_dag,
-                                        left_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
+      self.log("Subsets (by %s):\n" % frame.partitioner +
+               "\n".join(print_subset(local_label(i), s)
+                         for i, s in enumerate([left,right])))
+      for i, subsequence in enumerate([left, right]):
+        if i < frame.next_candidate:
+          continue
+        label = local_label(i)
+        prefix = label_prefix + (label, )
+        new_dag = dag.atomic_input_subset(subsequence)
+        self.log("Current subset: %s" % print_subset(label,
+                                                     new_dag.atomic_input_events))
+        if frame.winner == i:
+          # Resumed after this half's replay, but before we recursed on it.
+          violation = True
+        else:
+          # We test on subsequence U carryover_inputs
+          test_dag = new_dag.insert_atomic_inputs(carryover_inputs)
+          self._track_iteration_size(state.total_inputs_pruned)
+          violation = self._check_violation(test_dag, i, label)
+          self._advance_search(i, violation)
+        if violation:
+          self.log("Violation found in %dth half. Recursing" % i)
+          self._end_round(frame, len(dag.input_events) - len(new_dag.input_events))
+          state.total_inputs_pruned += len(dag.input_events) - len(new_dag.input_events)
+          self.mcs_log_tracker.maybe_dump_intermediate_mcs(state.total_inputs_pruned,
+                                                           new_dag, "", self)
+          state.frames[-1] = DDMinFrame(new_dag, carryover=carryover_inputs,
                                         recursion_level=recursion_level+1,
-                                        label_prefix=prefix,
-                                        total_inputs_pruned=total_inputs_pruned)
-
-    return (left_result.insert_atomic_inputs(right_result.atomic_input_events),
-            total_inputs_pruned)
-
+                                        label_prefix=prefix)
+          self._checkpoint()
+          break
+      else:
+        self.log("Interference")
+        self._end_round(frame, 0)
+        self.log("Recursing on left half")
+        frame.stage = "left"
+        right_dag = dag.atomic_input_subset(right)
+        state.frames.append(DDMinFrame(dag.atomic_input_subset(left),
+                              carryover=right_dag.insert_atomic_inputs(carryover_inputs).atomic_input_events,
+                              recursion_level=recursion_level+1,
+                              label_prefix=label_prefix + ("il/%d" % recursion_level,)))
+        self._checkpoint()
+
+
+class DDMinFrame(object):
+  ''' One (unrolled) invocation of _ddmin '''
+  def __init__(self, dag, split_ways=2, carryover=(), recursion_level=0,
+               label_prefix=(), stage=None, next_candidate=0, winner=None,
+               left_result=None, partitioner=None, round_start_replays=0):
+    self.dag = dag
+    # MCSFinder: the granularity n
+    self.split_ways = split_ways
+    # EfficientMCSFinder: atomic inputs "r"
+    self.carryover = list(carryover)
+    self.recursion_level = recursion_level
+    self.label_prefix = tuple(label_prefix)
+    # None while testing the first set of candidates. Then
+    # MCSFinder: "complements".
+    # EfficientMCSFinder: "left" or "right".
+    self.stage = stage
+    # Index of the next candidate to test in this stage
+    self.next_candidate = next_candidate
+    # Index of the candidate that reproduced the violation, if any
+    self.winner = winner
+    # EfficientMCSFinder: result of the recursion on the left half
+    self.left_result = left_result
+    # Name of the partitioner chosen for this round, and the number of
+    # replays when the round started
+    self.partitioner = partitioner
+    self.round_start_replays = round_start_replays
+
+  def to_json(self):
+    ''' Dags are stored as the labels of their input events '''
+    labels = lambda dag: [ e.label for e in dag.input_events ]
+    return {
+      "dag" : labels(self.dag),
+      "split_ways" : self.split_ways,
+      "carryover" : [ e.label for e in expand_atomic_inputs(self.carryover) ],
+      "recursion_level" : self.recursion_level,
+      "label_prefix" : list(self.label_prefix),
+      "stage" : self.stage,
+      "next_candidate" : self.next_candidate,
+      "winner" : self.winner,
+      "left_result" : (None if self.left_result is None
+                       else labels(self.left_result)),
+      "partitioner" : self.partitioner,
+      "round_start_replays" : self.round_start_replays,
+    }
+
+  @staticmethod
+  def from_json(json_hash, root, atomic=False):
+    ''' Rebuild the frame's dags as views of root '''
+    if atomic:
+      subset = lambda labels: root.atomic_input_subset(root.get_events(labels))
+    else:
+      subset = lambda labels: root.input_subset(root.get_events(labels))
+    carryover = []
+    if json_hash["carryover"] != []:
+      carryover = subset(json_hash["carryover"]).atomic_input_events
+    left_result = None
+    if json_hash["left_result"] is not None:
+      left_result = subset(json_hash["left_result"])
+    return DDMinFrame(subset(json_hash["dag"]),
+                      split_ways=json_hash["split_ways"],
+                      carryover=carryover,
+                      recursion_level=json_hash["recursion_level"],
+                      label_prefix=json_hash["label_prefix"],
+                      stage=json_hash["stage"],
+                      next_candidate=json_hash["next_candidate"],
+                      winner=json_hash["winner"],
+                      left_result=left_result,
+                      partitioner=json_hash["partitioner"],
+                      round_start_replays=json_hash["round_start_replays"])
+
+class MCSSearchState(object):
+  ''' Everything needed to resume an interrupted MCS search '''
+  def __init__(self):
+    # "reproducibility", "optimize", "prune", "final", or "done"
+    self.phase = "reproducibility"
+    # Input labels of the dag after _optimize_event_dag
+    self.dag = None
+    # DDMinFrames (or their json representation, until _ddmin restores them)
+    self.frames = []
+    self.total_inputs_pruned = 0
+    # Input sequences (as labels) already tested by delta debugging
+    self.done_sequences = []
+    # Input labels of the MCS, once pruning is complete
+    self.mcs = None
+    self.counters = {}
+    self.runtime_stats = {}
+
+  def dump(self, path):
+    json_hash = dict(self.__dict__)
+    json_hash["frames"] = [ f.to_json() if isinstance(f, DDMinFrame) else f
+                            for f in self.frames ]
+    # Write atomically, so that a crash mid-dump doesn't lose the checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as output:
+      json.dump(json_hash, output)
+    os.rename(tmp_path, path)
+
+  @staticmethod
+  def load(path):
+    with open(path) as input_file:
+      json_hash = json.load(input_file)
+    state = MCSSearchState()
+    state.__dict__.update(json_hash)
+    return state
+
+class SpeculativeReplay(object):
+  ''' Tracks the (possibly repeated) replays of one delta debugging candidate
+  in MCSFinder's parallel mode '''
+  def __init__(self, candidate, slot):
+    # (index, label, dag)
+    self.candidate = candidate
+    self.input_sequence = tuple(candidate[2].input_events)
+    # The dag actually replayed (after MCSFinder.transform_dag, if any)
+    self.replay_dag = candidate[2]
+    # Worker slot, which determines the controller ports
+    self.slot = slot
+    self.handle = None
+    # [(violation_found, client_runtime_stats, timed_out_internal)], one per replay
+    self.results = []
+    # Number of results that came from actual replays, rather than from a
+    # previously recorded outcome
+    self.replays = 0
+    self.finished = False
+
+  @property
+  def iterations(self):
+    return len(self.results)
+
+  @property
+  def bug_found(self):
+    return self.results != [] and self.results[-1][0]
+
+  def record_iteration(self, result):
+    self.results.append(tuple(result))
+    self.replays += 1
+    self.handle = None
+
+  def record_outcome(self, bug_found, iteration, timed_out_internal):
+    ''' Fill in a previously recorded outcome rather than replaying '''
+    self.results = ([(False, {}, [])] * iteration +
+                    [(bug_found, {}, timed_out_internal)])
+    self.finished = True
 
 class ReplayLogTracker(object):
   ''' Logs intermediate and final replay traces chosen by delta debugging'''
@@ -657,6 +1378,10 @@ class RuntimeStats(object):
     self.config = ""
     self.total_replays = 0
     self.total_inputs_replayed = 0
+    self.replay_outcome_cache_hits = 0
+    self.snapshot_resumes = 0
+    # Input events that did not have to be replayed thanks to snapshots
+    self.snapshot_inputs_skipped = 0
     # { % of inferred fingerprints that were ambiguous ->
     #   # of replays where this % occurred }
     self.ambiguous_counts = {}
@@ -732,6 +1457,13 @@ class RuntimeStats(object):
     self.total_replays += 1
     self.total_inputs_replayed += number_inputs_replayed
 
+  def record_replay_outcome_cache_hit(self):
+    self.replay_outcome_cache_hits += 1
+
+  def record_snapshot_resume(self, inputs_skipped):
+    self.snapshot_resumes += 1
+    self.snapshot_inputs_skipped += inputs_skipped
+
   def record_iteration_size(self, iteration_size):
     self.iteration_size[self._iteration] = iteration_size
     self._iteration += 1
@@ -766,7 +1498,7 @@ class RuntimeStats(object):
     d = {}
     for field in RuntimeStats.child_fields:
       v = getattr(self, field)
-      # xmlrpclib doesn't allow non-string keys
+      # Children only send plain dicts with string keys
       if type(v) == Counter:
         v = dict(v)
       if type(v) == dict:
@@ -0,0 +1,208 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Strategies for splitting a sequence of inputs into the subsets that delta
+debugging tests.
+
+Splitting by time (split_list) ignores the structure of the network. If the
+inputs that matter all touch the same switch (or link, host, controller),
+grouping inputs by that entity lets ddmin discard whole unrelated groups in a
+single replay.
+'''
+
+from sts.event_dag import split_list, AtomicInput
+
+from collections import OrderedDict
+import logging
+log = logging.getLogger("partitioners")
+
+class Partitioner(object):
+  ''' Splits a list of inputs into split_ways disjoint, non-empty subsets.
+
+  Pre: 1 <= split_ways <= len(inputs). Each subset preserves the relative
+  order of the inputs. If split_ways == len(inputs), every subset is a
+  singleton (delta debugging relies on this to guarantee 1-minimality). '''
+  name = None
+
+  def partition(self, inputs, split_ways):
+    raise NotImplementedError()
+
+  def record_outcome(self, name, inputs_pruned, replays):
+    ''' Feedback from delta debugging after a round that used this
+    partitioner '''
+    pass
+
+  def choose(self):
+    ''' Return the partitioner to use for the next round '''
+    return self
+
+  def lookup(self, name):
+    ''' Return the partitioner previously returned by choose() with the given
+    name '''
+    if name != self.name:
+      raise ValueError("Unknown partitioner %s" % name)
+    return self
+
+class TimePartitioner(Partitioner):
+  ''' Contiguous chunks of the input sequence (the default) '''
+  name = "time"
+
+  def partition(self, inputs, split_ways):
+    return split_list(inputs, split_ways)
+
+class KeyPartitioner(Partitioner):
+  ''' Groups inputs that share the same key(). Groups are packed into
+  split_ways subsets, and the largest groups are split by time when there are
+  fewer groups than split_ways. Inputs without a key form one group. '''
+  def key(self, event):
+    raise NotImplementedError()
+
+  def partition(self, inputs, split_ways):
+    if split_ways < 1:
+      raise ValueError("Split ways must be greater than 0")
+    index = { e : i for i, e in enumerate(inputs) }
+    key2group = OrderedDict()
+    for e in inputs:
+      if type(e) == AtomicInput:
+        key = self.key(e.failure)
+      else:
+        key = self.key(e)
+      key2group.setdefault(key, []).append(e)
+    groups = key2group.values()
+
+    # Not enough groups: split the largest by time
+    while len(groups) < split_ways:
+      largest = max(groups, key=len)
+      if len(largest) == 1:
+        break
+      groups.remove(largest)
+      groups += split_list(largest, 2)
+
+    # Too many groups: greedily add the largest remaining group to the
+    # smallest subset
+    subsets = [ [] for _ in range(split_ways) ]
+    for group in sorted(groups, key=lambda g: (-len(g), index[g[0]])):
+      min(subsets, key=len).extend(group)
+
+    subsets = [ sorted(s, key=lambda e: index[e]) for s in subsets if s != [] ]
+    # Keep the subsets in the order of their first input
+    return sorted(subsets, key=lambda s: index[s[0]])
+
+def first_attribute(event, attributes):
+  for attribute in attributes:
+    value = getattr(event, attribute, None)
+    if value is not None:
+      return value
+  return None
+
+class SwitchPartitioner(KeyPartitioner):
+  ''' Groups inputs by the (first) dpid they affect '''
+  name = "switch"
+  dpid_attributes = ["dpid", "start_dpid", "old_ingress_dpid", "src_dpid"]
+
+  def key(self, event):
+    return first_attribute(event, self.dpid_attributes)
+
+class LinkPartitioner(KeyPartitioner):
+  ''' Groups link failures and recoveries by the link's endpoints '''
+  name = "link"
+
+  def key(self, event):
+    if getattr(event, "start_dpid", None) is None:
+      return None
+    return tuple(sorted([(event.start_dpid, event.start_port_no),
+                         (event.end_dpid, event.end_port_no)]))
+
+class HostPartitioner(KeyPartitioner):
+  ''' Groups inputs by host_id '''
+  name = "host"
+
+  def key(self, event):
+    return getattr(event, "host_id", None)
+
+class ControllerPartitioner(KeyPartitioner):
+  ''' Groups inputs by the controller they affect '''
+  name = "controller"
+  controller_attributes = ["controller_id", "cid", "cid1"]
+
+  def key(self, event):
+    return first_attribute(event, self.controller_attributes)
+
+class EventTypePartitioner(KeyPartitioner):
+  ''' Groups inputs by their class '''
+  name = "event_type"
+
+  def key(self, event):
+    return type(event).__name__
+
+class AdaptivePartitioner(Partitioner):
+  ''' Picks among several partitioners, favouring the one that has pruned the
+  most inputs per replay so far. Each partitioner is tried once before any is
+  favoured. '''
+  name = "adaptive"
+
+  def __init__(self, partitioners=None):
+    if partitioners is None:
+      partitioners = [ cls() for cls in [TimePartitioner, SwitchPartitioner,
+                                         LinkPartitioner, HostPartitioner,
+                                         ControllerPartitioner,
+                                         EventTypePartitioner] ]
+    self.partitioners = OrderedDict((p.name, p) for p in partitioners)
+    # { name -> [rounds, total inputs pruned, total replays] }
+    self.stats = { name : [0, 0, 0] for name in self.partitioners.keys() }
+
+  def partition(self, inputs, split_ways):
+    return self.choose().partition(inputs, split_ways)
+
+  def inputs_pruned_per_replay(self, name):
+    (_, inputs_pruned, replays) = self.stats[name]
+    # Rounds that cost no replays (e.g. all outcomes were cached) are free
+    return float(inputs_pruned) / max(replays, 1)
+
+  def choose(self):
+    for name in self.partitioners.keys():
+      if self.stats[name][0] == 0:
+        return self.partitioners[name]
+    # N.B. max() returns the first maximal element, so ties favour the order
+    # of self.partitioners
+    name = max(self.partitioners.keys(), key=self.inputs_pruned_per_replay)
+    return self.partitioners[name]
+
+  def lookup(self, name):
+    return self.partitioners[name]
+
+  def record_outcome(self, name, inputs_pruned, replays):
+    stats = self.stats[name]
+    stats[0] += 1
+    stats[1] += inputs_pruned
+    stats[2] += replays
+    log.debug("Partitioner %s: %d inputs pruned in %d replays over %d rounds" %
+              (name, stats[1], stats[2], stats[0]))
+
+name_to_partitioner = {
+  cls.name : cls
+  for cls in [TimePartitioner, SwitchPartitioner, LinkPartitioner,
+              HostPartitioner, ControllerPartitioner, EventTypePartitioner,
+              AdaptivePartitioner]
+}
+
+def get_partitioner(partitioner):
+  ''' Accepts either a Partitioner or a key of name_to_partitioner '''
+  if isinstance(partitioner, Partitioner):
+    return partitioner
+  if partitioner not in name_to_partitioner:
+    raise ValueError("Unknown partitioner %s. Choose from %s" %
+                     (partitioner, name_to_partitioner.keys()))
+  return name_to_partitioner[partitioner]()
@@ -25,6 +25,7 @@ from sts.control_flow.base import ReplaySyncCallback
 from sts.control_flow.snapshot_utils import *
 from sts.replay_event import InternalEvent, NOPInput
 from sts.util.rpc_forker import LocalForker
+from sts.util.precompute_cache import PersistentPrefixTrie
 from sts.util.convenience import find
 from sts.input_traces.log_parser import parse
 
@@ -84,7 +85,10 @@ class SnapshotPeeker(Peeker):
     super(SnapshotPeeker, self).__init__(simulation_cfg,
                                          default_wait_time_seconds=default_wait_time_seconds,
                                          epsilon_time=epsilon_time)
-    self.forker = LocalForker()
+    # N.B. no pool of pre-forked children: play_forward_and_marshal() runs
+    # against the simulation as it is at the time of the fork, so each child
+    # must be fork()ed at that point.
+    self.forker = LocalForker(pool_size=0)
     if 'default_dp_permit' in kwargs and not kwargs['default_dp_permit']:
       raise ValueError('''Non-default DP Permit not currently supported '''
                        '''Please implement the TODO near the sleep() call '''
@@ -244,24 +248,28 @@ class SnapshotPeeker(Peeker):
 class PrefixPeeker(Peeker):
   ''' O(n^2) peeker that replays each prefix of the subseqeuence from the beginning. '''
   def __init__(self, simulation_cfg, default_wait_time_seconds=0.05,
-               epsilon_time=0.05):
+               epsilon_time=0.05, prefix_trie_path=None):
+    '''
+    If prefix_trie_path is given, the prefix trie is also kept in that file.
+    Any process peeking the same trace with the same parameters, including
+    forked replays and later MCS runs, then reuses the events inferred so far.
+    '''
     super(PrefixPeeker, self).__init__(simulation_cfg,
                                        default_wait_time_seconds=default_wait_time_seconds,
                                        epsilon_time=epsilon_time)
-    try:
-      import pytrie
-    except ImportError:
-      raise RuntimeError("Need to install pytrie: `sudo pip install pytrie`")
-    # The prefix trie stores lists of input events as keys,
-    # and lists of both input and internal events as values
+    # The prefix trie stores labels of input events as keys,
+    # and labels of both input and internal events as values
     # Note that we pass the trie around between DAG views
-    self._prefix_trie = pytrie.Trie()
+    self._prefix_trie = PersistentPrefixTrie(prefix_trie_path)
+
+  def _trie_namespace(self, dag):
+    ''' Inferred events are only valid for the same trace and wait times '''
+    return "%s %r %r" % (dag.trace_digest(), self.default_wait_time_seconds,
+                         self.epsilon_time)
 
   def peek(self, dag):
     ''' Infer which internal events are/aren't going to occur (for the entire
     sequence of input events in dag)'''
-    # TODO(cs): optimization: write the prefix trie to a file, in case we want to run
-    # FindMCS again?
     if len(dag.input_events) == 0:
       # Postcondition: input_events[-1] is not None
       #                and self._events_list[-1] is not None
@@ -276,19 +284,19 @@ class PrefixPeeker(Peeker):
 
     # Initilize current_input_prefix to the longest_match prefix we've
     # inferred previously (or [] if this is an entirely new prefix)
-    current_input_prefix = list(self._prefix_trie\
-                                .longest_prefix(input_events, default=[]))
-    log.debug("Current input prefix: %s" % str(current_input_prefix))
-
     # The value is both internal events and input events (values of the trie)
     # leading up, but not including the next input following the tail of the
     # prefix.
     # Note that we assume that there are no internal events before the first
     # input event (i.e. we assume quiescence)
-    inferred_events = list(self._prefix_trie\
-                           .longest_prefix_value(input_events, default=[]))
+    namespace = self._trie_namespace(dag)
+    (prefix_length, inferred_labels) = \
+      self._prefix_trie.longest_prefix(namespace, [ e.label for e in input_events ])
+    current_input_prefix = input_events[:prefix_length]
+    log.debug("Current input prefix: %s" % str(current_input_prefix))
+    inferred_events = get_inferred_events(dag, inferred_labels)
     log.debug("Current inferred_events: %s" % str(inferred_events))
-    inject_input_idx = len(current_input_prefix)
+    inject_input_idx = prefix_length
 
     # While we still have inputs to inject
     while inject_input_idx < len(input_events):
@@ -319,7 +327,7 @@ class PrefixPeeker(Peeker):
         newly_inferred_events = match_and_filter(found_events, expected_internal_events)
 
       (current_input_prefix,
-       inferred_events) = self._update_trie(current_input_prefix, inject_input,
+       inferred_events) = self._update_trie(namespace, current_input_prefix, inject_input,
                                             inferred_events, newly_inferred_events)
       inject_input_idx += 1
 
@@ -334,18 +342,31 @@ class PrefixPeeker(Peeker):
     newly_inferred_events = play_forward(simulation, inject_input, wait_time_seconds)
     return newly_inferred_events
 
-  def _update_trie(self, current_input_prefix, inject_input, inferred_events,
-                   newly_inferred_events):
+  def _update_trie(self, namespace, current_input_prefix, inject_input,
+                   inferred_events, newly_inferred_events):
     ''' Update the trie for this prefix '''
+    # Make sure to prepend the input we just injected
+    new_events = [inject_input] + list(newly_inferred_events)
+    self._prefix_trie.insert(namespace, [ e.label for e in current_input_prefix ],
+                             inject_input.label, [ e.label for e in new_events ])
     current_input_prefix = list(current_input_prefix)
     current_input_prefix.append(inject_input)
-    # Make sure to prepend the input we just injected
     inferred_events = list(inferred_events)
-    inferred_events.append(inject_input)
-    inferred_events += newly_inferred_events
-    self._prefix_trie[current_input_prefix] = inferred_events
+    inferred_events += new_events
     return (current_input_prefix, inferred_events)
 
+def get_inferred_events(dag, labels):
+  ''' Return the events with the given labels. Events in dag take precedence,
+  since dag may have rewritten host migrations (see
+  EventDag.update_migrations). The other inferred events need not be in dag,
+  but they are in its original trace. '''
+  if labels == []:
+    return []
+  label2event = { e.label : e for e in dag.events }
+  return [ label2event[label] if label in label2event
+           else dag.get_events([label])[0]
+           for label in labels ]
+
 def get_inject_input(inject_input_idx, input_events):
   ''' Return the input at inject_input_index, or None if
   index is negative'''
@@ -21,7 +21,7 @@ control flow for running the simulation forward.
 
 from sts.replay_event import InvariantViolation
 from sts.control_flow.interactive import Interactive
-from sts.control_flow.event_scheduler import EventScheduler
+from sts.control_flow.event_scheduler import EventScheduler, CausalEventScheduler
 from sts.replay_event import *
 from sts.event_dag import EventDag
 import sts.input_traces.log_parser as log_parser
@@ -36,7 +36,7 @@ import signal
 import logging
 import time
 import sys
-from collections import defaultdict
+from collections import defaultdict, Counter
 
 log = logging.getLogger("Replayer")
 
@@ -51,7 +51,7 @@ class Replayer(ControlFlow):
   # Interpolated time parameter. *not* the event scheduling epsilon:
   time_epsilon_microseconds = 500
 
-  kwargs = EventScheduler.kwargs | set(['create_event_scheduler', 'print_buffers',
+  kwargs = CausalEventScheduler.kwargs | set(['create_event_scheduler', 'print_buffers',
                 'wait_on_deterministic_values', 'default_dp_permit',
                 'fail_to_interactive', 'fail_to_interactive_on_persistent_violations',
                 'end_in_interactive', 'input_logger',
@@ -61,7 +61,7 @@ class Replayer(ControlFlow):
                 'delay_flow_mods', 'invariant_check_name',
                 'bug_signature', 'end_wait_seconds',
                 'transform_dag', 'pass_through_sends', 'fail_fast',
-                'check_interval'])
+                'check_interval', 'causal_scheduling'])
 
   def __init__(self, simulation_cfg, superlog_path_or_dag, create_event_scheduler=None,
                print_buffers=True, wait_on_deterministic_values=False, default_dp_permit=False,
@@ -73,7 +73,7 @@ class Replayer(ControlFlow):
                delay_flow_mods=False, invariant_check_name="",
                bug_signature="", end_wait_seconds=0.5,
                transform_dag=None, pass_through_sends=False,
-               fail_fast=False, check_interval=5,
+               fail_fast=False, check_interval=5, causal_scheduling=False,
                **kwargs):
     '''
      - If invariant_check_name is not None, check it at the end for the
@@ -81,6 +81,9 @@ class Replayer(ControlFlow):
      - If bug_signature is not None, check whether this particular signature
        appears in the output of the invariant check at the end of the
        execution
+     - If causal_scheduling is True, schedule events with
+       CausalEventScheduler, which does not reproduce the recorded gaps
+       between events
     '''
     ControlFlow.__init__(self, simulation_cfg)
     # Label uniquely identifying this replay, set in init_results()
@@ -103,16 +106,9 @@ class Replayer(ControlFlow):
       raise ValueError("No events to replay!")
 
     self.default_dp_permit = default_dp_permit
-    self.dp_checker = self._setup_dp_checker(default_dp_permit)
-    if self.default_dp_permit:
-      # Set DataplanePermit and DataplaneDrop to passive if permit is set
-      # to default
-      # TODO(cs): rather than setting these to passive (which still causes them to
-      # be scheduled as regular events) should these just be removed from the
-      # event dag altogether?
-      for event in [ e for e in self.dag.events if type(e) in dp_events ]:
-        event.passive = default_dp_permit
-
+    # If set, invoked with the index of each input event just before it is
+    # scheduled
+    self.input_boundary_hook = None
     self.print_buffers_flag = print_buffers
     self.fail_fast = fail_fast
     self.check_interval = check_interval
@@ -131,6 +127,8 @@ class Replayer(ControlFlow):
     self._input_logger = input_logger
     self.allow_unexpected_messages = allow_unexpected_messages
     self.expected_message_round_window = expected_message_round_window
+    # ExpectedMessageWindow over the dag being replayed, built lazily
+    self._expected_messages = None
     self.pass_through_whitelisted_messages = pass_through_whitelisted_messages
     self.pass_through_sends = pass_through_sends
     # How many logical rounds to peek ahead when deciding if a message is
@@ -151,13 +149,7 @@ class Replayer(ControlFlow):
                          self.invariant_check_name)
       self.invariant_check = name_to_invariant_check[self.invariant_check_name]
 
-    if self.pass_through_whitelisted_messages:
-      for event in self.dag.events:
-        if hasattr(event, "ignore_whitelisted_packets"):
-          event.ignore_whitelisted_packets = True
-
-    if self.simulation_cfg.ignore_interposition:
-      self._ignore_interposition()
+    self._prepare_dag()
 
     if create_event_scheduler:
       self.create_event_scheduler = create_event_scheduler
@@ -168,12 +160,13 @@ class Replayer(ControlFlow):
         kwargs['sleep_continuation'] = self._sleep_with_dataplane_passthrough
         kwargs['select_continuation'] = self._select_with_dataplane_passthrough
 
+      scheduler_class = CausalEventScheduler if causal_scheduling else EventScheduler
       self.create_event_scheduler = \
-        lambda simulation: EventScheduler(simulation,
+        lambda simulation: scheduler_class(simulation,
             **{ k: v for k,v in kwargs.items()
-                if k in EventScheduler.kwargs })
+                if k in scheduler_class.kwargs })
 
-    unknown_kwargs = [ k for k in kwargs.keys() if k not in EventScheduler.kwargs ]
+    unknown_kwargs = [ k for k in kwargs.keys() if k not in CausalEventScheduler.kwargs ]
     if unknown_kwargs != []:
       raise ValueError("Unknown kwargs %s" % str(unknown_kwargs))
 
@@ -193,6 +186,31 @@ class Replayer(ControlFlow):
         return DataplaneChecker(self.dag)
     return None
 
+  def _prepare_dag(self):
+    ''' Configure the events of self.dag for this replay '''
+    if self.default_dp_permit:
+      # Set DataplanePermit and DataplaneDrop to passive if permit is set
+      # to default
+      # TODO(cs): rather than setting these to passive (which still causes them to
+      # be scheduled as regular events) should these just be removed from the
+      # event dag altogether?
+      for event in [ e for e in self.dag.events if type(e) in dp_events ]:
+        event.passive = self.default_dp_permit
+    self.dp_checker = self._setup_dp_checker(self.default_dp_permit)
+
+    if self.pass_through_whitelisted_messages:
+      for event in self.dag.events:
+        if hasattr(event, "ignore_whitelisted_packets"):
+          event.ignore_whitelisted_packets = True
+
+    if self.pass_through_sends:
+      for e in self.dag.events:
+        if type(e) == ControlMessageSend:
+          e.pass_through_sends = True
+
+    if self.simulation_cfg.ignore_interposition:
+      self._ignore_interposition()
+
   def _ignore_interposition(self):
     '''
     Configure all interposition points to immediately pass through all
@@ -249,6 +267,14 @@ class Replayer(ControlFlow):
     if self._input_logger:
       self._input_logger.open(results_dir)
 
+  def switch_dag(self, dag):
+    ''' Continue the replay in progress with dag in place of self.dag, e.g.
+    after resuming from a snapshot taken at an input boundary.
+
+    Pre: dag's events before the current index are the same as self.dag's '''
+    self.dag = dag
+    self._prepare_dag()
+
   def set_pass_through_sends(self, simulation):
     simulation.openflow_buffer.pass_through_sends_only()
     for e in self.dag.events:
@@ -304,7 +330,13 @@ class Replayer(ControlFlow):
     self.old_interrupt = signal.signal(signal.SIGINT, interrupt)
 
     try:
-      for i, event in enumerate(self.dag.events):
+      i = 0
+      while i < len(self.dag.events):
+        if (self.input_boundary_hook is not None and
+            isinstance(self.dag.events[i], InputEvent)):
+          # N.B. the hook may switch_dag()
+          self.input_boundary_hook(i)
+        event = self.dag.events[i]
         try:
           self.compute_interpolated_time(event)
           if self.default_dp_permit:
@@ -337,6 +369,7 @@ class Replayer(ControlFlow):
           log.critical("Exception raised while scheduling event %s, replay %s"
                        % (str(event), self.replay_id))
           raise
+        i += 1
 
       if self.invariant_check:
         # Wait a bit in case the bug takes awhile to happen
@@ -437,26 +470,18 @@ class Replayer(ControlFlow):
     # Currently it appears that this method is too liberal, and ends up
     # causing timouts as a result of letting messages through.
 
-    # First, build a set of expected ControlMessageSends/Receives fingerprints
+    # First, find the expected ControlMessageSends/Receives fingerprints
     # within the next expected_message_round_window rounds.
-    start_round = dag.events[current_index].round
-    expected_receive_fingerprints = set()
-    expected_send_fingerprints = set()
-    for i in xrange(current_index, len(dag.events)):
-      event = dag.events[i]
-      if event.round - start_round > self.expected_message_round_window:
-        break
-      if type(event) == ControlMessageReceive:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_receive_fingerprints.add((of_fingerprint, dpid, cid))
-      if type(event) == ControlMessageSend:
-        (_, of_fingerprint, dpid, cid) = event.fingerprint
-        expected_send_fingerprints.add((of_fingerprint, dpid, cid))
+    window = self._expected_messages
+    if window is None or window.events is not dag.events:
+      window = ExpectedMessageWindow(dag.events, self.expected_message_round_window)
+      self._expected_messages = window
+    window.advance(current_index)
 
     # Now check pending messages.
     for expected_fingerprints, messages in [
-         (expected_receive_fingerprints, self.simulation.openflow_buffer.pending_receives),
-         (expected_send_fingerprints, self.simulation.openflow_buffer.pending_sends)]:
+         (window.receives, self.simulation.openflow_buffer.pending_receives),
+         (window.sends, self.simulation.openflow_buffer.pending_sends)]:
       for pending_message in messages:
         fingerprint = (pending_message.fingerprint,
                        pending_message.dpid,
@@ -475,6 +500,71 @@ class Replayer(ControlFlow):
           self.passed_unexpected_messages.append(repr(log_event))
           self._log_input_event(log_event)
 
+class ExpectedMessageWindow(object):
+  ''' Multisets of the (fingerprint, dpid, cid) of the ControlMessageReceives
+  and ControlMessageSends among events[head:tail], where tail is the index
+  of the first event more than round_window rounds after events[head].
+
+  Rounds are non-decreasing along the events, so moving head forward only
+  adds the events that enter the window and removes those that leave it,
+  rather than rescanning the whole window for every event scheduled. '''
+  def __init__(self, events, round_window):
+    self.events = events
+    self.round_window = round_window
+    self.receives = Counter()
+    self.sends = Counter()
+    self.head = 0
+    self.tail = 0
+    self._start_round = None
+
+  def _counter(self, event):
+    if type(event) == ControlMessageReceive:
+      return self.receives
+    if type(event) == ControlMessageSend:
+      return self.sends
+    return None
+
+  def _add(self, event):
+    counter = self._counter(event)
+    if counter is not None:
+      (_, of_fingerprint, dpid, cid) = event.fingerprint
+      counter[(of_fingerprint, dpid, cid)] += 1
+
+  def _remove(self, event):
+    counter = self._counter(event)
+    if counter is not None:
+      (_, of_fingerprint, dpid, cid) = event.fingerprint
+      key = (of_fingerprint, dpid, cid)
+      counter[key] -= 1
+      if counter[key] == 0:
+        # Keep `in' meaning "expected"
+        del counter[key]
+
+  def reset(self):
+    self.receives.clear()
+    self.sends.clear()
+    self.head = 0
+    self.tail = 0
+    self._start_round = None
+
+  def advance(self, current_index):
+    ''' Move the window to start at current_index '''
+    start_round = self.events[current_index].round
+    if (current_index < self.head or
+        (self._start_round is not None and start_round < self._start_round)):
+      # Only forward movement is incremental
+      self.reset()
+    self._start_round = start_round
+    while self.head < current_index:
+      if self.head < self.tail:
+        self._remove(self.events[self.head])
+      self.head += 1
+    self.tail = max(self.tail, self.head)
+    while (self.tail < len(self.events) and
+           self.events[self.tail].round - start_round <= self.round_window):
+      self._add(self.events[self.tail])
+      self.tail += 1
+
 class AlwaysAllowDataplane(object):
   ''' A dataplane checker that always allows through events. Should not be
   used if there are any DataplaneDrops in the trace; in that case, use
@@ -20,8 +20,14 @@ protocol description.
 '''
 
 from sts.util.io_master import IOMaster
+from sts.event_dag import EventDag
+from sts.input_traces.log_parser import parse
+from collections import OrderedDict
 import errno
+import json
+import os
 import socket
+import sys
 import logging
 log = logging.getLogger("snapshotter")
 
@@ -88,6 +94,17 @@ class IOWorkerCloner(object):
     self.io_worker.receive_buf = self.receive_buf
     self.io_worker.send_buf = self.send_buf
 
+  def restore_buffers(self):
+    '''
+    Bring the buffers back to the same state as they were in at the time
+    drain_buffers() was invoked, without replacing the socket. For the process
+    that carries on with the original controller after a snapshot.
+
+    Pre: drain_buffers has been called exactly once before.
+    '''
+    self.io_worker.receive_buf = self.receive_buf
+    self.io_worker.send_buf = self.send_buf
+
 class Snapshotter(object):
   ''' Handles snapshotting of a controller.
 
@@ -122,3 +139,247 @@ class Snapshotter(object):
     new_socket = self.controller.snapshot_proceed()
     self.io_worker_cloner.repopulate_buffers(new_socket)
 
+
+  def restore_buffers(self):
+    '''
+    Carry on with the original controller rather than the snapshot, and
+    repopulate the io_worker's buffers to its state at the time
+    snapshot_controller() was invoked.
+
+    pre: snapshot_controller has been invoked
+    '''
+    self.io_worker_cloner.restore_buffers()
+
+class SnapshotTrie(object):
+  '''
+  Maps prefixes of event label sequences to snapshots, and finds the snapshot
+  whose prefix is the longest prefix of a given label sequence.
+
+  Holds at most max_snapshots snapshots. When full, the least recently
+  inserted snapshot is evicted and passed to release().
+  '''
+  def __init__(self, max_snapshots=8, release=lambda snapshot: None):
+    if max_snapshots < 1:
+      raise ValueError("max_snapshots must be at least 1")
+    self.max_snapshots = max_snapshots
+    self.release = release
+    # { label -> child node }. A node with a snapshot maps None to its prefix.
+    self._root = {}
+    # { prefix -> snapshot }, least recently inserted first
+    self._snapshots = OrderedDict()
+
+  def __len__(self):
+    return len(self._snapshots)
+
+  def insert(self, prefix, snapshot):
+    prefix = tuple(prefix)
+    if prefix in self._snapshots:
+      self.release(self.pop(prefix))
+    while len(self._snapshots) >= self.max_snapshots:
+      self.release(self.pop(self._snapshots.keys()[0]))
+    node = self._root
+    for label in prefix:
+      node = node.setdefault(label, {})
+    node[None] = prefix
+    self._snapshots[prefix] = snapshot
+
+  def longest_prefix(self, labels):
+    ''' Return the longest prefix of labels that has a snapshot, or None '''
+    longest = None
+    node = self._root
+    for label in labels:
+      if None in node:
+        longest = node[None]
+      if label not in node:
+        return longest
+      node = node[label]
+    return node.get(None, longest)
+
+  def pop(self, prefix):
+    ''' Remove and return the snapshot for prefix '''
+    prefix = tuple(prefix)
+    snapshot = self._snapshots.pop(prefix)
+    nodes = [self._root]
+    for label in prefix:
+      nodes.append(nodes[-1][label])
+    del nodes[-1][None]
+    # Prune branches that no longer lead to any snapshot
+    for depth in range(len(prefix), 0, -1):
+      if nodes[depth] != {}:
+        break
+      del nodes[depth-1][prefix[depth-1]]
+    return snapshot
+
+  def pop_longest_prefix(self, labels):
+    ''' Remove the snapshot with the longest prefix of labels. Return
+    (length of the prefix, snapshot), or (0, None) if there is none '''
+    prefix = self.longest_prefix(labels)
+    if prefix is None:
+      return (0, None)
+    return (len(prefix), self.pop(prefix))
+
+  def clear(self):
+    ''' Release all snapshots '''
+    for prefix in self._snapshots.keys():
+      self.release(self.pop(prefix))
+
+class ReplaySnapshot(object):
+  '''
+  Snapshots a replay in progress at an input boundary, so that later replays
+  whose events share the same prefix can resume from there rather than
+  replaying the prefix from the beginning.
+
+  At the input with index `index`, the controller is snapshotted and the
+  replaying (simulator) process fork()s. The fork()ed copy suspends itself,
+  listening for a single JSON request on a unix domain socket at `path`:
+
+    {"command": "resume", "index": ..., "events": [...], ...}
+       wake the snapshotted controller, switch the replayer to the given
+       events, and continue the replay from the input boundary. The caller
+       is responsible for eventually invoking reply() with the outcome.
+    {"command": "release"}
+       clean up and exit
+
+  The controller's snapshot socket is shared by all of its suspended copies,
+  so a replay (or a resumed replay) may only take one snapshot. A resumed
+  replay may take another snapshot, at or after the input it resumed from.
+
+  The copy exits of its own accord if the process with pid owner_pid dies.
+  '''
+  # How often to check whether the owner is still alive
+  liveness_check_seconds = 5
+
+  def __init__(self, replayer, index, path, owner_pid,
+               prepare_fork=lambda: None, resume=lambda request: None):
+    '''
+     - prepare_fork is invoked just before fork()ing, e.g. to flush logs
+     - resume is invoked with the request in the fork()ed copy, after the
+       replayer has been switched to the requested events
+    '''
+    self.replayer = replayer
+    self.index = index
+    self.path = path
+    self.owner_pid = owner_pid
+    self.prepare_fork = prepare_fork
+    self.resume = resume
+    # Whether this process is a resumed copy
+    self.resumed = False
+    self._connection = None
+    replayer.input_boundary_hook = self.at_input_boundary
+
+  def at_input_boundary(self, index):
+    if index != self.index:
+      return
+    self.index = None
+    simulation = self.replayer.simulation
+    snapshotter = Snapshotter(simulation,
+                              simulation.controller_manager.controllers[0])
+    if os.path.exists(self.path):
+      os.unlink(self.path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(self.path)
+    listener.listen(1)
+    self.prepare_fork()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    log.debug("Snapshotting replay at input %d" % index)
+    snapshotter.snapshot_controller()
+    pid = os.fork()
+    if pid == 0:
+      # Returns only once a resume request arrives
+      self._suspend(listener, snapshotter, index)
+    else:
+      listener.close()
+      snapshotter.restore_buffers()
+
+  def _owner_alive(self):
+    try:
+      os.kill(self.owner_pid, 0)
+      return True
+    except OSError as e:
+      return e.errno != errno.ESRCH
+
+  def _suspend(self, listener, snapshotter, index):
+    listener.settimeout(self.liveness_check_seconds)
+    while True:
+      try:
+        (connection, _) = listener.accept()
+        break
+      except socket.timeout:
+        if not self._owner_alive():
+          self._exit(snapshotter)
+    listener.close()
+    try:
+      os.unlink(self.path)
+    except OSError:
+      pass
+    connection.settimeout(None)
+    events = None
+    try:
+      request = json.loads(connection.makefile().readline())
+      if request["command"] == "resume":
+        events = parse(request["events"])
+    except (ValueError, KeyError) as e:
+      log.warn("Bad replay snapshot request: %s" % e)
+    prefix = [ e.label for e in self.replayer.dag.events[:index] ]
+    if events is None or [ e.label for e in events[:index] ] != prefix:
+      # N.B. the requester treats a missing reply as a failed resume
+      connection.close()
+      self._exit(snapshotter)
+
+    log.debug("Resuming replay snapshot at input %d" % index)
+    snapshotter.snapshot_proceed()
+    self.resumed = True
+    self._connection = connection
+    # Keep the prefix events that were actually replayed
+    self.replayer.switch_dag(EventDag(self.replayer.dag.events[:index] + events[index:]))
+    self.resume(request)
+    if request.get("snapshot_index") is not None:
+      self.index = request["snapshot_index"]
+      self.path = str(request["snapshot_path"])
+      # We may have been asked to snapshot right here
+      self.at_input_boundary(index)
+
+  def _exit(self, snapshotter):
+    try:
+      # Wake the controller just so that clean_up() kills it
+      snapshotter.snapshot_proceed()
+      self.replayer.simulation.clean_up()
+    finally:
+      os._exit(0)
+
+  def reply(self, result):
+    ''' Send the outcome of the resumed replay to the requester and exit.
+
+    Pre: self.resumed '''
+    try:
+      self._connection.sendall(json.dumps(result) + "\n")
+      self._connection.close()
+    finally:
+      os._exit(0)
+
+def request_replay_snapshot(path, request):
+  '''
+  Send a request to the ReplaySnapshot listening at path. Return the reply
+  (for resume requests), or raise socket.error or ValueError if the snapshot
+  is gone or exited without replying.
+  '''
+  connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    connection.connect(path)
+    connection.sendall(json.dumps(request) + "\n")
+    if request["command"] != "resume":
+      return None
+    reply = connection.makefile().readline()
+    if reply == "":
+      raise ValueError("Replay snapshot %s exited without replying" % path)
+    return json.loads(reply)
+  finally:
+    connection.close()
+
+def release_replay_snapshot(path):
+  ''' Tell the ReplaySnapshot listening at path to exit, if it still exists '''
+  try:
+    request_replay_snapshot(path, {"command": "release"})
+  except socket.error as e:
+    log.warn("Could not release replay snapshot %s: %s" % (path, e))
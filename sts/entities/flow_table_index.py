@@ -0,0 +1,115 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Hash index over a software switch's flow table, for dataplane lookups.
+"""
+
+from pox.openflow.flow_table import FlowTableModification
+from pox.openflow.libopenflow_01 import ofp_match
+
+
+class FlowTableIndex(object):
+  """
+  Finds the flow table entry for a packet without testing every entry.
+
+  Each entry is filed under the first of dl_dst, nw_dst (/32 only) and
+  in_port that it matches exactly, or in a fallback list if it wildcards all
+  three. An entry filed under a field can only match packets carrying that
+  exact value, so a lookup only tests the entries in the packet's three
+  buckets and the fallback list. Every bucket keeps its entries in table
+  order, tagged with their position in the table, and the lookup returns the
+  matching entry with the lowest position: the same entry as pox's linear
+  scan, whatever priority and tie-breaking rules the table uses.
+
+  The index is rebuilt lazily on the first lookup after a
+  FlowTableModification.
+  """
+  def __init__(self, table):
+    self.table = table
+    # Number of lookups that found / didn't find an entry
+    self.hits = 0
+    self.misses = 0
+    # Number of times the index was rebuilt
+    self.rebuilds = 0
+    self._dirty = True
+    self._size = 0
+    # field value -> [(position in table, entry)], in table order
+    self._by_dl_dst = {}
+    self._by_nw_dst = {}
+    self._by_in_port = {}
+    # [(position in table, entry)] of entries wildcarding all indexed fields
+    self._wildcarded = []
+    table.addListener(FlowTableModification, self._handle_FlowTableModification)
+
+  def _handle_FlowTableModification(self, event):
+    self._dirty = True
+
+  def invalidate(self):
+    """Forces a rebuild on the next lookup"""
+    self._dirty = True
+
+  def _rebuild(self):
+    self._by_dl_dst = {}
+    self._by_nw_dst = {}
+    self._by_in_port = {}
+    self._wildcarded = []
+    entries = self.table.entries
+    for (position, entry) in enumerate(entries):
+      match = entry.match
+      if match.dl_dst is not None:
+        bucket = self._by_dl_dst.setdefault(match.dl_dst, [])
+      else:
+        (nw_dst, prefix_len) = match.get_nw_dst()
+        if nw_dst is not None and prefix_len == 32:
+          bucket = self._by_nw_dst.setdefault(nw_dst, [])
+        elif match.in_port is not None:
+          bucket = self._by_in_port.setdefault(match.in_port, [])
+        else:
+          bucket = self._wildcarded
+      bucket.append((position, entry))
+    self._size = len(entries)
+    self._dirty = False
+    self.rebuilds += 1
+
+  def lookup(self, packet_match):
+    """
+    Returns the highest priority entry matching packet_match, or None.
+    packet_match is an exact match, as built by ofp_match.from_packet().
+    """
+    # Also catch entries added or removed without raising an event
+    if self._dirty or self._size != len(self.table.entries):
+      self._rebuild()
+    best = None
+    for candidates in (self._by_dl_dst.get(packet_match.dl_dst, ()),
+                       self._by_nw_dst.get(packet_match.nw_dst, ()),
+                       self._by_in_port.get(packet_match.in_port, ()),
+                       self._wildcarded):
+      for (position, entry) in candidates:
+        if best is not None and position >= best[0]:
+          break
+        if entry.match.matches_with_wildcards(packet_match,
+                                              consider_other_wildcards=False):
+          best = (position, entry)
+          break
+    if best is None:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return best[1]
+
+  def entry_for_packet(self, packet, in_port):
+    """Drop-in replacement for FlowTable.entry_for_packet()"""
+    return self.lookup(ofp_match.from_packet(packet, in_port))
@@ -38,6 +38,7 @@ from sts.util.tabular import Tabular
 from sts.entities.base import DirectedLinkAbstractClass
 from sts.entities.base import BiDirectionalLinkAbstractClass
 from sts.entities.hosts import HostInterface
+from sts.entities.flow_table_index import FlowTableIndex
 
 
 import Queue
@@ -176,6 +177,10 @@ class FuzzSoftwareSwitch (NXSoftwareSwitch):
           self.log.debug("Table entry removed %s" % str(table_mod.removed))
       self.table.addListener(FlowTableModification, _print_entry_remove)
 
+    # Look packets up through a hash index rather than scanning every entry
+    self.flow_table_index = FlowTableIndex(self.table)
+    self.table.entry_for_packet = self.flow_table_index.entry_for_packet
+
     def error_handler(e):
       self.log.exception(e)
       raise e
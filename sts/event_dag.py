@@ -17,8 +17,11 @@
 from sts.fingerprints.messages import *
 from sts.replay_event import *
 import logging
+import hashlib
 import time
 from collections import defaultdict
+from bisect import bisect_left, bisect_right
+from heapq import heapify, heappush, heappop
 log = logging.getLogger("event_dag")
 
 def split_list(l, split_ways):
@@ -56,26 +59,65 @@ class AtomicInput(object):
   def __repr__(self):
     return "AtomicInput:%r%r" % (self.failure, self.recoveries)
 
+def expand_atomic_inputs(atomic_inputs):
+  ''' Flatten AtomicInputs into their failure and recovery events '''
+  inputs = []
+  for e in atomic_inputs:
+    if type(e) == AtomicInput:
+      inputs.append(e.failure)
+      inputs += e.recoveries
+    else:
+      inputs.append(e)
+  return inputs
+
 class EventDagView(object):
-  def __init__(self, parent, events_list):
-    ''' subset is a list '''
+  def __init__(self, parent, events_list, indices=None):
+    ''' events_list is a list, in the same relative order as the parent's
+    events. indices, if given, are the parent's indices of each event in
+    events_list '''
     self._parent = parent
     self._events_list = list(events_list)
-    self._events_set = set(self._events_list)
+    self._indices = indices
+    self._events_set_memo = None
+    self._input_events = None
+    self._atomic_input_events_memo = None
 
   @property
   def events(self):
     '''Return the events in the DAG'''
     return self._events_list
 
+  @property
+  def _events_set(self):
+    if self._events_set_memo is None:
+      self._events_set_memo = set(self._events_list)
+    return self._events_set_memo
+
+  @property
+  def indices(self):
+    ''' The parent's index of each of our events '''
+    if self._indices is None:
+      self._indices = self._parent.get_indices(self._events_list)
+    return self._indices
+
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    if self._input_events is None:
+      self._input_events = self._parent.input_events_of_view(self._events_list,
+                                                             self.indices)
+    return self._input_events
 
   @property
   def atomic_input_events(self):
-    return self._parent._atomic_input_events(self.input_events)
+    if self._atomic_input_events_memo is None:
+      self._atomic_input_events_memo = self._parent._atomic_input_events(self.input_events)
+    return list(self._atomic_input_events_memo)
+
+  def get_events(self, labels):
+    return self._parent.get_events(labels)
+
+  def trace_digest(self):
+    return self._parent.trace_digest()
 
   def input_subset(self, subset):
     '''pre: subset must be a subset of only this view'''
@@ -86,10 +128,12 @@ class EventDagView(object):
     return self._parent.atomic_input_subset(subset)
 
   def input_complement(self, subset):
-    return self._parent.input_complement(subset, self._events_list)
+    return self._parent.input_complement(subset, self._events_list,
+                                         indices=self.indices)
 
   def insert_atomic_inputs(self, inputs):
-    return self._parent.insert_atomic_inputs(inputs, events_list=self._events_list)
+    return self._parent.insert_atomic_inputs(inputs, events_list=self._events_list,
+                                             indices=self.indices)
 
   def add_inputs(self, inputs):
     return self._parent.add_inputs(inputs, self._events_list)
@@ -107,7 +151,8 @@ class EventDagView(object):
     return self._parent.set_events_as_timed_out(timed_out_event_labels)
 
   def filter_timeouts(self):
-    return self._parent.filter_timeouts(events_list=self._events_list)
+    return self._parent.filter_timeouts(events_list=self._events_list,
+                                        indices=self.indices)
 
   def __len__(self):
     return len(self._events_list)
@@ -120,18 +165,35 @@ def migrations_per_host(events):
       host2migrations[e.host_id].append(e)
   return host2migrations
 
-def replace_migration(replacee, old_location, new_location, event_list):
+def replace_migration(replacee, old_location, new_location, event_list,
+                      index=None):
   # `replacee' is the migration to be replaced
   # Don't mutate replacee -- instead, replace it
   new_migration = HostMigration(old_location[0], old_location[1],
                                 new_location[0], new_location[1],
                                 host_id=replacee.host_id,
-                                time=replacee.time, label=replacee.label)
-  # TODO(cs): O(n^2)
-  index = event_list.index(replacee)
+                                event_time=replacee.event_time,
+                                label=replacee.label)
+  if index is None:
+    index = event_list.index(replacee)
   event_list[index] = new_migration
   return new_migration
 
+def remove_positions(events_list, indices, removed):
+  ''' Return copies of events_list and indices without the entries at the
+  given (sorted) positions. Copies whole slices between removed positions,
+  rather than testing every event. '''
+  remaining = []
+  remaining_indices = []
+  start = 0
+  for position in removed:
+    remaining += events_list[start:position]
+    remaining_indices += indices[start:position]
+    start = position + 1
+  remaining += events_list[start:]
+  remaining_indices += indices[start:]
+  return (remaining, remaining_indices)
+
 class EventDag(object):
   '''A collection of Event objects. EventDags are primarily used to present a
   view of the underlying events with some subset of the input events pruned
@@ -160,6 +222,7 @@ class EventDag(object):
     # PeekingEventDag's data
     self._prefix_trie = prefix_trie
     self._events_list = events
+    self._trace_digest = None
     self._events_set = set(self._events_list)
     self._label2event = {
       event.label : event
@@ -169,6 +232,22 @@ class EventDag(object):
       event : i
       for i, event in enumerate(self._events_list)
     }
+    # Views are represented by the indices of their events in
+    # self._events_list, so that computing a view only touches the (few) input
+    # events and host migrations, and copies the (many) internal events
+    # between them in bulk.
+    self._indices = range(len(self._events_list))
+    # Indices of all prunable input events
+    self._input_indices = [ i for i, e in enumerate(self._events_list)
+                            if isinstance(e, InputEvent) and e.prunable ]
+    self._recovery_indices = set(i for i in self._input_indices
+                                 if type(self._events_list[i]) in self._recovery_types)
+    self._migration_indices = [ i for i, e in enumerate(self._events_list)
+                                if type(e) == HostMigration ]
+    # { index -> indices of dependent_labels }. Computed lazily, since
+    # mark_invalid_input_sequences() adds dependencies after construction
+    self._dependents = None
+    self._input_events = None
     # TODO(cs): this should be moved to a dag transformer class
     self._host2initial_location = {
       host : migrations[0].old_location
@@ -183,8 +262,9 @@ class EventDag(object):
 
   @property
   def input_events(self):
-    # TODO(cs): memoize?
-    return [ e for e in self._events_list if isinstance(e, InputEvent) and e.prunable ]
+    if self._input_events is None:
+      self._input_events = [ self._events_list[i] for i in self._input_indices ]
+    return self._input_events
 
   @property
   def atomic_input_events(self):
@@ -195,8 +275,46 @@ class EventDag(object):
       raise ValueError("Unknown label %s" % str(label))
     return self._label2event[label]
 
+  def get_events(self, labels):
+    ''' Return the events with the given labels, in the given order '''
+    return [ self._get_event(label) for label in labels ]
+
+  def trace_digest(self):
+    ''' Return a hex digest identifying the original trace. Views of the same
+    trace share it. '''
+    if self._trace_digest is None:
+      digest = hashlib.sha1()
+      for e in self._events_list:
+        digest.update("%s %s\n" % (e.label, type(e).__name__))
+      self._trace_digest = digest.hexdigest()
+    return self._trace_digest
+
+  def get_indices(self, events):
+    ''' Return the index of each of the events in the original trace '''
+    return [ self._event2idx[e] for e in events ]
+
+  def input_events_of_view(self, events_list, indices):
+    ''' Return the prunable input events of a view '''
+    # There are far fewer inputs than events, so look up each input in the view
+    # rather than scanning the view
+    inputs = []
+    for i in self._input_indices:
+      position = bisect_left(indices, i)
+      if position < len(indices) and indices[position] == i:
+        inputs.append(events_list[position])
+    return inputs
+
+  def _get_dependents(self):
+    if self._dependents is None:
+      self._dependents = {}
+      for i, e in enumerate(self._events_list):
+        if e.dependent_labels != []:
+          self._dependents[i] = [ self._event2idx[self._label2event[label]]
+                                  for label in e.dependent_labels
+                                  if label in self._label2event ]
+    return self._dependents
+
   def _atomic_input_events(self, inputs):
-    # TODO(cs): memoize?
     skipped_recoveries = set()
     atomic_inputs = []
     for e in inputs:
@@ -215,14 +333,7 @@ class EventDag(object):
     return atomic_inputs
 
   def _expand_atomics(self, atomic_inputs):
-    inputs = []
-    for e in atomic_inputs:
-      if type(e) == AtomicInput:
-        inputs.append(e.failure)
-        for recovery in e.recoveries:
-          inputs.append(recovery)
-      else:
-        inputs.append(e)
+    inputs = expand_atomic_inputs(atomic_inputs)
     inputs.sort(key=lambda e: self._event2idx[e])
     return inputs
 
@@ -230,25 +341,48 @@ class EventDag(object):
     return EventDagView(self, (e for e in self._events_list
                                if type(e) not in self._ignored_input_types))
 
-  def compute_remaining_input_events(self, ignored_portion, events_list=None):
+  def compute_remaining_input_events(self, ignored_portion, events_list=None,
+                                     indices=None):
     ''' ignore all input events in ignored_inputs,
     as well all of their dependent input events'''
+    ignored = set(self._event2idx[e] for e in ignored_portion)
+    (remaining, _) = self._compute_remaining(ignored, events_list, indices)
+    ignored_portion.update(self._events_list[i] for i in ignored)
+    return remaining
+
+  def _compute_remaining(self, ignored, events_list=None, indices=None):
+    ''' Index-based compute_remaining_input_events: ignored is a set of
+    indices, which is updated with the dependents of ignored events. Returns
+    (remaining events, their indices) '''
     if events_list is None:
-      events_list = self.events
-    remaining = []
-    for event in events_list:
-      if event not in ignored_portion:
-        remaining.append(event)
-      else:
-        # Add dependent to ignored_portion
-        for label in event.dependent_labels:
-          # Note that recoveries will be a dependent of preceding failures
-          dependent_event = self._label2event[label]
-          ignored_portion.add(dependent_event)
+      (events_list, indices) = (self._events_list, self._indices)
+    elif indices is None:
+      indices = self.get_indices(events_list)
+    dependents = self._get_dependents()
+    # Walk the ignored events in order, ignoring their dependents too. N.B.
+    # only dependents that come later in the trace are removed from the
+    # view (earlier ones were already passed over).
+    removed = []
+    queued = set(ignored)
+    heap = list(ignored)
+    heapify(heap)
+    while heap != []:
+      i = heappop(heap)
+      position = bisect_left(indices, i)
+      if position == len(indices) or indices[position] != i:
+        continue
+      removed.append(position)
+      for dependent in dependents.get(i, []):
+        ignored.add(dependent)
+        if dependent > i and dependent not in queued:
+          queued.add(dependent)
+          heappush(heap, dependent)
+    (remaining, remaining_indices) = remove_positions(events_list, indices, removed)
 
     # Update the migration locations in remaining
-    self.update_migrations(remaining, ignored_portion, events_list)
-    return remaining
+    self._update_migrations(remaining, remaining_indices, ignored,
+                            events_list, indices)
+    return (remaining, remaining_indices)
 
   def update_migrations(self, remaining, ignored_portion, events_list):
     ''' Walk through remaining input events, and update the source location of
@@ -263,19 +397,33 @@ class EventDag(object):
 
     Note: mutates remaining
     '''
+    self._update_migrations(remaining, self.get_indices(remaining),
+                            set(self.get_indices(ignored_portion)),
+                            events_list, self.get_indices(events_list))
+
+  def _update_migrations(self, remaining, remaining_indices, ignored,
+                         events_list, indices):
+    ''' Index-based update_migrations. remaining was computed from
+    events_list, whose indices are indices '''
     # TODO(cs): this should be moved outside of EventDag
     # TODO(cs): this algorithm could be simplified substantially by invoking
     # migrations_per_host()
+    if self._migration_indices == []:
+      return
 
     # keep track of the most recent location of the host that did not involve
     # a pruned HostMigration event
     # location is: (ingress dpid, ingress port no)
     currentloc2unprunedloc = {}
 
-    for m in [e for e in events_list if type(e) == HostMigration]:
-      src = m.old_location
-      dst = m.new_location
-      if m in ignored_portion:
+    for i in self._migration_indices:
+      if i in ignored:
+        position = bisect_left(indices, i)
+        if position == len(indices) or indices[position] != i:
+          continue
+        m = events_list[position]
+        src = m.old_location
+        dst = m.new_location
         if src in currentloc2unprunedloc:
           # There was a prior migration in ignored_portion
           # Update the new dst to point back to the unpruned location
@@ -287,6 +435,12 @@ class EventDag(object):
           # Point to our tail
           currentloc2unprunedloc[dst] = src
       else: # m in remaining
+        position = bisect_left(remaining_indices, i)
+        if position == len(remaining_indices) or remaining_indices[position] != i:
+          continue
+        m = remaining[position]
+        src = m.old_location
+        dst = m.new_location
         if src in currentloc2unprunedloc:
           # There was a prior migration in ignored_portion
           # Replace this HostMigration with a new one, with source at the
@@ -294,7 +448,7 @@ class EventDag(object):
           unpruned_loc = currentloc2unprunedloc[src]
           del currentloc2unprunedloc[src]
           new_loc = dst
-          replace_migration(m, unpruned_loc, new_loc, remaining)
+          replace_migration(m, unpruned_loc, new_loc, remaining, index=position)
 
   def _ignored_except_internals_and_recoveries(self, ignored_portion):
     # Note that dependent_labels only contains dependencies between input
@@ -312,30 +466,32 @@ class EventDag(object):
   def input_subset(self, subset):
     ''' Return a view of the dag with only the subset and subset dependents
     remaining'''
-    ignored = self._events_set - set(subset)
-    ignored = self._ignored_except_internals_and_recoveries(ignored)
-    remaining_events = self.compute_remaining_input_events(ignored)
-    return EventDagView(self, remaining_events)
+    # i.e. ignore every prunable input outside of subset, except recoveries
+    kept = set(self._event2idx[e] for e in subset)
+    ignored = set(i for i in self._input_indices
+                  if i not in kept and i not in self._recovery_indices)
+    (remaining, indices) = self._compute_remaining(ignored)
+    return EventDagView(self, remaining, indices=indices)
 
   def atomic_input_subset(self, subset):
     ''' Return a view of the dag with only the subset remaining, where
     dependent input pairs remain together'''
     # Relatively simple: expand atomic pairs into individual inputs, take
     # all input events in result, and compute_remaining_input_events as normal
-    subset = self._expand_atomics(subset)
-    ignored = self._events_set - set(subset)
-    ignored = self._ignored_except_internals(ignored)
-    remaining_events = self.compute_remaining_input_events(ignored)
-    return EventDagView(self, remaining_events)
+    kept = set(self._event2idx[e] for e in expand_atomic_inputs(subset))
+    ignored = set(i for i in self._input_indices if i not in kept)
+    (remaining, indices) = self._compute_remaining(ignored)
+    return EventDagView(self, remaining, indices=indices)
 
-  def input_complement(self, subset, events_list=None):
+  def input_complement(self, subset, events_list=None, indices=None):
     ''' Return a view of the dag with everything except the subset and
     subset dependencies'''
     subset = self._ignored_except_internals_and_recoveries(subset)
-    remaining_events = self.compute_remaining_input_events(subset, events_list)
-    return EventDagView(self, remaining_events)
+    ignored = set(self._event2idx[e] for e in subset)
+    (remaining, indices) = self._compute_remaining(ignored, events_list, indices)
+    return EventDagView(self, remaining, indices=indices)
 
-  def _straighten_inserted_migrations(self, remaining_events):
+  def _straighten_inserted_migrations(self, remaining_events, indices=None):
     ''' This is a bit hairy: when migrations are added back in, there may be
     gaps in host locations. We need to straighten out those gaps -- i.e. make
     the series of host migrations for any given host a line.
@@ -343,20 +499,30 @@ class EventDag(object):
     Pre: remaining_events is sorted in the same relative order as the original
     trace
     '''
-    host2migrations = migrations_per_host(remaining_events)
+    if self._migration_indices == []:
+      return remaining_events
+    if indices is None:
+      indices = self.get_indices(remaining_events)
+    host2migrations = defaultdict(list)
+    for i in self._migration_indices:
+      position = bisect_left(indices, i)
+      if position < len(indices) and indices[position] == i:
+        m = remaining_events[position]
+        host2migrations[m.host_id].append((m, position))
     for host, migrations in host2migrations.iteritems():
       # Prime the loop with the initial location
       previous_location = self._host2initial_location[host]
-      for m in migrations:
+      for m, position in migrations:
         if m.old_location != previous_location:
           replacement = replace_migration(m, previous_location,
-                                          m.new_location, remaining_events)
+                                          m.new_location, remaining_events,
+                                          index=position)
         else:
           replacement = m
         previous_location = replacement.new_location
     return remaining_events
 
-  def insert_atomic_inputs(self, atomic_inputs, events_list=None):
+  def insert_atomic_inputs(self, atomic_inputs, events_list=None, indices=None):
     '''Insert inputs into events_list in the same relative order as the
     original events list. This method is needed because set union as used in
     delta debugging does not make sense for event sequences (events are ordered)'''
@@ -365,31 +531,35 @@ class EventDag(object):
     if events_list is None:
       raise ValueError("Shouldn't be adding inputs to the original trace")
 
-    inputs = self._expand_atomics(atomic_inputs)
+    inputs = expand_atomic_inputs(atomic_inputs)
 
     if not all(e in self._event2idx for e in inputs):
       raise ValueError("Not all inputs present in original events list %s" %
-                       [e for e in input if e not in self._event2idx])
-    if not all(e in self._event2idx for e in events_list):
-      raise ValueError("Not all events in original events list %s" %
-                       [e for e in events_list if e not in self._event2idx])
-
+                       [e for e in inputs if e not in self._event2idx])
+    if indices is None:
+      if not all(e in self._event2idx for e in events_list):
+        raise ValueError("Not all events in original events list %s" %
+                         [e for e in events_list if e not in self._event2idx])
+      indices = self.get_indices(events_list)
+
+    # Each input goes right before the first successor that came after it in
+    # the original trace. Any inputs without successors are appended at the end
     result = []
-    for _, successor in enumerate(events_list):
-      orig_successor_idx = self._event2idx[successor]
-      while len(inputs) > 0 and orig_successor_idx > self._event2idx[inputs[0]]:
-        # If the current successor did in fact come after the next input in the
-        # original trace, insert next input here
-        input = inputs.pop(0)
-        result.append(input)
-      result.append(successor)
-
-    # Any remaining inputs should be appended at the end -- they had no
-    # successors
-    result += inputs
+    result_indices = []
+    start = 0
+    for i in sorted(self._event2idx[e] for e in inputs):
+      position = bisect_right(indices, i)
+      result += events_list[start:position]
+      result_indices += indices[start:position]
+      result.append(self._events_list[i])
+      result_indices.append(i)
+      start = position
+    result += events_list[start:]
+    result_indices += indices[start:]
+
     # Deal with newly added host migrations
-    result = self._straighten_inserted_migrations(result)
-    return EventDagView(self, result)
+    result = self._straighten_inserted_migrations(result, result_indices)
+    return EventDagView(self, result, indices=result_indices)
 
   def mark_invalid_input_sequences(self):
     '''Fill in domain knowledge about valid input
@@ -420,6 +590,8 @@ class EventDag(object):
         #elif type(event) in self._ignored_input_types:
         #  raise RuntimeError("No support for %s dependencies" %
         #                      type(event).__name__)
+    # dependent_labels changed: invalidate the lazily built dependents index
+    self._dependents = None
 
   def next_state_change(self, index, events=None):
     ''' Return the next ControllerStateChange that occurs at or after
@@ -455,8 +627,12 @@ class EventDag(object):
     for label in timed_out_event_labels:
       self._get_event(label).timed_out = True
 
-  def filter_timeouts(self, events_list=None):
+  def filter_timeouts(self, events_list=None, indices=None):
     if events_list is None:
-      events_list = self._events_list
-    no_timeouts = [ e for e in events_list if not e.timed_out ]
-    return EventDagView(self, no_timeouts)
+      (events_list, indices) = (self._events_list, self._indices)
+    if indices is None:
+      no_timeouts = [ e for e in events_list if not e.timed_out ]
+      return EventDagView(self, no_timeouts)
+    no_timeouts = [ (e, i) for e, i in zip(events_list, indices) if not e.timed_out ]
+    return EventDagView(self, [ e for e, _ in no_timeouts ],
+                        indices=[ i for _, i in no_timeouts ])
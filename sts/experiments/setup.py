@@ -38,16 +38,25 @@ def setup_experiment(args, config):
     # Note that argparse returns a list
     config.timestamp_results = args.timestamp_results
 
+  resume = getattr(args, "resume", False)
+
   if hasattr(config, 'timestamp_results') and config.timestamp_results:
+    if resume:
+      raise ValueError("Cannot resume into a freshly timestamped results "
+                       "directory. Drop -t, or set -n to the old directory's name")
     now = timestamp_string()
     config.results_dir += "_" + str(now)
 
-  # Set up results directory
+  # Set up results directory. When resuming, keep the previous run's results
   create_python_dir("./experiments")
-  create_clean_python_dir(config.results_dir)
+  if resume:
+    create_python_dir(config.results_dir)
+  else:
+    create_clean_python_dir(config.results_dir)
 
   # Copy stdout and stderr to a file "simulator.out"
-  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"), "w"))
+  tee = Tee(open(os.path.join(config.results_dir, "simulator.out"),
+                 "a" if resume else "w"))
   tee.tee_stdout()
   tee.tee_stderr()
 
@@ -15,9 +15,17 @@
 
 
 import abc
+import weakref
+
+# (fingerprint class, key) -> canonical fingerprint
+_interned = weakref.WeakValueDictionary()
 
 class Fingerprint(object):
+  ''' Fingerprints are immutable once constructed. Equality and hashing go
+  through _key(), which subclasses define: a tuple of the fields that
+  identify the fingerprint. It is computed once, on first use. '''
   __metaclass__ = abc.ABCMeta
+  __slots__ = ('_field2value', '_cached_key', '_hash', '__weakref__')
 
   # This should really be a protected constructor
   def __init__(self, field2value):
@@ -26,6 +34,42 @@ class Fingerprint(object):
       if type(value) == list:
         field2value[field] = tuple(value)
     self._field2value = field2value
+    self._cached_key = None
+    self._hash = None
+
+  @abc.abstractmethod
+  def _key(self):
+    pass
+
+  def key(self):
+    if self._cached_key is None:
+      self._cached_key = self._key()
+    return self._cached_key
+
+  def intern(self):
+    ''' Return the canonical fingerprint equal to this one, so that equal
+    fingerprints usually compare by identity '''
+    return _interned.setdefault((type(self), self.key()), self)
+
+  def __hash__(self):
+    if self._hash is None:
+      self._hash = hash(self.key())
+    return self._hash
+
+  def __eq__(self, other):
+    if self is other:
+      return True
+    if type(other) != type(self):
+      return False
+    return self.__hash__() == other.__hash__() and self.key() == other.key()
+
+  def __getstate__(self):
+    return self._field2value
+
+  def __setstate__(self, field2value):
+    self._field2value = field2value
+    self._cached_key = None
+    self._hash = None
 
   def to_dict(self):
     flattened = {}
@@ -63,14 +107,6 @@ class Fingerprint(object):
       return True
     return nested_fingerprint.check_match(match)
 
-  @abc.abstractmethod
-  def __hash__(self):
-    pass
-
-  @abc.abstractmethod
-  def __eq__(self, other):
-    pass
-
   def __getitem__(self, key):
     return self._field2value[key]
 
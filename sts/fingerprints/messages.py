@@ -14,6 +14,7 @@
 # limitations under the License.
 
 from sts.fingerprints.base import Fingerprint
+from sts.util.lru_cache import LRUCache
 from pox.openflow.libopenflow_01 import ofp_action_output
 from pox.openflow.libopenflow_01 import ofp_flow_mod_command_rev_map
 from pox.lib.packet.ethernet import ethernet
@@ -21,6 +22,7 @@ from pox.lib.packet.lldp import lldp
 from pox.lib.packet.arp import arp
 from pox.lib.packet.ipv4 import ipv4
 
+from operator import attrgetter
 import sys
 try:
   # Import a dummy hsa module to check that the submodule is there.
@@ -48,6 +50,16 @@ def process_data(msg):
     dp_packet = ethernet(msg.data)
     return DPFingerprint.from_pkt(dp_packet)
 
+def _cache_key(pkt):
+  ''' The packed message minus its xid, or None if it can't be packed '''
+  try:
+    packed = pkt.pack()
+  except Exception:
+    return None
+  # The xid (bytes 4-8 of the header) differs between otherwise identical
+  # messages, and isn't part of the fingerprint
+  return packed[:4] + packed[8:]
+
 def process_actions(msg):
   return tuple("output(%d)" % a.port if isinstance(a, ofp_action_output) else str(type(a)) for a in msg.actions)
 
@@ -60,6 +72,7 @@ def convert_match_to_human_readable_string(pkt):
 
 class OFFingerprint(Fingerprint):
   ''' Fingerprints for openflow messages '''
+  __slots__ = ()
   #  ofp_type -> fields to include in fingerprint
   # TODO(cs): I'm erring on the side of sparseness rather than completeness. We
   # may need to include more fields here to get an unambiguous fingerprint
@@ -117,6 +130,11 @@ class OFFingerprint(Fingerprint):
     'command': lambda ofp: OFFingerprint.flow_mod_commands[ofp.command]
   }
 
+  # pkt_type -> [(field, function from pkt to value)]
+  _extractors = {}
+  # (pkt_type, packed pkt minus xid) -> OFFingerprint
+  _cache = LRUCache(4096)
+
   def __init__(self, field2value):
     if type(field2value) == OFFingerprint:
       field2value = field2value._field2value
@@ -126,50 +144,49 @@ class OFFingerprint(Fingerprint):
         field2value[field] = DPFingerprint(value)
     super(OFFingerprint, self).__init__(field2value)
 
+  @staticmethod
+  def _extractor(pkt_type):
+    if pkt_type not in OFFingerprint._extractors:
+      if pkt_type not in OFFingerprint.pkt_type_to_fields:
+        raise ValueError("Unknown pkt_type %s" % pkt_type)
+      OFFingerprint._extractors[pkt_type] = [
+        (field, OFFingerprint.special_fields.get(field, attrgetter(field)))
+        for field in OFFingerprint.pkt_type_to_fields[pkt_type] ]
+    return OFFingerprint._extractors[pkt_type]
+
   @staticmethod
   def from_pkt(pkt):
     pkt_type = type(pkt).__name__
-    if pkt_type not in OFFingerprint.pkt_type_to_fields:
-      raise ValueError("Unknown pkt_type %s" % pkt_type)
+    extractor = OFFingerprint._extractor(pkt_type)
+    cache_key = _cache_key(pkt)
+    if cache_key is not None:
+      cache_key = (pkt_type, cache_key)
+      fingerprint = OFFingerprint._cache.get(cache_key)
+      if fingerprint is not None:
+        return fingerprint
     field2value = {}
     field2value["class"] = pkt_type
-    fields = OFFingerprint.pkt_type_to_fields[pkt_type]
-    for field in fields:
-      if field in OFFingerprint.special_fields:
-        value = OFFingerprint.special_fields[field](pkt)
-      else:
-        value = getattr(pkt, field)
-      field2value[field] = value
-    return OFFingerprint(field2value)
+    for (field, extract) in extractor:
+      field2value[field] = extract(pkt)
+    fingerprint = OFFingerprint(field2value).intern()
+    if cache_key is not None:
+      OFFingerprint._cache.put(cache_key, fingerprint)
+    return fingerprint
 
   def human_str(self):
     return "%s: " % self._field2value["class"] + \
         ", ".join("%s=%s" % (k, v) for (k,v) in self._field2value.iteritems() if k != "class" )
 
 
-  def __hash__(self):
-    hash = 0
+  def _key(self):
     class_name = self._field2value["class"]
-    hash += class_name.__hash__()
     # Note that the order is important
-    for field in self.pkt_type_to_fields[class_name]:
-      hash += self._field2value[field].__hash__()
-    return hash
-
-  def __eq__(self, other):
-    if type(other) != OFFingerprint:
-      return False
-    if self._field2value["class"] != other._field2value["class"]:
-      return False
-    klass = self._field2value["class"]
-    for field in self.pkt_type_to_fields[klass]:
-      ###### NOTE: do /not/ use the '!=' operator here, this doesn't invoke an override __eq__ method
-      if not (self._field2value[field] == other._field2value[field]):
-        return False
-    return True
+    return (class_name,) + tuple(self._field2value[field]
+                                 for field in self.pkt_type_to_fields[class_name])
 
 class DPFingerprint(Fingerprint):
   ''' Fingerprints for dataplane messages '''
+  __slots__ = ()
   fields = ['dl_src', 'dl_dst', 'nw_src', 'nw_dst']
 
   def __init__(self, field2value):
@@ -185,49 +202,28 @@ class DPFingerprint(Fingerprint):
     eth = pkt
     ip = pkt.next
     if type(ip) == lldp:
-      return DPFingerprint({'class': 'lldp'})
+      fingerprint = DPFingerprint({'class': 'lldp'})
     elif type(ip) == ipv4:
       field2value = {'dl_src': eth.src.toStr(), 'dl_dst': eth.dst.toStr(),
                      'nw_src': ip.srcip.toStr(), 'nw_dst': ip.dstip.toStr()}
-      return DPFingerprint(field2value)
+      fingerprint = DPFingerprint(field2value)
     elif type(ip) == arp:
       # TODO(cs): should include more context
-      return DPFingerprint({'class': 'arp'})
+      fingerprint = DPFingerprint({'class': 'arp'})
     elif type(ip) == str:
-      return DPFingerprint({'dl_type' : eth.type })
+      fingerprint = DPFingerprint({'dl_type' : eth.type })
     else:
       raise ValueError("Unknown dataplane packet type %s (eth type 0x%x)" % (str(type(ip)), eth.type))
+    return fingerprint.intern()
 
-  def __hash__(self):
-    hash = 0
-    if 'class' in self._field2value and len(self._field2value) == 1:
-      # This is not an IP packet -- it could be, e.g., an LLDAP packet
-      hash += self._field2value['class'].__hash__()
-      return hash
-
-    if 'dl_type' in self._field2value and len(self._field2value) == 1:
-      # This is not an IP packet -- it could be, e.g., an LLDAP packet
-      hash += self._field2value['dl_type'].__hash__()
-      return hash
-
-    # Else it's an IP packet
-    # Note that the order is important
-    for field in self.fields:
-      hash += self._field2value[field].__hash__()
-    return hash
-
-  def __eq__(self, other):
-    if type(other) != DPFingerprint:
-      return False
-    if len(self._field2value) != len(other._field2value):
-      return False
+  def _key(self):
+    size = len(self._field2value)
     if 'dl_type' in self._field2value:
-      return ('dl_type' in other._field2value and
-              self._field2value['dl_type'] == other._field2value['dl_type'])
+      # This is not an IP packet
+      return ('dl_type', self._field2value['dl_type'], size)
     if 'class' in self._field2value:
-      return ('class' in other._field2value and
-              self._field2value['class'] == other._field2value['class'])
-    for field in self.fields:
-      if self._field2value[field] != other._field2value[field]:
-        return False
-    return True
+      # This is not an IP packet -- it could be, e.g., an LLDP packet
+      return ('class', self._field2value['class'], size)
+    # Else it's an IP packet
+    # Note that the order is important
+    return tuple(self._field2value[field] for field in self.fields) + (size,)
@@ -0,0 +1,622 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+In-tree header space analysis over the flow tables of FuzzSoftwareSwitches,
+as an alternative to the external hassel modules for InvariantChecker.
+
+Headers are packed into a single bit vector (see header_fields). A wildcard
+expression is a pair of integers (mask, value): the bits set in mask are
+fixed to the corresponding bits of value, all others are wildcarded. Python's
+arbitrary precision integers make intersection a handful of bitwise
+operations. A HeaderSpace is a union of terms, each a wildcard minus a list of
+wildcards ("lazy differences", as in hassel), so that subtracting
+higher-priority rules doesn't blow up the number of terms.
+
+Per-switch transfer functions are compiled from the flow table, with fully
+shadowed rules dropped, and memoized for as long as the flow table is
+unchanged. So are the results of applying them. IncrementalAnalysis goes
+further, and only recomputes reachability from the ports whose paths cross a
+switch that has changed since the last check.
+'''
+
+from pox.openflow.libopenflow_01 import *
+from pox.openflow.flow_table import FlowTableModification
+from collections import defaultdict
+import logging
+log = logging.getLogger("header_space")
+
+try:
+  from config_parser.openflow_parser import get_uniq_port_id
+except ImportError:
+  # hassel isn't installed
+  def get_uniq_port_id(switch, port):
+    ''' A unique integer id for a switch port '''
+    return (switch.dpid << 16) | port.port_no
+
+# (name of the ofp_match field, width in bits), least significant first
+header_fields = [
+  ("tp_dst", 16), ("tp_src", 16), ("nw_dst", 32), ("nw_src", 32),
+  ("nw_proto", 8), ("nw_tos", 8), ("dl_type", 16), ("dl_vlan_pcp", 8),
+  ("dl_vlan", 16), ("dl_dst", 48), ("dl_src", 48),
+]
+
+# name -> (offset, width)
+field_layout = {}
+_offset = 0
+for (_name, _width) in header_fields:
+  field_layout[_name] = (_offset, _width)
+  _offset += _width
+header_length = _offset
+
+def field_mask(name, prefix_bits=None):
+  ''' The mask of the field's bits (or of its prefix_bits most significant
+  bits) within the header '''
+  (offset, width) = field_layout[name]
+  if prefix_bits is None:
+    prefix_bits = width
+  return (((1 << prefix_bits) - 1) << (width - prefix_bits)) << offset
+
+def _to_int(value):
+  ''' Convert EthAddrs, IPAddrs, and their string forms to integers '''
+  if isinstance(value, (int, long)):
+    return value
+  if hasattr(value, "toInt"):
+    return value.toInt()
+  if hasattr(value, "toUnsigned"):
+    return value.toUnsigned()
+  if isinstance(value, basestring):
+    if ":" in value:
+      return int(value.replace(":", ""), 16)
+    if "." in value:
+      result = 0
+      for octet in value.split("."):
+        result = (result << 8) | int(octet)
+      return result
+    return int(value)
+  return int(value)
+
+def set_field(mask, value, name, field_value):
+  ''' Return the wildcard (mask, value) with field name set to field_value '''
+  fmask = field_mask(name)
+  (offset, _) = field_layout[name]
+  return (mask | fmask, (value & ~fmask) | ((_to_int(field_value) << offset) & fmask))
+
+# -------------------------------------------------------------------------- #
+# Wildcard expressions                                                       #
+# -------------------------------------------------------------------------- #
+
+def intersect(w1, w2):
+  ''' Return the intersection of two wildcards, or None if it's empty '''
+  (m1, v1) = w1
+  (m2, v2) = w2
+  if (v1 ^ v2) & m1 & m2:
+    return None
+  return (m1 | m2, v1 | v2)
+
+def contains(w1, w2):
+  ''' Whether wildcard w1 is a superset of wildcard w2 '''
+  (m1, v1) = w1
+  (m2, v2) = w2
+  return (m1 & m2) == m1 and (v1 ^ v2) & m1 == 0
+
+def subtract(w1, w2):
+  ''' Return disjoint wildcards whose union is w1 minus w2 '''
+  if intersect(w1, w2) is None:
+    return [w1]
+  (m1, v1) = w1
+  (m2, v2) = w2
+  pieces = []
+  free = m2 & ~m1
+  while free:
+    bit = free & -free
+    free ^= bit
+    # Agree with w2 on the bits before this one, differ on this one
+    pieces.append((m1 | bit, v1 | (~v2 & bit)))
+    m1 |= bit
+    v1 |= v2 & bit
+  return pieces
+
+def covered(w, diffs):
+  ''' Whether the union of the wildcards in diffs covers wildcard w '''
+  for (i, d) in enumerate(diffs):
+    if contains(d, w):
+      return True
+    if intersect(w, d) is not None:
+      # Every piece of w that d doesn't cover must be covered by the rest
+      rest = diffs[i+1:]
+      return all(covered(piece, rest) for piece in subtract(w, d))
+  return False
+
+def wildcard_str(w):
+  (mask, value) = w
+  fields = []
+  for (name, width) in reversed(header_fields):
+    (offset, _) = field_layout[name]
+    fmask = (mask >> offset) & ((1 << width) - 1)
+    if fmask == 0:
+      continue
+    fvalue = (value >> offset) & fmask
+    if fmask == (1 << width) - 1:
+      fields.append("%s=%x" % (name, fvalue))
+    else:
+      fields.append("%s=%x/%x" % (name, fvalue, fmask))
+  if fields == []:
+    return "*"
+  return ",".join(fields)
+
+class HeaderSpace(object):
+  ''' A union of terms (wildcard, diffs): the headers matching the wildcard,
+  except those matching any of the diffs. Immutable. '''
+  def __init__(self, terms):
+    self.terms = tuple(terms)
+
+  @staticmethod
+  def full():
+    return HeaderSpace([((0, 0), ())])
+
+  @staticmethod
+  def from_wildcard(w):
+    return HeaderSpace([(w, ())])
+
+  def is_empty(self):
+    return self.terms == ()
+
+  def intersect(self, w):
+    terms = []
+    for (t, diffs) in self.terms:
+      t = intersect(t, w)
+      if t is None:
+        continue
+      diffs = tuple(d for d in diffs if intersect(t, d) is not None)
+      if any(contains(d, t) for d in diffs):
+        continue
+      terms.append((t, diffs))
+    return HeaderSpace(terms)
+
+  def intersects(self, other):
+    ''' Whether the two header spaces overlap '''
+    for (t1, diffs1) in self.terms:
+      for (t2, diffs2) in other.terms:
+        t = intersect(t1, t2)
+        if t is not None and not covered(t, diffs1 + diffs2):
+          return True
+    return False
+
+  def minus(self, w):
+    terms = []
+    for (t, diffs) in self.terms:
+      if intersect(t, w) is None:
+        terms.append((t, diffs))
+      elif not contains(w, t):
+        terms.append((t, diffs + (w,)))
+    return HeaderSpace(terms)
+
+  def compact(self):
+    ''' Drop terms that are covered by their diffs '''
+    return HeaderSpace([ (t, diffs) for (t, diffs) in self.terms
+                         if not covered(t, diffs) ])
+
+  def rewrite(self, name, field_value):
+    ''' Set the field to field_value in all headers '''
+    fmask = field_mask(name)
+    terms = []
+    for (t, diffs) in self.terms:
+      # Diffs on the rewritten bits no longer apply once they're
+      # overwritten, so subtract those exactly first.
+      pieces = [t]
+      kept_diffs = []
+      for d in diffs:
+        if d[0] & fmask:
+          pieces = [ p for piece in pieces for p in subtract(piece, d) ]
+        else:
+          kept_diffs.append(d)
+      for piece in pieces:
+        piece = set_field(piece[0], piece[1], name, field_value)
+        kept = tuple(d for d in kept_diffs if intersect(piece, d) is not None)
+        if not any(contains(d, piece) for d in kept):
+          terms.append((piece, kept))
+    return HeaderSpace(terms)
+
+  def __eq__(self, other):
+    return type(other) == HeaderSpace and self.terms == other.terms
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+  def __hash__(self):
+    return hash(self.terms)
+
+  def __str__(self):
+    if self.is_empty():
+      return "(empty)"
+    terms = []
+    for (t, diffs) in self.terms:
+      s = wildcard_str(t)
+      if diffs != ():
+        s += " - (%s)" % " + ".join(wildcard_str(d) for d in diffs)
+      terms.append(s)
+    return " U ".join(terms)
+
+  def __repr__(self):
+    return "HeaderSpace(%s)" % str(self)
+
+# -------------------------------------------------------------------------- #
+# Transfer functions                                                         #
+# -------------------------------------------------------------------------- #
+
+# action type -> (header field, ofp_action attribute)
+_set_field_actions = {
+  OFPAT_SET_VLAN_VID : ("dl_vlan", "vlan_vid"),
+  OFPAT_SET_VLAN_PCP : ("dl_vlan_pcp", "vlan_pcp"),
+  OFPAT_SET_DL_SRC : ("dl_src", "dl_addr"),
+  OFPAT_SET_DL_DST : ("dl_dst", "dl_addr"),
+  OFPAT_SET_NW_SRC : ("nw_src", "nw_addr"),
+  OFPAT_SET_NW_DST : ("nw_dst", "nw_addr"),
+  OFPAT_SET_NW_TOS : ("nw_tos", "nw_tos"),
+  OFPAT_SET_TP_SRC : ("tp_src", "tp_port"),
+  OFPAT_SET_TP_DST : ("tp_dst", "tp_port"),
+}
+
+def compile_match(match):
+  ''' Return (in_port or None, wildcard) for an ofp_match '''
+  mask = 0
+  value = 0
+  for (name, width) in header_fields:
+    field_value = getattr(match, name, None)
+    if field_value is None:
+      continue
+    prefix_bits = width
+    if name in ("nw_src", "nw_dst") and hasattr(match, "get_" + name):
+      (field_value, prefix_bits) = getattr(match, "get_" + name)()
+      if field_value is None or prefix_bits == 0:
+        continue
+    fmask = field_mask(name, prefix_bits)
+    mask |= fmask
+    value |= (_to_int(field_value) << field_layout[name][0]) & fmask
+  return (getattr(match, "in_port", None), (mask, value))
+
+def compile_actions(actions):
+  ''' Return a tuple of ("output", port) and ("set", field, value) '''
+  compiled = []
+  for action in actions:
+    if action.type in (OFPAT_OUTPUT, OFPAT_ENQUEUE):
+      compiled.append(("output", action.port))
+    elif action.type == OFPAT_STRIP_VLAN:
+      compiled.append(("set", "dl_vlan", OFP_VLAN_NONE))
+    elif action.type in _set_field_actions:
+      (name, attribute) = _set_field_actions[action.type]
+      compiled.append(("set", name, _to_int(getattr(action, attribute))))
+    else:
+      log.debug("Ignoring unknown action %s" % str(action))
+  return tuple(compiled)
+
+def compile_rules(switch):
+  ''' Return the switch's flow table as a tuple of (in_port, wildcard,
+  actions), highest priority first '''
+  entries = sorted(switch.table.entries, key=lambda e: -e.priority)
+  return tuple(compile_match(e.match) + (compile_actions(e.actions),)
+               for e in entries)
+
+class TransferFunction(object):
+  ''' Maps (in_port, HeaderSpace) to the [(out_port, HeaderSpace)] that a
+  flow table forwards. out_ports may be OFPP_* constants. Headers that match
+  no rule are sent to the controller, and not returned. '''
+  # Maximum number of memoized apply() results
+  max_memo_size = 10000
+
+  def __init__(self, rules):
+    self.rules = self._unshadowed(rules)
+    self._memo = {}
+
+  @staticmethod
+  def _unshadowed(rules):
+    ''' Drop rules whose matches are covered by higher priority rules '''
+    result = []
+    for (i, (in_port, w, actions)) in enumerate(rules):
+      higher = tuple(hw for (hin_port, hw, _) in rules[:i]
+                     if hin_port is None or hin_port == in_port)
+      if covered(w, higher):
+        continue
+      result.append((in_port, w, actions))
+    return result
+
+  def apply(self, in_port, hs):
+    key = (in_port, hs)
+    if key in self._memo:
+      return self._memo[key]
+    outputs = []
+    remaining = hs
+    for (rule_in_port, w, actions) in self.rules:
+      if rule_in_port is not None and rule_in_port != in_port:
+        continue
+      matched = remaining.intersect(w).compact()
+      if matched.is_empty():
+        continue
+      for action in actions:
+        if action[0] == "output":
+          outputs.append((action[1], matched))
+        else:
+          matched = matched.rewrite(action[1], action[2])
+      remaining = remaining.minus(w)
+      if remaining.is_empty():
+        break
+    if len(self._memo) >= self.max_memo_size:
+      self._memo.clear()
+    self._memo[key] = outputs
+    return outputs
+
+def transfer_function(switch):
+  return TransferFunction(compile_rules(switch))
+
+# -------------------------------------------------------------------------- #
+# Network-wide analysis                                                      #
+# -------------------------------------------------------------------------- #
+
+class NetworkModel(object):
+  ''' The live switches' transfer functions, and the live links between them.
+  Locations are (dpid, port_no) pairs. tfs optionally supplies already
+  computed transfer functions, keyed by dpid. '''
+  def __init__(self, live_switches, live_links, access_links, tfs=None):
+    self.switches = { sw.dpid : sw for sw in live_switches }
+    if tfs is None:
+      tfs = {}
+    self.tfs = { dpid : tfs[dpid] if dpid in tfs else transfer_function(sw)
+                 for dpid, sw in self.switches.iteritems() }
+    # location -> location at the other end of a live link
+    self.links = {}
+    for link in live_links:
+      if hasattr(link, 'start_node'):
+        ends = [((link.start_node, link.start_port), (link.end_node, link.end_port))]
+      else:
+        ends = [((link.node1, link.port1), (link.node2, link.port2)),
+                ((link.node2, link.port2), (link.node1, link.port1))]
+      for ((start_node, start_port), (end_node, end_port)) in ends:
+        if start_node.dpid in self.switches and end_node.dpid in self.switches:
+          self.links[(start_node.dpid, start_port.port_no)] = \
+            (end_node.dpid, end_port.port_no)
+    # location -> AccessLink
+    self.edges = {}
+    for link in access_links:
+      if link.switch.dpid in self.switches:
+        self.edges[(link.switch.dpid, link.switch_port.port_no)] = link
+    # Bounds the length of paths that revisit locations with disjoint headers
+    self.max_hops = 2 * (len(self.links) + len(self.edges)) + 1
+
+  def port_id(self, location):
+    (dpid, port_no) = location
+    switch = self.switches[dpid]
+    return get_uniq_port_id(switch, switch.ports[port_no])
+
+  def live_locations(self):
+    ''' Every switch port with a live link attached '''
+    return sorted(set(self.links.keys()) | set(self.edges.keys()))
+
+  def _out_ports(self, dpid, in_port, out_port):
+    ''' Return [(port_no, explicit)] for an output action '''
+    if out_port == OFPP_IN_PORT:
+      return [(in_port, True)]
+    if out_port in (OFPP_FLOOD, OFPP_ALL):
+      return [ (p, False) for p in sorted(self.switches[dpid].ports.keys())
+               if p != in_port and p < OFPP_MAX ]
+    if out_port >= OFPP_MAX:
+      # CONTROLLER, LOCAL, NORMAL, TABLE, NONE
+      return []
+    return [(out_port, True)]
+
+  def propagate(self, start, result):
+    ''' Inject all headers at location start, and record what happens to them
+    in result, an AnalysisResult '''
+    stack = [(start, HeaderSpace.full(), ())]
+    while stack != []:
+      (location, hs, visits) = stack.pop()
+      (dpid, in_port) = location
+      result.touched.add(dpid)
+      visits = visits + ((location, hs),)
+      if len(visits) > self.max_hops:
+        log.warn("Giving up on path from %s after %d hops" % (str(start), len(visits)))
+        continue
+      for (out_port, out_hs) in self.tfs[dpid].apply(in_port, hs):
+        for (port_no, explicit) in self._out_ports(dpid, in_port, out_port):
+          if port_no == in_port and out_port != OFPP_IN_PORT:
+            # Dropped by the switch, since OFPP_IN_PORT wasn't used
+            continue
+          out_location = (dpid, port_no)
+          if out_location in self.edges:
+            result.reached[start].append((out_hs, out_location))
+          elif out_location in self.links:
+            next_location = self.links[out_location]
+            loop = self._find_loop(visits, next_location, out_hs)
+            if loop is not None:
+              result.loops.add(loop)
+            else:
+              stack.append((next_location, out_hs, visits))
+          elif explicit:
+            result.blackholes.add((dpid, port_no, "no live link"))
+
+  @staticmethod
+  def _find_loop(visits, next_location, hs):
+    for (i, (location, visited_hs)) in enumerate(visits):
+      if location == next_location and visited_hs.intersects(hs):
+        cycle = [ l for (l, _) in visits[i:] ]
+        # Canonical rotation, so that each loop is reported once
+        j = cycle.index(min(cycle))
+        return tuple(cycle[j:] + cycle[:j])
+    return None
+
+class AnalysisResult(object):
+  def __init__(self):
+    # start location -> [(final HeaderSpace, final location)]
+    self.reached = defaultdict(list)
+    # tuples of locations
+    self.loops = set()
+    # (dpid, port_no, reason)
+    self.blackholes = set()
+    # dpids of the switches that headers passed through
+    self.touched = set()
+
+  def update(self, other):
+    for start, final_locations in other.reached.iteritems():
+      self.reached[start].extend(final_locations)
+    self.loops |= other.loops
+    self.blackholes |= other.blackholes
+    self.touched |= other.touched
+
+def analyze(model, start_locations):
+  result = AnalysisResult()
+  for start in start_locations:
+    if start[0] in model.switches:
+      model.propagate(start, result)
+  return result
+
+def _loop_strs(result):
+  return sorted("Loop: %s" % " -> ".join("%d:%d" % location for location in loop)
+                for loop in result.loops)
+
+def _blackhole_strs(result):
+  return sorted("Blackhole: %d:%d (%s)" % b for b in result.blackholes)
+
+def _omega(model, result):
+  omega = {}
+  for start, final_locations in result.reached.iteritems():
+    if start not in model.edges:
+      continue
+    omega[model.port_id(start)] = [ (hs, model.port_id(location))
+                                    for (hs, location) in final_locations ]
+  return omega
+
+def _connected_pairs(omega):
+  return set((start, final) for start, final_locations in omega.iteritems()
+                            for (_, final) in final_locations)
+
+def find_loops(live_switches, live_links, access_links):
+  ''' Return a sorted list of strings describing forwarding loops '''
+  model = NetworkModel(live_switches, live_links, access_links)
+  return _loop_strs(analyze(model, model.live_locations()))
+
+def find_blackholes(live_switches, live_links, access_links):
+  ''' Return a sorted list of strings describing ports that packets are
+  explicitly forwarded out of, but that have no live link attached '''
+  model = NetworkModel(live_switches, live_links, access_links)
+  return _blackhole_strs(analyze(model, model.live_locations()))
+
+def compute_omega(live_switches, live_links, access_links):
+  ''' Return { original port id -> [(final HeaderSpace, final port id)] } for
+  headers injected at each access link '''
+  model = NetworkModel(live_switches, live_links, access_links)
+  return _omega(model, analyze(model, sorted(model.edges.keys())))
+
+def find_connected_pairs(live_switches, live_links, access_links):
+  ''' Return the set of (original port id, final port id) between which some
+  header is forwarded '''
+  return _connected_pairs(compute_omega(live_switches, live_links, access_links))
+
+class IncrementalAnalysis(object):
+  '''
+  Keeps per-switch transfer functions and per-port analysis results between
+  calls to update(), and only recomputes what could have changed since.
+
+  Flow table changes are learned from FlowTableModification events raised by
+  each switch's table. Switch and link failures and recoveries are learned by
+  comparing the live switches and links with those of the previous update().
+  Either marks the switches involved as changed. The analysis from a start
+  location is reused unless its headers passed through a changed switch.
+  '''
+  def __init__(self):
+    # dpid -> (switch whose table we listen to, listener)
+    self._listeners = {}
+    # dpids whose flow tables changed since the last update()
+    self._dirty = set()
+    # dpid -> TransferFunction
+    self._tfs = {}
+    # Live dpids, links and edges as of the last update()
+    self._live_dpids = set()
+    self._links = {}
+    self._edges = {}
+    # start location -> AnalysisResult
+    self._results = {}
+    self.model = None
+    self.result = AnalysisResult()
+    # Number of start locations recomputed by the last update()
+    self.recomputed = 0
+
+  def _subscribe(self, switch):
+    dpid = switch.dpid
+    if dpid in self._listeners:
+      (old_switch, listener) = self._listeners[dpid]
+      if old_switch is switch:
+        return
+      old_switch.table.removeListener(listener)
+    def listener(event):
+      self._dirty.add(dpid)
+    switch.table.addListener(FlowTableModification, listener)
+    self._listeners[dpid] = (switch, listener)
+    self._dirty.add(dpid)
+
+  def close(self):
+    ''' Stop listening to flow table changes '''
+    for (switch, listener) in self._listeners.values():
+      switch.table.removeListener(listener)
+    self._listeners = {}
+
+  def update(self, live_switches, live_links, access_links):
+    ''' Bring the analysis up to date, and return it as an AnalysisResult '''
+    for switch in live_switches:
+      self._subscribe(switch)
+    changed = self._dirty
+    self._dirty = set()
+    for dpid in changed:
+      self._tfs.pop(dpid, None)
+    model = NetworkModel(live_switches, live_links, access_links, tfs=self._tfs)
+    self._tfs = model.tfs
+
+    live_dpids = set(model.switches.keys())
+    changed |= live_dpids ^ self._live_dpids
+    for (old, new) in [(self._links, model.links), (self._edges, model.edges)]:
+      for location in set(old.keys()) | set(new.keys()):
+        if old.get(location) != new.get(location):
+          changed.add(location[0])
+    self._live_dpids = live_dpids
+    self._links = dict(model.links)
+    self._edges = dict(model.edges)
+
+    results = {}
+    self.recomputed = 0
+    for start in model.live_locations():
+      cached = self._results.get(start)
+      if cached is not None and not (cached.touched & changed):
+        results[start] = cached
+        continue
+      results[start] = AnalysisResult()
+      model.propagate(start, results[start])
+      self.recomputed += 1
+    self._results = results
+
+    self.model = model
+    self.result = AnalysisResult()
+    for result in results.itervalues():
+      self.result.update(result)
+    return self.result
+
+  def loops(self):
+    return _loop_strs(self.result)
+
+  def blackholes(self):
+    return _blackhole_strs(self.result)
+
+  def omega(self):
+    return _omega(self.model, self.result)
+
+  def connected_pairs(self):
+    return _connected_pairs(self.omega())
@@ -129,13 +129,16 @@ class InputLogger(object):
   def allow_timeouts(self):
     self._disallow_timeouts = False
 
-  def _serialize_event(self, event, output):
+  def _event_line(self, event):
     if self._disallow_timeouts and hasattr(event, "disallow_timeouts"):
       event.timeout_disallowed = True
     self.last_time = event.event_time
     json_hash = event.to_json()
     log.debug("logging event %r" % event)
-    output.write(json_hash + '\n')
+    return json_hash + '\n'
+
+  def _serialize_event(self, event, output):
+    output.write(self._event_line(event))
 
   def log_input_event(self, event):
     '''
@@ -148,6 +151,17 @@ class InputLogger(object):
     else:
       self._events_after_close.append(event)
 
+  def log_input_events(self, events):
+    '''
+    Log each of the events as a json hash, with a single write.
+    '''
+    if not self.output:
+      raise Exception("Not opened -- call InputLogger.open")
+    if not self.output.closed:
+      self.output.write("".join(self._event_line(e) for e in events))
+    else:
+      self._events_after_close.extend(events)
+
   def dump_buffered_events(self, events):
     ''' If there were un-acknowledge message receives or state changes at the
     end of the run, dump them to a separate input trace ".unacked" '''
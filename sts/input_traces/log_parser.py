@@ -28,10 +28,18 @@ Hashes may have additional custom keys. For example, external input events
 must the following key:
   'dependent_labels': list of dependent labels (internal events that will not occur if this
                       event is pruned)
+
+Large superlogs can be parsed lazily with iter_parse(), and indexed with
+build_index() so that individual events can be looked up, filtered and
+compared without decoding the rest of the superlog.
 '''
 
 import json
 import sts.replay_event as event
+from collections import namedtuple
+import hashlib
+import struct
+import os
 import logging
 log = logging.getLogger("superlog_parser")
 
@@ -79,14 +87,14 @@ def sanity_check_internal_event(existing_event_labels, dependent_labels,
   '''
   dependent_labels.discard(json_hash['label'])
 
-def parse_path(logfile_path):
-  '''Input: path to a logfile.
+def parse_path(logfile_path, skip_classes=()):
+  '''Input: path to a logfile, and optionally a list of event classes to leave
+  out.
 
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
   source events that are necessary conditions for its occurence.'''
-  with open(logfile_path) as logfile:
-    return parse(logfile)
+  return list(iter_parse_path(logfile_path, skip_classes=skip_classes))
 
 def check_legacy_format(json_hash):
   if (hasattr(json_hash, 'controller_id') and
@@ -97,15 +105,43 @@ def check_legacy_format(json_hash):
     # Insert a dummy logical_round number
     json_hash['logical_round'] = -1
 
-def parse(logfile):
-  '''Input: logfile.
+def _check_and_decode(json_hash, event_labels, dependent_labels,
+                      skip_class_names=()):
+  '''Sanity check json_hash against the events before it, and return the
+  event it represents. Returns None for events of unknown or skipped
+  classes.'''
+  check_unique_label(json_hash['label'], event_labels)
+  check_legacy_format(json_hash)
+  class_name = json_hash['class']
+  if class_name in input_name_to_class:
+    sanity_check_external_input_event(event_labels,
+                                      dependent_labels,
+                                      json_hash)
+    klass = input_name_to_class[class_name]
+  elif class_name in internal_event_name_to_class:
+    sanity_check_internal_event(event_labels, dependent_labels,
+                                json_hash)
+    klass = internal_event_name_to_class[class_name]
+  elif class_name in special_event_name_to_class:
+    klass = special_event_name_to_class[class_name]
+  else:
+    print "Warning: Unknown class type %s" % class_name
+    return None
+  if class_name in skip_class_names:
+    return None
+  return klass.from_json(json_hash)
 
-  Output: A list of all the internal and external events in the order in which
-  they exist in the logfile. Each internal event is annotated with the set of
-  source events that are necessary conditions for its occurence.'''
+def iter_parse(logfile, skip_classes=()):
+  '''Input: logfile, and optionally a list of event classes not to construct.
+
+  Output: A generator over all the internal and external events in the order
+  in which they exist in the logfile, except events of skip_classes. Unlike
+  parse(), the whole trace is never held in memory. Events of skip_classes
+  are still sanity checked.
 
-  # the return value of the parsed log
-  trace = []
+  N.B. the check that all dependent labels are present happens once the last
+  event has been yielded.'''
+  skip_class_names = set(klass.__name__ for klass in skip_classes)
   # a set of all event labels
   event_labels = set()
   # dependent labels that must be present somewhere in the log.
@@ -113,25 +149,196 @@ def parse(logfile):
 
   for line in logfile:
     json_hash = json.loads(line.rstrip())
-    check_unique_label(json_hash['label'], event_labels)
-    check_legacy_format(json_hash)
-    if json_hash['class'] in input_name_to_class:
-      sanity_check_external_input_event(event_labels,
-                                        dependent_labels,
-                                        json_hash)
-      event = input_name_to_class[json_hash['class']].from_json(json_hash)
-    elif json_hash['class'] in internal_event_name_to_class:
-      sanity_check_internal_event(event_labels, dependent_labels,
-                                  json_hash)
-      event = internal_event_name_to_class[json_hash['class']].from_json(json_hash)
-    elif json_hash['class'] in special_event_name_to_class:
-      event = special_event_name_to_class[json_hash['class']].from_json(json_hash)
-    else:
-      print "Warning: Unknown class type %s" % json_hash['class']
-      continue
-    trace.append(event)
+    event = _check_and_decode(json_hash, event_labels, dependent_labels,
+                              skip_class_names)
+    if event is not None:
+      yield event
 
   # all the foward dependencies should be satisfied!
   assert(len(dependent_labels) == 0)
 
-  return trace
+def parse(logfile, skip_classes=()):
+  '''Input: logfile.
+
+  Output: A list of all the internal and external events in the order in which
+  they exist in the logfile. Each internal event is annotated with the set of
+  source events that are necessary conditions for its occurence.'''
+  return list(iter_parse(logfile, skip_classes=skip_classes))
+
+def iter_parse_path(logfile_path, skip_classes=()):
+  '''Like iter_parse(), on the logfile at logfile_path. If the logfile has an
+  up-to-date sidecar index (see build_index()), events of skip_classes are
+  not even decoded.'''
+  entries = None
+  if skip_classes:
+    entries = load_index(logfile_path, build=False)
+  with open(logfile_path, 'rb') as logfile:
+    if entries is None:
+      for event in iter_parse(logfile, skip_classes=skip_classes):
+        yield event
+      return
+
+    skip_class_names = set(klass.__name__ for klass in skip_classes)
+    event_labels = set()
+    dependent_labels = set()
+    for entry in entries:
+      if entry.class_name in skip_class_names:
+        check_unique_label(entry.label, event_labels)
+        dependent_labels.discard(entry.label)
+        continue
+      json_hash = read_json(logfile, entry)
+      event = _check_and_decode(json_hash, event_labels, dependent_labels)
+      if event is not None:
+        yield event
+    assert(len(dependent_labels) == 0)
+
+# -------------------------------------------------------------------------- #
+# Sidecar index                                                              #
+# -------------------------------------------------------------------------- #
+# An index of a logfile is kept in the file logfile_path + INDEX_SUFFIX, so
+# that tools can find, filter and compare events without decoding the whole
+# logfile. Format (all integers big-endian):
+#   - magic
+#   - header: size and mtime (microseconds) of the indexed logfile, and the
+#     number of class names that follow
+#   - class names, each prefixed by its length
+#   - one record per event: offset and length of its line in the logfile,
+#     logical round, index of its class name, fingerprint_hash(), and the
+#     length of its label, followed by the label
+
+INDEX_SUFFIX = ".idx"
+_index_magic = "STSIDX1\n"
+_index_header = struct.Struct("!QQH")
+_index_string_length = struct.Struct("!H")
+_index_record = struct.Struct("!QIiH20sH")
+
+class IndexEntry(namedtuple('IndexEntry', ['offset', 'length', 'class_name',
+                                           'label', 'logical_round',
+                                           'fingerprint_hash'])):
+  '''The location and summary of one event in an indexed logfile'''
+  pass
+
+def index_path(logfile_path):
+  return logfile_path + INDEX_SUFFIX
+
+def fingerprint_hash(json_hash):
+  '''A digest of the event's class and fingerprint, so that events can be
+  compared without being decoded'''
+  fingerprint = json.dumps(json_hash.get('fingerprint'), sort_keys=True)
+  return hashlib.sha1(json_hash['class'] + "\n" + fingerprint).digest()
+
+def _logfile_version(logfile_path):
+  stat = os.stat(logfile_path)
+  return (stat.st_size, int(stat.st_mtime * 1000000))
+
+def build_index(logfile_path):
+  '''Index the logfile at logfile_path, and write the index next to it if
+  possible. Returns a list of IndexEntrys in the order of the logfile.'''
+  entries = []
+  (size, mtime) = _logfile_version(logfile_path)
+  with open(logfile_path, 'rb') as logfile:
+    offset = 0
+    for line in logfile:
+      json_hash = json.loads(line.rstrip())
+      entries.append(IndexEntry(offset, len(line), str(json_hash['class']),
+                                str(json_hash['label']),
+                                json_hash.get('logical_round', -1),
+                                fingerprint_hash(json_hash)))
+      offset += len(line)
+
+  class_names = sorted(set(e.class_name for e in entries))
+  class_name2id = { name : i for i, name in enumerate(class_names) }
+  chunks = [_index_magic, _index_header.pack(size, mtime, len(class_names))]
+  for name in class_names:
+    chunks.append(_index_string_length.pack(len(name)) + name)
+  for e in entries:
+    chunks.append(_index_record.pack(e.offset, e.length, e.logical_round,
+                                     class_name2id[e.class_name],
+                                     e.fingerprint_hash, len(e.label)) + e.label)
+  # Write atomically, since other processes may be reading the index
+  tmp_path = "%s.%d" % (index_path(logfile_path), os.getpid())
+  try:
+    with open(tmp_path, 'wb') as index_file:
+      index_file.write("".join(chunks))
+    os.rename(tmp_path, index_path(logfile_path))
+  except (IOError, OSError) as e:
+    # e.g. the logfile is in a read-only directory. The index is only an
+    # optimization, so carry on without it.
+    log.warn("Could not write index %s: %s" % (index_path(logfile_path), e))
+    if os.path.exists(tmp_path):
+      os.unlink(tmp_path)
+  return entries
+
+def _read_index(logfile_path):
+  '''Return the IndexEntrys of the logfile's index, or None if there is no
+  up-to-date index'''
+  path = index_path(logfile_path)
+  if not os.path.exists(path):
+    return None
+  with open(path, 'rb') as index_file:
+    data = index_file.read()
+  if not data.startswith(_index_magic):
+    return None
+  pos = len(_index_magic)
+  (size, mtime, class_count) = _index_header.unpack_from(data, pos)
+  if (size, mtime) != _logfile_version(logfile_path):
+    return None
+  pos += _index_header.size
+  class_names = []
+  for _ in xrange(class_count):
+    (length,) = _index_string_length.unpack_from(data, pos)
+    pos += _index_string_length.size
+    class_names.append(data[pos:pos+length])
+    pos += length
+  entries = []
+  while pos < len(data):
+    (offset, length, logical_round, class_id, digest, label_length) = \
+      _index_record.unpack_from(data, pos)
+    pos += _index_record.size
+    entries.append(IndexEntry(offset, length, class_names[class_id],
+                              data[pos:pos+label_length], logical_round,
+                              digest))
+    pos += label_length
+  return entries
+
+def load_index(logfile_path, build=True):
+  '''Return the IndexEntrys of the logfile at logfile_path. If there is no
+  up-to-date index, build one if build is True, otherwise return None.'''
+  try:
+    entries = _read_index(logfile_path)
+  except struct.error:
+    log.warn("Corrupt index %s" % index_path(logfile_path))
+    entries = None
+  except IOError as e:
+    log.warn("Could not read index %s: %s" % (index_path(logfile_path), e))
+    entries = None
+  if entries is None and build:
+    entries = build_index(logfile_path)
+  return entries
+
+def read_json(logfile, entry):
+  '''Return the json hash of the event at entry in logfile, an open file'''
+  logfile.seek(entry.offset)
+  json_hash = json.loads(logfile.read(entry.length).rstrip())
+  check_legacy_format(json_hash)
+  return json_hash
+
+def read_event(logfile, entry):
+  '''Decode the event at entry in logfile, an open file. Unlike parse(), the
+  event is not sanity checked against the rest of the logfile. Returns None
+  for events of unknown classes.'''
+  json_hash = read_json(logfile, entry)
+  for name_to_class in [input_name_to_class, internal_event_name_to_class,
+                        special_event_name_to_class]:
+    if entry.class_name in name_to_class:
+      return name_to_class[entry.class_name].from_json(json_hash)
+  print "Warning: Unknown class type %s" % entry.class_name
+  return None
+
+def read_events(logfile, entries):
+  '''Generator over the events at the given entries of logfile, an open file.
+  Events of unknown classes are skipped.'''
+  for entry in entries:
+    event = read_event(logfile, entry)
+    if event is not None:
+      yield event
@@ -21,15 +21,35 @@ from entities import *
 import logging
 import collections
 from sts.util.console import msg
-import time
-from collections import defaultdict
+import sts.header_space as header_space
+from sts.header_space import get_uniq_port_id
+from sts.topology.partition_tracker import PartitionTracker
 
 log = logging.getLogger("invariant_checker")
 
 class InvariantChecker(object):
+  # Which header space analysis implementation the loop, blackhole and
+  # connectivity checks use: "hassel" (the external hassel modules), "sts"
+  # (the in-tree sts.header_space), or "auto" (hassel if it is installed,
+  # otherwise sts). check_correspondence always uses hassel.
+  header_space_engine = "auto"
+
   def __init__(self, snapshotService):
     self.snapshotService = snapshotService
 
+  @staticmethod
+  def _use_hassel():
+    engine = InvariantChecker.header_space_engine
+    if engine not in ("auto", "hassel", "sts"):
+      raise ValueError("Unknown header_space_engine %s" % engine)
+    if engine == "auto":
+      try:
+        import headerspace.applications
+        return True
+      except ImportError:
+        return False
+    return engine == "hassel"
+
   # --------------------------------------------------------------#
   #                    Invariant checks                           #
   # --------------------------------------------------------------#
@@ -71,6 +91,8 @@ class InvariantChecker(object):
 
   @staticmethod
   def python_check_loops(simulation):
+    if not InvariantChecker._use_hassel():
+      return InvariantChecker._header_space_check_loops(simulation)
     import topology_loader.topology_loader as hsa_topo
     import headerspace.applications as hsa
     # Warning! depends on python Hassell -- may be really slow!
@@ -83,6 +105,8 @@ class InvariantChecker(object):
 
   @staticmethod
   def check_loops(simulation):
+    if not InvariantChecker._use_hassel():
+      return InvariantChecker._header_space_check_loops(simulation)
     import headerspace.applications as hsa
     live_switches = simulation.topology.switches_manager.live_switches
     live_links = simulation.topology.patch_panel.live_network_links
@@ -92,28 +116,16 @@ class InvariantChecker(object):
     violations = list(set(violations))
     return violations
 
-  # TODO(cs): this should be stored within simulation, not as class variables.
-  # For check_connectivity and python_check_connectivity: return only unconnected pairs that persist
-  interface_pair_map = {}     # (src_addr, dst_addr) -> timestamp
-  pair_timeout = 3            # TODO(ao): arbitrary
-
   @staticmethod
-  def register_interface_pair(src, dst):
-    ''' Register any interface pair that has previously communicated, along with the timestamp '''
-    if src is None or dst is None:
-      raise RuntimeError("Interface to register is None!")
-    interface_pair_map = InvariantChecker.interface_pair_map
-    pair_timeout = InvariantChecker.pair_timeout
-    interface_pair_map[(src, dst)] = time.time()
-    for pair, timestamp in interface_pair_map.items():
-      if (time.time() - timestamp > pair_timeout):
-        del interface_pair_map[pair]
+  def _header_space_check_loops(simulation):
+    return header_space.find_loops(simulation.topology.switches_manager.live_switches,
+                                   simulation.topology.patch_panel.live_network_links,
+                                   simulation.topology.patch_panel.access_links)
 
   @staticmethod
   def _get_all_pairs(simulation):
     # TODO(cs): translate HSA port numbers to ofp_phy_ports in the
     # headerspace/ module instead of computing uniq_port_id here
-    from config_parser.openflow_parser import get_uniq_port_id
     access_links = simulation.topology.patch_panel.access_links
     all_pairs = [ (get_uniq_port_id(l1.switch, l1.switch_port), get_uniq_port_id(l2.switch, l2.switch_port))
                   for l1 in access_links
@@ -124,28 +136,8 @@ class InvariantChecker(object):
   @staticmethod
   def _get_communicated_pairs(simulation):
     ''' Return pairs that have recently communicated; also remove outdated entries '''
-    from config_parser.openflow_parser import get_uniq_port_id
-    interface_pair_map = InvariantChecker.interface_pair_map
-    pair_timeout = InvariantChecker.pair_timeout
-    communicated_pairs = set()
-    for (src_addr, dst_addr), timestamp in interface_pair_map.items():
-      if (time.time() - timestamp < pair_timeout):
-        interface2access_links = simulation.topology.link_tracker.interface2access_link
-        src_interface, dst_interface = None, None
-        for interface in interface2access_links.keys():
-          if interface.hw_addr == src_addr:
-            src_interface = interface
-          if interface.hw_addr == dst_addr:
-            dst_interface = interface
-        if src_interface is not None and dst_interface is not None:
-          l1 = interface2access_links[src_interface]
-          l2 = interface2access_links[dst_interface]
-          communicated_pair = (get_uniq_port_id(l1.switch, l1.switch_port),
-                               get_uniq_port_id(l2.switch, l2.switch_port))
-          communicated_pairs.add(communicated_pair)
-      else:
-        del interface_pair_map[(src_addr, dst_addr)]
-    return communicated_pairs
+    tracker = simulation.topology.communication_tracker
+    return _port_id_pairs(tracker.communicated_link_pairs())
 
   @staticmethod
   def _get_unconnected_pairs(simulation, connected_pairs):
@@ -154,10 +146,7 @@ class InvariantChecker(object):
     unconnected_pairs = all_pairs - connected_pairs
 
     # Ignore partitioned pairs
-    partitioned_pairs = check_partitions(simulation.topology.switches_manager.switches,
-                                         simulation.topology.patch_panel.live_network_links,
-                                         simulation.topology.patch_panel.access_links,
-                                         simulation.topology.switches_manager)
+    partitioned_pairs = InvariantChecker._get_partitioned_pairs(simulation)
     unconnected_pairs -= partitioned_pairs
 
     # Ignore pairs that have not communicated with each other in a while
@@ -189,13 +178,17 @@ class InvariantChecker(object):
         connected_pairs.add((start_port, final_port))
     return connected_pairs
 
+  @staticmethod
+  def _get_partitioned_pairs(simulation):
+    ''' Return the pairs of access ports that can't reach each other '''
+    tracker = simulation.topology.partition_tracker
+    link_pairs = tracker.partitioned_link_pairs(simulation.topology.patch_panel.access_links)
+    return _port_id_pairs(link_pairs)
+
   @staticmethod
   def _remove_partitioned_pairs(simulation, pairs):
     # Ignore partitioned pairs
-    partitioned_pairs = check_partitions(simulation.topology.switches_manager.switches,
-                                         simulation.topology.patch_panel.live_network_links,
-                                         simulation.topology.patch_panel.access_links,
-                                         simulation.topology.switches_manager)
+    partitioned_pairs = InvariantChecker._get_partitioned_pairs(simulation)
     if len(partitioned_pairs) != 0:
       log.info("Partitioned pairs! %s" % str(partitioned_pairs))
     pairs -= partitioned_pairs
@@ -241,6 +234,10 @@ class InvariantChecker(object):
     ''' Return any pairs of hosts where there does not exist a path in the
     network between them '''
     connected_pairs = InvariantChecker._get_connected_pairs(simulation)
+    return InvariantChecker._check_connectivity(simulation, connected_pairs)
+
+  @staticmethod
+  def _check_connectivity(simulation, connected_pairs):
     all_pairs = InvariantChecker._get_all_pairs(simulation)
     remaining_pairs = all_pairs - connected_pairs
     remaining_pairs = InvariantChecker._remove_partitioned_pairs(simulation, remaining_pairs)
@@ -260,6 +257,8 @@ class InvariantChecker(object):
 
   @staticmethod
   def _python_get_connected_pairs(simulation):
+    if not InvariantChecker._use_hassel():
+      return InvariantChecker._get_connected_pairs(simulation)
     import topology_loader.topology_loader as hsa_topo
     import headerspace.applications as hsa
     NTF = hsa_topo.generate_NTF(simulation.topology.switches_manager.live_switches)
@@ -323,6 +322,10 @@ class InvariantChecker(object):
     # For now, use a python method that explicitly
     # finds blackholes rather than inferring them from check_reachability
     # Warning! depends on python Hassell -- may be really slow!
+    if not InvariantChecker._use_hassel():
+      return header_space.find_blackholes(simulation.topology.switches_manager.live_switches,
+                                          simulation.topology.patch_panel.live_network_links,
+                                          simulation.topology.patch_panel.access_links)
     import topology_loader.topology_loader as hsa_topo
     import headerspace.applications as hsa
     NTF = hsa_topo.generate_NTF(simulation.topology.switches_manager.live_switches)
@@ -335,14 +338,21 @@ class InvariantChecker(object):
   @staticmethod
   def check_correspondence(simulation):
     ''' Return if there were any policy-violations '''
+    # Controller omegas are only computed with hassel, and omegas from
+    # different engines can't be compared, so this always uses hassel.
+    try:
+      import headerspace.applications
+    except ImportError:
+      raise RuntimeError("check_correspondence requires hassel, which is not "
+                         "installed")
+    log.debug("Computing physical omega...")
+    physical_omega = InvariantChecker.compute_physical_omega(simulation.topology.switches_manager.live_switches,
+                                                             simulation.topology.patch_panel.live_network_links,
+                                                             simulation.topology.patch_panel.access_links)
     log.debug("Snapshotting live controllers...")
     controllers_with_violations = []
     for controller in simulation.controller_manager.live_controllers:
       controller_snapshot = controller.snapshot_service.fetchSnapshot(controller)
-      log.debug("Computing physical omega...")
-      physical_omega = InvariantChecker.compute_physical_omega(simulation.topology.switches_manager.live_switches,
-                                                               simulation.topology.patch_panel.live_network_links,
-                                                               simulation.topology.patch_panel.access_links)
       log.debug("Computing controller omega...")
       # note: using all_switches to compute the controller omega. The controller might still
       # reference switches in his omega that are currently dead, which should result in a
@@ -362,6 +372,8 @@ class InvariantChecker(object):
   # --------------------------------------------------------------#
   @staticmethod
   def compute_physical_omega(live_switches, live_links, edge_links):
+    ''' Computed with hassel regardless of header_space_engine, so that it
+    can be compared with compute_controller_omega() '''
     import headerspace.applications as hsa
     (name_tf_pairs, TTF) = InvariantChecker._get_transfer_functions(live_switches, live_links)
     physical_omega = hsa.compute_omega(name_tf_pairs, TTF, edge_links)
@@ -426,86 +438,69 @@ class InvariantChecker(object):
                                                 controller_omega, physical_omega)
     return missing_routing_entries or missing_acl_entries
 
-def check_partitions(switches, live_links, access_links, switches_manager):
-  # TODO(cs): lifted directly from pox.forwarding.l2_multi. Highly
-  # redundant!
-  from config_parser.openflow_parser import get_uniq_port_id
+class IncrementalInvariantChecker(object):
+  '''
+  Loop, blackhole and connectivity checks backed by a
+  sts.header_space.IncrementalAnalysis, which reuses the transfer functions
+  and reachability computed by the previous check and only recomputes the
+  ports whose paths cross switches that changed since. Cheap enough to check
+  invariants every round.
+
+  The analysis is held between checks by an instance hung off the
+  simulation (see for_simulation()), so simulations never share it.
+  '''
+  def __init__(self):
+    self.analysis = header_space.IncrementalAnalysis()
 
-  # Adjacency map.  [sw1][sw2] -> port from sw1 to sw2
-  adjacency = defaultdict(lambda:defaultdict(lambda:None))
+  @staticmethod
+  def for_simulation(simulation):
+    ''' Return simulation's checker, creating it on first use '''
+    if simulation.incremental_invariant_checker is None:
+      simulation.incremental_invariant_checker = IncrementalInvariantChecker()
+    return simulation.incremental_invariant_checker
+
+  def close(self):
+    self.analysis.close()
+
+  @staticmethod
+  def update(simulation):
+    ''' Bring simulation's analysis up to date, and return it '''
+    analysis = IncrementalInvariantChecker.for_simulation(simulation).analysis
+    analysis.update(simulation.topology.switches_manager.live_switches,
+                    simulation.topology.patch_panel.live_network_links,
+                    simulation.topology.patch_panel.access_links)
+    log.debug("Recomputed reachability from %d ports" % analysis.recomputed)
+    return analysis
 
+  @staticmethod
+  def check_loops(simulation):
+    return IncrementalInvariantChecker.update(simulation).loops()
+
+  @staticmethod
+  def check_blackholes(simulation):
+    return IncrementalInvariantChecker.update(simulation).blackholes()
+
+  @staticmethod
+  def check_connectivity(simulation):
+    connected_pairs = IncrementalInvariantChecker.update(simulation).connected_pairs()
+    return InvariantChecker._check_connectivity(simulation, connected_pairs)
+
+def _port_id_pairs(link_pairs):
+  return set((get_uniq_port_id(l1.switch, l1.switch_port),
+              get_uniq_port_id(l2.switch, l2.switch_port))
+             for (l1, l2) in link_pairs)
+
+def check_partitions(switches, live_links, access_links, switches_manager):
+  ''' Return the pairs of access ports that can't reach each other over
+  live_links, disregarding links adjacent to failed switches '''
+  tracker = PartitionTracker()
+  for switch in switches:
+    tracker.add_switch(switch)
   for link in live_links:
-    # Make sure to disregard links that are adjacent to down switches
-    # (technically those links are still `live', but it's easier to treat it
-    #  this way)
-
-    if hasattr(link, 'start_node'):
-      if not (link.start_node in switches_manager.failed_switches or
-                link.end_node in switches_manager.failed_switches):
-        adjacency[link.start_node][link.end_node] = link
-    else:
-      if not (link.node1 in switches_manager.failed_switches or
-                link.node2 in switches_manager.failed_switches):
-        adjacency[link.node1][link.node2] = link
-
-  # Switches we know of.  [dpid] -> Switch
-  switches = { sw.dpid : sw for sw in switches }
-
-  # [sw1][sw2] -> (distance, intermediate)
-  path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
-
-  def _calc_paths ():
-    """
-    Essentially Floyd-Warshall algorithm
-    """
-    sws = switches.values()
-    path_map.clear()
-    for k in sws:
-      for j,port in adjacency[k].iteritems():
-        if port is None: continue
-        path_map[k][j] = (1,None)
-      path_map[k][k] = (0,None) # distance, intermediate
-
-    """
-    for i in sws:
-      for j in sws:
-        a = path_map[i][j][0]
-        #a = adjacency[i][j]
-        if a is None: a = "*"
-        print a,
-      print
-    """
-
-    for k in sws:
-      for i in sws:
-        for j in sws:
-          if path_map[i][k][0] is not None:
-            if path_map[k][j][0] is not None:
-              # i -> k -> j exists
-              ikj_dist = path_map[i][k][0]+path_map[k][j][0]
-              if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-                # i -> k -> j is better than existing
-                path_map[i][j] = (ikj_dist, k)
-
-    """
-    print "--------------------"
-    for i in sws:
-      for j in sws:
-        print path_map[i][j][0],
-      print
-    """
-
-  all_link_pairs = [ (l1,l2) for l1 in access_links
-                                for l2 in access_links if l1 != l2 ]
-
-  _calc_paths()
-  partioned_pairs = set()
-  for link_pair in all_link_pairs:
-    if path_map[link_pair[0].switch][link_pair[1].switch] == (None,None):
-      id1 = get_uniq_port_id(link_pair[0].switch, link_pair[0].switch_port)
-      id2 = get_uniq_port_id(link_pair[1].switch, link_pair[1].switch_port)
-      partioned_pairs.add((id1,id2))
-  return partioned_pairs
+    tracker.add_link(link)
+  for switch in switches_manager.failed_switches:
+    tracker.crash_switch(switch)
+  return _port_id_pairs(tracker.partitioned_link_pairs(access_links))
 
 class ViolationTracker(object):
   '''
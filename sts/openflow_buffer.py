@@ -14,12 +14,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from collections import defaultdict, namedtuple
+from collections import namedtuple, deque, OrderedDict
 from sts.fingerprints.messages import *
 from pox.lib.revent import Event, EventMixin
 from sts.syncproto.base import SyncTime
 from sts.util.convenience import base64_encode
-from sts.util.ordered_default_dict import OrderedDefaultDict
 import logging
 log = logging.getLogger("openflow_buffer")
 
@@ -35,53 +34,90 @@ class PendingMessage(Event):
     self.send_event = send_event
 
 class PendingQueue(object):
-  '''Stores pending messages between switches and controllers'''
+  '''
+  Stores pending messages between switches and controllers.
+
+  Each message id has a FIFO of its pending messages, and each connection an
+  ordered set of the message ids pending on it, in the order they became
+  pending. Together with a running count of the pending messages, this makes
+  insertion, lookup, removal of the oldest message for a message id, and
+  len() constant time.
+
+  The lists returned by conn_ids(), get_message_ids() and iteration are
+  snapshots, so messages may be scheduled while looping over them.
+  '''
   ConnectionId = namedtuple('ConnectionId', ['dpid', 'controller_id'])
 
   def __init__(self):
-    # { ConnectionId(dpid, controller_id) -> MessageId -> [conn_message1, conn_message2, ....]
-    self.pending = defaultdict(lambda: OrderedDefaultDict(list))
+    # { MessageId -> deque([conn_message1, conn_message2, ...]) }
+    self._message_id2queue = {}
+    # { ConnectionId(dpid, controller_id) -> OrderedDict(MessageId -> None) }
+    self._conn_id2message_ids = {}
+    self._len = 0
+    # All message ids, in iteration order. None if it needs to be rebuilt
+    self._snapshot = None
 
   def insert(self, message_id, conn_message):
     '''' message_id is a fingerprint named tuple, and conn_message is a ConnMessage named tuple'''
-    conn_id = ConnectionId(dpid=message_id.dpid, controller_id=message_id.controller_id)
-    self.pending[conn_id][message_id].append(conn_message)
+    queue = self._message_id2queue.get(message_id)
+    if queue is None:
+      queue = self._message_id2queue[message_id] = deque()
+      conn_id = ConnectionId(dpid=message_id.dpid, controller_id=message_id.controller_id)
+      if conn_id not in self._conn_id2message_ids:
+        self._conn_id2message_ids[conn_id] = OrderedDict()
+      self._conn_id2message_ids[conn_id][message_id] = None
+      self._snapshot = None
+    queue.append(conn_message)
+    self._len += 1
 
   def has_message_id(self, message_id):
-    conn_id = ConnectionId(dpid=message_id.dpid, controller_id=message_id.controller_id)
-    return message_id in self.pending[conn_id]
+    return message_id in self._message_id2queue
 
   def get_all_by_message_id(self, message_id):
-    conn_id = ConnectionId(dpid=message_id.dpid, controller_id=message_id.controller_id)
-    return self.pending[conn_id][message_id]
+    return list(self._message_id2queue.get(message_id, []))
+
+  def peek_by_message_id(self, message_id):
+    ''' Return the oldest conn_message for message_id, without removing it '''
+    queue = self._message_id2queue.get(message_id)
+    if not queue:
+      raise ValueError("Empty queue for message_id %s" % str(message_id))
+    return queue[0]
 
   def pop_by_message_id(self, message_id):
-    conn_id = ConnectionId(dpid=message_id.dpid, controller_id=message_id.controller_id)
-    message_id_map = self.pending[conn_id]
-    msg_list = message_id_map[message_id]
-    if len(msg_list) == 0:
+    queue = self._message_id2queue.get(message_id)
+    if not queue:
       raise ValueError("Empty queue for message_id %s" % str(message_id))
-    res = msg_list.pop(0)
-    if len(msg_list) == 0:
-      del message_id_map[message_id]
-    if len(message_id_map) == 0:
-      del self.pending[conn_id]
+    res = queue.popleft()
+    self._len -= 1
+    if len(queue) == 0:
+      del self._message_id2queue[message_id]
+      conn_id = ConnectionId(dpid=message_id.dpid, controller_id=message_id.controller_id)
+      message_ids = self._conn_id2message_ids[conn_id]
+      del message_ids[message_id]
+      if len(message_ids) == 0:
+        del self._conn_id2message_ids[conn_id]
+      self._snapshot = None
     return res
 
   def conn_ids(self):
-    return self.pending.keys()
+    return self._conn_id2message_ids.keys()
 
   def get_message_ids(self, dpid, controller_id):
     conn_id = ConnectionId(dpid=dpid, controller_id=controller_id)
-    return self.pending[conn_id].keys()
+    message_ids = self._conn_id2message_ids.get(conn_id)
+    if message_ids is None:
+      return []
+    return message_ids.keys()
 
   def __len__(self):
-    return sum( len(msg_list)
-        for message_id_map in self.pending.values()
-        for msg_list in message_id_map.values() )
+    return self._len
 
   def __iter__(self):
-    return (message_id for message_id_map in self.pending.values() for message_id in message_id_map.keys())
+    if self._snapshot is None:
+      self._snapshot = [ message_id
+                         for message_ids in self._conn_id2message_ids.values()
+                         for message_id in message_ids ]
+    return iter(self._snapshot)
 
 
 # TODO(cs): move me to another file?
@@ -119,6 +155,8 @@ class OpenFlowBuffer(EventMixin):
     self._delegate_input_logger = None
     self.pass_through_whitelisted_packets = False
     self.pass_through_sends = False
+    # message_id -> callbacks waiting for a matching pending message
+    self._arrival_callbacks = {}
 
   def _pass_through_handler(self, message_event):
     ''' handler for pass-through mode '''
@@ -164,6 +202,25 @@ class OpenFlowBuffer(EventMixin):
     self.passed_through_events = []
     return passed_events
 
+  def notify_on_arrival(self, message_id, callback):
+    '''
+    Invoke callback(message_id) once, the next time a pending message matching
+    message_id (a PendingReceive or PendingSend) is inserted
+    '''
+    self._arrival_callbacks.setdefault(message_id, []).append(callback)
+
+  def cancel_arrival_notification(self, message_id, callback):
+    callbacks = self._arrival_callbacks.get(message_id, [])
+    if callback in callbacks:
+      callbacks.remove(callback)
+    if callbacks == [] and message_id in self._arrival_callbacks:
+      del self._arrival_callbacks[message_id]
+
+  def _notify_arrival(self, message_id):
+    if message_id in self._arrival_callbacks:
+      for callback in self._arrival_callbacks.pop(message_id):
+        callback(message_id)
+
   def message_receipt_waiting(self, message_id):
     '''
     Return whether the pending message receive is available
@@ -178,11 +235,11 @@ class OpenFlowBuffer(EventMixin):
 
   def get_message_receipt(self, message_id):
     # pending receives are (conn, message) pairs. We return the message.
-    return self.pending_receives.get_all_by_message_id(message_id)[0][1]
+    return self.pending_receives.peek_by_message_id(message_id)[1]
 
   def get_message_send(self, message_id):
     # pending sends are (conn, message) pairs. We return the message.
-    return self.pending_sends.get_all_by_message_id(message_id)[0][1]
+    return self.pending_sends.peek_by_message_id(message_id)[1]
 
   def schedule(self, message_id):
     '''
@@ -205,6 +262,13 @@ class OpenFlowBuffer(EventMixin):
       forwarder.allow_message_send(message)
     return message
 
+  def schedule_many(self, message_ids):
+    '''
+    schedule() each of message_ids, in order. Returns the list of scheduled
+    messages.
+    '''
+    return [ self.schedule(message_id) for message_id in message_ids ]
+
   # TODO(cs): make this a factory method that returns DeferredOFConnection objects
   # with bound openflow_buffer.insert() method. (much cleaner API + separation of concerns)
   def insert_pending_receipt(self, dpid, controller_id, ofp_message, conn):
@@ -218,6 +282,7 @@ class OpenFlowBuffer(EventMixin):
     self.pending_receives.insert(message_id, conn_message)
     b64_packet = base64_encode(ofp_message)
     self.raiseEventNoErrors(PendingMessage(message_id, b64_packet))
+    self._notify_arrival(message_id)
     return message_id
 
   # TODO(cs): make this a factory method that returns DeferredOFConnection objects
@@ -234,6 +299,7 @@ class OpenFlowBuffer(EventMixin):
     self.pending_sends.insert(message_id, conn_message)
     b64_packet = base64_encode(ofp_message)
     self.raiseEventNoErrors(PendingMessage(message_id, b64_packet, send_event=True))
+    self._notify_arrival(message_id)
     return message_id
 
   def conns_with_pending_receives(self):
@@ -72,6 +72,20 @@ def dictify_fingerprint(fingerprint):
   return tuple(mutable)
 
 
+def dp_fingerprint_tuple(class_name, fingerprint):
+  """
+  Convert the fingerprint of a DataplaneDrop or DataplanePermit, possibly
+  parsed from json, to (class name, DPFingerprint, switch dpid, port no)
+  """
+  if fingerprint[0] != class_name:
+    fingerprint = list(fingerprint)
+    fingerprint.insert(0, class_name)
+  if type(fingerprint) == list:
+    fingerprint = (fingerprint[0], DPFingerprint(fingerprint[1]).intern(),
+                   fingerprint[2], fingerprint[3])
+  return fingerprint
+
+
 class Event(object):
   """Superclass for all event types."""
   __metaclass__ = abc.ABCMeta
@@ -1025,12 +1039,9 @@ class DataplaneDrop(InputEvent):
                                         event_time=event_time)
     # N.B. fingerprint is monkeypatched on to DpPacketOut events by
     # BufferedPatchPanel
-    if fingerprint[0] != self.__class__.__name__:
-      fingerprint = list(fingerprint)
-      fingerprint.insert(0, self.__class__.__name__)
-    if type(fingerprint) == list:
-      fingerprint = (fingerprint[0], DPFingerprint(fingerprint[1]),
-                     fingerprint[2], fingerprint[3])
+    # Fingerprints parsed from json are converted on first access
+    if type(fingerprint) != list:
+      fingerprint = dp_fingerprint_tuple(self.__class__.__name__, fingerprint)
     self._fingerprint = fingerprint
     # TODO(cs): passive is a bit of a hack, but this was easier.
     self.passive = passive
@@ -1056,6 +1067,9 @@ class DataplaneDrop(InputEvent):
     (class name, DPFingerprint, switch dpid, port no)
     See fingerprints/messages.py for format of DPFingerprint.
     """
+    if type(self._fingerprint) == list:
+      self._fingerprint = dp_fingerprint_tuple(self.__class__.__name__,
+                                               self._fingerprint)
     return self._fingerprint
 
   @property
@@ -1465,17 +1479,23 @@ class ControlMessageBase(InternalEvent):
     self.dpid = dpid
     self.controller_id = controller_id
     self.b64_packet = b64_packet
-    if type(fingerprint) == list:
-      fingerprint = (fingerprint[0], OFFingerprint(fingerprint[1]),
-                     fingerprint[2], tuple(fingerprint[3]))
-    if type(fingerprint) == dict or type(fingerprint) != tuple:
-      fingerprint = (self.__class__.__name__, OFFingerprint(fingerprint),
-                     dpid, controller_id)
-
+    # Fingerprints parsed from json are converted on first access, since most
+    # events of a large trace are never matched against.
+    if type(fingerprint) != list and type(fingerprint) != dict:
+      fingerprint = self._fingerprint_tuple(fingerprint)
     self._fingerprint = fingerprint
     self.ignore_whitelisted_packets = False
     self.pass_through_sends = False
 
+  def _fingerprint_tuple(self, fingerprint):
+    if type(fingerprint) == list:
+      fingerprint = (fingerprint[0], OFFingerprint(fingerprint[1]).intern(),
+                     fingerprint[2], tuple(fingerprint[3]))
+    if type(fingerprint) == dict or type(fingerprint) != tuple:
+      fingerprint = (self.__class__.__name__, OFFingerprint(fingerprint).intern(),
+                     self.dpid, self.controller_id)
+    return fingerprint
+
   def get_packet(self):
     # Avoid serialization exceptions, but we still want to memoize.
     if not hasattr(self, "_packet"):
@@ -1494,6 +1514,8 @@ class ControlMessageBase(InternalEvent):
       (class name, OFFingerprint, dpid, controller id)
     See fingerprints/messages.py for OFFingerprint format.
     """
+    if type(self._fingerprint) != tuple:
+      self._fingerprint = self._fingerprint_tuple(self._fingerprint)
     return self._fingerprint
 
   @staticmethod
@@ -1817,12 +1839,9 @@ class DataplanePermit(InternalEvent):
     super(DataplanePermit, self).__init__(label=label,
                                           logical_round=logical_round,
                                           event_time=event_time)
-    if fingerprint[0] != self.__class__.__name__:
-      fingerprint = list(fingerprint)
-      fingerprint.insert(0, self.__class__.__name__)
-    if type(fingerprint) == list:
-      fingerprint = (fingerprint[0], DPFingerprint(fingerprint[1]),
-                     fingerprint[2], fingerprint[3])
+    # Fingerprints parsed from json are converted on first access
+    if type(fingerprint) != list:
+      fingerprint = dp_fingerprint_tuple(self.__class__.__name__, fingerprint)
     self._fingerprint = fingerprint
     # TODO(cs): passive is a bit of a hack, but this was easier.
     self.passive = passive
@@ -1845,6 +1864,9 @@ class DataplanePermit(InternalEvent):
     (class name, DPFingerprint, switch dpid, outgoing port no)
     See fingerprints/messages.py for format of DPFingerprint.
     """
+    if type(self._fingerprint) == list:
+      self._fingerprint = dp_fingerprint_tuple(self.__class__.__name__,
+                                               self._fingerprint)
     return self._fingerprint
 
   @property
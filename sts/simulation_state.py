@@ -22,7 +22,7 @@ Encapsulates the state of the simulation, including:
   - Metadata (e.g. # of failures)
 '''
 
-from sts.util.io_master import IOMaster
+from sts.util.io_master import create_io_master
 from sts.dataplane_traces.trace import Trace
 from entities import DeferredOFConnection
 from sts.controller_manager import ControllerManager, UserSpaceControllerPatchPanel
@@ -39,6 +39,7 @@ from pox.lib.util import connect_socket_with_backoff
 from sts.control_flow.base import ReplaySyncCallback
 from sts.util.console import msg
 
+import copy
 import select
 import socket
 import logging
@@ -66,6 +67,42 @@ def revert_select_monkeypatch():
   if hasattr(select, "_old_select"):
     select.select = select._old_select
 
+class IOWorkersUnavailable(Exception):
+  '''Raised when a topology template tries to create an io worker'''
+  pass
+
+class IOWorkerFactory(object):
+  '''
+  Stands in for io_master.create_worker_for_socket in topology templates.
+
+  The template is built against a factory that points nowhere; each clone
+  gets its own factory pointing at the io_master of the bootstrap that
+  created it.
+  '''
+  def __init__(self, create_io_worker=None):
+    self.create_io_worker = create_io_worker
+
+  def __call__(self, *args, **kwargs):
+    if self.create_io_worker is None:
+      raise IOWorkersUnavailable("Topology template tried to create an io "
+                                 "worker")
+    return self.create_io_worker(*args, **kwargs)
+
+def clone_topology(template, memo=None):
+  '''
+  Deep-copies a topology template. Everything reachable from it is copied,
+  except the loggers and the console, which are process-wide singletons,
+  and whatever the caller already put in memo.
+  '''
+  memo = {} if memo is None else memo
+  memo[id(msg)] = msg
+  loggers = [logging.getLogger()] + logging.Logger.manager.loggerDict.values()
+  for logger in loggers:
+    # loggerDict also holds PlaceHolders for unused parent names
+    if isinstance(logger, logging.Logger):
+      memo[id(logger)] = logger
+  return copy.deepcopy(template, memo)
+
 class SimulationConfig(object):
   """
   Maintains the configuration for:
@@ -83,10 +120,12 @@ class SimulationConfig(object):
                dataplane_trace=None,
                snapshot_service=None,
                multiplex_sockets=False,
+               binary_mux_framing=False,
                violation_persistence_threshold=None,
                kill_controllers_on_exit=True,
                interpose_on_controllers=False,
-               ignore_interposition=False):
+               ignore_interposition=False,
+               reuse_topology=True):
     '''
     Constructor parameters:
       topology_class    => a sts.topology.Topology class (not object!)
@@ -97,6 +136,9 @@ class SimulationConfig(object):
       patch_panel_class => a sts.topology.PatchPanel class (not object!)
       dataplane_trace   => a path to a dataplane trace file
                            (e.g. dataplane_traces/ping_pong_same_subnet.trace)
+      binary_mux_framing => if multiplex_sockets, whether to send the
+                            multiplexed messages as length-prefixed binary
+                            frames rather than json with base64 encoded data
       violation_persistence_threshold => number of logical time units to observe a
                                          violation before we declare that it is
                                          persistent
@@ -107,6 +149,12 @@ class SimulationConfig(object):
                               Replayer and MCSFinder read this configuration
                               parameter, and remove all internal events from their
                               event dags if set to True.
+      reuse_topology => whether bootstrap() should build the topology once and
+                        hand out deep copies of that pristine template,
+                        rather than running the topology constructor on every
+                        invocation. Topologies whose constructor creates io
+                        workers (e.g. network namespace hosts) are always
+                        constructed from scratch.
     '''
     if controller_configs is None:
       controller_configs = []
@@ -115,6 +163,12 @@ class SimulationConfig(object):
     # clean topology objects for (multiple invocations of) bootstrapping later
     self._topology_class = topology_class
     self._topology_params = topology_params
+    self.reuse_topology = reuse_topology
+    # Pristine topology that bootstrap() clones, and the IOWorkerFactory it
+    # was built with. _topology_template is False if the topology can't be
+    # cloned.
+    self._topology_template = None
+    self._template_io_factory = None
     self._patch_panel_class = patch_panel_class
     self._dataplane_trace_path = dataplane_trace
     self._violation_persistence_threshold = violation_persistence_threshold
@@ -127,6 +181,7 @@ class SimulationConfig(object):
     self.snapshot_service = snapshot_service
     self.current_simulation = None
     self.multiplex_sockets = multiplex_sockets
+    self.binary_mux_framing = binary_mux_framing
     self.controller_patch_panel_class = controller_patch_panel_class
     self.interpose_on_controllers = interpose_on_controllers
     self.ignore_interposition = ignore_interposition
@@ -148,7 +203,7 @@ class SimulationConfig(object):
 
     def initialize_io_loop():
       ''' boot the IOLoop (needed for the controllers) '''
-      _io_master = IOMaster()
+      _io_master = create_io_master(multiplex_sockets=self.multiplex_sockets)
       # monkey patch time.sleep for all our friends
       _io_master.monkey_time_sleep()
       # tell sts.console to use our io_master
@@ -167,17 +222,6 @@ class SimulationConfig(object):
           patch_panel.register_controller(c.cid, c.guest_eth_addr, c.host_device)
       return patch_panel
 
-    def instantiate_topology(create_io_worker):
-      '''construct a clean topology object from topology_class and
-      topology_params'''
-      log.info("Creating topology...")
-      # If you want to shoot yourself in the foot, feel free :)
-      comma = "" if self._topology_params == "" else ","
-      topology = eval("%s(%s%screate_io_worker=create_io_worker)" %
-                      (self._topology_class.__name__,
-                       self._topology_params, comma))
-      return topology
-
     def monkeypatch_select(multiplex_sockets, controller_manager):
       mux_select = None
       demuxers = []
@@ -191,7 +235,8 @@ class SimulationConfig(object):
           true_socket = connect_socket_with_backoff(address=c.address, port=c.port)
           true_socket.setblocking(0)
           io_worker = mux_select.create_worker_for_socket(true_socket)
-          demux = STSSocketDemultiplexer(io_worker, c.server_info)
+          demux = STSSocketDemultiplexer(io_worker, c.server_info,
+                                         binary_framing=self.binary_mux_framing)
           demuxers.append(demux)
 
         # Monkey patch select.select
@@ -211,7 +256,7 @@ class SimulationConfig(object):
                                           multiplex_sockets=self.multiplex_sockets)
     controller_patch_panel = wire_controller_patch_panel(controller_manager,
                                                          io_master.create_worker_for_socket)
-    topology = instantiate_topology(io_master.create_worker_for_socket)
+    topology = self._instantiate_topology(io_master.create_worker_for_socket)
     patch_panel = self._patch_panel_class(topology.switches, topology.hosts,
                                           topology.get_connected_port)
     openflow_buffer = OpenFlowBuffer()
@@ -236,6 +281,42 @@ class SimulationConfig(object):
     self.current_simulation = simulation
     return simulation
 
+  def _construct_topology(self, create_io_worker):
+    '''construct a clean topology object from topology_class and
+    topology_params'''
+    log.info("Creating topology...")
+    # If you want to shoot yourself in the foot, feel free :)
+    comma = "" if self._topology_params == "" else ","
+    topology = eval("%s(%s%screate_io_worker=create_io_worker)" %
+                    (self._topology_class.__name__,
+                     self._topology_params, comma))
+    return topology
+
+  def _instantiate_topology(self, create_io_worker):
+    '''return a clean topology object, cloned from the template if
+    possible'''
+    if not self.reuse_topology or self._topology_template is False:
+      return self._construct_topology(create_io_worker)
+    if self._topology_template is None:
+      factory = IOWorkerFactory()
+      try:
+        self._topology_template = self._construct_topology(factory)
+        self._template_io_factory = factory
+      except IOWorkersUnavailable:
+        log.info("Topology constructor needs io workers, not reusing it")
+        self._topology_template = False
+        return self._construct_topology(create_io_worker)
+    # The io worker factory is replaced by one bound to this io_master
+    memo = { id(self._template_io_factory) :
+               IOWorkerFactory(create_io_worker) }
+    try:
+      return clone_topology(self._topology_template, memo)
+    except (TypeError, RuntimeError, copy.Error) as e:
+      log.info("Topology can't be cloned (%s), not reusing it" % e)
+      self._topology_template = False
+      self._template_io_factory = None
+      return self._construct_topology(create_io_worker)
+
   def set_dataplane_trace_path(self, path):
     if self._dataplane_trace_path is None:
       self._dataplane_trace_path = path
@@ -247,11 +328,12 @@ class SimulationConfig(object):
             '''                 patch_panel_class=%s,\n'''
             '''                 multiplex_sockets=%s,\n'''
             '''                 ignore_interposition=%s,\n'''
-            '''                 kill_controllers_on_exit=%s)''' %
+            '''                 kill_controllers_on_exit=%s,\n'''
+            '''                 reuse_topology=%s)''' %
             (str(self.controller_configs),self._topology_class.__name__,
              self._topology_params, self._patch_panel_class.__name__,
              str(self.multiplex_sockets), str(self.ignore_interposition),
-             str(self._kill_controllers_on_exit)))
+             str(self._kill_controllers_on_exit), str(self.reuse_topology)))
 
 class Simulation(object):
   '''
@@ -282,6 +364,8 @@ class Simulation(object):
     self.mux_select = mux_select
     self.multiplex_sockets = mux_select is not None
     self.demuxers = demuxers
+    # State held between checks by IncrementalInvariantChecker
+    self.incremental_invariant_checker = None
 
   def set_exit_code(self, code):
     self.exit_code = code
@@ -319,6 +403,10 @@ class Simulation(object):
     if self.controller_patch_panel is not None:
       self.controller_patch_panel.clean_up()
 
+    if self.incremental_invariant_checker is not None:
+      self.incremental_invariant_checker.close()
+      self.incremental_invariant_checker = None
+
     # Just to make sure there isn't any state lying around, throw out
     # the old RecocoIOLoop
     msg.unset_io_master()
@@ -29,6 +29,8 @@ from sts.util.capability import Capabilities
 
 from sts.topology.graph import TopologyGraph
 from sts.topology.connectivity_tracker import ConnectivityTracker
+from sts.topology.partition_tracker import PartitionTracker
+from sts.topology.communication_tracker import CommunicationTracker
 
 
 class TopologyCapabilities(Capabilities):
@@ -155,6 +157,8 @@ class Topology(object):
     - SwitchesManager: Manages switches in the network
     - HostManager
     - PatchPanel: Manages dataplane links
+    - PartitionTracker: Tracks which switches are partitioned
+    - CommunicationTracker: Tracks which host interfaces recently communicated
 
   """
   def __init__(self, hosts_manager, switches_manager, patch_panel,
@@ -205,6 +209,10 @@ class Topology(object):
       self._graph.add_link(link)
     for link in self.patch_panel.network_links:
       self._graph.add_link(link)
+    self._partition_tracker = PartitionTracker(self.switches_manager,
+                                               self.patch_panel)
+    self._communication_tracker = CommunicationTracker(self.patch_panel)
+    self._dp_buffer.communication_tracker = self._communication_tracker
 
   @property
   def hosts_manager(self):
@@ -250,6 +258,24 @@ class Topology(object):
   def dp_buffer(self):
     return self._dp_buffer
 
+  @property
+  def partition_tracker(self):
+    """
+    Returns read-only reference to the partition tracker.
+
+    See: `sts.topology.partition_tracker.PartitionTracker`
+    """
+    return self._partition_tracker
+
+  @property
+  def communication_tracker(self):
+    """
+    Returns read-only reference to the communication tracker.
+
+    See: `sts.topology.communication_tracker.CommunicationTracker`
+    """
+    return self._communication_tracker
+
   @property
   def graph(self):
     """Return the graph of the network."""
@@ -358,6 +384,7 @@ class Topology(object):
     self._switches_manager.add_switch(switch)
     self._graph.add_switch(switch)
     self._dp_buffer.add_switch(switch)
+    self._partition_tracker.add_switch(switch)
     return switch
 
   def remove_switch(self, switch):
@@ -372,6 +399,7 @@ class Topology(object):
         self.remove_access_link(link)
     self._graph.remove_switch(switch)
     self._dp_buffer.remove_switch(switch)
+    self._partition_tracker.remove_switch(switch)
 
   def add_link(self, link):
     """Add link to the topology"""
@@ -390,10 +418,47 @@ class Topology(object):
     # the link
     if self.is_access_link(link):
       self.patch_panel.add_access_link(link)
+      self._communication_tracker.add_access_link(link)
     elif self.is_network_link(link):
       self.patch_panel.add_network_link(link)
+      self._partition_tracker.add_link(link)
     return link
 
+  def add_hosts(self, hosts):
+    """Adds many hosts to the topology. See `add_host`."""
+    return [self.add_host(host) for host in hosts]
+
+  def add_switches(self, switches):
+    """Adds many switches to the topology. See `add_switch`."""
+    return [self.add_switch(switch) for switch in switches]
+
+  def add_links(self, links):
+    """
+    Adds many links to the topology. See `add_link`.
+
+    The links are added to the graph one at a time, but handed to the patch
+    panel and the trackers as whole lists.
+    """
+    access_links = []
+    network_links = []
+    for link in links:
+      if self.is_access_link(link):
+        assert self.capabilities.can_add_access_link
+        access_links.append(link)
+      else:
+        assert self.is_network_link(link)
+        assert self.capabilities.can_add_network_link
+        network_links.append(link)
+      assert not self._graph.has_link(link), "Link already exists: %s" % link
+      self._graph.add_link(link, bidir=not hasattr(link, 'start_node'))
+    self.patch_panel.add_access_links(access_links)
+    self.patch_panel.add_network_links(network_links)
+    for link in access_links:
+      self._communication_tracker.add_access_link(link)
+    for link in network_links:
+      self._partition_tracker.add_link(link)
+    return access_links + network_links
+
   def add_network_link(self, link):
     """Add Network link to the topology"""
     return self.add_link(link)
@@ -405,10 +470,12 @@ class Topology(object):
   def sever_network_link(self, link):
     """Brings link down"""
     self.patch_panel.sever_network_link(link)
+    self._partition_tracker.sever_link(link)
 
   def repair_network_link(self, link):
     """Brings link back up"""
     self.patch_panel.repair_network_link(link)
+    self._partition_tracker.repair_link(link)
 
   def create_access_link(self, host, interface, switch, port):
     assert self.capabilities.can_create_access_link
@@ -435,6 +502,7 @@ class Topology(object):
     assert self._graph.has_link(link)
     self._graph.remove_link(link)
     self.patch_panel.remove_access_link(link)
+    self._communication_tracker.remove_access_link(link)
 
   def remove_network_link(self, link):
     assert self.capabilities.can_remove_network_link
@@ -442,6 +510,7 @@ class Topology(object):
     assert self._graph.has_link(link)
     self._graph.remove_link(link)
     self.patch_panel.remove_network_link(link)
+    self._partition_tracker.remove_link(link)
 
   def add_controller(self, controller):
     """Adds controller to the topology"""
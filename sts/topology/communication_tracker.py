@@ -0,0 +1,106 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Tracks which pairs of host interfaces have recently communicated.
+"""
+
+import heapq
+import time
+
+
+class CommunicationTracker(object):
+  """
+  Tracks the (src hw_addr, dst hw_addr) pairs seen on the dataplane within
+  the last pair_timeout seconds.
+
+  register() is called for every forwarded packet, so it only updates the
+  pair's timestamp. Expiry is driven by a heap holding one (timestamp, pair)
+  entry per pair: popping an entry whose pair was seen again since re-pushes
+  it with the newer timestamp, so each expiry pass only touches pairs that
+  are actually due.
+  """
+  def __init__(self, patch_panel=None, pair_timeout=3, clock=time.time):
+    """
+    Args:
+      - patch_panel: if given, the access links to index are read from it
+      - pair_timeout: seconds after which a pair no longer counts as having
+        communicated
+      - clock: returns the current time in seconds
+    """
+    # TODO(ao): pair_timeout is arbitrary
+    self.pair_timeout = pair_timeout
+    self.clock = clock
+    # (src_addr, dst_addr) -> last time seen
+    self._last_seen = {}
+    # Min-heap of (timestamp, (src_addr, dst_addr)), one per pair
+    self._expiry = []
+    # hw_addr -> access link
+    self._addr2access_link = {}
+    if patch_panel is not None:
+      for link in patch_panel.access_links:
+        self.add_access_link(link)
+
+  def add_access_link(self, link):
+    self._addr2access_link[link.interface.hw_addr] = link
+
+  def remove_access_link(self, link):
+    if self._addr2access_link.get(link.interface.hw_addr) is link:
+      del self._addr2access_link[link.interface.hw_addr]
+
+  def get_access_link(self, hw_addr):
+    """Returns the access link of the interface with hw_addr, or None"""
+    return self._addr2access_link.get(hw_addr)
+
+  def register(self, src_addr, dst_addr):
+    """Registers that src_addr sent a packet to dst_addr just now"""
+    if src_addr is None or dst_addr is None:
+      raise RuntimeError("Interface to register is None!")
+    pair = (src_addr, dst_addr)
+    now = self.clock()
+    if pair not in self._last_seen:
+      heapq.heappush(self._expiry, (now, pair))
+    self._last_seen[pair] = now
+
+  def expire(self):
+    """Forgets the pairs that haven't communicated within pair_timeout"""
+    deadline = self.clock() - self.pair_timeout
+    while self._expiry and self._expiry[0][0] <= deadline:
+      (timestamp, pair) = heapq.heappop(self._expiry)
+      last_seen = self._last_seen[pair]
+      if last_seen > deadline:
+        heapq.heappush(self._expiry, (last_seen, pair))
+      else:
+        del self._last_seen[pair]
+
+  @property
+  def recent_pairs(self):
+    """Returns the (src_addr, dst_addr) pairs that recently communicated"""
+    self.expire()
+    return set(self._last_seen.keys())
+
+  def communicated_link_pairs(self):
+    """
+    Returns the (src access link, dst access link) pairs between which
+    packets were recently sent, ignoring addresses that aren't attached to
+    an access link.
+    """
+    link_pairs = set()
+    for (src_addr, dst_addr) in self.recent_pairs:
+      src_link = self._addr2access_link.get(src_addr)
+      dst_link = self._addr2access_link.get(dst_addr)
+      if src_link is not None and dst_link is not None:
+        link_pairs.add((src_link, dst_link))
+    return link_pairs
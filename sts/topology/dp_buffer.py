@@ -29,7 +29,6 @@ from pox.lib.revent import EventMixin
 
 from sts.entities.hosts import HostAbstractClass
 from sts.fingerprints.messages import DPFingerprint
-from sts.invariant_checker import InvariantChecker
 from sts.util.capability import Capabilities
 from sts.util.console import msg
 
@@ -62,6 +61,10 @@ class DataPathBuffer(object):
   A Patch panel. Contains a bunch of wires to forward packets between switches.
   Listens to the SwitchDPPacketOut event on the switches.
   """
+  # The CommunicationTracker to register forwarded packets' interface pairs
+  # with, if any
+  communication_tracker = None
+
   def __init__(self, switches=None, hosts=None, connected_port_mapping=None,
                capabilities=None):
     """
@@ -113,9 +116,11 @@ class DataPathBuffer(object):
     self.hosts.remove(host)
 
   def register_interface_pair(self, event):
+    if self.communication_tracker is None:
+      return
     (src_addr, dst_addr) = (event.packet.src, event.packet.dst)
     if src_addr is not None and dst_addr is not None:
-      InvariantChecker.register_interface_pair(src_addr, dst_addr)
+      self.communication_tracker.register(src_addr, dst_addr)
 
   def handle_DpPacketOut(self, event):
     self.register_interface_pair(event)
@@ -153,6 +158,14 @@ class DataPathBuffer(object):
     assert self.capabilities.can_drop_dp_event
     raise NotImplementedError()
 
+  def permit_many(self, dp_events):
+    assert self.capabilities.can_permit_dp_event
+    raise NotImplementedError()
+
+  def drop_many(self, dp_events):
+    assert self.capabilities.can_drop_dp_event
+    raise NotImplementedError()
+
 
 
 class BufferedPatchPanel(DataPathBuffer, EventMixin):
@@ -243,12 +256,52 @@ class BufferedPatchPanel(DataPathBuffer, EventMixin):
     self._remove_dp_event(dp_event)
     return dp_event
 
+  def permit_many(self, dp_events):
+    """
+    Permit each of the given buffered SwitchDpPacketOut events to be
+    forwarded, in order
+    """
+    assert self.capabilities.can_permit_dp_event
+    dp_events = list(dp_events)
+    if dp_events:
+      msg.event("Forwarding %d dataplane events" % len(dp_events))
+    self._remove_dp_events(dp_events)
+    for dp_event in dp_events:
+      self.handle_DpPacketOut(dp_event)
+
+  def drop_many(self, dp_events):
+    """
+    Remove the given buffered SwitchDpPacketOut events from our buffer, and
+    do not forward them.
+    Returns the dropped events.
+    """
+    assert self.capabilities.can_drop_dp_event
+    dp_events = list(dp_events)
+    if dp_events:
+      msg.event("Dropping %d dataplane events" % len(dp_events))
+    self._remove_dp_events(dp_events)
+    return dp_events
+
   def _remove_dp_event(self, dp_event):
     # Pre: dp_event.fingerprint in self.fingerprint2dp_outs
     self.fingerprint2dp_outs[dp_event.fingerprint].remove(dp_event)
     if self.fingerprint2dp_outs[dp_event.fingerprint] == []:
       del self.fingerprint2dp_outs[dp_event.fingerprint]
 
+  def _remove_dp_events(self, dp_events):
+    """Removes the dp_events with one pass over each fingerprint's list"""
+    # Pre: each dp_event.fingerprint in self.fingerprint2dp_outs
+    fingerprint2removed = defaultdict(set)
+    for dp_event in dp_events:
+      fingerprint2removed[dp_event.fingerprint].add(id(dp_event))
+    for fingerprint, removed in fingerprint2removed.iteritems():
+      remaining = [ e for e in self.fingerprint2dp_outs[fingerprint]
+                    if id(e) not in removed ]
+      if remaining == []:
+        del self.fingerprint2dp_outs[fingerprint]
+      else:
+        self.fingerprint2dp_outs[fingerprint] = remaining
+
   def get_buffered_dp_event(self, fingerprint):
     if fingerprint in self.fingerprint2dp_outs:
       return self.fingerprint2dp_outs[fingerprint][0]
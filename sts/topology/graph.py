@@ -17,14 +17,19 @@ A Simple Library for topology graphs.
 """
 
 import logging
-import networkx as nx
+from collections import OrderedDict
 
 LOG = logging.getLogger("sts.topology.graph")
 
 
 class Graph(object):
   """
-  A generic graph representation
+  A generic directed graph representation.
+
+  Edges are kept in both a forward (src -> dst -> attrs) and a reverse
+  (dst -> src -> attrs) adjacency map sharing the same attrs dicts, so the
+  edges into or out of a vertex, and removing a vertex, only cost as much as
+  the vertex's degree.
   """
 
   def __init__(self, vertices=None, edges=None):
@@ -35,6 +40,7 @@ class Graph(object):
     """
     self._vertices = {}
     self._edges = {}
+    self._reverse_edges = {}
     if vertices is not None:
       assert isinstance(vertices, dict)
       for vertex, attrs in vertices.iteritems():
@@ -95,14 +101,15 @@ class Graph(object):
 
   def remove_vertex(self, vertex, remove_edges=True):
     assert self.has_vertex(vertex)
-    edges = []
-    for edge in self.edges_iter(include_attrs=False):
-      if vertex in edge:
-        edges.append(edge)
+    edges = self.edges_src(vertex)
+    # Self loops are already in edges_src
+    edges.extend(edge for edge in self.edges_dst(vertex) if edge[0] != vertex)
     if remove_edges == False:
       assert len(edges) == 0, "Vertex is part of some edges"
     for edge in edges:
       self.remove_edge(*edge)
+    self._edges.pop(vertex, None)
+    self._reverse_edges.pop(vertex, None)
     del self._vertices[vertex]
 
   def has_vertex(self, vertex):
@@ -146,12 +153,16 @@ class Graph(object):
       self.add_vertex(v2)
     if self._edges.get(v1, None) is None:
       self._edges[v1] = {}
+    if self._reverse_edges.get(v2, None) is None:
+      self._reverse_edges[v2] = {}
     self._edges[v1][v2] = attrs
+    self._reverse_edges[v2][v1] = attrs
     return v1, v2
 
   def remove_edge(self, v1, v2):
     assert self.has_edge(v1, v2), "No edge between '%s' and '%s'" % (v1, v2)
     del self._edges[v1][v2]
+    del self._reverse_edges[v2][v1]
 
   def has_edge(self, v1, v2):
     """Return True if an edge exists between two vertices v1 and v2"""
@@ -171,10 +182,10 @@ class Graph(object):
 
   def edges_dst(self, v2):
     """Return list of edges in which v2 is destination"""
+    adj = self._reverse_edges.get(v2, {})
     edges = []
-    for v1, adj in self._edges.iteritems():
-      if v2 in adj:
-        edges.append((v1, v2))
+    for vertex in adj:
+      edges.append((vertex, v2))
     return edges
 
 
@@ -192,32 +203,6 @@ class EdgeType(object):
   INTERNAL_LINK = 'internal_link'  # for switch-port and host-interface links
 
 
-def edges_iter_with_check(g, check, include_attrs=False):
-  """
-  Iterate over edges in the topology and return edges which
-  check(v1, v2, attrs) is True
-  """
-  for v1, v2, attrs in g.edges_iter(data=True):
-    if check(v1, v2, attrs):
-      if include_attrs:
-        yield v1, v2, attrs
-      else:
-        yield v1, v2
-
-
-def vertices_iter_with_check(g, check, include_attrs=False):
-  """
-  Iterate over vertices in the topology and return vertices which
-  check(vertex_id, attrs) is True
-  """
-  for vertex, attrs in g.nodes_iter(data=True):
-    if check(vertex, attrs):
-      if include_attrs:
-        yield vertex, attrs
-      else:
-        yield vertex
-
-
 class TopologyGraph(object):
   """
   A high level graph of the network topology.
@@ -234,11 +219,19 @@ class TopologyGraph(object):
     switch vertex id: see `_switch_vertex_id`
     port vertex id: see `_port_vertex_id`
     link vertices: see `_get_link_vertices`
+
+  Vertices are also kept in per type buckets (in insertion order), so
+  iterating over the hosts, interfaces, switches or ports doesn't visit the
+  whole graph.
   """
   def __init__(self, hosts=None, switches=None, links=None):
     super(TopologyGraph, self).__init__()
-    #self._g = Graph()
-    self._g = nx.DiGraph()
+    self._g = Graph()
+    # vtype -> vertices of that type, used as an ordered set
+    self._typed_vertices = {}
+    for vtype in [VertexType.HOST, VertexType.INTERFACE, VertexType.SWITCH,
+                  VertexType.PORT]:
+      self._typed_vertices[vtype] = OrderedDict()
     self.log = LOG
     # Load initial configurations
     hosts = hosts or []
@@ -324,11 +317,9 @@ class TopologyGraph(object):
       # from this class
       v_port = self._port_vertex_id(node, vertex)
       v_iface = self._interface_vertex_id(vertex)
-      if (self._g.has_node(v_port) and
-            self.is_port(v_port, self._g.node[v_port])):
+      if v_port in self._typed_vertices[VertexType.PORT]:
         v = v_port
-      elif (self._g.has_node(v_iface) and
-              self.is_interface(v_iface, self._g.node[v_iface])):
+      elif v_iface in self._typed_vertices[VertexType.INTERFACE]:
         v = v_iface
       else:
         v = None
@@ -338,6 +329,14 @@ class TopologyGraph(object):
     self.log.debug("_get_link_vertices (%s): %s<->%s", link, v1, v2)
     return v1, v2
 
+  def _typed_vertices_iter(self, vtype, include_attrs=False):
+    """Iterates over the vertices of type vtype"""
+    for vertex in self._typed_vertices[vtype].keys():
+      if include_attrs:
+        yield vertex, self._g.vertices[vertex]
+      else:
+        yield vertex
+
   def hosts_iter(self, include_attrs=False):
     """
     Iterates over hosts in the topology.
@@ -345,8 +344,8 @@ class TopologyGraph(object):
     Args:
       include_attr: If true not only host is returned but the attributes as well
     """
-    return vertices_iter_with_check(self._g, check=self.is_host,
-                                            include_attrs=include_attrs)
+    return self._typed_vertices_iter(VertexType.HOST,
+                                     include_attrs=include_attrs)
 
   @property
   def hosts(self):
@@ -362,8 +361,8 @@ class TopologyGraph(object):
       include_attr: If true not only interfaces are returned but the attributes
                     as well
     """
-    return vertices_iter_with_check(self._g, check=self.is_interface,
-                                            include_attrs=include_attrs)
+    return self._typed_vertices_iter(VertexType.INTERFACE,
+                                     include_attrs=include_attrs)
 
   @property
   def interfaces(self):
@@ -380,8 +379,8 @@ class TopologyGraph(object):
       include_attr: If true not only ports are returned but the attributes
                     as well
     """
-    return vertices_iter_with_check(self._g, check=self.is_port,
-                                    include_attrs=include_attrs)
+    return self._typed_vertices_iter(VertexType.PORT,
+                                     include_attrs=include_attrs)
 
   @property
   def ports(self):
@@ -397,8 +396,8 @@ class TopologyGraph(object):
       include_attr: If true not only switches are returned but the attributes
                     as well
     """
-    return vertices_iter_with_check(self._g, check=self.is_switch,
-                                    include_attrs=include_attrs)
+    return self._typed_vertices_iter(VertexType.SWITCH,
+                                     include_attrs=include_attrs)
 
   @property
   def switches(self):
@@ -439,23 +438,21 @@ class TopologyGraph(object):
       include_attr: If true not only edges are returned but the attributes
                     as well
     """
-    return self._g.edges_iter(data=include_attrs)
+    return self._g.edges_iter(include_attrs=include_attrs)
 
   def has_host(self, host):
     """Returns True if the host exists in the topology"""
     hid = self._host_vertex_id(host)
-    return (self._g.has_node(hid) and
-            self.is_host(hid, self.get_host_attrs(hid)))
+    return hid in self._typed_vertices[VertexType.HOST]
 
   def has_switch(self, switch):
     """Returns True if the topology has a switch with sid"""
     sid = self._switch_vertex_id(switch)
-    return (self._g.has_node(sid) and
-            self.is_switch(sid, self.get_switch_attrs(sid)))
+    return sid in self._typed_vertices[VertexType.SWITCH]
 
   def _get_attrs(self, vertex, vtype):
     """Returns all attributes for the vertex and checks it's type."""
-    info = self._g.node[vertex]
+    info = self._g.vertices[vertex]
     assert info.get('vtype', None) == vtype, \
       "There is a vertex with the same ID but it's not a '%s'" % vtype
     return info
@@ -532,14 +529,21 @@ class TopologyGraph(object):
     """
     Get all links that this vertex is connected to.
     """
-    assert self._g.has_node(vertex), "Vertex  doesn't exist: '%s'" % vertex
+    assert self._g.has_vertex(vertex), "Vertex  doesn't exist: '%s'" % vertex
     edges = []
-    for src, dst in self._g.out_edges(vertex):
-      edges.append(self._g.get_edge_data(src, dst))
-    for src, dst in self._g.in_edges(vertex):
-      edges.append(self._g.get_edge_data(src, dst))
+    for src, dst in self._g.edges_src(vertex):
+      edges.append(self._g.get_edge(src, dst))
+    for src, dst in self._g.edges_dst(vertex):
+      edges.append(self._g.get_edge(src, dst))
     return edges
 
+  def _add_vertex(self, vertex, vtype, obj):
+    """Adds a vertex of type vtype for obj to the topology."""
+    self._g.add_vertex(vertex, vtype=vtype, obj=obj)
+    for bucket in self._typed_vertices.itervalues():
+      bucket.pop(vertex, None)
+    self._typed_vertices[vtype][vertex] = None
+
   def _remove_vertex(self, vertex, vtype):
     """
     Removes a vertex with all associated edges from the topology.
@@ -547,15 +551,12 @@ class TopologyGraph(object):
     Also removes all associated links.
     """
 
-    assert self._g.has_node(vertex), \
+    assert self._g.has_vertex(vertex), \
       "Removing a vertex that doesn't exist: '%s'" % vertex
-    vertex_info = self._g.node[vertex]
+    vertex_info = self._g.vertices[vertex]
     assert vertex_info['vtype'] == vtype
-    for src, dst in self._g.out_edges(vertex):
-      self._g.remove_edge(src, dst)
-    for src, dst in self._g.in_edges(vertex):
-      self._g.remove_edge(src, dst)
-    self._g.remove_node(vertex)
+    self._g.remove_vertex(vertex, remove_edges=True)
+    del self._typed_vertices[vtype][vertex]
 
   def remove_interface(self, port_no):
     """
@@ -584,10 +585,10 @@ class TopologyGraph(object):
     """
     hid = self._host_vertex_id(host)
     self.log.debug("Adding host: %s with vertex id: %s", host, hid)
-    assert not self._g.has_node(hid)
-    self._g.add_node(hid, vtype=VertexType.HOST, obj=host)
+    assert not self._g.has_vertex(hid)
+    self._add_vertex(hid, VertexType.HOST, host)
     for port_no, interface in self._interfaces_iterator(host):
-      self._g.add_node(port_no, vtype=VertexType.INTERFACE, obj=interface)
+      self._add_vertex(port_no, VertexType.INTERFACE, interface)
       self.log.debug("Adding interface: %s with vertex id: %s", interface, port_no)
       self._g.add_edge(hid, port_no, etype=EdgeType.INTERNAL_LINK)
       self._g.add_edge(port_no, hid, etype=EdgeType.INTERNAL_LINK)
@@ -616,10 +617,10 @@ class TopologyGraph(object):
       switch: Switch object. Little assumptions are made about the Switch type.
     """
     sid = self._switch_vertex_id(switch)
-    assert not self._g.has_node(sid)
-    self._g.add_node(sid, vtype=VertexType.SWITCH, obj=switch)
+    assert not self._g.has_vertex(sid)
+    self._add_vertex(sid, VertexType.SWITCH, switch)
     for port_no, port in self._ports_iterator(switch):
-      self._g.add_node(port_no, vtype=VertexType.PORT, obj=port)
+      self._add_vertex(port_no, VertexType.PORT, port)
       self._g.add_edge(sid, port_no, etype=EdgeType.INTERNAL_LINK)
       self._g.add_edge(port_no, sid, etype=EdgeType.INTERNAL_LINK)
     return sid
@@ -633,7 +634,7 @@ class TopologyGraph(object):
     sid = self._switch_vertex_id(switch)
     assert self.has_switch(switch), \
       "Removing a switch that doesn't exist: '%s'" % sid
-    ports = self._ports_iterator(self._g.node[sid]['obj'])
+    ports = self._ports_iterator(self._g.vertices[sid]['obj'])
     for port_no, _ in ports:
       self.remove_port(port_no)
     self._remove_vertex(sid, VertexType.SWITCH)
@@ -647,8 +648,8 @@ class TopologyGraph(object):
     src_vertex, dst_vertex = self._get_link_vertices(link)
     assert src_vertex is not None
     assert dst_vertex is not None
-    assert self._g.has_node(src_vertex)
-    assert self._g.has_node(dst_vertex)
+    assert self._g.has_vertex(src_vertex)
+    assert self._g.has_vertex(dst_vertex)
     if bidir:
       self._g.add_edge(src_vertex, dst_vertex, obj=link, etype=EdgeType.LINK,
                        bidir=bidir)
@@ -666,7 +667,7 @@ class TopologyGraph(object):
     """
     if not self._g.has_edge(src_vertex, dst_vertex):
       return None
-    edge_attrs = self._g.get_edge_data(src_vertex, dst_vertex)
+    edge_attrs = self._g.get_edge(src_vertex, dst_vertex)
     assert self.is_link(src_vertex, dst_vertex, edge_attrs), (
       "There is an edgebetween '%s' and '%s' but it's"
       "not a Link" % (src_vertex, dst_vertex))
@@ -681,7 +682,7 @@ class TopologyGraph(object):
     """Removes the link between src and dst."""
     src_vertex, dst_vertex = self._get_link_vertices(link)
     assert self.has_link(link), ("Link is not part of the graph: '%s'" % link)
-    bidir = self._g.get_edge_data(src_vertex, dst_vertex)['bidir']
+    bidir = self._g.get_edge(src_vertex, dst_vertex)['bidir']
     self._g.remove_edge(src_vertex, dst_vertex)
     # Remove the other link in case of bidir links
     if bidir and self._g.has_edge(dst_vertex, src_vertex):
@@ -0,0 +1,279 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Incremental tracking of which switches are partitioned from each other.
+"""
+
+import logging
+from collections import defaultdict
+
+
+def link_directions(link):
+  """Returns the (src switch, dst switch) pairs that link forwards between"""
+  if hasattr(link, 'start_node'):
+    return [(link.start_node, link.end_node)]
+  return [(link.node1, link.node2), (link.node2, link.node1)]
+
+
+class PartitionTracker(object):
+  """
+  Tracks which switches can reach each other over live network links.
+
+  A link is live if it isn't cut and neither of its switches has failed. The
+  tracker keeps a count of the live links between each ordered pair of
+  switches, updated as links are severed or repaired and switches crash or
+  recover. As long as every live adjacency has a live reverse adjacency,
+  reachability is symmetric and the tracker maintains connected components
+  with union-find: repairs and recoveries merge components in place, while
+  cuts and crashes mark the components for a single BFS rebuild on the next
+  query. While some adjacency is one-way, queries fall back to a BFS from
+  each switch in question.
+  """
+  def __init__(self, switches_manager=None, patch_panel=None):
+    """
+    Args:
+      - switches_manager, patch_panel: if given, the tracker is initialized
+        from them, and sync() picks up the switch failures and link cuts made
+        through them.
+    """
+    self.switches_manager = switches_manager
+    self.patch_panel = patch_panel
+    self.log = logging.getLogger(__name__ + '.PartitionTracker')
+    # switch -> set of network links attached to it
+    self._links_of = defaultdict(set)
+    self._links = set()
+    self._cut_links = set()
+    self._failed_switches = set()
+    # src switch -> dst switch -> number of live links from src to dst
+    self._live = defaultdict(lambda: defaultdict(int))
+    # Number of ordered (src, dst) with live links, but none from dst to src
+    self._one_way = 0
+    # Union-find over switches; None if it needs to be rebuilt
+    self._parent = {}
+    # Bumped on every change, to invalidate directed reachability
+    self._version = 0
+    self._reachable = {}
+    self._reachable_version = -1
+    if switches_manager is not None:
+      for switch in switches_manager.switches:
+        self.add_switch(switch)
+    if patch_panel is not None:
+      for link in patch_panel.network_links:
+        self.add_link(link)
+    self.sync()
+
+  # --------------------------------------------------------------#
+  #                    Bookkeeping                                #
+  # --------------------------------------------------------------#
+
+  def _is_live(self, link):
+    if link in self._cut_links:
+      return False
+    for (src, dst) in link_directions(link):
+      if src in self._failed_switches or dst in self._failed_switches:
+        return False
+    return True
+
+  def _adjust(self, link, delta):
+    """Adds delta to the live link counts of link's directions"""
+    self._version += 1
+    for (src, dst) in link_directions(link):
+      before = self._live[src][dst]
+      after = before + delta
+      self._live[src][dst] = after
+      if (before == 0) == (after == 0):
+        continue
+      reverse = self._live[dst][src] > 0
+      if after > 0:
+        # src -> dst came up
+        self._one_way += -1 if reverse else 1
+        if self._parent is not None:
+          self._union(src, dst)
+      else:
+        # src -> dst went down
+        self._one_way += 1 if reverse else -1
+        self._parent = None
+
+  def add_switch(self, switch):
+    if self._parent is not None:
+      self._parent.setdefault(switch, switch)
+    self._version += 1
+
+  def remove_switch(self, switch):
+    for link in list(self._links_of[switch]):
+      self.remove_link(link)
+    self._failed_switches.discard(switch)
+    self._links_of.pop(switch, None)
+    self._parent = None
+    self._version += 1
+
+  def add_link(self, link):
+    if link in self._links:
+      return
+    self._links.add(link)
+    for (src, dst) in link_directions(link):
+      self._links_of[src].add(link)
+      self._links_of[dst].add(link)
+    if self._is_live(link):
+      self._adjust(link, 1)
+
+  def remove_link(self, link):
+    if link not in self._links:
+      return
+    if self._is_live(link):
+      self._adjust(link, -1)
+    self._links.remove(link)
+    self._cut_links.discard(link)
+    for (src, dst) in link_directions(link):
+      self._links_of[src].discard(link)
+      self._links_of[dst].discard(link)
+
+  def sever_link(self, link):
+    if link in self._cut_links:
+      return
+    if link in self._links and self._is_live(link):
+      self._adjust(link, -1)
+    self._cut_links.add(link)
+
+  def repair_link(self, link):
+    if link not in self._cut_links:
+      return
+    self._cut_links.remove(link)
+    if link in self._links and self._is_live(link):
+      self._adjust(link, 1)
+
+  def crash_switch(self, switch):
+    if switch in self._failed_switches:
+      return
+    live_links = [ l for l in self._links_of[switch] if self._is_live(l) ]
+    self._failed_switches.add(switch)
+    for link in live_links:
+      self._adjust(link, -1)
+
+  def recover_switch(self, switch):
+    if switch not in self._failed_switches:
+      return
+    self._failed_switches.remove(switch)
+    for link in self._links_of[switch]:
+      if self._is_live(link):
+        self._adjust(link, 1)
+
+  def sync(self):
+    """
+    Picks up switch failures and recoveries, and link cuts and repairs, made
+    through the switches manager and patch panel since the last sync(). Only
+    looks at the failed switches and cut links, so it is cheap.
+    """
+    if self.switches_manager is not None:
+      failed = set(self.switches_manager.failed_switches)
+      for switch in self._failed_switches - failed:
+        self.recover_switch(switch)
+      for switch in failed - self._failed_switches:
+        self.crash_switch(switch)
+    if self.patch_panel is not None:
+      cut = set(self.patch_panel.cut_network_links)
+      for link in self._cut_links - cut:
+        self.repair_link(link)
+      for link in cut - self._cut_links:
+        self.sever_link(link)
+
+  # --------------------------------------------------------------#
+  #                    Queries                                    #
+  # --------------------------------------------------------------#
+
+  def _find(self, switch):
+    parent = self._parent
+    root = parent.setdefault(switch, switch)
+    while parent[root] != root:
+      root = parent[root]
+    # Path compression
+    while parent[switch] != root:
+      (parent[switch], switch) = (root, parent[switch])
+    return root
+
+  def _union(self, s1, s2):
+    (r1, r2) = (self._find(s1), self._find(s2))
+    if r1 != r2:
+      self._parent[r1] = r2
+
+  def _rebuild_components(self):
+    self.log.debug("Rebuilding connected components")
+    self._parent = {}
+    for switch in self._links_of.keys():
+      if switch in self._parent:
+        continue
+      self._parent[switch] = switch
+      queue = [switch]
+      while queue:
+        current = queue.pop()
+        for (neighbor, count) in self._live[current].iteritems():
+          if count > 0 and neighbor not in self._parent:
+            self._parent[neighbor] = switch
+            queue.append(neighbor)
+
+  def _reachable_from(self, switch):
+    """Returns the set of switches reachable from switch over live links"""
+    if self._reachable_version != self._version:
+      self._reachable = {}
+      self._reachable_version = self._version
+    if switch not in self._reachable:
+      reached = set([switch])
+      queue = [switch]
+      while queue:
+        current = queue.pop()
+        for (neighbor, count) in self._live[current].iteritems():
+          if count > 0 and neighbor not in reached:
+            reached.add(neighbor)
+            queue.append(neighbor)
+      self._reachable[switch] = reached
+    return self._reachable[switch]
+
+  def is_partitioned(self, src_switch, dst_switch):
+    """Returns True if src_switch can't reach dst_switch over live links"""
+    self.sync()
+    if src_switch == dst_switch:
+      return False
+    if self._one_way != 0:
+      return dst_switch not in self._reachable_from(src_switch)
+    if self._parent is None:
+      self._rebuild_components()
+    return self._find(src_switch) != self._find(dst_switch)
+
+  def partitioned_link_pairs(self, access_links):
+    """
+    Returns the set of ordered pairs of distinct access links such that the
+    first one's switch can't reach the second one's.
+    """
+    self.sync()
+    access_links = list(access_links)
+    pairs = set()
+    if self._one_way != 0:
+      for l1 in access_links:
+        reachable = self._reachable_from(l1.switch)
+        pairs.update((l1, l2) for l2 in access_links
+                     if l2.switch not in reachable)
+      return pairs
+    if self._parent is None:
+      self._rebuild_components()
+    # component root -> access links attached to it
+    buckets = defaultdict(list)
+    for link in access_links:
+      buckets[self._find(link.switch)].append(link)
+    for (root1, links1) in buckets.iteritems():
+      for (root2, links2) in buckets.iteritems():
+        if root1 != root2:
+          pairs.update((l1, l2) for l1 in links1 for l2 in links2)
+    return pairs
@@ -19,6 +19,7 @@ Patch panel connects the different elements in the network together.
 
 
 import abc
+from collections import defaultdict
 
 from sts.util.capability import Capabilities
 
@@ -37,6 +38,91 @@ def is_network_link(link):
                            BiDirectionalLinkAbstractClass))
 
 
+class LinkStateSet(set):
+  """
+  A set of cut links that reports links entering or leaving it to on_change,
+  so the patch panel can keep its indexes up to date while subclasses keep
+  severing and repairing links by mutating the cut set directly.
+
+  copy() and the results of set operations are plain sets.
+  """
+  def __init__(self, on_change, iterable=()):
+    super(LinkStateSet, self).__init__(iterable)
+    self._on_change = on_change
+
+  def copy(self):
+    return set(self)
+
+  def __reduce__(self):
+    # set.__reduce__ would pass the links as on_change. Restore them through
+    # __setstate__ instead, after the copy is memoized, so that deep-copying
+    # the owner of on_change doesn't copy this set twice.
+    return (LinkStateSet, (None,), (self._on_change, list(self)))
+
+  def __setstate__(self, state):
+    (self._on_change, links) = state
+    super(LinkStateSet, self).update(links)
+
+  def add(self, link):
+    if link not in self:
+      super(LinkStateSet, self).add(link)
+      self._on_change(link, True)
+
+  def remove(self, link):
+    super(LinkStateSet, self).remove(link)
+    self._on_change(link, False)
+
+  def discard(self, link):
+    if link in self:
+      self.remove(link)
+
+  def pop(self):
+    link = super(LinkStateSet, self).pop()
+    self._on_change(link, False)
+    return link
+
+  def clear(self):
+    while self:
+      self.pop()
+
+  def update(self, *iterables):
+    for iterable in iterables:
+      for link in iterable:
+        self.add(link)
+
+  def difference_update(self, *iterables):
+    for iterable in iterables:
+      for link in iterable:
+        self.discard(link)
+
+  def intersection_update(self, *iterables):
+    keep = set(self).intersection(*iterables)
+    self.difference_update([link for link in self if link not in keep])
+
+  def symmetric_difference_update(self, iterable):
+    for link in set(iterable):
+      if link in self:
+        self.remove(link)
+      else:
+        self.add(link)
+
+  def __ior__(self, other):
+    self.update(other)
+    return self
+
+  def __isub__(self, other):
+    self.difference_update(other)
+    return self
+
+  def __iand__(self, other):
+    self.intersection_update(other)
+    return self
+
+  def __ixor__(self, other):
+    self.symmetric_difference_update(other)
+    return self
+
+
 class PatchPanelCapabilities(Capabilities):
   """
   Expresses what a PatchPanel can/cannot do.
@@ -287,6 +373,11 @@ class PatchPanelAbstractClass(object):
     """Connect whatever necessary to make the link connected."""
     raise NotImplementedError()
 
+  def add_network_links(self, links):
+    """Adds many network links at once. See `add_network_link`."""
+    for link in links:
+      self.add_network_link(link)
+
   @abc.abstractmethod
   def remove_network_link(self, link):
     """
@@ -326,6 +417,11 @@ class PatchPanelAbstractClass(object):
     """Connect whatever necessary to make the link connected."""
     raise NotImplementedError()
 
+  def add_access_links(self, links):
+    """Adds many access links at once. See `add_access_link`."""
+    for link in links:
+      self.add_access_link(link)
+
   @abc.abstractmethod
   def remove_access_link(self, link):
     """
@@ -391,6 +487,11 @@ class PatchPanelBK(PatchPanelAbstractClass):
   """
   This class implements the bookkeeping methods of PatchPanelAbstractClass to
   make it easier to extend.
+
+  The link sets, the live links, the (src switch, dst switch) -> links index
+  and the per switch adjacency are all maintained as links are added, removed,
+  severed and repaired. The link properties return snapshots that are only
+  rebuilt after a change, so reading them every round is cheap.
   """
 
   __metaclass__ = abc.ABCMeta
@@ -407,22 +508,94 @@ class PatchPanelBK(PatchPanelAbstractClass):
     self.is_access_link = is_access_link
     self.access_link_factory = access_link_factory
 
-    self._cut_network_links = set()
-    self._cut_access_links = set()
+    self._cut_network_links = LinkStateSet(self._network_link_cut_changed)
+    self._cut_access_links = LinkStateSet(self._access_link_cut_changed)
     self.port2access_link = {}
     self.interface2access_link = {}
     self.src_port2internal_link = {}
     self.dst_port2internal_link = {}
 
+    self._network_links = set()
+    self._live_network_links = set()
+    self._access_links = set()
+    self._live_access_links = set()
+    # (src switch, dst switch) -> set of links forwarding from src to dst
+    self._switch_pair2network_links = defaultdict(set)
+    # switch -> set of network links attached to it
+    self._switch2network_links = defaultdict(set)
+    # Cached snapshots returned by the properties, None when stale
+    self._network_links_view = None
+    self._live_network_links_view = None
+    self._access_links_view = None
+    self._live_access_links_view = None
+
+  def _network_link_directions(self, link):
+    """Returns the (src switch, dst switch) pairs that link forwards between"""
+    if self.is_bidir_network_link(link):
+      return [(link.node1, link.node2), (link.node2, link.node1)]
+    return [(link.start_node, link.end_node)]
+
+  def _network_link_cut_changed(self, link, cut):
+    if link not in self._network_links:
+      return
+    if cut:
+      self._live_network_links.discard(link)
+    else:
+      self._live_network_links.add(link)
+    self._live_network_links_view = None
+
+  def _access_link_cut_changed(self, link, cut):
+    if link not in self._access_links:
+      return
+    if cut:
+      self._live_access_links.discard(link)
+    else:
+      self._live_access_links.add(link)
+    self._live_access_links_view = None
+
+  def _index_network_link(self, link):
+    self._network_links.add(link)
+    if link not in self._cut_network_links:
+      self._live_network_links.add(link)
+    for src, dst in self._network_link_directions(link):
+      self._switch_pair2network_links[(src, dst)].add(link)
+      self._switch2network_links[src].add(link)
+      self._switch2network_links[dst].add(link)
+
+  def _unindex_network_link(self, link):
+    self._network_links.discard(link)
+    self._live_network_links.discard(link)
+    for src, dst in self._network_link_directions(link):
+      for index, key in ((self._switch_pair2network_links, (src, dst)),
+                         (self._switch2network_links, src),
+                         (self._switch2network_links, dst)):
+        links = index.get(key)
+        if links is not None:
+          links.discard(link)
+          if not links:
+            del index[key]
+
+  def _network_links_changed(self):
+    self._network_links_view = None
+    self._live_network_links_view = None
+
+  def _access_links_changed(self):
+    self._access_links_view = None
+    self._live_access_links_view = None
+
   @property
   def network_links(self):
     """Return list of internal network links"""
-    return list(set(self.src_port2internal_link.values()))
+    if self._network_links_view is None:
+      self._network_links_view = tuple(self._network_links)
+    return self._network_links_view
 
   @property
   def live_network_links(self):
     """Returns list of live internal network links"""
-    return set(self.network_links) - self.cut_network_links
+    if self._live_network_links_view is None:
+      self._live_network_links_view = frozenset(self._live_network_links)
+    return self._live_network_links_view
 
   @property
   def cut_network_links(self):
@@ -435,7 +608,7 @@ class PatchPanelBK(PatchPanelAbstractClass):
     Returns list of UP Links, Checks the actual status of network links.
     """
     assert self.capabilities.can_get_up_network_links
-    return set(self.network_links) - self.cut_network_links
+    return self.live_network_links
 
   @property
   def down_network_links(self):
@@ -443,17 +616,21 @@ class PatchPanelBK(PatchPanelAbstractClass):
     Returns list of DOWN Links, Checks the actual status of network links.
     """
     assert self.capabilities.can_get_down_network_links
-    return set(self.network_links) - self.cut_network_links
+    return self.live_network_links
 
   @property
   def access_links(self):
     """Returns list of access links (host->switch)"""
-    return self.interface2access_link.values()
+    if self._access_links_view is None:
+      self._access_links_view = tuple(self._access_links)
+    return self._access_links_view
 
   @property
   def live_access_links(self):
     """Return list of live access links"""
-    return set(self.access_links) - self.cut_access_links
+    if self._live_access_links_view is None:
+      self._live_access_links_view = frozenset(self._live_access_links)
+    return self._live_access_links_view
 
   @property
   def cut_access_links(self):
@@ -466,7 +643,7 @@ class PatchPanelBK(PatchPanelAbstractClass):
     Returns list of UP Links, Checks the actual status of network links.
     """
     assert self.capabilities.can_get_up_access_links
-    return set(self.access_links) - self.cut_access_links
+    return self.live_access_links
 
   @property
   def down_access_links(self):
@@ -474,7 +651,19 @@ class PatchPanelBK(PatchPanelAbstractClass):
     Returns list of DOWN Links, Checks the actual status of network links.
     """
     assert self.capabilities.can_get_down_access_links
-    return set(self.access_links) - self.cut_access_links
+    return self.live_access_links
+
+  def has_network_link(self, link):
+    """Returns True if link is managed by this patch panel."""
+    return link in self._network_links
+
+  def has_access_link(self, link):
+    """Returns True if the access link is managed by this patch panel."""
+    return link in self._access_links
+
+  def switch_network_links(self, switch):
+    """Returns the set of network links attached to switch."""
+    return frozenset(self._switch2network_links.get(switch, ()))
 
   def is_port_connected(self, port):
     """
@@ -524,18 +713,43 @@ class PatchPanelBK(PatchPanelAbstractClass):
 
   def add_network_link(self, link):
     """Connect whatever necessary to make the link connected."""
-    assert self.capabilities.can_add_network_link
-    assert self.is_network_link(link), link
-    if self.is_bidir_network_link(link):
-      self.src_port2internal_link[link.port1] = link
-      self.src_port2internal_link[link.port2] = link
-      self.dst_port2internal_link[link.port1] = link
-      self.dst_port2internal_link[link.port2] = link
-    else:
-      self.src_port2internal_link[link.start_port] = link
-      self.dst_port2internal_link[link.end_port] = link
+    self.add_network_links([link])
     return link
 
+  def add_network_links(self, links):
+    """
+    Adds many network links at once. See `add_network_link`.
+
+    The indexes are updated in one pass, and the snapshots returned by the
+    link properties are only invalidated once.
+    """
+    assert self.capabilities.can_add_network_link
+    replaced = set()
+    for link in links:
+      assert self.is_network_link(link), link
+      if self.is_bidir_network_link(link):
+        src_ports = [link.port1, link.port2]
+      else:
+        src_ports = [link.start_port]
+      replaced.update(self.src_port2internal_link.get(port)
+                      for port in src_ports)
+      if self.is_bidir_network_link(link):
+        self.src_port2internal_link[link.port1] = link
+        self.src_port2internal_link[link.port2] = link
+        self.dst_port2internal_link[link.port1] = link
+        self.dst_port2internal_link[link.port2] = link
+      else:
+        self.src_port2internal_link[link.start_port] = link
+        self.dst_port2internal_link[link.end_port] = link
+      self._index_network_link(link)
+    replaced.discard(None)
+    if replaced:
+      # Links whose ports were all taken over are no longer managed
+      remaining = set(self.src_port2internal_link.values())
+      for old_link in replaced - remaining:
+        self._unindex_network_link(old_link)
+    self._network_links_changed()
+
   def remove_network_link(self, link):
     """
     Removes a network links between two switches.
@@ -544,7 +758,7 @@ class PatchPanelBK(PatchPanelAbstractClass):
     """
     assert self.capabilities.can_remove_network_link
     assert self.is_network_link(link)
-    assert link in self.network_links
+    assert link in self._network_links
     if self.is_bidir_network_link(link):
       del self.src_port2internal_link[link.port1]
       del self.src_port2internal_link[link.port2]
@@ -553,29 +767,18 @@ class PatchPanelBK(PatchPanelAbstractClass):
     else:
       del self.src_port2internal_link[link.start_port]
       del self.dst_port2internal_link[link.end_port]
+    self._unindex_network_link(link)
+    self._network_links_changed()
 
   def query_network_links(self, src_switch, src_port, dst_switch, dst_port):
     """
     Get links between two switches. Set port=None for wildcard query on port.
     Returns a `set`
     """
-    links = []
-    for _, port in self.switch_ports_iter(src_switch):
-      if port not in self.src_port2internal_link.keys():
-        # Port is not connected, skip it
-        continue
-      link = self.src_port2internal_link.get(port)
-      for p, v in self.src_port2internal_link.iteritems():
-        if p == port:
-          link = v
-      if link is None:
-        link = self.src_port2internal_link[port]
-      if link in links:
-        continue
-      is_bidr = self.is_bidir_network_link(link)
-      if is_bidr:
-        if set([src_switch, dst_switch]) != set([link.node1, link.node2]):
-          continue
+    links = set()
+    for link in self._switch_pair2network_links.get((src_switch, dst_switch),
+                                                    ()):
+      if self.is_bidir_network_link(link):
         if src_port is not None and src_port not in [link.port1, link.port2]:
           continue
         if dst_port is not None and dst_port not in [link.port1, link.port2]:
@@ -584,17 +787,13 @@ class PatchPanelBK(PatchPanelAbstractClass):
         if (src_port == dst_port and src_port is not None and
                 link.port1 != link.port2):
           continue
-      elif not is_bidr:
-        if link.start_node != src_switch:
-          continue
-        if link.end_node != dst_switch:
-          continue
+      else:
         if src_port is not None and src_port != link.start_port:
           continue
         if dst_port is not None and dst_port != link.end_port:
           continue
-      links.append(link)
-    return set(links)
+      links.add(link)
+    return links
 
   def create_access_link(self, host, interface, switch, port):
     """
@@ -610,20 +809,40 @@ class PatchPanelBK(PatchPanelAbstractClass):
 
   def add_access_link(self, link):
     """Connects whatever necessary to make the link connected."""
-    assert self.capabilities.can_add_access_link
-    assert self.is_access_link(link)
-    self.port2access_link[link.switch_port] = link
-    self.interface2access_link[link.interface] = link
+    self.add_access_links([link])
     return link
 
+  def add_access_links(self, links):
+    """
+    Adds many access links at once. See `add_access_link`.
+
+    The snapshots returned by the link properties are only invalidated once.
+    """
+    assert self.capabilities.can_add_access_link
+    for link in links:
+      assert self.is_access_link(link)
+      old_link = self.interface2access_link.get(link.interface)
+      if old_link is not None and old_link is not link:
+        self._access_links.discard(old_link)
+        self._live_access_links.discard(old_link)
+      self.port2access_link[link.switch_port] = link
+      self.interface2access_link[link.interface] = link
+      self._access_links.add(link)
+      if link not in self._cut_access_links:
+        self._live_access_links.add(link)
+    self._access_links_changed()
+
   def remove_access_link(self, link):
     """
     Removes access link between a host and a switch.
     """
     assert self.capabilities.can_remove_access_link
-    assert link in self.access_links
+    assert link in self._access_links
     del self.interface2access_link[link.interface]
     del self.port2access_link[link.switch_port]
+    self._access_links.discard(link)
+    self._live_access_links.discard(link)
+    self._access_links_changed()
 
   def query_access_links(self, host, interface, switch, port):
     """
@@ -49,7 +49,7 @@ class STSPatchPanel(PatchPanelBK):
     Disconnect link
     """
     self.msg.event("Cutting link %s" % str(link))
-    if link not in self.network_links:
+    if not self.has_network_link(link):
       raise ValueError("unknown link %s" % str(link))
     if link in self.cut_network_links:
       raise RuntimeError("link %s already cut!" % str(link))
@@ -61,7 +61,7 @@ class STSPatchPanel(PatchPanelBK):
   def repair_network_link(self, link):
     """Bring a link back online"""
     self.msg.event("Restoring link %s" % str(link))
-    if link not in self.network_links:
+    if not self.has_network_link(link):
       raise ValueError("Unknown link %s" % str(link))
     if link not in self.cut_network_links:
       raise RuntimeError("link %s already repaired!" % str(link))
@@ -75,7 +75,7 @@ class STSPatchPanel(PatchPanelBK):
     Disconnect host-switch link
     """
     self.msg.event("Cutting access link %s" % str(link))
-    if link not in self.access_links:
+    if not self.has_access_link(link):
       raise ValueError("unknown access link %s" % str(link))
     if link in self.cut_access_links:
       raise RuntimeError("Access link %s already cut!" % str(link))
@@ -88,7 +88,7 @@ class STSPatchPanel(PatchPanelBK):
     """Bring a link back online"""
 
     self.msg.event("Restoring access link %s" % str(link))
-    if link not in self.access_links:
+    if not self.has_access_link(link):
       raise ValueError("Unknown access link %s" % str(link))
     if link not in self.cut_access_links:
       raise RuntimeError("Access link %s already repaired!" % str(link))
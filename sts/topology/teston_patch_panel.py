@@ -143,7 +143,7 @@ class TestONPatchPanel(PatchPanelBK):
     """
     assert self.capabilities.can_sever_network_link
     self.msg.event("Cutting link %s" % str(link))
-    if link not in self.network_links:
+    if not self.has_network_link(link):
       raise ValueError("unknown link %s" % str(link))
     if link in self.cut_network_links:
       raise RuntimeError("link %s already cut!" % str(link))
@@ -154,7 +154,7 @@ class TestONPatchPanel(PatchPanelBK):
     """Bring a link back online"""
     assert self.capabilities.can_repair_network_link
     self.msg.event("Restoring link %s" % str(link))
-    if link not in self.network_links:
+    if not self.has_network_link(link):
       raise ValueError("Unknown link %s" % str(link))
     if link not in self.cut_network_links:
       raise RuntimeError("link %s already repaired!" % str(link))
@@ -167,7 +167,7 @@ class TestONPatchPanel(PatchPanelBK):
     """
     assert self.capabilities.can_sever_access_link
     self.msg.event("Cutting access link %s" % str(link))
-    if link not in self.access_links:
+    if not self.has_access_link(link):
       raise ValueError("unknown access link %s" % str(link))
     if link in self.cut_access_links:
       raise RuntimeError("Access link %s already cut!" % str(link))
@@ -178,7 +178,7 @@ class TestONPatchPanel(PatchPanelBK):
     """Bring a link back online"""
     assert self.capabilities.can_repair_access_link
     self.msg.event("Restoring access link %s" % str(link))
-    if link not in self.access_links:
+    if not self.has_access_link(link):
       raise ValueError("Unknown access link %s" % str(link))
     if link not in self.cut_access_links:
       raise RuntimeError("Access link %s already repaired!" % str(link))
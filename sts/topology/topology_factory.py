@@ -22,6 +22,8 @@
 Helper method to fill Topology objects.
 """
 
+from collections import deque
+
 from sts.topology.hosts_manager import mac_addresses_generator
 from sts.topology.hosts_manager import ip_addresses_generator
 from sts.topology.hosts_manager import interface_names_generator
@@ -34,10 +36,13 @@ def create_mesh_topology(topology, num_switches=3,
   # Every switch has a link to every other switch + 1 host,
   # for N*(N-1)+N = N^2 total ports
   ports_per_switch = (num_switches - 1) + 1
+  assert topology.capabilities.can_create_switch
+  assert topology.capabilities.can_create_host
+  assert topology.capabilities.can_create_interface
   # 1- Create switches
   switches = []
   for switch_id in range(1, num_switches + 1):
-    sw = topology.create_switch(switch_id, ports_per_switch)
+    sw = topology.switches_manager.create_switch(switch_id, ports_per_switch)
     switches.append(sw)
   # 2- Create hosts
   hosts = []
@@ -45,23 +50,33 @@ def create_mesh_topology(topology, num_switches=3,
   ip_gen = ip_addresses_generator()
   for switch_id in range(1, num_switches + 1):
     name_gen = interface_names_generator()
-    host = topology.create_host_with_interfaces(
+    host = topology.hosts_manager.create_host_with_interfaces(
       hid=switch_id, name="h%d" % switch_id, num_interfaces=1,
       mac_generator=mac_gen, ip_generator=ip_gen, interface_name_generator=name_gen)
     hosts.append(host)
-  # 3- Create access links
-  for index in range(len(hosts)):
-    print "Creating access link:", hosts[index], hosts[index].interfaces[0].port_no, switches[index], switches[index].ports[1].port_no
-    access_link = topology.create_access_link(
-      hosts[index], hosts[index].interfaces[0], switches[index],
-      switches[index].ports[1])
-  # 4- Create network links
+  topology.add_switches(switches)
+  topology.add_hosts(hosts)
+  # 3- Create access links, port 1 of each switch goes to its host
+  assert topology.capabilities.can_create_access_link
+  assert topology.capabilities.can_create_network_link
+  patch_panel = topology.patch_panel
+  links = []
+  for host, switch in zip(hosts, switches):
+    links.append(patch_panel.create_access_link(
+      host, host.interfaces[0], switch, switch.ports[1]))
+  # 4- Create network links, claiming the remaining ports in order
+  unused_ports = [deque(port for port_no, port in sorted(switch.ports.iteritems())
+                         if port_no != 1) for switch in switches]
   for i, switch_i in enumerate(switches):
-    for switch_j in switches[i + 1:]:
-      src_port = topology.patch_panel.find_unused_port(switch_i)
-      dst_port = topology.patch_panel.find_unused_port(switch_j)
-      topology.create_network_link(switch_i, src_port, switch_j, dst_port, False)
-      topology.create_network_link(switch_j, dst_port, switch_i, src_port, False)
+    for j in range(i + 1, len(switches)):
+      switch_j = switches[j]
+      src_port = unused_ports[i].popleft()
+      dst_port = unused_ports[j].popleft()
+      links.append(patch_panel.create_network_link(
+        switch_i, src_port, switch_j, dst_port, False))
+      links.append(patch_panel.create_network_link(
+        switch_j, dst_port, switch_i, src_port, False))
+  topology.add_links(links)
 
 
 
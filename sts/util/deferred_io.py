@@ -52,13 +52,22 @@ class DeferredIOWorker(object):
   def unblock(self):
     ''' Allow data through, and flush buffers '''
     self._currently_blocked = False
-    while not self._send_queue.empty():
-      data = self._send_queue.get()
+    # Flush each queue in one go, rather than growing the buffers (and
+    # invoking the client) once per queued chunk
+    data = self._drain(self._send_queue)
+    if data:
       self._actual_send(data)
-    while not self._receive_queue.empty():
-      data = self._receive_queue.get()
+    data = self._drain(self._receive_queue)
+    if data:
       self._actual_receive(data)
 
+  @staticmethod
+  def _drain(queue):
+    chunks = []
+    while not queue.empty():
+      chunks.append(queue.get())
+    return "".join(chunks)
+
   def send(self, data):
     ''' send data from the client side. fire and forget. '''
     if self._currently_blocked:
@@ -28,12 +28,14 @@ log = logging.getLogger("io_master")
 
 class STSIOWorker(IOWorker):
   """ An IOWorker that works with our IOMaster """
-  def __init__(self, socket, on_close):
+  def __init__(self, socket, on_close, on_send=None):
     IOWorker.__init__(self)
     self.socket = socket
     self.closed = False
     # (on_close factory method hides details of the Select loop)
     self.on_close = on_close
+    # Tells the Select loop that there is data to send, if it cares
+    self.on_send = on_send
 
   def fileno(self):
     """ Return the wrapped sockets' fileno """
@@ -41,7 +43,10 @@ class STSIOWorker(IOWorker):
 
   def send(self, data):
     """ send data from the client side. fire and forget. """
-    return IOWorker.send(self, data)
+    result = IOWorker.send(self, data)
+    if self.on_send is not None:
+      self.on_send(self)
+    return result
 
   def close(self):
     """ Register this socket to be closed. fire and forget """
@@ -73,16 +78,21 @@ class IOMaster(object):
     # Does not register the IOWorker immediately with the select loop --
     # rather, adds a command to the pending queue
 
-    # Our callback for io_worker.close():
-    def on_close(worker):
-      worker.socket.close()
-      worker.closed = True
-      self._workers.discard(worker)
-
-    worker = STSIOWorker(socket, on_close=on_close)
-    self._workers.add(worker)
+    worker = STSIOWorker(socket, on_close=self._on_worker_close,
+                         on_send=self._on_worker_send)
+    self.reschedule_worker(worker)
     return worker
 
+  def _on_worker_close(self, worker):
+    ''' Our callback for io_worker.close() '''
+    self.deschedule_worker(worker)
+    worker.socket.close()
+    worker.closed = True
+
+  def _on_worker_send(self, worker):
+    ''' Our callback for io_worker.send() '''
+    pass
+
   def monkey_time_sleep(self):
     """monkey patches time.sleep to use this io_masters's time.sleep"""
     self.original_time_sleep = time.sleep
@@ -157,6 +167,10 @@ class IOMaster(object):
   def poll(self):
     self.select(0)
 
+  def wake(self):
+    ''' Makes a concurrent or the next select() return immediately '''
+    self._ping()
+
   def sleep(self, timeout):
     ''' invokes select.select continuously for exactly timeout seconds, then returns. '''
     start = time.time()
@@ -208,8 +222,7 @@ class IOMaster(object):
 
     for worker in elist:
       worker.close()
-      if worker in self._workers:
-        self._workers.discard(worker)
+      self.deschedule_worker(worker)
 
     for worker in rlist:
       try:
@@ -219,11 +232,11 @@ class IOMaster(object):
         else:
           log.warn("Closing socket due to empty read")
           worker.close()
-          self._workers.discard(worker)
+          self.deschedule_worker(worker)
       except socket.error as (s_errno, strerror):
         log.error("Socket error: " + strerror)
         worker.close()
-        self._workers.discard(worker)
+        self.deschedule_worker(worker)
 
     for worker in wlist:
       try:
@@ -234,4 +247,118 @@ class IOMaster(object):
         if s_errno != errno.EAGAIN:
           log.error("Socket error: " + strerror)
           worker.close()
-          self._workers.discard(worker)
+          self.deschedule_worker(worker)
+
+class EpollIOMaster(IOMaster):
+  """
+  An IOMaster that waits on an epoll object rather than select.select.
+
+  Workers stay registered with the epoll object from the time they are
+  created (or rescheduled) until they are closed (or descheduled), rather than
+  being gathered into fresh lists on every select(). Write readiness is only
+  requested while a worker has buffered data to send, so idle connections
+  cost nothing per iteration, and there is no FD_SETSIZE limit.
+
+  Only works with real sockets; see create_io_master().
+  """
+  def __init__(self):
+    IOMaster.__init__(self)
+    self._epoll = select.epoll()
+    self._read_mask = select.EPOLLIN | select.EPOLLPRI
+    self._write_mask = self._read_mask | select.EPOLLOUT
+    # fileno -> worker
+    self._fd2worker = {}
+    # worker -> fileno it was registered under, since a closed socket no
+    # longer has one
+    self._worker2fd = {}
+    # Workers registered for write readiness
+    self._writers = set()
+    self._pinger_fd = self.pinger.fileno()
+    self._epoll.register(self._pinger_fd, select.EPOLLIN)
+
+  def reschedule_worker(self, io_worker):
+    if io_worker in self._worker2fd:
+      return
+    fd = io_worker.fileno()
+    self._workers.add(io_worker)
+    self._fd2worker[fd] = io_worker
+    self._worker2fd[io_worker] = fd
+    if io_worker._ready_to_send:
+      self._writers.add(io_worker)
+      self._epoll.register(fd, self._write_mask)
+    else:
+      self._epoll.register(fd, self._read_mask)
+
+  def deschedule_worker(self, io_worker):
+    self._workers.discard(io_worker)
+    self._writers.discard(io_worker)
+    fd = self._worker2fd.pop(io_worker, None)
+    if fd is None:
+      return
+    del self._fd2worker[fd]
+    try:
+      self._epoll.unregister(fd)
+    except (IOError, OSError, ValueError):
+      # The socket was already closed, which unregisters it
+      pass
+
+  def _on_worker_send(self, worker):
+    if worker in self._worker2fd and worker not in self._writers:
+      self._writers.add(worker)
+      self._epoll.modify(self._worker2fd[worker], self._write_mask)
+
+  def grab_workers_rwe(self):
+    raise NotImplementedError("EpollIOMaster keeps its workers registered")
+
+  def select(self, timeout=0):
+    ''' Waits up to timeout seconds, but may return before then if I/O is
+    ready. '''
+    self._in_select += 1
+    try:
+      try:
+        events = self._epoll.poll(-1 if timeout is None else timeout)
+      except IOError as e:
+        if e.errno != errno.EINTR:
+          raise
+        events = []
+      rlist, wlist, elist = [], [], []
+      for fd, mask in events:
+        if fd == self._pinger_fd:
+          rlist.append(self.pinger)
+          continue
+        worker = self._fd2worker.get(fd)
+        if worker is None:
+          continue
+        if mask & select.EPOLLERR:
+          elist.append(worker)
+          continue
+        if mask & (self._read_mask | select.EPOLLHUP):
+          rlist.append(worker)
+        if mask & select.EPOLLOUT:
+          wlist.append(worker)
+      self.handle_workers_rwe(rlist, wlist, elist)
+      for worker in wlist:
+        if worker in self._writers and not worker._ready_to_send:
+          self._writers.discard(worker)
+          self._epoll.modify(self._worker2fd[worker], self._read_mask)
+    except (IOError, ValueError):
+      # As in IOMaster.select: the epoll object is closed upon shut down
+      sys.stderr.write("File Descriptor Closed\n")
+    finally:
+      self._in_select -= 1
+    if self._in_select == 0 and self._close_requested and not self.closed:
+      self._do_close_all()
+
+  def _do_close_all(self):
+    IOMaster._do_close_all(self)
+    self._epoll.close()
+
+def create_io_master(multiplex_sockets=False):
+  '''
+  Returns an EpollIOMaster where epoll is available, and an IOMaster
+  otherwise. Multiplexed sockets are MockSockets without file descriptors,
+  which only the (monkeypatched) select.select knows how to wait on.
+  '''
+  if hasattr(select, "epoll") and not multiplex_sockets:
+    return EpollIOMaster()
+  return IOMaster()
@@ -0,0 +1,51 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+class LRUCache(object):
+  ''' A dict of at most max_size entries that evicts the least recently used
+  entry when full '''
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self._entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key, default=None):
+    try:
+      value = self._entries.pop(key)
+    except KeyError:
+      self.misses += 1
+      return default
+    # Move to the most recently used end
+    self._entries[key] = value
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    if key in self._entries:
+      del self._entries[key]
+    elif len(self._entries) >= self.max_size:
+      self._entries.popitem(last=False)
+    self._entries[key] = value
+
+  def clear(self):
+    self._entries.clear()
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  def __len__(self):
+    return len(self._entries)
@@ -15,6 +15,10 @@
 
 from collections import defaultdict
 import itertools
+import hashlib
+import fcntl
+import json
+import os
 
 class PrecomputePowerSetCache(object):
   sequence_id = itertools.count(1)
@@ -38,4 +42,171 @@ class PrecomputeCache(object):
   def update(self, input_sequence):
     self.done_sequences.add(input_sequence)
 
+def hash_file(path, chunk_size=1 << 20):
+  ''' Return the hex sha1 digest of the file at path '''
+  digest = hashlib.sha1()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(chunk_size), ""):
+      digest.update(chunk)
+  return digest.hexdigest()
 
+def append_line(path, line):
+  ''' Append line to the file at path, under an exclusive flock(). Terminates
+  any line left incomplete by a process that was killed, so that line doesn't
+  swallow ours. '''
+  with open(path, "a+") as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    try:
+      f.seek(0, os.SEEK_END)
+      if f.tell() > 0:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != "\n":
+          line = "\n" + line
+      # N.B. stdio requires a seek between reads and writes
+      f.seek(0, os.SEEK_END)
+      f.write(line + "\n")
+      f.flush()
+    finally:
+      fcntl.flock(f, fcntl.LOCK_UN)
+
+class ReplayOutcomeCache(object):
+  '''
+  On-disk store of replay outcomes, shared by every MCS run (and every
+  restart of an MCS run) on the same superlog.
+
+  Each outcome is keyed by the superlog's hash, the ordered labels of the
+  replayed input subsequence, and any other parameters that determine the
+  outcome of a replay (invariant check, bug signature, replay settings).
+  Outcomes are appended to the file as one JSON object per line, so a run that
+  dies midway loses at most the line it was writing.
+  '''
+  def __init__(self, path, superlog_hash, **replay_params):
+    self.path = path
+    # Parameters that must match for an outcome to be reused. Values that
+    # aren't plain data (e.g. input_logger objects) are reduced to their type.
+    self._key_prefix = [superlog_hash] + sorted(
+      (k, v if isinstance(v, (basestring, bool, int, long, float, type(None)))
+            else type(v).__name__)
+      for k, v in replay_params.iteritems())
+    # { key -> (violation_found, iteration, [timed out internal event labels]) }
+    self._outcomes = {}
+    self.hits = 0
+    self._load()
+
+  def _key(self, input_labels):
+    return hashlib.sha1(json.dumps(self._key_prefix + [list(input_labels)])).hexdigest()
+
+  def _load(self):
+    if not os.path.exists(self.path):
+      return
+    with open(self.path) as f:
+      for line in f:
+        try:
+          record = json.loads(line)
+        except ValueError:
+          # Partially written line from a run that was killed
+          continue
+        self._outcomes[record["key"]] = (record["violation_found"],
+                                         record["iteration"],
+                                         record["timed_out"])
+
+  def lookup(self, input_labels):
+    ''' Return (violation_found, iteration, timed_out_labels) for a previous
+    replay of input_labels, or None '''
+    outcome = self._outcomes.get(self._key(input_labels))
+    if outcome is not None:
+      self.hits += 1
+    return outcome
+
+  def record(self, input_labels, violation_found, iteration, timed_out_labels):
+    key = self._key(input_labels)
+    outcome = (violation_found, iteration, list(timed_out_labels))
+    self._outcomes[key] = outcome
+    line = json.dumps({"key" : key, "violation_found" : violation_found,
+                       "iteration" : iteration, "timed_out" : outcome[2]})
+    append_line(self.path, line)
+
+class PersistentPrefixTrie(object):
+  '''
+  Trie from sequences of labels to sequences of labels, optionally backed by
+  an append-only file that is shared by concurrent processes and later runs.
+
+  The value of each prefix is the value of the prefix one shorter, extended
+  by a list of labels given when the prefix was inserted. Each node is stored
+  as one JSON line holding only that extension:
+
+    [key, parent key, last label of the prefix, [extension labels]]
+
+  where a node's key is a hash of its parent's key and its last label, and
+  the root's key is a hash of a namespace (e.g. identifying the trace and any
+  parameters the values depend on). So one file may be shared between traces.
+
+  Lines are appended under an exclusive flock(), and other processes' lines
+  are picked up on every lookup. A line left incomplete by a process that was
+  killed is skipped.
+  '''
+  def __init__(self, path=None):
+    self.path = path
+    # { key -> (parent key, extension labels) }
+    self._nodes = {}
+    # How far into the file we have read
+    self._offset = 0
+
+  @staticmethod
+  def _key(parent_key, label):
+    return hashlib.sha1("%s\0%s" % (parent_key, label)).hexdigest()[:20]
+
+  @staticmethod
+  def root_key(namespace):
+    return hashlib.sha1(namespace).hexdigest()[:20]
+
+  def _refresh(self):
+    ''' Read nodes appended to the file since we last looked '''
+    if self.path is None or not os.path.exists(self.path):
+      return
+    with open(self.path) as f:
+      f.seek(self._offset)
+      for line in iter(f.readline, ""):
+        if not line.endswith("\n"):
+          # Still being written
+          break
+        self._offset += len(line)
+        try:
+          (key, parent_key, _, extension) = json.loads(line)
+        except ValueError:
+          # Partially written line from a process that was killed
+          continue
+        self._nodes.setdefault(key, (parent_key, extension))
+
+  def longest_prefix(self, namespace, labels):
+    ''' Return (length, value) for the longest prefix of labels in the trie.
+    The empty prefix has the value []. '''
+    self._refresh()
+    key = self.root_key(namespace)
+    keys = []
+    for label in labels:
+      key = self._key(key, label)
+      if key not in self._nodes:
+        break
+      keys.append(key)
+    value = []
+    for key in keys:
+      value += self._nodes[key][1]
+    return (len(keys), value)
+
+  def insert(self, namespace, prefix, label, extension):
+    ''' Insert prefix + [label], whose value is prefix's value + extension.
+
+    Pre: prefix is in the trie '''
+    key = self.root_key(namespace)
+    for l in prefix:
+      key = self._key(key, l)
+    (parent_key, key) = (key, self._key(key, label))
+    if key in self._nodes:
+      return
+    extension = list(extension)
+    self._nodes[key] = (parent_key, extension)
+    if self.path is None:
+      return
+    line = json.dumps([key, parent_key, label, extension], separators=(',', ':'))
+    append_line(self.path, line)
@@ -1,20 +1,30 @@
-
 from abc import *
 import os
-from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
-import xmlrpclib
 import sys
 import marshal
 import signal
-from sts.util.convenience import find_port
-from pox.lib.util import connect_with_backoff
+import socket
+import struct
+import errno
+import itertools
+import threading
+import traceback
+import types
 import logging
 log = logging.getLogger("rpc_forker")
 
+# Children and parents exchange messages over a stream socket (an inherited
+# socketpair for LocalForker, TCP for RemoteForker). Each message is a
+# 4-byte big-endian length followed by a marshal()ed payload. Results are
+# sent as (status, value), where status is one of:
+_RESULT = 0
+_EXCEPTION = 1
+_header = struct.Struct("!I")
+
 def test_serialize_response(*args):
   for arg in args:
     try:
-      xmlrpclib.dumps((arg,), methodresponse=True)
+      marshal.dumps(arg)
     except Exception as e:
       print "Could not serialize arg %s" % str(arg)
       raise e
@@ -22,11 +32,60 @@ def test_serialize_response(*args):
 def test_serialize_request(methodname, *args):
   for arg in args:
     try:
-      xmlrpclib.dumps((arg,), methodresponse=True, methodname=methodname)
+      marshal.dumps((methodname, arg))
     except Exception as e:
       print "Could not serialize arg %s" % str(arg)
       raise e
 
+def _recv_exactly(sock, length):
+  chunks = []
+  while length > 0:
+    try:
+      chunk = sock.recv(min(length, 1 << 20))
+    except socket.error as e:
+      if e.errno == errno.EINTR:
+        continue
+      raise
+    if chunk == "":
+      raise EOFError("Connection closed")
+    chunks.append(chunk)
+    length -= len(chunk)
+  return "".join(chunks)
+
+def send_message(sock, value):
+  payload = marshal.dumps(value)
+  sock.sendall(_header.pack(len(payload)) + payload)
+
+def recv_message(sock):
+  ''' Raises EOFError if the other end closed the connection '''
+  (length,) = _header.unpack(_recv_exactly(sock, _header.size))
+  return marshal.loads(_recv_exactly(sock, length))
+
+def _run_task(task, args):
+  ''' Return the (status, value) message for invoking task '''
+  try:
+    return (_RESULT, task(*args))
+  except Exception:
+    # N.B. SystemExit propagates, and the child exits without sending a
+    # result, which the parent reports as a ReplayException.
+    return (_EXCEPTION, traceback.format_exc())
+
+def _send_result(sock, message, strict_assertion_checking=False):
+  (status, value) = message
+  try:
+    if strict_assertion_checking and status == _RESULT:
+      test_serialize_response(value)
+    send_message(sock, message)
+  except ValueError:
+    # Unmarshallable result
+    send_message(sock, (_EXCEPTION, traceback.format_exc()))
+
+def _unwrap_result(message, description):
+  (status, value) = message
+  if status == _EXCEPTION:
+    raise ReplayException("An Exception occured in %s: %s" % (description, value))
+  return value
+
 class TaskRegistry(object):
   ''' Maintains code for tasks to be Forked. '''
   def __init__(self):
@@ -40,27 +99,19 @@ class TaskRegistry(object):
       raise ValueError("Task %s is not registered" % task_name)
     return self._name_to_task[task_name]
 
+  def is_registered(self, task_name, code_block):
+    return self._name_to_task.get(task_name) == code_block
+
 class ReplayException(Exception):
   pass
 
-class DebuggableHandler(SimpleXMLRPCRequestHandler):
-  ''' Simple handler that extracts the stack trace of any exceptions that occur '''
-  ''' on the server side, and encapsulates them in a new exception to send '''
-  ''' to the client as a xmlrpclib.Fault '''
-  def _dispatch(self, method, params):
-    try:
-      return self.server.funcs[method](*params)
-    except Exception as e:
-      import traceback
-      raise type(e)("\n" + traceback.format_exc())
-
 class Forker(object):
   ''' Easily fork a job and retrieve the results '''
   # Implementation:
-  #  - parent forks a child
-  #  - child runs an RPC server
-  #  - parent invokes (blocking) RPC on child
-  #  - child eventually returns, and shuts itself down
+  #  - parent forks a child (or takes a pre-forked one from a pool)
+  #  - parent sends the task name and arguments to the child
+  #  - child runs the task and sends back its return value or exception
+  #  - child exits
   #  - parent returns result to caller.
   __metaclass__ = ABCMeta
 
@@ -72,109 +123,346 @@ class Forker(object):
   def register_task(self, task_name, code_block):
     ''' Register a new task to be invoked by this Forker. Parameters:
       - task_name: the name of the task to be run, later passed to fork()
-      - code_block: a function object to be invoked via RPC
-        in the child process. *Must not* depend on any environment state
-        contained in its closure.
+      - code_block: a function object to be invoked in the child process.
+        Its arguments and return value must be marshal()able.
     '''
     pass
 
   @abstractmethod
   def fork(self, task_name, *args, **kws):
-    ''' Fork off a child process and invoke the child RPC method. Return the json_hash
-    sent by the child.
+    ''' Fork off a child process and invoke the task. Return the value
+    returned by the task in the child.
 
-    Raises a ValueError if task_name is not registered.'''
+    Raises a ValueError if task_name is not registered, and a ReplayException
+    if the task raised an exception.'''
     pass
 
-  def _new_child_url(self, ip='localhost', port=None):
-    # Called within the parent process
-    if port is None:
-      port = find_port(xrange(3000,6000))
-    return (ip, port)
+  def fork_async(self, task_name, args=(), done_queue=None):
+    ''' Like fork(), but return a ForkedTask handle immediately rather than
+    blocking until the child returns. If done_queue is given, the handle is
+    put() onto it once the child's result (or exception) is available. '''
+    raise NotImplementedError("%s does not support fork_async()" %
+                              self.__class__.__name__)
 
-  def _invoke_child_rpc(self, ip, port, task_name, *args):
-    # Called within the parent process
-    child_url = "http://" + str(ip) + ":" + str(port) + "/"
-    log.debug("Invoking task %s on child %s" % (task_name, child_url,))
-    if self.strict_assertion_checking:
-      test_serialize_request(task_name, *args)
-    proxy = xmlrpclib.ServerProxy(child_url, allow_none=True)
-    def invoke_child():
-      try:
-        return getattr(proxy, task_name)(*args)
-      except xmlrpclib.Fault as e:
-        raise ReplayException("An Exception (code %d) occured in the child replay process: %s" %
-                              (e.faultCode, e.faultString))
-
-    child_return = connect_with_backoff(invoke_child)
-    # Magic to close the underlying socket. I'm not sure if this is actually
-    # needed? See ServerProxy.__call__ in:
-    # http://hg.python.org/cpython/file/2.7/Lib/xmlrpclib.py
-    proxy("close")()
-    log.debug("Completed task %s on child %s" % (task_name, child_url,))
-    return child_return
-
-  def _initialize_child_rpc_server(self, ip, port):
-    # Called within the child process.
-    # The child's RPC methods must registered through register_task()
-    self.server = SimpleXMLRPCServer((ip, port), DebuggableHandler, allow_none=True,
-                                     bind_and_activate=False)
-    self.server.allow_reuse_address = True
-    self.server.server_bind()
-    self.server.server_activate()
+  def close_pool(self):
+    ''' Discard any children that were fork()ed ahead of time, e.g. because
+    the state that tasks depend on has changed since. '''
+    pass
+
+class ForkedTask(object):
+  ''' Handle for a child process started with LocalForker.fork_async() '''
+  def __init__(self, forker, pid, sock, done_queue=None):
+    self.pid = pid
+    self.cancelled = False
+    self._forker = forker
+    self._sock = sock
+    self._done_queue = done_queue
+    self._result = None
+    self._exception = None
+    self._finished = threading.Event()
+    self._finish_lock = threading.Lock()
+
+  def _receive(self):
+    # Called within a helper thread of the parent process
+    try:
+      message = recv_message(self._sock)
+      self._result = _unwrap_result(message, "child process %d" % self.pid)
+    except EOFError:
+      self._exception = ReplayException("Child process %d exited without "
+                                        "returning a result" % self.pid)
+    except Exception as e:
+      self._exception = e
+    finally:
+      self._finish()
+
+  def _finish(self):
+    with self._finish_lock:
+      if self._finished.is_set():
+        return
+      self._forker._reap(self.pid, self._sock)
+      self._finished.set()
+    if self._done_queue is not None:
+      self._done_queue.put(self)
+
+  def done(self):
+    return self._finished.is_set()
+
+  def wait(self):
+    ''' Block until the child returns, and return its result. Re-raises any
+    exception that occurred in the child. '''
+    # N.B. Event.wait() without a timeout can't be interrupted by signals.
+    while not self._finished.wait(0.5):
+      pass
+    if self._exception is not None:
+      raise self._exception
+    return self._result
+
+  def cancel(self):
+    ''' Kill the child (which cleans up its own controllers upon SIGTERM) and
+    wait for it to exit. '''
+    if self.done():
+      return
+    self.cancelled = True
+    self._exception = ReplayException("Task in child %d was cancelled" % self.pid)
+    try:
+      os.kill(self.pid, signal.SIGTERM)
+    except OSError:
+      pass
+    self._finish()
+
+class _Worker(object):
+  ''' A pre-forked child waiting for a task '''
+  def __init__(self, pid, sock, generation):
+    self.pid = pid
+    self.sock = sock
+    # The version of the task registry that the child has a copy of
+    self.generation = generation
 
 class LocalForker(Forker):
+  '''
+  fork()s children on the local machine, talking to them over an inherited
+  socketpair.
+
+  If pool_size > 0, up to pool_size children are fork()ed ahead of time and
+  wait for a task, so that replays don't pay for fork()ing (and for
+  importing preload_modules) on their critical path. Pre-forked children
+  only have a copy of the parent's memory as of when they were fork()ed, so
+  tasks must get any state that changes over time through their arguments.
+  Children that were fork()ed before a task was (re-)registered are
+  discarded. Each child runs a single task.
+  '''
   # set of process ids that are currently running. These are all killed upon
   # signal reception.
   _active_pids = set()
+  # Parent ends of all socketpairs, which children must not hold on to
+  _parent_socks = set()
+  _lock = threading.Lock()
+
+  def __init__(self, pool_size=0, preload_modules=(),
+               strict_assertion_checking=False):
+    super(LocalForker, self).__init__(strict_assertion_checking=strict_assertion_checking)
+    self.pool_size = pool_size
+    self.preload_modules = list(preload_modules)
+    # Idle pre-forked children
+    self._pool = []
+    self._generation = 0
 
   @staticmethod
   def kill_all():
     for pid in list(LocalForker._active_pids):
-      os.kill(pid, signal.SIGTERM)
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except OSError:
+        pass
     LocalForker._active_pids.clear()
 
   def register_task(self, task_name, code_block):
+    if self._task_registry.is_registered(task_name, code_block):
+      return
     self._task_registry.register_task(task_name, code_block)
+    # Pre-forked children don't know about the new task
+    self._generation += 1
 
-  def fork(self, task_name, *args, **kws):
-    # N.B. get_task raises an exception if task_name is not registered
-    task = self._task_registry.get_task(task_name)
-    (ip, port) = self._new_child_url()
-    # TODO(cs): use subprocess to spawn baby snakes instead of os.fork()
+  def _reap(self, pid, sock):
+    with LocalForker._lock:
+      LocalForker._active_pids.discard(pid)
+      LocalForker._parent_socks.discard(sock)
+    sock.close()
+    try:
+      os.waitpid(pid, 0)
+    except OSError as e:
+      if e.errno != errno.ECHILD:
+        raise
+
+  def _spawn(self):
+    ''' fork() a child that waits for a task. Return a _Worker for it. '''
+    for module in self.preload_modules:
+      __import__(module)
+    (parent_sock, child_sock) = socket.socketpair()
+    sys.stdout.flush()
+    sys.stderr.flush()
     pid = os.fork()
     if pid == 0: # Child
-      # Send parents interrupts to the child
-      os.setsid()
-      self._initialize_child_rpc_server(ip, port)
-      self.server.register_function(task, task_name)
-      self.server.handle_request()
-      sys.exit(0)
-    else: # Parent
+      try:
+        # Send parents interrupts to the child
+        os.setsid()
+        # Don't kill our siblings if we are signaled.
+        LocalForker._active_pids.clear()
+        # Let our siblings see EOF when the parent closes their sockets
+        for sock in list(LocalForker._parent_socks) + [parent_sock]:
+          sock.close()
+        LocalForker._parent_socks.clear()
+        self._pool = []
+        self._serve(child_sock)
+      finally:
+        # N.B. don't run the parent's exit handlers (or finally: blocks
+        # further up our copy of the parent's stack)
+        try:
+          sys.stdout.flush()
+          sys.stderr.flush()
+        finally:
+          os._exit(0)
+    # Parent
+    child_sock.close()
+    with LocalForker._lock:
       LocalForker._active_pids.add(pid)
-      child_return = self._invoke_child_rpc(ip, port,
-                                            task_name, *args, **kws)
-      LocalForker._active_pids.remove(pid)
+      LocalForker._parent_socks.add(parent_sock)
+    return _Worker(pid, parent_sock, self._generation)
 
-      os.waitpid(pid, 0)
-      return child_return
+  def _serve(self, sock):
+    # Called within the child process
+    try:
+      (task_name, args) = recv_message(sock)
+    except EOFError:
+      # Discarded by the parent
+      return
+    message = _run_task(self._task_registry.get_task(task_name), args)
+    _send_result(sock, message, self.strict_assertion_checking)
+
+  def _take_worker(self):
+    while self._pool != []:
+      worker = self._pool.pop(0)
+      if worker.generation == self._generation:
+        return worker
+      self._reap(worker.pid, worker.sock)
+    return self._spawn()
+
+  def fill_pool(self):
+    ''' fork() children until there are pool_size idle ones '''
+    while len(self._pool) < self.pool_size:
+      self._pool.append(self._spawn())
+
+  def close_pool(self):
+    while self._pool != []:
+      worker = self._pool.pop()
+      self._reap(worker.pid, worker.sock)
+
+  def fork(self, task_name, *args, **kws):
+    return self.fork_async(task_name, args).wait()
+
+  def fork_async(self, task_name, args=(), done_queue=None):
+    # N.B. get_task raises an exception if task_name is not registered
+    self._task_registry.get_task(task_name)
+    if self.strict_assertion_checking:
+      test_serialize_request(task_name, *args)
+    worker = self._take_worker()
+    handle = ForkedTask(self, worker.pid, worker.sock, done_queue=done_queue)
+    try:
+      send_message(worker.sock, (task_name, tuple(args)))
+    except socket.error as e:
+      handle._exception = ReplayException("Could not send task to child %d: %s" %
+                                          (worker.pid, e))
+      handle._finish()
+      return handle
+    receiver = threading.Thread(target=handle._receive,
+                                name="fork_async-%d" % worker.pid)
+    receiver.daemon = True
+    receiver.start()
+    # Get the next child ready while this one runs
+    self.fill_pool()
+    return handle
 
 class RemoteForker(Forker):
-  def __init__(self, server_info_list):
-    ''' cycles through server_info_list for each invocation of fork() '''
-    pass
+  '''
+  Runs tasks in children fork()ed by ForkerServers, which may be on other
+  machines (with the same version of python and of this code).
+
+  Tasks are sent as their marshal()ed func_code only, and run with the
+  globals of the module they were defined in. So they must be plain
+  functions, not closures or bound methods (e.g. MCSFinder.play_forward),
+  and must get any state through their arguments.
+  '''
+  def __init__(self, server_info_list, strict_assertion_checking=False):
+    ''' cycles through server_info_list, a list of (ip, port) pairs, for each
+    invocation of fork() '''
+    super(RemoteForker, self).__init__(strict_assertion_checking=strict_assertion_checking)
+    if len(server_info_list) == 0:
+      raise ValueError("Need at least one server")
+    self._servers = itertools.cycle(server_info_list)
 
   def register_task(self, task_name, code_block):
+    if getattr(code_block, "im_self", None) is not None:
+      raise ValueError("Task %s must not be a bound method: only its code "
+                       "would be sent, not the object it is bound to" %
+                       task_name)
+    if code_block.func_closure is not None:
+      raise ValueError("Task %s must not be a closure" % task_name)
     # Serialize the code_block so we can send it across the wire to the child
-    serialized_code = marshal.dumps(code_block.func_code)\
-                             .encode('base64')
-    self._task_registry.register_task(task_name, serialized_code)
+    self._task_registry.register_task(task_name,
+                                      (code_block.__module__,
+                                       marshal.dumps(code_block.func_code)))
 
   def fork(self, task_name, *args, **kws):
-    # TODO(cs): Need to define a main() method for the child process, tell child what URL
-    # to bind to via command line arguments, and have child boot
-    # up an RPC server. Then send over the TaskRegistry's task code over the wire,
-    # have the child deserialize the base64 encoded func object, and have the
-    # child register the tasks as RPC stubs.
-    task = self._task_registry.get_task(task_name)
-    pass
+    (module, code) = self._task_registry.get_task(task_name)
+    if self.strict_assertion_checking:
+      test_serialize_request(task_name, *args)
+    (ip, port) = next(self._servers)
+    log.debug("Invoking task %s on %s:%d" % (task_name, ip, port))
+    sock = socket.create_connection((ip, port))
+    try:
+      send_message(sock, (task_name, module, code, tuple(args)))
+      try:
+        message = recv_message(sock)
+      except EOFError:
+        raise ReplayException("Server %s:%d closed the connection without "
+                              "returning a result" % (ip, port))
+    finally:
+      sock.close()
+    return _unwrap_result(message, "task %s on %s:%d" % (task_name, ip, port))
+
+class ForkerServer(object):
+  ''' Serves RemoteForkers: fork()s a child for every task it is sent.
+
+  N.B. clients are not authenticated, and any client can run arbitrary code
+  as this process's user. Only bind to a non-local address on a trusted
+  network. '''
+  def __init__(self, ip='localhost', port=0):
+    ''' port 0 picks a free port; see self.address '''
+    self._listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self._listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self._listen_sock.bind((ip, port))
+    self._listen_sock.listen(16)
+    self.address = self._listen_sock.getsockname()
+
+  def handle_request(self):
+    (sock, _) = self._listen_sock.accept()
+    pid = os.fork()
+    if pid == 0: # Child
+      try:
+        self._listen_sock.close()
+        (task_name, module, code, args) = recv_message(sock)
+        __import__(module)
+        task = types.FunctionType(marshal.loads(code), sys.modules[module].__dict__,
+                                  task_name)
+        _send_result(sock, _run_task(task, args))
+      finally:
+        os._exit(0)
+    sock.close()
+    # Reap any children that have finished
+    try:
+      while os.waitpid(-1, os.WNOHANG)[0] != 0:
+        pass
+    except OSError as e:
+      if e.errno != errno.ECHILD:
+        raise
+
+  def serve_forever(self):
+    while True:
+      self.handle_request()
+
+  def close(self):
+    self._listen_sock.close()
+
+if __name__ == '__main__':
+  # Stand-in server for RemoteForker:
+  #   python -m sts.util.rpc_forker [port [bind address]]
+  # Binds to localhost unless a bind address is explicitly given.
+  port = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+  ip = sys.argv[2] if len(sys.argv) > 2 else 'localhost'
+  server = ForkerServer(ip=ip, port=port)
+  if ip != 'localhost':
+    print ("WARNING: serving unauthenticated RemoteForker tasks on %s. Anyone "
+           "who can connect can run code as this user." % ip)
+  print "Serving RemoteForker tasks on %s:%d" % server.address
+  sys.stdout.flush()
+  server.serve_forever()
@@ -21,6 +21,9 @@ import logging
 import errno
 import threading
 import base64
+import json
+import struct
+from collections import deque
 
 log = logging.getLogger("sock_mux")
 
@@ -40,18 +43,109 @@ log = logging.getLogger("sock_mux")
 #    creates a MockSocket and stores it to be accept()'ed by the mock listener
 #    socket.
 #  - All data messages are of type `data', and include a `data' field
+#
+# By default the hashes are sent as json, with the `data' field base64
+# encoded. With binary framing, each message is instead sent as a
+# BinaryFrameIOWorker frame, which carries the data as is. The server picks
+# the framing the client uses from the first byte it receives: json hashes
+# start with `{', whereas frames start with a (negative) id.
+
+class BinaryFrameIOWorker(object):
+  '''
+  Drop-in replacement for JSONIOWorker that sends each hash as a frame with a
+  fixed size header (id, type, payload length), followed by the payload: the
+  raw `data' of data messages, or the json `address' of SYNs. Saves encoding
+  each message as json, and base64 encoding (and decoding) the data.
+  '''
+  _header = struct.Struct("!iBI")
+  _types = ['data', 'SYN']
+  _type2code = dict((t, i) for (i, t) in enumerate(_types))
+
+  def __init__(self, io_worker, on_json_received=None):
+    self.io_worker = io_worker
+    self.on_json_received = on_json_received
+    self.io_worker.set_receive_handler(self._io_worker_receive_handler)
+
+  def send(self, json_hash):
+    msg_type = json_hash['type']
+    if msg_type == 'data':
+      payload = json_hash['data']
+    else:
+      payload = json.dumps(json_hash['address'])
+    header = self._header.pack(json_hash['id'], self._type2code[msg_type],
+                               len(payload))
+    self.io_worker.send(header + payload)
+
+  def _io_worker_receive_handler(self, io_worker):
+    buf = io_worker.peek_receive_buf()
+    offset = 0
+    hashes = []
+    while len(buf) - offset >= self._header.size:
+      (sock_id, code, length) = self._header.unpack_from(buf, offset)
+      start = offset + self._header.size
+      if len(buf) - start < length:
+        break
+      payload = buf[start:start+length]
+      offset = start + length
+      msg_type = self._types[code]
+      if msg_type == 'data':
+        hashes.append({'id' : sock_id, 'type' : msg_type, 'data' : payload})
+      else:
+        hashes.append({'id' : sock_id, 'type' : msg_type,
+                       'address' : json.loads(payload)})
+    io_worker.consume_receive_buf(offset)
+    if self.on_json_received is not None:
+      for json_hash in hashes:
+        self.on_json_received(self, json_hash)
+
+  def close(self):
+    self.io_worker.close()
+
+def encode_data(json_worker, data):
+  ''' The `data' field of a data message sent through json_worker '''
+  if isinstance(json_worker, BinaryFrameIOWorker):
+    return data
+  # base 64 occasionally adds extraneous newlines: bit.ly/aRTmNu
+  return base64.b64encode(data).replace("\n", "")
+
+def decode_data(json_worker, data):
+  ''' Inverse of encode_data '''
+  if isinstance(json_worker, BinaryFrameIOWorker):
+    return data
+  return base64.b64decode(data)
 
 class SocketDemultiplexer(object):
   ''' Each true socket is wrapped in a single SocketDemultiplexer, which
   Demultiplexes messages received on the true socket to MockSockets'''
-  def __init__(self, true_io_worker):
+  def __init__(self, true_io_worker, binary_framing=None):
+    '''
+    binary_framing: whether to use BinaryFrameIOWorker rather than
+    JSONIOWorker. If None, use whichever the peer uses, once it sends
+    something.
+    '''
     self.true_io_worker = true_io_worker
     self.client_info = true_io_worker.socket.getsockname()
-    self.json_worker = JSONIOWorker(true_io_worker,
-                                    on_json_received=self._on_receive)
+    self.json_worker = None
+    if binary_framing is None:
+      true_io_worker.set_receive_handler(self._detect_framing)
+    else:
+      self._set_framing(binary_framing)
     self.id2socket = {}
     self.log = logging.getLogger("sockdemux")
 
+  def _set_framing(self, binary_framing):
+    worker_class = BinaryFrameIOWorker if binary_framing else JSONIOWorker
+    self.json_worker = worker_class(self.true_io_worker,
+                                    on_json_received=self._on_receive)
+
+  def _detect_framing(self, io_worker):
+    data = io_worker.peek_receive_buf()
+    if data == "" or self.json_worker is not None:
+      return
+    self._set_framing(data[0] != "{")
+    # Have the new json_worker handle what we have received so far
+    io_worker._push_receive_data("")
+
   def _on_receive(self, _, json_hash):
     if 'id' not in json_hash or 'type' not in json_hash:
       raise ValueError("Invalid json_hash %s" % str(json_hash))
@@ -63,15 +157,14 @@ class MockSocket(object):
     self.sock_type = sock_type
     self.sock_id = sock_id
     self.json_worker = json_worker
-    self.pending_reads = []
+    self.pending_reads = deque()
 
   def ready_to_read(self):
-    return self.pending_reads != []
+    return len(self.pending_reads) > 0
 
   def send(self, data):
-    # base 64 occasionally adds extraneous newlines: bit.ly/aRTmNu
-    json_safe_data = base64.b64encode(data).replace("\n", "")
-    wrapped = {'id' : self.sock_id, 'type' : 'data', 'data' : json_safe_data}
+    wrapped = {'id' : self.sock_id, 'type' : 'data',
+               'data' : encode_data(self.json_worker, data)}
     self.json_worker.send(wrapped)
     # that just put it on a buffer. Now, actually send...
     # TODO(cs): this is hacky. Should really define our own IOWorker class
@@ -91,12 +184,14 @@ class MockSocket(object):
     return len(data)
 
   def recv(self, bufsize):
-    if self.pending_reads == []:
+    if len(self.pending_reads) == 0:
       log.warn("recv() called with an empty buffer")
       # Never block
       return None
-    # TODO(cs): don't ignore bufsize
-    data = self.pending_reads.pop(0)
+    data = self.pending_reads.popleft()
+    if len(data) > bufsize:
+      self.pending_reads.appendleft(data[bufsize:])
+      data = data[:bufsize]
     return data
 
   def append_read(self, data):
@@ -16,7 +16,6 @@
 from base import *
 import socket
 import logging
-import base64
 
 # The server generally goes through the following states:
 #
@@ -41,7 +40,9 @@ class ServerSocketDemultiplexer(SocketDemultiplexer):
   instance = None
 
   def __init__(self, true_io_worker, mock_listen_sock):
-    super(ServerSocketDemultiplexer, self).__init__(true_io_worker)
+    # Use the framing the client uses
+    super(ServerSocketDemultiplexer, self).__init__(true_io_worker,
+                                                    binary_framing=None)
     # Whenever we see a handshake from the client, hand new MockSockets to
     # mock_listen_sock so that they can be accept()'ed
     self.mock_listen_sock = mock_listen_sock
@@ -61,7 +62,7 @@ class ServerSocketDemultiplexer(SocketDemultiplexer):
                                  peer_address=json_hash['address'])
       self.mock_listen_sock.append_new_mock_socket(new_sock)
     elif msg_type == "data":
-      raw_data = base64.b64decode(json_hash['data'])
+      raw_data = decode_data(self.json_worker, json_hash['data'])
       sock_id = json_hash['id']
       if sock_id not in self.id2socket:
         raise ValueError("Unknown socket id %d" % sock_id)
@@ -105,7 +106,7 @@ class ServerMockSocket(MockSocket):
     self.server_info = None
 
   def ready_to_read(self):
-    return self.pending_reads != [] or self.new_sockets != []
+    return len(self.pending_reads) > 0 or self.new_sockets != []
 
   def bind(self, server_info):
     # Before bind() is called, we don't know the
@@ -25,7 +25,6 @@
 #  - return STSMocketSockets to all switches rather than socket.sockets
 
 from base import *
-from sts.util.convenience import base64_decode
 from itertools import count
 import logging
 
@@ -38,8 +37,9 @@ class STSSocketDemultiplexer(SocketDemultiplexer):
   # -1 is reserved for the listen socket
   _id_gen = count(start=-2, step=-1)
 
-  def __init__(self, true_io_worker, server_info):
-    super(STSSocketDemultiplexer, self).__init__(true_io_worker)
+  def __init__(self, true_io_worker, server_info, binary_framing=False):
+    super(STSSocketDemultiplexer, self).__init__(true_io_worker,
+                                                 binary_framing=binary_framing)
     self.server_info = server_info
     # let MockSockets know who their Demuxer is when they connect()
     STSMockSocket.address2demuxer[server_info] = self
@@ -51,7 +51,7 @@ class STSSocketDemultiplexer(SocketDemultiplexer):
     if sock_id not in self.id2socket:
       raise ValueError("Unknown socket id %d" % sock_id)
     sock = self.id2socket[sock_id]
-    raw_data = base64_decode(json_hash['data'])
+    raw_data = decode_data(self.json_worker, json_hash['data'])
     sock.append_read(raw_data)
 
   def add_new_socket(self, new_socket):
@@ -354,6 +354,31 @@ class TopologyTest(unittest.TestCase):
     self.assertIn(l1, topo.patch_panel.access_links)
     self.assertTrue(topo.graph.has_link(l1))
 
+  def test_add_links(self):
+    # Arrange
+    s1 = FuzzSoftwareSwitch(1, 's1', ports=2)
+    s2 = FuzzSoftwareSwitch(2, 's2', ports=2)
+    h1_eth1 = HostInterface(hw_addr='11:22:33:44:55:66', ip_or_ips='10.0.0.1')
+    h1 = Host([h1_eth1], name='h1', hid=1)
+    topo_cls = self.sts_topology_type_factory()
+    topo = topo_cls(patch_panel=STSPatchPanel(),
+                    capabilities=TopologyCapabilities())
+    topo.add_switches([s1, s2])
+    topo.add_hosts([h1])
+    l1 = AccessLink(h1, h1_eth1, s1, s1.ports[1])
+    l2 = Link(s1, s1.ports[2], s2, s2.ports[2])
+    l3 = l2.reversed_link()
+    # Act
+    links = topo.add_links([l1, l2, l3])
+    # Assert
+    self.assertItemsEqual([l1, l2, l3], links)
+    self.assertItemsEqual([l1], topo.patch_panel.access_links)
+    self.assertItemsEqual([l2, l3], topo.patch_panel.network_links)
+    for link in links:
+      self.assertTrue(topo.graph.has_link(link))
+    self.assertFalse(topo.partition_tracker.is_partitioned(s1, s2))
+    self.assertRaises(AssertionError, topo.add_links, [l2])
+
   def test_remove_access_link(self):
     # Arrange
     s1 = FuzzSoftwareSwitch(1, 's1', ports=2)
@@ -49,5 +49,60 @@ class superlog_parser_test(unittest.TestCase):
       if name is not None:
         os.unlink(name)
 
+  def test_iter_parse(self):
+    try:
+      self.open_simple_superlog()
+      with open(self.tmpfile) as superlog:
+        events = log_parser.iter_parse(superlog, skip_classes=[LinkRecovery])
+        self.assertEqual(LinkFailure, type(events.next()))
+        self.assertRaises(StopIteration, events.next)
+    finally:
+      os.unlink(self.tmpfile)
+
+  def test_index(self):
+    try:
+      self.open_simple_superlog()
+      self.assertEqual(None, log_parser.load_index(self.tmpfile, build=False))
+      entries = log_parser.build_index(self.tmpfile)
+      self.assertEqual(entries, log_parser.load_index(self.tmpfile, build=False))
+      self.assertEqual(["LinkFailure", "LinkRecovery"],
+                       [ e.class_name for e in entries ])
+      self.assertEqual(["e1", "e2"], [ e.label for e in entries ])
+      self.assertNotEqual(entries[0].fingerprint_hash, entries[1].fingerprint_hash)
+      with open(self.tmpfile, 'rb') as superlog:
+        event = log_parser.read_event(superlog, entries[1])
+        self.assertEqual((LinkRecovery, "e2"), (type(event), event.label))
+      events = log_parser.parse_path(self.tmpfile, skip_classes=[LinkFailure])
+      self.assertEqual(["e2"], [ e.label for e in events ])
+
+      # The index is rebuilt once the superlog changes
+      with open(self.tmpfile, 'a') as superlog:
+        superlog.write('''{"class": "NOPInput", "label": "e3", "event_time": [0,0],'''
+                       ''' "dependent_labels": [], "logical_round": 1}\n''')
+      os.utime(self.tmpfile, (0, 0))
+      self.assertEqual(None, log_parser.load_index(self.tmpfile, build=False))
+      entries = log_parser.load_index(self.tmpfile)
+      self.assertEqual(3, len(entries))
+      self.assertEqual(1, entries[2].logical_round)
+    finally:
+      for path in [self.tmpfile, log_parser.index_path(self.tmpfile)]:
+        if os.path.exists(path):
+          os.unlink(path)
+
+  def test_unwritable_index(self):
+    index = log_parser.index_path(self.tmpfile)
+    try:
+      self.open_simple_superlog()
+      # The index can't be written over a directory
+      os.mkdir(index)
+      entries = log_parser.load_index(self.tmpfile)
+      self.assertEqual(["e1", "e2"], [ e.label for e in entries ])
+      # The temporary index file is cleaned up
+      self.assertFalse(os.path.exists("%s.%d" % (index, os.getpid())))
+    finally:
+      if os.path.isdir(index):
+        os.rmdir(index)
+      os.unlink(self.tmpfile)
+
 if __name__ == '__main__':
   unittest.main()
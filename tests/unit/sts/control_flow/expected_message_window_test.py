@@ -0,0 +1,93 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.replayer import ExpectedMessageWindow
+from sts.replay_event import ControlMessageReceive, ControlMessageSend, NOPInput
+
+def receive(of_fingerprint, logical_round, dpid=1, cid=("127.0.0.1", 6633)):
+  event = ControlMessageReceive(dpid, cid, ("ControlMessageReceive",
+                                            of_fingerprint, dpid, cid))
+  event.round = logical_round
+  return event
+
+def send(of_fingerprint, logical_round, dpid=1, cid=("127.0.0.1", 6633)):
+  event = ControlMessageSend(dpid, cid, ("ControlMessageSend",
+                                         of_fingerprint, dpid, cid))
+  event.round = logical_round
+  return event
+
+def nop(logical_round):
+  event = NOPInput()
+  event.round = logical_round
+  return event
+
+def rescan(events, current_index, round_window):
+  ''' The expected fingerprints, computed from scratch '''
+  start_round = events[current_index].round
+  receives = set()
+  sends = set()
+  for event in events[current_index:]:
+    if event.round - start_round > round_window:
+      break
+    if type(event) == ControlMessageReceive:
+      receives.add(event.fingerprint[1:])
+    if type(event) == ControlMessageSend:
+      sends.add(event.fingerprint[1:])
+  return (receives, sends)
+
+class ExpectedMessageWindowTest(unittest.TestCase):
+  def setUp(self):
+    self.cid = ("127.0.0.1", 6633)
+    self.events = [receive("a", 0), send("b", 0), nop(1), receive("a", 2),
+                   receive("c", 3), send("b", 4), nop(5), send("d", 9),
+                   receive("e", 9)]
+
+  def check(self, window, current_index):
+    window.advance(current_index)
+    (receives, sends) = rescan(self.events, current_index, window.round_window)
+    self.assertEqual(receives, set(window.receives.keys()))
+    self.assertEqual(sends, set(window.sends.keys()))
+
+  def test_window(self):
+    window = ExpectedMessageWindow(self.events, 2)
+    window.advance(0)
+    self.assertTrue(("a", 1, self.cid) in window.receives)
+    self.assertFalse(("c", 1, self.cid) in window.receives)
+    self.assertEqual(4, window.tail)
+    window.advance(1)
+    # The second receive of "a" is still in the window
+    self.assertTrue(("a", 1, self.cid) in window.receives)
+    window.advance(4)
+    self.assertFalse(("a", 1, self.cid) in window.receives)
+    self.assertTrue(("c", 1, self.cid) in window.receives)
+    self.assertTrue(("b", 1, self.cid) in window.sends)
+
+  def test_matches_rescan(self):
+    for round_window in [0, 1, 3, 10]:
+      window = ExpectedMessageWindow(self.events, round_window)
+      for current_index in range(len(self.events)):
+        self.check(window, current_index)
+      # Skipping ahead and moving back
+      window = ExpectedMessageWindow(self.events, round_window)
+      for current_index in [0, 5, 8, 2, 3, 7]:
+        self.check(window, current_index)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,88 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.partitioners import *
+
+class MockInput(object):
+  def __init__(self, label, **kws):
+    self.label = label
+    self.__dict__.update(kws)
+
+  def __repr__(self):
+    return self.label
+
+class MockLinkInput(MockInput):
+  def __init__(self, label, start_dpid, end_dpid):
+    MockInput.__init__(self, label, start_dpid=start_dpid, start_port_no=1,
+                       end_dpid=end_dpid, end_port_no=2)
+
+class PartitionerTest(unittest.TestCase):
+  def check_partition(self, inputs, subsets, split_ways):
+    self.assertEqual(split_ways, len(subsets))
+    self.assertEqual(sorted(inputs), sorted(sum(subsets, [])))
+    for subset in subsets:
+      self.assertEqual(sorted(subset, key=inputs.index), subset)
+
+  def test_every_split_is_a_partition(self):
+    inputs = [ MockInput("e%d" % i, dpid=i % 3, host_id=i / 4)
+               for i in range(10) ]
+    for cls in name_to_partitioner.values():
+      for split_ways in range(1, len(inputs)+1):
+        subsets = cls().partition(inputs, split_ways)
+        self.check_partition(inputs, subsets, split_ways)
+        if split_ways == len(inputs):
+          self.assertTrue(all(len(s) == 1 for s in subsets))
+
+  def test_switch(self):
+    inputs = [ MockInput("e%d" % i, dpid=i % 2) for i in range(6) ]
+    subsets = SwitchPartitioner().partition(inputs, 2)
+    self.assertEqual([inputs[0::2], inputs[1::2]], subsets)
+
+  def test_link(self):
+    (a, b, c) = (MockLinkInput("a", 1, 2), MockLinkInput("b", 2, 3),
+                 MockLinkInput("c", 2, 1))
+    subsets = LinkPartitioner().partition([a, b, c], 2)
+    self.assertEqual([[a, c], [b]], subsets)
+
+  def test_unkeyed_inputs_are_grouped(self):
+    inputs = [ MockInput("e0", host_id=1), MockInput("e1"),
+               MockInput("e2", host_id=1), MockInput("e3") ]
+    subsets = HostPartitioner().partition(inputs, 2)
+    self.assertEqual([[inputs[0], inputs[2]], [inputs[1], inputs[3]]], subsets)
+
+  def test_adaptive(self):
+    adaptive = AdaptivePartitioner()
+    tried = []
+    for _ in range(len(adaptive.partitioners)):
+      partitioner = adaptive.choose()
+      tried.append(partitioner.name)
+      inputs_pruned = 4 if partitioner.name == "host" else 1
+      adaptive.record_outcome(partitioner.name, inputs_pruned, 2)
+    self.assertEqual(adaptive.partitioners.keys(), tried)
+    self.assertEqual("host", adaptive.choose().name)
+    self.assertEqual(adaptive.lookup("host"), adaptive.choose())
+
+  def test_unknown(self):
+    self.assertRaises(ValueError, get_partitioner, "nonexistent")
+    partitioner = SwitchPartitioner()
+    self.assertEqual(partitioner, get_partitioner(partitioner))
+
+if __name__ == '__main__':
+  unittest.main()
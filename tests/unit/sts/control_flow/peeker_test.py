@@ -22,7 +22,7 @@ from sts.control_flow.peeker import *
 # TODO: move Mock internal events to lib
 from tests.unit.sts.event_dag_test import MockInternalEvent
 from tests.unit.sts.mcs_finder_test import MockInputEvent
-from sts.replay_event import InternalEvent, ConnectToControllers
+from sts.replay_event import InternalEvent, ConnectToControllers, HostMigration
 from sts.event_dag import EventDag
 from config.experiment_config_lib import ControllerConfig
 from sts.simulation_state import SimulationConfig
@@ -147,6 +147,23 @@ class PeekerTest(unittest.TestCase):
     new_dag = self.snapshot_peeker.peek(EventDag(sub_events))
     self.assertEquals([inp2, inp3, int2], new_dag.events)
 
+class PrefixPeekerTest(unittest.TestCase):
+  def test_trie_hit_keeps_rewritten_migrations(self):
+    connect = MockConnectToControllers(fingerprint="a")
+    migration1 = HostMigration(1, 1, 2, 2, "host1")
+    migration2 = HostMigration(2, 2, 3, 3, "host1")
+    dag = EventDag([connect, migration1, migration2])
+    peeker = PrefixPeeker(None)
+    # Pruning the first migration rewrites the second one to start at (1,1)
+    view = dag.input_subset([migration2])
+    first = peeker.peek(view)
+    # The second peek is answered from the prefix trie
+    second = peeker.peek(view)
+    for new_dag in (first, second):
+      self.assertEqual(2, len(new_dag.events))
+      self.assertEqual((1, 1), new_dag.events[-1].old_location)
+      self.assertEqual((3, 3), new_dag.events[-1].new_location)
+
 # TODO(cs): update these tests to reflect new match_fingerprints!
 #class MatchFingerPrintTest(unittest.TestCase):
 #  def test_match_fingerprints_simple(self):
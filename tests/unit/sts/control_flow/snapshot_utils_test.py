@@ -0,0 +1,61 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.snapshot_utils import SnapshotTrie
+
+class SnapshotTrieTest(unittest.TestCase):
+  def setUp(self):
+    self.released = []
+    self.trie = SnapshotTrie(max_snapshots=3, release=self.released.append)
+
+  def test_longest_prefix(self):
+    self.trie.insert(["a"], "s1")
+    self.trie.insert(["a", "b", "c"], "s3")
+    self.assertEqual(("a", "b", "c"), self.trie.longest_prefix(["a", "b", "c", "d"]))
+    self.assertEqual(("a", "b", "c"), self.trie.longest_prefix(["a", "b", "c"]))
+    self.assertEqual(("a",), self.trie.longest_prefix(["a", "b", "x"]))
+    self.assertEqual(None, self.trie.longest_prefix(["b"]))
+    self.assertEqual(None, self.trie.longest_prefix([]))
+
+  def test_pop_longest_prefix(self):
+    self.trie.insert(["a"], "s1")
+    self.trie.insert(["a", "b"], "s2")
+    self.assertEqual((2, "s2"), self.trie.pop_longest_prefix(["a", "b", "c"]))
+    self.assertEqual((1, "s1"), self.trie.pop_longest_prefix(["a", "b", "c"]))
+    self.assertEqual((0, None), self.trie.pop_longest_prefix(["a", "b", "c"]))
+    self.assertEqual(0, len(self.trie))
+    # Emptied branches are pruned
+    self.assertEqual({}, self.trie._root)
+    self.assertEqual([], self.released)
+
+  def test_eviction(self):
+    for i in range(4):
+      self.trie.insert(["a"] * (i+1), "s%d" % i)
+    self.assertEqual(["s0"], self.released)
+    self.assertEqual(3, len(self.trie))
+    # Replacing a snapshot releases the old one
+    self.trie.insert(["a", "a"], "t1")
+    self.assertEqual(["s0", "s1"], self.released)
+    self.trie.clear()
+    self.assertEqual(["s0", "s1", "s2", "s3", "t1"], self.released)
+    self.assertEqual(None, self.trie.longest_prefix(["a"] * 4))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,99 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+
+from pox.lib.addresses import EthAddr
+from pox.lib.addresses import IPAddr
+from pox.openflow.flow_table import FlowTable
+from pox.openflow.flow_table import TableEntry
+from pox.openflow.libopenflow_01 import ofp_match
+
+from sts.entities.flow_table_index import FlowTableIndex
+
+
+def linear_lookup(table, packet_match):
+  for entry in table.entries:
+    if entry.match.matches_with_wildcards(packet_match,
+                                          consider_other_wildcards=False):
+      return entry
+  return None
+
+
+class FlowTableIndexTest(unittest.TestCase):
+  def setUp(self):
+    self.table = FlowTable()
+    self.index = FlowTableIndex(self.table)
+    self.macs = [EthAddr("00:00:00:00:00:0%d" % i) for i in range(1, 4)]
+    self.ips = [IPAddr("10.0.0.%d" % i) for i in range(1, 4)]
+    self.entries = [
+      TableEntry(priority=10, match=ofp_match(dl_dst=self.macs[0])),
+      TableEntry(priority=20, match=ofp_match(dl_type=0x800,
+                                              nw_dst=self.ips[1])),
+      TableEntry(priority=30, match=ofp_match(in_port=1,
+                                              dl_dst=self.macs[1])),
+      TableEntry(priority=5, match=ofp_match(in_port=2)),
+      TableEntry(priority=1, match=ofp_match()),
+    ]
+    for entry in self.entries:
+      self.table.add_entry(entry)
+
+  def packet_matches(self):
+    for in_port in (1, 2, 3):
+      for mac in self.macs:
+        for ip in self.ips:
+          yield ofp_match(in_port=in_port, dl_dst=mac, dl_type=0x800,
+                          nw_dst=ip)
+
+  def assert_same_as_linear(self):
+    for packet_match in self.packet_matches():
+      self.assertEqual(linear_lookup(self.table, packet_match),
+                       self.index.lookup(packet_match))
+
+  def test_lookup(self):
+    self.assert_same_as_linear()
+    packet_match = ofp_match(in_port=1, dl_dst=self.macs[1], dl_type=0x800,
+                             nw_dst=self.ips[1])
+    self.assertEqual(self.entries[2], self.index.lookup(packet_match))
+
+  def test_counters(self):
+    self.table.remove_entry(self.entries[-1])
+    hit = ofp_match(in_port=3, dl_dst=self.macs[0])
+    miss = ofp_match(in_port=3, dl_dst=self.macs[2])
+    self.assertEqual(self.entries[0], self.index.lookup(hit))
+    self.assertEqual(None, self.index.lookup(miss))
+    self.assertEqual(1, self.index.hits)
+    self.assertEqual(1, self.index.misses)
+
+  def test_invalidation(self):
+    self.assert_same_as_linear()
+    rebuilds = self.index.rebuilds
+    self.assert_same_as_linear()
+    self.assertEqual(rebuilds, self.index.rebuilds)
+    # A higher priority entry shadows the existing ones
+    shadow = TableEntry(priority=100, match=ofp_match(nw_dst=self.ips[0],
+                                                      dl_type=0x800))
+    self.table.add_entry(shadow)
+    self.assert_same_as_linear()
+    self.assertEqual(rebuilds + 1, self.index.rebuilds)
+    for entry in self.entries:
+      self.table.remove_entry(entry)
+    self.assert_same_as_linear()
+    packet_match = ofp_match(in_port=1, dl_dst=self.macs[0], dl_type=0x800,
+                             nw_dst=self.ips[0])
+    self.assertEqual(shadow, self.index.lookup(packet_match))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -161,6 +161,28 @@ class event_dag_test(unittest.TestCase):
     fingerprint = ('HostMigration',1,1,2,2,"host1")
     self.assertEqual(fingerprint, new_dag.events[1].fingerprint)
 
+  def test_failure_recovery_pair(self):
+    events = [ SwitchFailure(1), MockInternalEvent('a'), MockInputEvent(),
+               SwitchRecovery(1), MockInputEvent() ]
+    event_dag = EventDag(events)
+    event_dag.mark_invalid_input_sequences()
+    # Pruning the failure prunes its recovery
+    new_dag = event_dag.input_complement([events[0]])
+    self.assertEqual([events[1], events[2], events[4]], new_dag.events)
+    # ... but the recovery is kept if the failure is
+    new_dag = event_dag.input_subset([events[0]])
+    self.assertEqual(events[0:2] + [events[3]], new_dag.events)
+    self.assertEqual([events[3]], event_dag.atomic_input_events[0].recoveries)
+
+  def test_insert_atomic_inputs(self):
+    events = [ MockInputEvent(), MockInternalEvent('a'), MockInputEvent(),
+               MockInternalEvent('b'), MockInputEvent() ]
+    event_dag = EventDag(events)
+    view = event_dag.input_subset([events[2]])
+    self.assertEqual([events[1], events[2], events[3]], view.events)
+    new_dag = view.insert_atomic_inputs([events[4], events[0]])
+    self.assertEqual(events, new_dag.events)
+    self.assertEqual([events[0], events[2], events[4]], new_dag.input_events)
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,108 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.event_scheduler import *
+from sts.replay_event import InputEvent, InternalEvent
+from sts.syncproto.base import SyncTime
+
+class MockInputEvent(InputEvent):
+  def proceed(self, simulation):
+    return True
+
+class MockInternalEvent(InternalEvent):
+  ''' Occurs after proceed() has been called `polls' times '''
+  def __init__(self, polls=0, **kws):
+    super(MockInternalEvent, self).__init__(**kws)
+    self.polls = polls
+
+  def proceed(self, simulation):
+    self.polls -= 1
+    return self.polls < 0
+
+class MockSimulation(object):
+  io_master = None
+
+class CausalEventSchedulerTest(unittest.TestCase):
+  def setUp(self):
+    self.sleeps = []
+    self.selects = []
+    self.scheduler = CausalEventScheduler(MockSimulation(),
+                                          sleep_continuation=self.sleeps.append,
+                                          select_continuation=self.selects.append,
+                                          epsilon_seconds=0.5)
+
+  def test_inputs_are_not_delayed(self):
+    # Recorded 100 seconds apart
+    for seconds in [0, 100]:
+      event = MockInputEvent(event_time=SyncTime(seconds, 0))
+      self.scheduler.schedule(event)
+      self.assertFalse(event.timed_out)
+    self.assertEqual([], self.sleeps)
+
+  def test_timeouts_are_learned(self):
+    self.scheduler.schedule(MockInputEvent(event_time=SyncTime(0, 0)))
+    event = MockInternalEvent(polls=2, event_time=SyncTime(10, 0))
+    # Nothing matched yet: fall back to EventScheduler's timeout
+    self.assertTrue(self.scheduler.timeout_seconds(event) > 10)
+    self.scheduler.schedule(event)
+    self.assertFalse(event.timed_out)
+    self.assertEqual(2, len(self.selects))
+
+    self.scheduler.stats.class2max_match_latency[("MockInternalEvent",)] = 0.1
+    event = MockInternalEvent(polls=2, event_time=SyncTime(20, 0))
+    self.assertAlmostEqual(0.3, self.scheduler.timeout_seconds(event))
+    # Never below min_timeout_seconds
+    self.scheduler.stats.class2max_match_latency[("MockInternalEvent",)] = 0.0
+    self.assertEqual(self.scheduler.min_timeout_seconds,
+                     self.scheduler.timeout_seconds(event))
+
+  def test_max_match_latency(self):
+    stats = EventSchedulerStats()
+    event = MockInternalEvent(event_time=SyncTime(0, 0))
+    stats.start_replay(event)
+    self.assertEqual(None, stats.max_match_latency(event))
+    for latency in [0.2, 0.5, 0.1]:
+      stats.event_matched(event, latency_seconds=latency)
+    stats.event_matched(event)
+    self.assertEqual(0.5, stats.max_match_latency(event))
+    self.assertEqual(None, stats.max_match_latency(MockInputEvent()))
+
+  def test_awaited_messages_are_not_polled(self):
+    end_time = time.time() + 2
+    self.scheduler._select_until(end_time)
+    self.assertTrue(self.selects[-1] <= self.scheduler.sleep_interval_seconds)
+    # Arrival of the awaited message wakes select() up
+    self.scheduler._select_until(end_time, wakes_on_arrival=True)
+    self.assertTrue(self.selects[-1] > 1)
+    self.scheduler._select_until(time.time() + 10**9, wakes_on_arrival=True)
+    self.assertEqual(self.scheduler.max_select_seconds, self.selects[-1])
+
+  def test_timeout(self):
+    self.scheduler.schedule(MockInputEvent(event_time=SyncTime(0, 0)))
+    self.scheduler.stats.class2max_match_latency[("MockInternalEvent",)] = 0.0
+    event = MockInternalEvent(polls=10**9, event_time=SyncTime(0, 0))
+    self.scheduler.select_continuation = lambda timeout: time.sleep(timeout)
+    start = time.time()
+    self.scheduler.schedule(event)
+    self.assertTrue(event.timed_out)
+    self.assertTrue(time.time() - start < 1)
+
+if __name__ == '__main__':
+  unittest.main()
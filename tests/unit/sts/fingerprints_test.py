@@ -0,0 +1,90 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import copy
+import pickle
+import struct
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.fingerprints.messages import *
+from sts.util.lru_cache import LRUCache
+
+class ofp_error(object):
+  ''' Stands in for pox's ofp_error '''
+  def __init__(self, xid, type, code):
+    self.xid = xid
+    self.type = type
+    self.code = code
+
+  def pack(self):
+    return struct.pack("!BBHLHH", 1, 1, 12, self.xid, self.type, self.code)
+
+class FingerprintTest(unittest.TestCase):
+  def test_equality(self):
+    dp1 = DPFingerprint({'dl_src': 'a', 'dl_dst': 'b', 'nw_src': 'c', 'nw_dst': 'd'})
+    dp2 = DPFingerprint({'dl_src': u'a', 'dl_dst': 'b', 'nw_src': 'c', 'nw_dst': 'd'})
+    self.assertEqual(dp1, dp2)
+    self.assertEqual(hash(dp1), hash(dp2))
+    self.assertNotEqual(dp1, DPFingerprint({'class': 'lldp'}))
+    self.assertNotEqual(DPFingerprint({'class': 'arp'}), DPFingerprint({'class': 'lldp'}))
+    of1 = OFFingerprint({'class': 'ofp_packet_in', 'in_port': 1, 'data': dp1._field2value})
+    of2 = OFFingerprint({'class': 'ofp_packet_in', 'in_port': 1, 'data': dp2})
+    self.assertEqual(of1, of2)
+    self.assertEqual(hash(of1), hash(of2))
+    self.assertEqual(1, len(set([of1, of2])))
+    self.assertNotEqual(of1, dp1)
+
+  def test_intern(self):
+    fields = {'class': 'ofp_error', 'type': 1, 'code': 2}
+    fingerprint = OFFingerprint(dict(fields)).intern()
+    self.assertTrue(OFFingerprint(dict(fields)).intern() is fingerprint)
+    self.assertFalse(OFFingerprint(dict(fields, code=3)).intern() is fingerprint)
+
+  def test_slots(self):
+    for fingerprint in [OFFingerprint({'class': 'ofp_error', 'type': 1}),
+                        DPFingerprint({'class': 'lldp'})]:
+      self.assertFalse(hasattr(fingerprint, '__dict__'))
+
+  def test_copy(self):
+    fingerprint = OFFingerprint({'class': 'ofp_error', 'type': 1, 'code': 2})
+    for clone in [copy.deepcopy(fingerprint), pickle.loads(pickle.dumps(fingerprint))]:
+      self.assertEqual(fingerprint, clone)
+      self.assertEqual(fingerprint.to_dict(), clone.to_dict())
+
+  def test_from_pkt_cache(self):
+    fingerprint = OFFingerprint.from_pkt(ofp_error(1, 1, 2))
+    self.assertEqual(OFFingerprint({'class': 'ofp_error', 'type': 1, 'code': 2}),
+                     fingerprint)
+    # Only the xid differs, so the cached fingerprint is returned
+    self.assertTrue(OFFingerprint.from_pkt(ofp_error(2, 1, 2)) is fingerprint)
+    self.assertNotEqual(fingerprint, OFFingerprint.from_pkt(ofp_error(1, 1, 3)))
+
+class LRUCacheTest(unittest.TestCase):
+  def test_eviction(self):
+    cache = LRUCache(2)
+    cache.put(1, "a")
+    cache.put(2, "b")
+    self.assertEqual("a", cache.get(1))
+    cache.put(3, "c")
+    self.assertFalse(2 in cache)
+    self.assertEqual(None, cache.get(2))
+    self.assertEqual(["a", "c"], [cache.get(1), cache.get(3)])
+    self.assertEqual(2, len(cache))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,242 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.header_space import *
+from pox.openflow.libopenflow_01 import *
+
+def wildcard(**fields):
+  w = (0, 0)
+  for name, value in fields.iteritems():
+    w = set_field(w[0], w[1], name, value)
+  return w
+
+class MockMatch(object):
+  def __init__(self, **fields):
+    self.in_port = None
+    for (name, _) in header_fields:
+      setattr(self, name, None)
+    for name, value in fields.iteritems():
+      setattr(self, name, value)
+
+class MockAction(object):
+  def __init__(self, type, **kws):
+    self.type = type
+    self.__dict__.update(kws)
+
+def output(port):
+  return MockAction(OFPAT_OUTPUT, port=port)
+
+class MockEntry(object):
+  def __init__(self, priority, match, actions):
+    self.priority = priority
+    self.match = match
+    self.actions = actions
+
+class MockTable(object):
+  def __init__(self):
+    self.entries = []
+    self.listeners = []
+
+  def addListener(self, event_type, listener):
+    self.listeners.append(listener)
+
+  def removeListener(self, listener):
+    self.listeners.remove(listener)
+
+  def add_entry(self, entry):
+    self.entries.append(entry)
+    for listener in self.listeners:
+      listener(None)
+
+class MockPort(object):
+  def __init__(self, port_no):
+    self.port_no = port_no
+
+class MockSwitch(object):
+  def __init__(self, dpid, port_nos):
+    self.dpid = dpid
+    self.ports = { p : MockPort(p) for p in port_nos }
+    self.table = MockTable()
+
+  def add(self, priority, actions, **match):
+    self.table.add_entry(MockEntry(priority, MockMatch(**match), actions))
+
+class MockLink(object):
+  def __init__(self, start_node, start_port, end_node, end_port):
+    self.start_node = start_node
+    self.start_port = start_node.ports[start_port]
+    self.end_node = end_node
+    self.end_port = end_node.ports[end_port]
+
+class MockAccessLink(object):
+  def __init__(self, switch, port_no):
+    self.switch = switch
+    self.switch_port = switch.ports[port_no]
+
+def links_between(s1, p1, s2, p2):
+  return [MockLink(s1, p1, s2, p2), MockLink(s2, p2, s1, p1)]
+
+class WildcardTest(unittest.TestCase):
+  def test_intersect(self):
+    w1 = wildcard(nw_proto=6)
+    w2 = wildcard(tp_dst=80)
+    self.assertEqual(wildcard(nw_proto=6, tp_dst=80), intersect(w1, w2))
+    self.assertEqual(None, intersect(w1, wildcard(nw_proto=17)))
+    self.assertTrue(contains(w1, wildcard(nw_proto=6, tp_dst=80)))
+    self.assertFalse(contains(wildcard(nw_proto=6, tp_dst=80), w1))
+
+  def test_subtract(self):
+    w = wildcard(nw_proto=6)
+    pieces = subtract(w, wildcard(tp_dst=80))
+    self.assertEqual(16, len(pieces))
+    for piece in pieces:
+      self.assertTrue(contains(w, piece))
+      self.assertEqual(None, intersect(piece, wildcard(tp_dst=80)))
+    self.assertTrue(covered(w, pieces + [wildcard(tp_dst=80)]))
+    self.assertFalse(covered(w, pieces))
+    self.assertEqual([w], subtract(w, wildcard(nw_proto=17)))
+    self.assertEqual([], subtract(w, (0, 0)))
+
+  def test_prefix(self):
+    match = MockMatch(nw_dst="10.0.0.0")
+    match.get_nw_dst = lambda: ("10.0.0.0", 8)
+    (_, w) = compile_match(match)
+    self.assertTrue(contains(w, wildcard(nw_dst="10.1.2.3")))
+    self.assertFalse(contains(w, wildcard(nw_dst="11.1.2.3")))
+
+class HeaderSpaceTest(unittest.TestCase):
+  def test_lazy_differences(self):
+    hs = HeaderSpace.full().minus(wildcard(nw_proto=6))
+    self.assertEqual(1, len(hs.terms))
+    self.assertTrue(hs.intersect(wildcard(nw_proto=6)).is_empty())
+    self.assertFalse(hs.intersect(wildcard(nw_proto=17)).is_empty())
+    self.assertFalse(hs.intersects(HeaderSpace.from_wildcard(wildcard(nw_proto=6))))
+    # Covered only by the union of the diffs
+    hs = HeaderSpace.from_wildcard(wildcard(nw_proto=6))
+    for piece in subtract(wildcard(nw_proto=6), wildcard(tp_dst=80)):
+      hs = hs.minus(piece)
+    self.assertFalse(hs.compact().is_empty())
+    self.assertTrue(hs.minus(wildcard(tp_dst=80)).compact().is_empty())
+
+  def test_rewrite(self):
+    hs = HeaderSpace.full().minus(wildcard(nw_tos=1)).minus(wildcard(tp_dst=80))
+    rewritten = hs.rewrite("nw_tos", 1)
+    self.assertFalse(rewritten.intersect(wildcard(nw_tos=1)).is_empty())
+    self.assertTrue(rewritten.intersect(wildcard(nw_tos=2)).is_empty())
+    self.assertTrue(rewritten.intersect(wildcard(tp_dst=80)).compact().is_empty())
+
+class TransferFunctionTest(unittest.TestCase):
+  def test_shadowing(self):
+    switch = MockSwitch(1, [1, 2])
+    switch.add(10, [output(1)], nw_proto=6)
+    switch.add(5, [output(2)], nw_proto=6, tp_dst=80)
+    switch.add(1, [output(2)])
+    tf = TransferFunction(compile_rules(switch))
+    self.assertEqual(2, len(tf.rules))
+    outputs = tf.apply(3, HeaderSpace.full())
+    self.assertEqual([1, 2], [ port for (port, _) in outputs ])
+    self.assertTrue(outputs[1][1].intersect(wildcard(nw_proto=6)).compact().is_empty())
+
+class NetworkModelTest(unittest.TestCase):
+  def test_loop(self):
+    s1 = MockSwitch(1, [1, 2])
+    s2 = MockSwitch(2, [1, 2])
+    s1.add(1, [output(2)])
+    s2.add(1, [output(2)])
+    links = links_between(s1, 2, s2, 1) + links_between(s2, 2, s1, 1)
+    self.assertEqual(["Loop: 1:1 -> 2:1"], find_loops([s1, s2], links, []))
+
+  def test_reachability(self):
+    s1 = MockSwitch(1, [1, 2, 3])
+    s2 = MockSwitch(2, [1, 2])
+    s1.add(2, [output(2)], nw_proto=6)
+    s1.add(1, [output(3)])
+    s2.add(1, [output(2)])
+    links = links_between(s1, 2, s2, 1)
+    access_links = [MockAccessLink(s1, 1), MockAccessLink(s2, 2)]
+    self.assertEqual(["Blackhole: 1:3 (no live link)"],
+                     find_blackholes([s1, s2], links, access_links))
+    omega = compute_omega([s1, s2], links, access_links)
+    start = get_uniq_port_id(s1, s1.ports[1])
+    final = get_uniq_port_id(s2, s2.ports[2])
+    self.assertEqual([final], [ port for (_, port) in omega[start] ])
+    self.assertEqual(set([(start, final)]),
+                     find_connected_pairs([s1, s2], links, access_links))
+    self.assertEqual([], find_loops([s1, s2], links, access_links))
+
+class IncrementalAnalysisTest(unittest.TestCase):
+  def setUp(self):
+    self.s1 = MockSwitch(1, [1, 2, 3])
+    self.s2 = MockSwitch(2, [1, 2])
+    self.s1.add(2, [output(2)], nw_proto=6)
+    self.s1.add(1, [output(3)])
+    self.links = links_between(self.s1, 2, self.s2, 1)
+    self.access_links = [MockAccessLink(self.s1, 1), MockAccessLink(self.s2, 2)]
+    self.analysis = IncrementalAnalysis()
+
+  def tearDown(self):
+    self.analysis.close()
+
+  def check(self, switches, links):
+    self.analysis.update(switches, links, self.access_links)
+    self.assertEqual(find_loops(switches, links, self.access_links),
+                     self.analysis.loops())
+    self.assertEqual(find_blackholes(switches, links, self.access_links),
+                     self.analysis.blackholes())
+    self.assertEqual(find_connected_pairs(switches, links, self.access_links),
+                     self.analysis.connected_pairs())
+    return self.analysis.recomputed
+
+  def test_flow_table_changes(self):
+    switches = [self.s1, self.s2]
+    self.assertEqual(4, self.check(switches, self.links))
+    self.assertEqual(set(), self.analysis.connected_pairs())
+    tfs = dict(self.analysis.model.tfs)
+    self.assertEqual(0, self.check(switches, self.links))
+    self.assertTrue(tfs[1] is self.analysis.model.tfs[1])
+    self.assertTrue(tfs[2] is self.analysis.model.tfs[2])
+    # Only the ports whose headers reach s2 are recomputed
+    self.s2.add(1, [output(2)])
+    self.assertEqual(3, self.check(switches, self.links))
+    self.assertTrue(tfs[1] is self.analysis.model.tfs[1])
+    self.assertTrue(tfs[2] is not self.analysis.model.tfs[2])
+    # Transfer functions aren't shared with other analyses
+    other = IncrementalAnalysis()
+    other.update(switches, self.links, self.access_links)
+    self.assertTrue(other.model.tfs[1] is not self.analysis.model.tfs[1])
+    other.close()
+    self.assertEqual(1, len(self.analysis.connected_pairs()))
+    self.assertEqual(1, len(self.s2.table.listeners))
+    self.analysis.close()
+    self.assertEqual([], self.s2.table.listeners)
+
+  def test_topology_changes(self):
+    switches = [self.s1, self.s2]
+    self.s2.add(1, [output(2)])
+    self.check(switches, self.links)
+    self.assertEqual(2, self.check(switches, []))
+    self.assertEqual(set(), self.analysis.connected_pairs())
+    self.assertEqual(4, self.check(switches, self.links))
+    self.assertEqual(1, len(self.analysis.connected_pairs()))
+    self.check([self.s1], self.links)
+    self.assertEqual(set(), self.analysis.connected_pairs())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,10 +22,12 @@ from sts.topology.sts_topology import MeshTopology
 from pox.openflow.software_switch import SoftwareSwitch
 from pox.openflow.libopenflow_01 import *
 from config.invariant_checks import check_for_two_loop
+from sts.invariant_checker import IncrementalInvariantChecker
 
 class MockSimulation(object):
   def __init__(self, topology):
     self.topology = topology
+    self.incremental_invariant_checker = None
 
 class InvariantCheckTest(unittest.TestCase):
   def basic_test(self):
@@ -47,3 +49,15 @@ class InvariantCheckTest(unittest.TestCase):
     simulation = MockSimulation(topo)
     violations = check_for_two_loop(simulation)
     self.assertEqual(violations, [])
+
+  def test_incremental_checker_per_simulation(self):
+    simulations = [ MockSimulation(MeshTopology(create_connection=None,
+                                                num_switches=2))
+                    for _ in range(2) ]
+    for simulation in simulations:
+      self.assertEqual([], IncrementalInvariantChecker.check_loops(simulation))
+    checkers = [ s.incremental_invariant_checker for s in simulations ]
+    self.assertTrue(checkers[0] is not checkers[1])
+    # Later checks reuse the simulation's analysis
+    IncrementalInvariantChecker.check_blackholes(simulations[0])
+    self.assertTrue(checkers[0] is simulations[0].incremental_invariant_checker)
@@ -19,8 +19,8 @@ import os
 import shutil
 
 from sts.control_flow.mcs_finder import MCSFinder, EfficientMCSFinder
-from sts.replay_event import InputEvent, InvariantViolation
-from sts.event_dag import EventDag
+from sts.replay_event import InputEvent, InvariantViolation, HostMigration
+from sts.event_dag import EventDag, replace_migration
 import logging
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
@@ -31,9 +31,10 @@ class MockSimulationConfig(object):
 
 class MockMCSFinderBase(MCSFinder):
   ''' Overrides self.invariant_check and run_simulation_forward() '''
-  def __init__(self, event_dag, mcs):
+  def __init__(self, event_dag, mcs, **kwargs):
     super(MockMCSFinderBase, self).__init__(MockSimulationConfig(), event_dag,
-                                            invariant_check_name="InvariantChecker.check_liveness")
+                                            invariant_check_name="InvariantChecker.check_liveness",
+                                            **kwargs)
     # Hack! Give a fake name in config.invariant_checks.name_to_invariant_checks, but
     # but remove it from our dict directly after. This is to prevent
     # sanity check exceptions from being thrown.
@@ -42,6 +43,8 @@ class MockMCSFinderBase(MCSFinder):
     self.mcs = mcs
     self.simulation = None
     self.transform_dag = None
+    # Number of replays not done through _fork_replay()
+    self.replay_count = 0
 
   def log(self, message):
     self._log.info(message)
@@ -54,19 +57,46 @@ class MockMCSFinderBase(MCSFinder):
 
   def replay(self, new_dag, hook=None, ignore_runtime_stats=False):
     self.new_dag = new_dag
+    self.replay_count += 1
     return self.invariant_check(new_dag)
 
 # Horrible horrible hack. This way lies insanity
 class MockMCSFinder(MockMCSFinderBase, MCSFinder):
-  def __init__(self, event_dag, mcs):
-    MockMCSFinderBase.__init__(self, event_dag, mcs)
+  def __init__(self, event_dag, mcs, **kwargs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs, **kwargs)
     self._log = logging.getLogger("mock_mcs_finder")
 
 class MockEfficientMCSFinder(MockMCSFinderBase, EfficientMCSFinder):
-  def __init__(self, event_dag, mcs):
-    MockMCSFinderBase.__init__(self, event_dag, mcs)
+  def __init__(self, event_dag, mcs, **kwargs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs, **kwargs)
     self._log = logging.getLogger("mock_efficient_mcs_finder")
 
+class MockForkedTask(object):
+  ''' A ForkedTask whose child has already returned '''
+  def __init__(self, result, done_queue):
+    self.result = result
+    self.cancelled = False
+    done_queue.put(self)
+
+  def wait(self):
+    return self.result
+
+  def cancel(self):
+    self.cancelled = True
+
+class MockParallelMCSFinder(MockMCSFinderBase, MCSFinder):
+  def __init__(self, event_dag, mcs, **kwargs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs, max_parallel_replays=3,
+                               **kwargs)
+    self._log = logging.getLogger("mock_parallel_mcs_finder")
+    self.replayed_slots = []
+
+  def _fork_replay(self, new_dag, label, port_offset=0, done_queue=None):
+    self.new_dag = new_dag
+    self.replayed_slots.append(port_offset / self.worker_port_stride)
+    violation_found = self.invariant_check(new_dag) != []
+    return MockForkedTask((violation_found, {}, []), done_queue)
+
 class MockInputEvent(InputEvent):
   def __init__(self, fingerprint=None, **kws):
     super(MockInputEvent, self).__init__(**kws)
@@ -80,6 +110,28 @@ class MockInputEvent(InputEvent):
   def proceed(self, simulation):
     return True
 
+class Interrupted(Exception):
+  pass
+
+class Interruptible(object):
+  ''' Dies after max_replays replays '''
+  def __init__(self, event_dag, mcs, max_replays=None, **kwargs):
+    super(Interruptible, self).__init__(event_dag, mcs, **kwargs)
+    self.max_replays = max_replays
+    self.replays = 0
+
+  def replay(self, new_dag, hook=None, ignore_runtime_stats=False):
+    if self.replays == self.max_replays:
+      raise Interrupted()
+    self.replays += 1
+    return super(Interruptible, self).replay(new_dag)
+
+class MockInterruptibleMCSFinder(Interruptible, MockMCSFinder):
+  pass
+
+class MockInterruptibleEfficientMCSFinder(Interruptible, MockEfficientMCSFinder):
+  pass
+
 mcs_results_path = "/tmp/mcs_results"
 
 class MCSFinderTest(unittest.TestCase):
@@ -103,6 +155,9 @@ class MCSFinderTest(unittest.TestCase):
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
 
+  def test_basic_parallel(self):
+    self.basic(MockParallelMCSFinder)
+
   def test_straddle(self):
     self.straddle(MockMCSFinder)
 
@@ -123,6 +178,70 @@ class MCSFinderTest(unittest.TestCase):
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
 
+  def test_straddle_parallel(self):
+    self.straddle(MockParallelMCSFinder)
+
+  def test_parallel_uses_distinct_slots(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    dag = EventDag(trace)
+    mcs_finder = MockParallelMCSFinder(dag, [trace[0], trace[5]])
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertTrue(set(mcs_finder.replayed_slots) <= set(range(3)))
+
+  def test_rewritten_migrations_are_shipped(self):
+    migration = HostMigration(1, 1, 2, 1, host_id=1, label="e2")
+    trace = [ MockInputEvent(fingerprint=("class",1), label="e1"), migration,
+              InvariantViolation(["violation"], persistent=True, label="e3") ]
+    mcs_finder = MockMCSFinder(EventDag(trace), [])
+    self.assertEqual(["e1", "e2", "e3"], mcs_finder._event_tokens(EventDag(trace)))
+    rewritten = list(trace)
+    new_migration = replace_migration(migration, (1, 1), (3, 1), rewritten)
+    tokens = mcs_finder._event_tokens(EventDag(rewritten))
+    self.assertEqual(["e1", "e3"], [tokens[0], tokens[2]])
+    self.assertNotEqual("e2", tokens[1])
+    # Children see the rewritten migration, not the original one
+    self.assertTrue(mcs_finder._token2event[tokens[1]] is new_migration)
+    self.assertTrue(mcs_finder._token2event["e2"] is migration)
+    self.assertEqual(tokens, mcs_finder._event_tokens(EventDag(rewritten)))
+
+  def test_parallel_counts_used_replays(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    mcs_finders = []
+    for mcs_finder_type in [MockMCSFinder, MockParallelMCSFinder]:
+      mcs_finder = mcs_finder_type(EventDag(trace), [trace[0]])
+      try:
+        os.makedirs(mcs_results_path)
+        mcs_finder.init_results(mcs_results_path)
+        mcs_finder.simulate()
+      finally:
+        shutil.rmtree(mcs_results_path)
+      mcs_finders.append(mcs_finder)
+    (sequential, parallel) = mcs_finders
+    # Speculative replays past the violating subset are discarded, and not
+    # counted
+    self.assertTrue(parallel._runtime_stats.total_replays <
+                    len(parallel.replayed_slots))
+    self.assertEqual(sequential.replay_count,
+                     parallel.replay_count + parallel._runtime_stats.total_replays)
+
+  def test_default_forker_pool(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,3) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    sequential = MockMCSFinder(EventDag(trace), [])
+    parallel = MockMCSFinder(EventDag(trace), [], max_parallel_replays=3)
+    self.assertTrue(sequential.forker is not parallel.forker)
+    self.assertEqual(1, sequential.forker.pool_size)
+    self.assertEqual(3, parallel.forker.pool_size)
+    self.assertEqual(list(MCSFinder.preload_modules),
+                     parallel.forker.preload_modules)
+
   def test_all(self):
     self.all(MockMCSFinder)
 
@@ -143,5 +262,73 @@ class MCSFinderTest(unittest.TestCase):
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
 
+  def test_partitioners(self):
+    for partitioner in ["switch", "host", "adaptive"]:
+      self.partitioned(MockMCSFinder, partitioner)
+      self.partitioned(MockEfficientMCSFinder, partitioner)
+
+  def partitioned(self, mcs_finder_type, partitioner):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+    for i, e in enumerate(trace):
+      (e.dpid, e.host_id) = (i % 3, i / 3)
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    dag = EventDag(trace)
+    mcs = [trace[0],trace[3],trace[6]]
+    mcs_finder = mcs_finder_type(dag, mcs, partitioner=partitioner)
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(mcs, mcs_finder.dag.input_events)
+
+  def test_resume(self):
+    self.resume(MockInterruptibleMCSFinder)
+
+  def test_resume_efficient(self):
+    self.resume(MockInterruptibleEfficientMCSFinder)
+
+  def resume(self, mcs_finder_type):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,9) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    dag = EventDag(trace)
+    mcs = [trace[1],trace[6]]
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder = mcs_finder_type(dag, mcs)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+      total_replays = mcs_finder.replays
+    finally:
+      shutil.rmtree(mcs_results_path)
+
+    # Interrupt the search after every possible number of replays
+    for max_replays in range(1, total_replays):
+      try:
+        os.makedirs(mcs_results_path)
+        mcs_finder = mcs_finder_type(dag, mcs, max_replays=max_replays)
+        mcs_finder.init_results(mcs_results_path)
+        self.assertRaises(Interrupted, mcs_finder.simulate)
+        mcs_finder = mcs_finder_type(dag, mcs, resume=True)
+        mcs_finder.init_results(mcs_results_path)
+        mcs_finder.simulate()
+      finally:
+        shutil.rmtree(mcs_results_path)
+      self.assertEqual(mcs, mcs_finder.dag.input_events)
+      # No replay is repeated after resuming
+      self.assertEqual(total_replays - max_replays, mcs_finder.replays)
+
+  def test_resume_without_checkpoint(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,3) ]
+    trace.append(InvariantViolation(["violation"], persistent=True))
+    dag = EventDag(trace)
+    mcs_finder = MockMCSFinder(dag, [trace[0]], resume=True)
+    try:
+      os.makedirs(mcs_results_path)
+      self.assertRaises(ValueError, mcs_finder.init_results, mcs_results_path)
+    finally:
+      shutil.rmtree(mcs_results_path)
+
 if __name__ == '__main__':
   unittest.main()
@@ -82,6 +82,27 @@ class PendingQueueTest(unittest.TestCase):
     self.assertEquals([self.pending_receipt2],
             q.get_message_ids(1, "c2"))
 
+  def test_iteration_snapshot(self):
+    q = PendingQueue()
+    q.insert(self.pending_receipt, self.conn_message)
+    q.insert(self.pending_receipt, self.conn_message2)
+    q.insert(self.pending_receipt1a, self.conn_message2)
+    self.assertEquals(self.conn_message, q.peek_by_message_id(self.pending_receipt))
+    # Each message id once, in order; popping while iterating is fine
+    popped = []
+    for message_id in q:
+      popped.append(message_id)
+      q.pop_by_message_id(message_id)
+    self.assertEquals([self.pending_receipt, self.pending_receipt1a], popped)
+    self.assertEquals(1, len(q))
+    self.assertEquals([self.pending_receipt], list(q))
+    q.pop_by_message_id(self.pending_receipt)
+    self.assertEquals([], list(q))
+    self.assertEquals([], q.conn_ids())
+    self.assertEquals([], q.get_message_ids(1, "c1"))
+    self.assertFalse(q.has_message_id(self.pending_receipt))
+    self.assertRaises(ValueError, q.pop_by_message_id, self.pending_receipt)
+
 class OpenFlowBufferTest(unittest.TestCase):
   def test_receive(self):
     buf = OpenFlowBuffer()
@@ -108,3 +129,35 @@ class OpenFlowBufferTest(unittest.TestCase):
     buf.schedule(pending_send)
     self.assertTrue(mock_conn.passed_message)
     self.assertFalse(buf.message_receipt_waiting(pending_send))
+
+  def test_arrival_notification(self):
+    buf = OpenFlowBuffer()
+    message = ofp_flow_mod(match=ofp_match(in_port=1, nw_src="1.1.1.1"),
+                           action=ofp_action_output(port=1))
+    pending_receipt = PendingReceive(1,"c1",OFFingerprint.from_pkt(message))
+    arrived = []
+    buf.notify_on_arrival(pending_receipt, arrived.append)
+    cancelled = lambda message_id: self.fail("Cancelled callback invoked")
+    buf.notify_on_arrival(pending_receipt, cancelled)
+    buf.cancel_arrival_notification(pending_receipt, cancelled)
+    # Other connections don't trigger it
+    buf.insert_pending_receipt(1,"c2",message,MockConnection())
+    self.assertEquals([], arrived)
+    buf.insert_pending_receipt(1,"c1",message,MockConnection())
+    self.assertEquals([pending_receipt], arrived)
+    # Only invoked once
+    buf.insert_pending_receipt(1,"c1",message,MockConnection())
+    self.assertEquals([pending_receipt], arrived)
+
+  def test_schedule_many(self):
+    buf = OpenFlowBuffer()
+    message = ofp_flow_mod(match=ofp_match(in_port=1, nw_src="1.1.1.1"),
+                           action=ofp_action_output(port=1))
+    conns = [MockConnection(), MockConnection(is_send=True)]
+    pending_receipt = buf.insert_pending_receipt(1,"c1",message,conns[0])
+    pending_send = buf.insert_pending_send(1,"c1",message,conns[1])
+    self.assertEquals([message, message],
+                      buf.schedule_many([pending_receipt, pending_send]))
+    self.assertTrue(conns[0].passed_message)
+    self.assertTrue(conns[1].passed_message)
+    self.assertEquals(0, len(buf.pending_receives) + len(buf.pending_sends))
@@ -0,0 +1,139 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy_reg
+import logging
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.libopenflow_01 import ofp_action_output
+from pox.openflow.libopenflow_01 import ofp_flow_mod
+from pox.openflow.libopenflow_01 import ofp_match
+
+import sts.simulation_state
+from sts.simulation_state import SimulationConfig
+from sts.simulation_state import clone_topology
+from sts.topology.sts_topology import MeshTopology
+
+constructed = []
+
+class TemplateTopology(object):
+  def __init__(self, num_links=2, create_io_worker=None):
+    constructed.append(self)
+    self.create_io_worker = create_io_worker
+    self.log = logging.getLogger("template_topology")
+    self.cut_links = set()
+    self.links = range(num_links)
+
+class EagerTopology(TemplateTopology):
+  def __init__(self, create_io_worker=None):
+    TemplateTopology.__init__(self, create_io_worker=create_io_worker)
+    self.io_worker = create_io_worker("socket")
+
+class BrokenTopology(TemplateTopology):
+  def __init__(self, create_io_worker=None):
+    TemplateTopology.__init__(self, create_io_worker=create_io_worker)
+    raise RuntimeError("broken")
+
+# bootstrap() resolves topology classes by name in sts.simulation_state
+sts.simulation_state.TemplateTopology = TemplateTopology
+sts.simulation_state.EagerTopology = EagerTopology
+sts.simulation_state.BrokenTopology = BrokenTopology
+
+class SimulationConfigTest(unittest.TestCase):
+  def setUp(self):
+    del constructed[:]
+
+  def test_reuse_topology(self):
+    cfg = SimulationConfig(topology_class=TemplateTopology,
+                           topology_params="num_links=3",
+                           snapshot_service=object())
+    topology1 = cfg._instantiate_topology(lambda s: ("io1", s))
+    topology1.cut_links.add(1)
+    topology2 = cfg._instantiate_topology(lambda s: ("io2", s))
+    # Only the template ran the constructor
+    self.assertEqual(1, len(constructed))
+    self.assertTrue(topology1 is not topology2)
+    self.assertEqual(set(), topology2.cut_links)
+    self.assertEqual([0, 1, 2], topology2.links)
+    self.assertTrue(topology1.log is topology2.log)
+    self.assertEqual(("io1", "s"), topology1.create_io_worker("s"))
+    self.assertEqual(("io2", "s"), topology2.create_io_worker("s"))
+
+  def test_no_reuse(self):
+    cfg = SimulationConfig(topology_class=TemplateTopology,
+                           snapshot_service=object(), reuse_topology=False)
+    topology1 = cfg._instantiate_topology(None)
+    topology2 = cfg._instantiate_topology(None)
+    self.assertEqual([topology1, topology2], constructed)
+
+  def test_constructor_needs_io_workers(self):
+    cfg = SimulationConfig(topology_class=EagerTopology,
+                           snapshot_service=object())
+    topology1 = cfg._instantiate_topology(lambda s: "io1")
+    topology2 = cfg._instantiate_topology(lambda s: "io2")
+    self.assertEqual("io1", topology1.io_worker)
+    self.assertEqual("io2", topology2.io_worker)
+    self.assertFalse(cfg._topology_template)
+
+  def test_constructor_error(self):
+    cfg = SimulationConfig(topology_class=BrokenTopology,
+                           snapshot_service=object())
+    self.assertRaises(RuntimeError, cfg._instantiate_topology,
+                      lambda s: "io1")
+    self.assertEqual(1, len(constructed))
+
+  def test_loggers_still_pickle(self):
+    cfg = SimulationConfig(topology_class=TemplateTopology,
+                           snapshot_service=object())
+    cfg._instantiate_topology(None)
+    cfg._instantiate_topology(None)
+    self.assertFalse(logging.Logger in copy_reg.dispatch_table)
+
+class CloneTopologyTest(unittest.TestCase):
+  def test_clone_mesh_topology(self):
+    template = MeshTopology(None, 2)
+    link = iter(template.patch_panel.network_links).next()
+    template.sever_network_link(link)
+    clone = clone_topology(template)
+    # Flow tables
+    flow_mod = ofp_flow_mod(match=ofp_match(in_port=1, nw_src="1.1.1.1"),
+                            action=ofp_action_output(port=2))
+    for switch in clone.switches_manager.switches:
+      self.assertTrue(switch.flow_table_index.table is switch.table)
+      switch.table.process_flow_mod(flow_mod)
+      self.assertEqual(1, len(switch.table.entries))
+    for switch in template.switches_manager.switches:
+      self.assertEqual(0, len(switch.table.entries))
+    # Cut links
+    self.assertEqual(set([link]), set(clone.patch_panel.cut_network_links))
+    self.assertFalse(link in clone.patch_panel.live_network_links)
+    clone.repair_network_link(link)
+    self.assertTrue(link in clone.patch_panel.live_network_links)
+    self.assertEqual(set([link]), set(template.patch_panel.cut_network_links))
+    # Trackers
+    self.assertTrue(clone.partition_tracker is not template.partition_tracker)
+    self.assertTrue(clone.partition_tracker.patch_panel is clone.patch_panel)
+    self.assertEqual(set(), clone.partition_tracker._cut_links)
+    self.assertEqual(set([link]), template.partition_tracker._cut_links)
+    self.assertTrue(clone.communication_tracker is not
+                    template.communication_tracker)
+    # Loggers are shared
+    self.assertTrue(clone.log is template.log)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -27,6 +27,7 @@ sys.path.append(os.path.dirname(__file__) + "/../../..")
 
 class MultiplexerTest(unittest.TestCase):
   client_messages = [ "foo", "bar", "baz" ]
+  binary_framing = False
 
   def setup_server(self, address):
     import socket
@@ -46,7 +47,8 @@ class MultiplexerTest(unittest.TestCase):
       socket = connect_socket_with_backoff(address=address)
       io_worker = io_master.create_worker_for_socket(socket)
       # TODO(cs): unused variable demux
-      demux = STSSocketDemultiplexer(io_worker, address)
+      demux = STSSocketDemultiplexer(io_worker, address,
+                                     binary_framing=self.binary_framing)
       mock_socks = []
       for i in xrange(num_socks):
         mock_socket = STSMockSocket(None, None)
@@ -128,3 +130,37 @@ class MultiplexerTest(unittest.TestCase):
         if os.path.exists(address):
           raise RuntimeError("can't remove PIPE socket %s" % str(address))
 
+
+class BinaryFramingMultiplexerTest(MultiplexerTest):
+  binary_framing = True
+
+class BinaryFrameIOWorkerTest(unittest.TestCase):
+  def test_frames(self):
+    from pox.lib.ioworker.io_worker import IOWorker
+    received = []
+    sender = BinaryFrameIOWorker(IOWorker())
+    receiver = BinaryFrameIOWorker(IOWorker(),
+                   on_json_received=lambda worker, h: received.append(h))
+    sender.send({'id' : -2, 'type' : 'SYN', 'address' : ["127.0.0.1", 6633]})
+    sender.send({'id' : -2, 'type' : 'data', 'data' : "\x00{foo\n"})
+    wire = sender.io_worker.send_buf
+    # Partial frames wait for the rest
+    receiver.io_worker._push_receive_data(wire[:5])
+    self.assertEqual([], received)
+    receiver.io_worker._push_receive_data(wire[5:-1])
+    self.assertEqual(1, len(received))
+    receiver.io_worker._push_receive_data(wire[-1:])
+    self.assertEqual([{'id' : -2, 'type' : 'SYN', 'address' : ["127.0.0.1", 6633]},
+                      {'id' : -2, 'type' : 'data', 'data' : "\x00{foo\n"}],
+                     received)
+    self.assertEqual("", receiver.io_worker.peek_receive_buf())
+
+class MockSocketTest(unittest.TestCase):
+  def test_recv_bufsize(self):
+    sock = MockSocket(None, None)
+    sock.append_read("foobar")
+    sock.append_read("baz")
+    self.assertEqual("foo", sock.recv(3))
+    self.assertEqual("bar", sock.recv(2048))
+    self.assertEqual("baz", sock.recv(2048))
+    self.assertFalse(sock.ready_to_read())
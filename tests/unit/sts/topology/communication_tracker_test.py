@@ -0,0 +1,64 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+from collections import namedtuple
+
+from sts.topology.communication_tracker import CommunicationTracker
+
+
+Interface = namedtuple('Interface', ['hw_addr'])
+AccessLink = namedtuple('AccessLink', ['interface'])
+
+
+class MockPatchPanel(object):
+  def __init__(self, access_links):
+    self.access_links = access_links
+
+
+class CommunicationTrackerTest(unittest.TestCase):
+  def setUp(self):
+    self.now = 0
+    self.links = [AccessLink(Interface(addr)) for addr in ["a", "b", "c"]]
+    self.tracker = CommunicationTracker(MockPatchPanel(self.links[:2]),
+                                        pair_timeout=3,
+                                        clock=lambda: self.now)
+
+  def test_expiry(self):
+    self.tracker.register("a", "b")
+    self.tracker.register("b", "a")
+    self.now = 2
+    self.tracker.register("a", "b")
+    self.assertEqual(set([("a", "b"), ("b", "a")]), self.tracker.recent_pairs)
+    self.now = 3
+    self.assertEqual(set([("a", "b")]), self.tracker.recent_pairs)
+    # Refreshed pairs keep a single heap entry
+    self.assertEqual(1, len(self.tracker._expiry))
+    self.now = 5
+    self.assertEqual(set(), self.tracker.recent_pairs)
+    self.assertEqual([], self.tracker._expiry)
+    self.assertRaises(RuntimeError, self.tracker.register, None, "a")
+
+  def test_access_links(self):
+    (a, b, c) = self.links
+    self.tracker.register("a", "b")
+    self.tracker.register("a", "c")
+    self.assertEqual(set([(a, b)]), self.tracker.communicated_link_pairs())
+    self.tracker.add_access_link(c)
+    self.assertEqual(set([(a, b), (a, c)]),
+                     self.tracker.communicated_link_pairs())
+    self.tracker.remove_access_link(b)
+    self.assertEqual(None, self.tracker.get_access_link("b"))
+    self.assertEqual(set([(a, c)]), self.tracker.communicated_link_pairs())
@@ -105,3 +105,19 @@ class BufferedPanelTest(unittest.TestCase):
                     "should have cleared buffer")
     self.assertFalse(self.switch2.has_forwarded,
                      "should not have forwarded")
+
+  def test_permit_drop_many(self):
+    other_event = DpPacketOut(self.switch1, self.icmp_packet, self.port)
+    third_event = DpPacketOut(self.switch1, self.icmp_packet, self.port)
+    for event in [self.dp_out_event, other_event, third_event]:
+      self.switch1.raiseEvent(event)
+    self.assertEqual(3, len(self.m.queued_dataplane_events))
+    self.assertEqual([other_event], self.m.drop_many([other_event]))
+    self.assertEqual([self.dp_out_event, third_event],
+                     self.m.queued_dataplane_events)
+    self.assertFalse(self.switch2.has_forwarded,
+                     "should not have forwarded")
+    self.m.permit_many([third_event, self.dp_out_event])
+    self.assertEqual([], self.m.queued_dataplane_events)
+    self.assertTrue(self.switch2.has_forwarded,
+                    "should have forwarded")
@@ -241,6 +241,22 @@ class GraphTest(unittest.TestCase):
     self.assertItemsEqual([e2, e3], v3_dst)
     self.assertEquals(v4_dst, [])
 
+  def test_remove_vertex_reverse_edges(self):
+    # Arrange
+    g = Graph()
+    e1 = g.add_edge(1, 1)
+    e2 = g.add_edge(1, 2)
+    e3 = g.add_edge(3, 1)
+    e4 = g.add_edge(3, 2)
+    # Act
+    g.remove_vertex(1)
+    # Assert
+    self.assertItemsEqual([e4], g.edges_dst(2))
+    self.assertItemsEqual([e4], g.edges_src(3))
+    self.assertEquals([(3, 2, {})], g.edges)
+    for edge in [e1, e2, e3]:
+      self.assertFalse(g.has_edge(*edge))
+
 
 class TopologyGraphTest(unittest.TestCase):
 
@@ -450,3 +466,34 @@ class TopologyGraphTest(unittest.TestCase):
     self.assertIsNone(graph.get_link("s1-1", "s2-1"))
     self.assertIsNone(graph.get_link("s1-2", "s2-2"))
     self.assertRaises(AssertionError, fail_remove)
+
+  def test_remove_switch_with_links(self):
+    # Arrange
+    s1 = mock.Mock()
+    s1.name = "s1"
+    s1.ports = {1: mock.Mock()}
+    s1.ports[1].port_no = 1
+    s1.ports[1].name = 's1-1'
+    s2 = mock.Mock()
+    s2.name = "s2"
+    s2.ports = {1: mock.Mock()}
+    s2.ports[1].port_no = 1
+    s2.ports[1].name = 's2-1'
+    l1 = mock.Mock()
+    l1.start_node = s1
+    l1.start_port = s1.ports[1]
+    l1.end_node = s2
+    l1.end_port = s2.ports[1]
+    graph = TopologyGraph()
+    graph.add_switch(s1)
+    graph.add_switch(s2)
+    graph.add_link(l1)
+    links_before = graph.get_switch_links(s2)
+    # Act
+    graph.remove_switch(s1)
+    # Assert
+    self.assertEquals([l1], links_before)
+    self.assertEquals([], graph.get_switch_links(s2))
+    self.assertEquals(['s2'], list(graph.switches_iter()))
+    self.assertEquals(['s2-1'], list(graph.ports_iter()))
+    self.assertEquals([], graph.links)
@@ -0,0 +1,88 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+from collections import namedtuple
+
+from sts.topology.partition_tracker import PartitionTracker
+
+
+Link = namedtuple('Link', ['start_node', 'end_node'])
+BidirLink = namedtuple('BidirLink', ['node1', 'node2'])
+AccessLink = namedtuple('AccessLink', ['switch'])
+
+
+class MockSwitchesManager(object):
+  def __init__(self, switches):
+    self.switches = set(switches)
+    self.failed_switches = set()
+
+
+class MockPatchPanel(object):
+  def __init__(self, network_links):
+    self.network_links = list(network_links)
+    self.cut_network_links = set()
+
+
+class PartitionTrackerTest(unittest.TestCase):
+  def setUp(self):
+    # A chain of switches 1 - 2 - 3, and an isolated switch 4
+    self.links = {}
+    for (s1, s2) in [(1, 2), (2, 3)]:
+      self.links[(s1, s2)] = Link(s1, s2)
+      self.links[(s2, s1)] = Link(s2, s1)
+    self.switches_manager = MockSwitchesManager([1, 2, 3, 4])
+    self.patch_panel = MockPatchPanel(self.links.values())
+    self.tracker = PartitionTracker(self.switches_manager, self.patch_panel)
+    self.access_links = [AccessLink(s) for s in [1, 3, 4]]
+
+  def partitioned_switches(self):
+    return set((l1.switch, l2.switch) for (l1, l2) in
+               self.tracker.partitioned_link_pairs(self.access_links))
+
+  def test_components(self):
+    self.assertFalse(self.tracker.is_partitioned(1, 3))
+    self.assertTrue(self.tracker.is_partitioned(1, 4))
+    self.assertFalse(self.tracker.is_partitioned(4, 4))
+    self.assertEqual(set([(1, 4), (4, 1), (3, 4), (4, 3)]),
+                     self.partitioned_switches())
+    link = BidirLink(3, 4)
+    self.tracker.add_link(link)
+    self.assertEqual(set(), self.partitioned_switches())
+    self.tracker.remove_link(link)
+    self.assertTrue(self.tracker.is_partitioned(3, 4))
+
+  def test_crash_and_recover(self):
+    self.switches_manager.failed_switches.add(2)
+    self.assertTrue(self.tracker.is_partitioned(1, 3))
+    self.assertEqual(set([(1, 3), (3, 1), (1, 4), (4, 1), (3, 4), (4, 3)]),
+                     self.partitioned_switches())
+    self.switches_manager.failed_switches.remove(2)
+    self.assertFalse(self.tracker.is_partitioned(1, 3))
+
+  def test_one_way_links(self):
+    self.patch_panel.cut_network_links.add(self.links[(2, 3)])
+    self.assertTrue(self.tracker.is_partitioned(1, 3))
+    self.assertFalse(self.tracker.is_partitioned(3, 1))
+    self.assertTrue((1, 3) in self.partitioned_switches())
+    self.assertFalse((3, 1) in self.partitioned_switches())
+    self.tracker.repair_link(self.links[(2, 3)])
+    self.patch_panel.cut_network_links.clear()
+    self.assertEqual(set([(1, 4), (4, 1), (3, 4), (4, 3)]),
+                     self.partitioned_switches())
+    # Crashes don't mark the links as cut
+    self.tracker.crash_switch(2)
+    self.tracker.recover_switch(2)
+    self.assertFalse(self.tracker.is_partitioned(1, 3))
@@ -13,9 +13,11 @@
 # limitations under the License.
 
 
+import copy
 import mock
 import unittest
 
+from sts.topology.patch_panel import LinkStateSet
 from sts.topology.patch_panel import PatchPanelBK
 from sts.topology.patch_panel import PatchPanelCapabilities
 
@@ -241,6 +243,105 @@ class PatchPanelTest(unittest.TestCase):
     self.assertItemsEqual([link1, link2], set9)
     self.assertItemsEqual([link3, link4], set10)
 
+  def test_link_indexes(self):
+    # Arrange
+    patch_panel = TestPatchPanel()
+    switch1, switch2 = mock.Mock(name='s1'), mock.Mock(name='s2')
+    port1, port2 = mock.Mock(name='p1'), mock.Mock(name='p2')
+    port3, port4 = mock.Mock(name='p3'), mock.Mock(name='p4')
+    switch1.ports = {1: port1, 2: port3}
+    switch2.ports = {1: port2, 2: port4}
+
+    link1 = mock.Mock(name='link1')
+    link1.start_node = switch1
+    link1.start_port = port1
+    link1.end_node = switch2
+    link1.end_port = port2
+
+    link2 = mock.Mock(name='link2')
+    link2.node1 = switch1
+    link2.port1 = port3
+    link2.node2 = switch2
+    link2.port2 = port4
+
+    patch_panel.is_network_link = lambda x: x in [link1, link2]
+    patch_panel.is_bidir_network_link = lambda x: x == link2
+    patch_panel.add_network_link(link1)
+    patch_panel.add_network_link(link2)
+    # Act
+    live1 = patch_panel.live_network_links
+    patch_panel.sever_network_link(link1)
+    live2 = patch_panel.live_network_links
+    query1 = patch_panel.query_network_links(switch2, None, switch1, None)
+    patch_panel.cut_network_links.clear()
+    live3 = patch_panel.live_network_links
+    patch_panel.remove_network_link(link2)
+    query2 = patch_panel.query_network_links(switch1, None, switch2, None)
+    # Assert
+    self.assertItemsEqual([link1, link2], live1)
+    self.assertItemsEqual([link2], live2)
+    self.assertItemsEqual([link2], query1)
+    self.assertItemsEqual([link1, link2], live3)
+    self.assertItemsEqual([link1], query2)
+    self.assertItemsEqual([link1], patch_panel.network_links)
+    self.assertItemsEqual([link1], patch_panel.live_network_links)
+    self.assertTrue(patch_panel.has_network_link(link1))
+    self.assertFalse(patch_panel.has_network_link(link2))
+    self.assertItemsEqual([link1], patch_panel.switch_network_links(switch2))
+    self.assertIs(patch_panel.network_links, patch_panel.network_links)
+
+  def test_add_network_links(self):
+    # Arrange
+    patch_panel = TestPatchPanel()
+    switch1, switch2 = mock.Mock(name='s1'), mock.Mock(name='s2')
+    port1, port2 = mock.Mock(name='p1'), mock.Mock(name='p2')
+    port3 = mock.Mock(name='p3')
+    links = []
+    for start_port, end_port in [(port1, port2), (port2, port1),
+                                 (port1, port3)]:
+      link = mock.Mock(name='link')
+      link.start_node = switch1
+      link.start_port = start_port
+      link.end_node = switch2
+      link.end_port = end_port
+      links.append(link)
+    patch_panel.is_network_link = lambda x: x in links
+    patch_panel.is_bidir_network_link = lambda x: False
+    patch_panel.add_network_link(links[1])
+    before = patch_panel.network_links
+    # Act
+    patch_panel.add_network_links([links[0], links[2]])
+    # Assert
+    self.assertItemsEqual([links[1]], before)
+    # links[2] took over links[0]'s only port
+    self.assertItemsEqual([links[1], links[2]], patch_panel.network_links)
+    self.assertItemsEqual([links[1], links[2]], patch_panel.live_network_links)
+    self.assertItemsEqual([links[1], links[2]],
+                          patch_panel.query_network_links(switch1, None,
+                                                          switch2, None))
+    self.assertFalse(patch_panel.has_network_link(links[0]))
+
+  def test_link_state_set_deepcopy(self):
+    # Arrange
+    class Owner(object):
+      def __init__(self):
+        self.changes = []
+        self.cut = LinkStateSet(self.on_change, [1, 2])
+
+      def on_change(self, link, cut):
+        self.changes.append((link, cut))
+    owner = Owner()
+    # Act
+    clone = copy.deepcopy(owner)
+    clone.cut.add(3)
+    clone.cut.remove(1)
+    # Assert
+    self.assertItemsEqual([1, 2], copy.deepcopy(owner.cut))
+    self.assertItemsEqual([1, 2], owner.cut)
+    self.assertEqual([], owner.changes)
+    self.assertItemsEqual([2, 3], clone.cut)
+    self.assertEqual([(3, True), (1, False)], clone.changes)
+
   def test_is_port_connected(self):
     # Arrange
     patch_panel = TestPatchPanel()
@@ -0,0 +1,88 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import select
+import socket
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.io_master import *
+
+class IOMasterTest(unittest.TestCase):
+  io_master_class = IOMaster
+
+  def setUp(self):
+    self.io_master = self.io_master_class()
+    (self.ours, self.theirs) = socket.socketpair()
+    self.worker = self.io_master.create_worker_for_socket(self.ours)
+
+  def tearDown(self):
+    self.io_master.close_all()
+    self.theirs.close()
+
+  def test_receive(self):
+    self.theirs.send("hello")
+    deadline = time.time() + 1
+    while self.worker.peek_receive_buf() != "hello" and time.time() < deadline:
+      self.io_master.select(deadline - time.time())
+    self.assertEqual("hello", self.worker.peek_receive_buf())
+
+  def test_send(self):
+    self.worker.send("hello")
+    self.io_master.select(0)
+    self.assertEqual("hello", self.theirs.recv(100))
+    self.assertFalse(self.worker._ready_to_send)
+    # Nothing left to send or receive
+    start = time.time()
+    self.io_master.select(0.1)
+    self.assertTrue(time.time() - start >= 0.09)
+
+  def test_wake(self):
+    self.io_master.wake()
+    start = time.time()
+    self.io_master.select(5)
+    self.assertTrue(time.time() - start < 1)
+
+  def test_close(self):
+    self.theirs.close()
+    self.io_master.select(1)
+    self.assertTrue(self.worker.closed)
+    self.assertEqual(set(), self.io_master._workers)
+
+@unittest.skipUnless(hasattr(select, "epoll"), "epoll is not available")
+class EpollIOMasterTest(IOMasterTest):
+  io_master_class = EpollIOMaster
+
+  def test_write_interest(self):
+    self.worker.send("hello")
+    self.assertTrue(self.worker in self.io_master._writers)
+    self.io_master.select(0)
+    self.assertEqual(set(), self.io_master._writers)
+    self.assertEqual("hello", self.theirs.recv(100))
+
+  def test_deschedule(self):
+    self.io_master.deschedule_worker(self.worker)
+    self.theirs.send("hello")
+    self.io_master.select(0.05)
+    self.assertEqual("", self.worker.peek_receive_buf())
+    self.io_master.reschedule_worker(self.worker)
+    self.io_master.select(0.05)
+    self.assertEqual("hello", self.worker.peek_receive_buf())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -16,6 +16,8 @@
 import unittest
 import sys
 import os.path
+import tempfile
+import shutil
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
@@ -56,3 +58,86 @@ class precompute_cache_test(unittest.TestCase):
     self.assertTrue(p.already_done( (4,)))
     self.assertFalse(p.already_done( (1,2,3,4)))
 
+class replay_outcome_cache_test(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "replay_outcomes")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_persistent(self):
+    c = ReplayOutcomeCache(self.path, "hash", invariant_check_name="check")
+    self.assertEqual(None, c.lookup(("e1", "e2")))
+    c.record(("e1", "e2"), True, 2, ["i3"])
+    c.record(("e1",), False, 0, [])
+    self.assertEqual((True, 2, ["i3"]), c.lookup(("e1", "e2")))
+    # A new run on the same superlog sees the previous run's outcomes
+    c = ReplayOutcomeCache(self.path, "hash", invariant_check_name="check")
+    self.assertEqual((True, 2, ["i3"]), c.lookup(("e1", "e2")))
+    self.assertEqual((False, 0, []), c.lookup(("e1",)))
+    self.assertEqual(None, c.lookup(("e2", "e1")))
+    self.assertEqual(2, c.hits)
+
+  def test_parameters_are_part_of_key(self):
+    c = ReplayOutcomeCache(self.path, "hash", invariant_check_name="check")
+    c.record(("e1",), True, 0, [])
+    self.assertEqual(None, ReplayOutcomeCache(self.path, "other_hash",
+                             invariant_check_name="check").lookup(("e1",)))
+    self.assertEqual(None, ReplayOutcomeCache(self.path, "hash",
+                             invariant_check_name="other").lookup(("e1",)))
+
+  def test_truncated_line(self):
+    c = ReplayOutcomeCache(self.path, "hash")
+    c.record(("e1",), True, 0, [])
+    with open(self.path, "a") as f:
+      f.write('{"key": "tru')
+    c = ReplayOutcomeCache(self.path, "hash")
+    self.assertEqual((True, 0, []), c.lookup(("e1",)))
+    # Records appended after the truncated line survive reloading
+    c.record(("e2",), False, 1, ["i1"])
+    c = ReplayOutcomeCache(self.path, "hash")
+    self.assertEqual((True, 0, []), c.lookup(("e1",)))
+    self.assertEqual((False, 1, ["i1"]), c.lookup(("e2",)))
+
+class persistent_prefix_trie_test(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "prefix_trie")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_in_memory(self):
+    t = PersistentPrefixTrie()
+    self.assertEqual((0, []), t.longest_prefix("ns", ["e1", "e2"]))
+    t.insert("ns", [], "e1", ["e1", "i1"])
+    t.insert("ns", ["e1"], "e2", ["e2"])
+    self.assertEqual((2, ["e1", "i1", "e2"]), t.longest_prefix("ns", ["e1", "e2", "e3"]))
+    self.assertEqual((1, ["e1", "i1"]), t.longest_prefix("ns", ["e1", "e3"]))
+    self.assertEqual((0, []), t.longest_prefix("other", ["e1", "e2"]))
+
+  def test_shared_between_instances(self):
+    writer = PersistentPrefixTrie(self.path)
+    reader = PersistentPrefixTrie(self.path)
+    writer.insert("ns", [], "e1", ["e1"])
+    self.assertEqual((1, ["e1"]), reader.longest_prefix("ns", ["e1", "e2"]))
+    # Both insert the same prefix concurrently
+    writer.insert("ns", ["e1"], "e2", ["e2", "i2"])
+    reader.insert("ns", ["e1"], "e2", ["e2", "i2"])
+    reader.insert("ns", ["e1", "e2"], "e3", ["e3"])
+    self.assertEqual((3, ["e1", "e2", "i2", "e3"]),
+                     writer.longest_prefix("ns", ["e1", "e2", "e3"]))
+    # A later run
+    self.assertEqual((3, ["e1", "e2", "i2", "e3"]),
+                     PersistentPrefixTrie(self.path).longest_prefix("ns", ["e1", "e2", "e3"]))
+
+  def test_truncated_line(self):
+    t = PersistentPrefixTrie(self.path)
+    t.insert("ns", [], "e1", ["e1"])
+    with open(self.path, "a") as f:
+      f.write('["tru')
+    reader = PersistentPrefixTrie(self.path)
+    self.assertEqual((1, ["e1"]), reader.longest_prefix("ns", ["e1", "e2"]))
+    t.insert("ns", ["e1"], "e2", ["e2"])
+    self.assertEqual((2, ["e1", "e2"]), reader.longest_prefix("ns", ["e1", "e2"]))
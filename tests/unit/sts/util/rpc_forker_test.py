@@ -0,0 +1,133 @@
+# Copyright 2011-2013 Colin Scott
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import signal
+import time
+import Queue
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.rpc_forker import *
+
+def add(a, b):
+  return a + b
+
+def pid():
+  return os.getpid()
+
+def fail():
+  raise ValueError("boom")
+
+class LocalForkerTest(unittest.TestCase):
+  def setUp(self):
+    self.forker = LocalForker()
+
+  def tearDown(self):
+    self.forker.close_pool()
+
+  def test_fork(self):
+    self.forker.register_task("add", add)
+    self.assertEqual([1, "2", None, {"a" : 2.5}],
+                     self.forker.fork("add", [1, "2"], [None, {"a" : 2.5}]))
+    self.assertEqual(3, self.forker.fork("add", 1, 2))
+    # The child sees our state as of the fork
+    state = []
+    self.forker.register_task("state", lambda: len(state))
+    state.append(1)
+    self.assertEqual(1, self.forker.fork("state"))
+
+  def test_unregistered(self):
+    self.assertRaises(ValueError, self.forker.fork, "nonexistent")
+
+  def test_exceptions(self):
+    self.forker.register_task("fail", fail)
+    self.forker.register_task("exit", sys.exit)
+    self.forker.register_task("unmarshallable", lambda: object())
+    for task_name in ["fail", "exit", "unmarshallable"]:
+      self.assertRaises(ReplayException, self.forker.fork, task_name)
+    self.assertEqual(set(), LocalForker._active_pids)
+
+  def test_fork_async(self):
+    self.forker.register_task("add", add)
+    self.forker.register_task("sleep", lambda: time.sleep(60))
+    done_queue = Queue.Queue()
+    sleeper = self.forker.fork_async("sleep", done_queue=done_queue)
+    handles = [ self.forker.fork_async("add", (i, 1), done_queue=done_queue)
+                for i in range(3) ]
+    self.assertEqual(set(handles), set([ done_queue.get() for _ in handles ]))
+    self.assertEqual([1, 2, 3], [ h.wait() for h in handles ])
+    self.assertFalse(sleeper.done())
+    sleeper.cancel()
+    self.assertTrue(sleeper.cancelled)
+    self.assertRaises(ReplayException, sleeper.wait)
+    self.assertEqual(sleeper, done_queue.get())
+
+  def test_pool(self):
+    self.forker = LocalForker(pool_size=2)
+    self.forker.register_task("pid", pid)
+    self.forker.fill_pool()
+    idle_pids = [ w.pid for w in self.forker._pool ]
+    self.assertEqual(idle_pids[0], self.forker.fork("pid"))
+    self.assertEqual(idle_pids[1], self.forker.fork("pid"))
+    self.assertEqual(2, len(self.forker._pool))
+    # Re-registering the same task keeps the pool, a new one discards it
+    self.forker.register_task("pid", pid)
+    idle_pids = [ w.pid for w in self.forker._pool ]
+    self.assertEqual(idle_pids[0], self.forker.fork("pid"))
+    self.forker.register_task("pid", lambda: -os.getpid())
+    self.assertTrue(self.forker.fork("pid") < 0)
+    self.forker.close_pool()
+    self.assertEqual(set(), LocalForker._active_pids)
+
+class RemoteForkerTest(unittest.TestCase):
+  def setUp(self):
+    self.server = ForkerServer()
+    self.server_pid = os.fork()
+    if self.server_pid == 0:
+      try:
+        self.server.serve_forever()
+      finally:
+        os._exit(0)
+    self.forker = RemoteForker([self.server.address])
+
+  def tearDown(self):
+    self.server.close()
+    os.kill(self.server_pid, signal.SIGKILL)
+    os.waitpid(self.server_pid, 0)
+
+  def test_fork(self):
+    self.forker.register_task("add", add)
+    self.forker.register_task("fail", fail)
+    self.assertEqual(3, self.forker.fork("add", 1, 2))
+    self.assertEqual("ab", self.forker.fork("add", "a", "b"))
+    self.assertRaises(ReplayException, self.forker.fork, "fail")
+    self.assertRaises(ValueError, self.forker.fork, "nonexistent")
+
+  def test_binds_locally(self):
+    self.assertEqual("127.0.0.1", self.server.address[0])
+
+  def test_closures(self):
+    x = 1
+    self.assertRaises(ValueError, self.forker.register_task, "closure",
+                      lambda: x)
+
+  def test_bound_methods(self):
+    self.assertRaises(ValueError, self.forker.register_task, "bound",
+                      self.test_fork)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -10,27 +10,40 @@ from collections import Counter
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from trace_utils import parse_event_trace, Stats
+from trace_utils import Stats
 from pretty_print_input_trace import default_fields, field_formatters
 import sts.replay_event as replay_events
 from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import load_index, read_events
 
 def l_minus_r(l, r):
+  ''' l and r are lists of IndexEntrys. Return the entries of l whose
+  fingerprints don't occur (as many times) in r '''
   result = []
-  r_fingerprints = Counter([e.fingerprint for e in r.events])
-  for e in l.events:
-    if e.fingerprint not in r_fingerprints:
+  r_fingerprints = Counter([e.fingerprint_hash for e in r])
+  for e in l:
+    if r_fingerprints[e.fingerprint_hash] <= 0:
       result.append(e)
     else:
-      r_fingerprints[e] -= 1
-      if r_fingerprints[e] == 0:
-        del r_fingerprints[e]
+      r_fingerprints[e.fingerprint_hash] -= 1
   return result
 
+def print_difference(l_path, l_entries, r_entries, filtered_classes):
+  # Only the events that differ are decoded
+  filtered_class_names = set(c.__name__ for c in filtered_classes)
+  stats = Stats()
+  with open(l_path, 'rb') as l_file:
+    difference = [ e for e in l_minus_r(l_entries, r_entries)
+                   if e.class_name not in filtered_class_names ]
+    for e in read_events(l_file, difference):
+      stats.update(e)
+      for field in default_fields:
+        field_formatters[field](e)
+  print str(stats)
+
 def main(args):
-  trace1 = parse_event_trace(args.trace1)
-  trace2 = parse_event_trace(args.trace2)
+  trace1 = load_index(args.trace1)
+  trace2 = load_index(args.trace2)
 
   if args.ignore_inputs:
     filtered_classes = set(replay_events.all_input_events)
@@ -39,23 +52,11 @@ def main(args):
 
   print "Events in trace1, not in trace2"
   print "================================="
-  t1_t2_stats = Stats()
-  for e in l_minus_r(trace1, trace2):
-    if type(e) not in filtered_classes:
-      t1_t2_stats.update(e)
-      for field in default_fields:
-        field_formatters[field](e)
-  print str(t1_t2_stats)
+  print_difference(args.trace1, trace1, trace2, filtered_classes)
 
   print "Events in trace2, not in trace1"
   print "================================="
-  t2_t1_stats = Stats()
-  for e in l_minus_r(trace2, trace1):
-    if type(e) not in filtered_classes:
-      t2_t1_stats.update(e)
-      for field in default_fields:
-        field_formatters[field](e)
-  print str(t2_t1_stats)
+  print_difference(args.trace2, trace2, trace1, filtered_classes)
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
@@ -11,7 +11,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import sts.replay_event as replay_events
 from sts.dataplane_traces.trace import Trace
-from sts.input_traces.log_parser import parse
+from sts.input_traces.log_parser import load_index, read_events
 from trace_utils import Stats
 
 default_fields = ['class_with_label', 'fingerprint', 'event_delimiter']
@@ -65,8 +65,9 @@ field_formatters = {
 }
 
 
-def check_for_violation_signature(trace, signature):
-  for event in reversed(trace):
+def check_for_violation_signature(reversed_trace, signature):
+  ''' reversed_trace is an iterable over the trace's events, last to first '''
+  for event in reversed_trace:
     # TODO(cs): this algorithm is broken in the case that InvariantViolations
     # were part of the original events.trace as internal/special events. The
     # last InvariantViolation in the trace is not necessarily the one that
@@ -116,17 +117,22 @@ def main(args):
   # all events are printed with a fixed number of lines, and (optionally)
   # separated by delimiter lines of the form:
   # ----------------------------------
-  with open(args.input) as input_file:
-    trace = parse(input_file)
-    for event in trace:
-      if type(event) not in filtered_classes:
-        if dp_trace is not None and type(event) == replay_events.TrafficInjection:
-          event.dp_event = dp_trace.pop(0)
-        for field in fields:
-          field_formatters[field](event)
-        stats.update(event)
-
-    if check_for_violation_signature(trace, args.violation_signature):
+  # Only decode the events that are printed (and the ones at the end of the
+  # trace that are checked for violations)
+  entries = load_index(args.input)
+  filtered_class_names = set(c.__name__ for c in filtered_classes)
+  with open(args.input, 'rb') as input_file:
+    printed_entries = [ e for e in entries
+                        if e.class_name not in filtered_class_names ]
+    for event in read_events(input_file, printed_entries):
+      if dp_trace is not None and type(event) == replay_events.TrafficInjection:
+        event.dp_event = dp_trace.pop(0)
+      for field in fields:
+        field_formatters[field](event)
+      stats.update(event)
+
+    if check_for_violation_signature(read_events(input_file, reversed(entries)),
+                                     args.violation_signature):
       print "Violation occurs at end of trace: %s" % args.violation_signature
     elif args.violation_signature is not None:
       print ("Violation does not occur at end of trace: %s",